@@ -7,8 +7,10 @@ This module is part of the MGP library.
 
 
 
-from common import MGPDataRowL2
-from time import sleep, time, time_ns
+from common import (MGPData, MGPError, MGPGateCycle, MGPJournal, NullPipe,
+                    drain_source, is_source)
+from re import compile
+from time import monotonic, sleep, time, time_ns
 
 
 
@@ -27,6 +29,34 @@ class AreaOfGates(object):
     must have a .tick() function. The output of both functions should be a tuple.
     The first element of the tuple should be a dictionary of
     AreaOfGates.GateObject alike objects with all the keys from the gates list.
+
+    The .eval() function gets the data of the cycle and the journal of received
+    data as an MGPJournal. The journal keeps the data as long as its retention
+    policy allows or until .eval() asks for clearing it. Handlers can query a
+    time range, like the last N milliseconds, as a view without copying.
+
+    The loop runs in one of two modes. In the fixed-interval mode a cycle runs
+    once per loop_interval. In the event-driven mode the loop blocks on the
+    source and a cycle runs as soon as data arrives, after collecting further
+    data for at most batch_delay. Without data a cycle still runs every
+    loop_interval, so channel 2 gets its tick() calls periodically.
+
+    Gate logics are compiled into a truth table. The open flags of the channels
+    are tri-state: None (no opinion), False or True, and a gate's code is
+    computed from its logic and the states of its two channels. The codes of
+    all gates are translated with the table in a single bytes.translate() call
+    to the decision of each gate: closed, open with channel 1 data or open with
+    channel 2 data. Only the open gates are handled further.
+
+    In incremental mode an open gate is acted on only when it has just opened
+    or its channel or data changed since the last cycle. An optional heartbeat
+    re-asserts an open gate that hasn't changed for a while, for safety. The
+    counters of acted and skipped decisions are given by getcounters().
+
+    The decisions of a cycle are sent to the data flow as one MGPGateCycle.
+    The UI flow gets a conflated summary, a tuple of the timestamp and a
+    dictionary of the channel and the data of the gates opened since the last
+    summary by gate label, at most once per ui_interval.
     """
 
 
@@ -235,8 +265,44 @@ class AreaOfGates(object):
 
 
 
+    __LOGICS = [__logic_or_p, __logic_or_a, __logic_and_p, __logic_and_a,
+                __logic_xor, __logic_p_g_a, __logic_p_l_a, __logic_only_p,
+                __logic_only_a]
+
+    __OPEN = compile(b'[\x01\x02]')
+
+    __STATES = {None: 0, False: 1, True: 2}
+
+
+
+    def __truthtable():
+        """
+        Compiles the gate logics into a truth table
+        -------------------------------------------
+        The code of a gate is 9 * logic + 3 * state of channel 1 + state of
+        channel 2, where states are the indices of None, False and True. The
+        table maps each code to 0 if the gate is closed, to 1 if it opens with
+        channel 1 data and to 2 if it opens with channel 2 data.
+        @Return: (bytes)    The translation table of 256 bytes.
+        """
+
+        table = bytearray(256)
+        states = [None, False, True]
+        for logic_id, logic in enumerate(AreaOfGates.__LOGICS):
+            for ch1_state, ch1 in enumerate(states):
+                for ch2_state, ch2 in enumerate(states):
+                    open, data = logic(ch1, ch2, 1, 2)
+                    if open:
+                        table[logic_id * 9 + ch1_state * 3 + ch2_state] = data
+        return bytes(table)
+
+
+
     def __init__(self, flow_source, outputarea, ch1, ch2, gatelogics,
-                 loop_interval=100, data_pipe=None, ui_pipe=None):
+                 loop_interval=100, data_pipe=None, ui_pipe=None,
+                 event_driven=False, batch_delay=0, journal_age=None,
+                 journal_size=None, incremental=False, heartbeat=None,
+                 ui_interval=0):
         """
         Intializes the class
         --------------------
@@ -255,13 +321,44 @@ class AreaOfGates(object):
                                                     the logic identifier of the
                                                     gate.
                  loop_interval  (int)               [optional] Time in milliseconds
-                                                    between cycles.
+                                                    between cycles. In event-driven
+                                                    mode the longest time
+                                                    between two tick() calls.
                  data_pipe      (PipeConnection)    [optional] Pipe to send
                                                     data to the data flow.
                  ui_pipe        (PipeConnection)    [optional] Pipe to send
                                                     data to the UI flow.
+                 event_driven   (bool)              [optional] True to wake up
+                                                    on incoming data, False to
+                                                    run cycles in fixed
+                                                    intervals.
+                 batch_delay    (int)               [optional] Time in
+                                                    milliseconds to collect data
+                                                    after the first element in
+                                                    event-driven mode.
+                 journal_age    (int)               [optional] Time in
+                                                    nanoseconds to keep data in
+                                                    the journal, None to keep it
+                                                    without time limit.
+                 journal_size   (int)               [optional] Count of elements
+                                                    to keep in the journal at
+                                                    most, None for any count.
+                 incremental    (bool)              [optional] True to act only
+                                                    on gates that opened or
+                                                    changed, False to act on all
+                                                    open gates in every cycle.
+                 heartbeat      (int|dict)          [optional] Time in
+                                                    milliseconds after an
+                                                    unchanged open gate is acted
+                                                    on again in incremental
+                                                    mode. A dictionary sets it
+                                                    per gate label. None for no
+                                                    heartbeat.
+                 ui_interval    (int)               [optional] Time in
+                                                    milliseconds between two
+                                                    summaries to the UI flow.
         @Throws: MGPError                           When flow_source is not
-                                                    instance of PipeConnection.
+                                                    PipeConnection alike.
                                                     When outputarea is not
                                                     instance of OutputArea.
                                                     When ch1 doesn't have a
@@ -270,15 +367,19 @@ class AreaOfGates(object):
                                                     callable member .tick().
                                                     When gatelogics contains non
                                                     existing gate logic string.
+                                                    When a journal limit is not
+                                                    positive.
+                                                    When heartbeat has a label
+                                                    that is not a gate.
         """
 
-        if flow_source.__class__.__name__ == 'PipeConnection':
+        if is_source(flow_source):
             self.__flow_source = flow_source
         else:
-            raise MGPError('AreaOfGates: Pipe for main workflow must be instance of PipeConnection but is "{}".'
+            raise MGPError('AreaOfGates: Pipe for main workflow must be a PipeConnection alike object with poll() and recv() but is "{}".'
                            .format(flow_source.__class__.__name__))
         if outputarea.__class__.__name__ == 'OutputArea':
-            self.__output_area = flow_source
+            self.__output_area = outputarea
         else:
             raise MGPError('AreaOfGates: Object of Output Area must be instance of OutputArea but is "{}".'
                            .format(outputarea.__class__.__name__))
@@ -290,36 +391,18 @@ class AreaOfGates(object):
             self.__ch2 = ch2
         else:
             raise MGPError('AreaOfGates: Channel 2 object must have a callable member "tick".')
-        self.__gates = {}
-        self.__empty_results = {}
+        self.__bases = []
         for key, value in gatelogics.items():
             if value not in AreaOfGates.__GATE_TYPES:
                 self.showimplemented()
                 raise MGPError('AreaOfGates: Logic "{}" at label "{}" is not valid or not implemented.'
-                               .format(key, value))
-            else:
-                if value == 'P OR A (P)':
-                    self.__gates[key] = AreaOfGates.__logic_or_p
-                elif value == 'P OR A (A)':
-                    self.__gates[key] = AreaOfGates.__logic_or_a
-                elif value == 'P AND A (P)':
-                    self.__gates[key] = AreaOfGates.__logic_and_p
-                elif value == 'P AND A (A)':
-                    self.__gates[key] = AreaOfGates.__logic_and_a
-                elif value == 'P XOR A':
-                    self.__gates[key] = AreaOfGates.__logic_xor
-                elif value == 'P > A':
-                    self.__gates[key] = AreaOfGates.__logic_p_g_a
-                elif value == 'P < A':
-                    self.__gates[key] = AreaOfGates.__logic_p_l_a
-                elif value == 'P ONLY':
-                    self.__gates[key] = AreaOfGates.__logic_only_p
-                elif value == 'ONLY A':
-                    self.__gates[key] = AreaOfGates.__logic_only_a
-                self.__empty_results[key] = (False, None)
-        keylist = list(self.__gates.keys())
-        self.__ch1.gates = keylist.copy()
-        self.__ch2.gates = keylist.copy()
+                               .format(value, key))
+            self.__bases.append(AreaOfGates.__GATE_TYPES.index(value) * 9)
+        self.__keys = list(gatelogics.keys())
+        self.__closed_bases = [base + 3 for base in self.__bases]
+        self.__table = AreaOfGates.__truthtable()
+        self.__ch1.gates = self.__keys.copy()
+        self.__ch2.gates = self.__keys.copy()
         self.__loop_interval = loop_interval / 1000
         if data_pipe is not None:
             self.__to_data = data_pipe
@@ -329,10 +412,194 @@ class AreaOfGates(object):
             self.__to_ui = ui_pipe
         else:
             self.__to_ui = NullPipe()
+        self.__ui_interval = ui_interval / 1000
+        self.__ui_summary = {}
+        self.__ui_sent = 0.0
+        self.__event_driven = event_driven
+        self.__batch_delay = max(batch_delay, 0) / 1000
+        self.__new_data = []
+        self.__journal = MGPJournal(journal_age, journal_size)
+        self.__incremental = incremental
+        if heartbeat is None:
+            self.__heartbeats = {}
+        elif isinstance(heartbeat, dict):
+            for key in heartbeat:
+                if key not in gatelogics:
+                    raise MGPError('AreaOfGates: Heartbeat is given for "{}", which is not a gate.'
+                                   .format(key))
+            self.__heartbeats = {key: value / 1000 for key, value in heartbeat.items()}
+        else:
+            self.__heartbeats = {key: heartbeat / 1000 for key in self.__keys}
+        self.__emitted = {}
+        self.__counters = {'acted': 0, 'heartbeats': 0, 'skipped': 0}
         self.__do_loop = False
 
 
 
+    def __receive(self, element):
+        """
+        Collects an element of the source
+        ---------------------------------
+        @Params: element    (object)    The received data.
+        """
+
+        self.__new_data.append(element)
+        self.__journal.append(element)
+
+
+
+    def __changes(self, decisions):
+        """
+        Filters the decisions that changed
+        ----------------------------------
+        A decision changed if its gate was closed in the last cycle, or it
+        opens with another channel or other data than in the last cycle, or
+        the heartbeat of the gate is over. Data are compared by
+        AreaOfGates.__samedata().
+        @Params: decisions  (list)  Tuples of the label, the channel and the
+                                    data of the open gates.
+        @Return: (list)             The decisions to act on.
+        """
+
+        now = monotonic()
+        heartbeats = self.__heartbeats
+        last = self.__emitted
+        emitted = {}
+        result = []
+        skipped = 0
+        reasserted = 0
+        for decision in decisions:
+            key, channel, data = decision
+            previous = last.get(key)
+            if (previous is not None and previous[0] == channel
+                    and AreaOfGates.__samedata(previous[1], data)):
+                heartbeat = heartbeats.get(key)
+                if heartbeat is None or now - previous[2] < heartbeat:
+                    emitted[key] = previous
+                    skipped += 1
+                    continue
+                reasserted += 1
+            emitted[key] = (channel, data, now)
+            result.append(decision)
+        self.__emitted = emitted
+        self.__counters['heartbeats'] += reasserted
+        self.__counters['skipped'] += skipped
+        return result
+
+
+
+    def __report(self, decisions):
+        """
+        Sends the decisions of a cycle to the data and UI flows
+        -------------------------------------------------------
+        Rows are only created if there is a data flow, since nothing else
+        finalizes them.
+        @Params: decisions  (list)  Tuples of the label, the channel and the
+                                    data of the acted gates.
+        """
+
+        timestamp = time()
+        if decisions:
+            if self.__to_data.__class__ is not NullPipe:
+                cycle = MGPGateCycle(timestamp)
+                for key, channel, data in decisions:
+                    cycle.append(key, channel, data)
+                self.__to_data.send(cycle)
+            if self.__to_ui.__class__ is not NullPipe:
+                summary = self.__ui_summary
+                for key, channel, data in decisions:
+                    summary[key] = (channel, data)
+        if self.__ui_summary:
+            now = monotonic()
+            if now - self.__ui_sent >= self.__ui_interval:
+                self.__to_ui.send((timestamp, self.__ui_summary))
+                self.__ui_summary = {}
+                self.__ui_sent = now
+
+
+
+    @staticmethod
+    def __samedata(data, other):
+        """
+        Gets whether the data of two decisions are the same
+        ---------------------------------------------------
+        MGPData are the same with the same label, value and unit, other data
+        if they are equal. Values that have no single truth value when they
+        are compared, like arrays, are the same only as the same object.
+        @Params: data   (MGPData|object)    The data of the last cycle.
+                 other  (MGPData|object)    The data of this cycle.
+        @Return: (bool)                     True if the data are the same,
+                                            False if not.
+        """
+
+        if data is other:
+            return True
+        if data.__class__ is MGPData and other.__class__ is MGPData:
+            if data.getlabel() != other.getlabel() or data.getunit() != other.getunit():
+                return False
+            data, other = data.getvalue(), other.getvalue()
+            if data is other:
+                return True
+        try:
+            return bool(data == other)
+        except (TypeError, ValueError):
+            return False
+
+
+
+    def evaluate(self, ch1_data, ch2_data):
+        """
+        Evaluates all gates at once
+        ---------------------------
+        The open member of a result is either None or taken by its truth value,
+        so numpy.bool_ values and non-empty strings work too.
+        @Params: ch1_data   (dict|NoneType)     GateObject alike results of
+                                                channel 1 by gate label, None
+                                                if channel 1 had no data, that
+                                                counts as closed.
+                 ch2_data   (dict)              GateObject alike results of
+                                                channel 2 by gate label.
+        @Return: (list)                         Tuples of the label, the channel
+                                                (1 or 2) and the data of the
+                                                open gates.
+        """
+
+        states = AreaOfGates.__STATES
+        keys = self.__keys
+        ch2_opens = [ch2_data[key].open for key in keys]
+        if ch1_data is None:
+            codes = bytes([base + states[None if ch2 is None else bool(ch2)]
+                           for ch2, base in zip(ch2_opens, self.__closed_bases)])
+        else:
+            ch1_opens = [ch1_data[key].open for key in keys]
+            codes = bytes([base + states[None if ch1 is None else bool(ch1)] * 3
+                           + states[None if ch2 is None else bool(ch2)]
+                           for ch1, ch2, base in zip(ch1_opens, ch2_opens, self.__bases)])
+        decisions = codes.translate(self.__table)
+        result = []
+        for match in AreaOfGates.__OPEN.finditer(decisions):
+            key = keys[match.start()]
+            if decisions[match.start()] == 1:
+                result.append((key, 1, ch1_data[key].data))
+            else:
+                result.append((key, 2, ch2_data[key].data))
+        return result
+
+
+
+    def getcounters(self):
+        """
+        Gets the counters of the gate decisions
+        ---------------------------------------
+        @Return: (dict)     The count of decisions acted on (acted), of them
+                            the count of heartbeats (heartbeats) and the count
+                            of unchanged decisions that were skipped (skipped).
+        """
+
+        return self.__counters.copy()
+
+
+
     def loopinterval(self, new_value=None):
         """
         Gets or sets the value of loop interval
@@ -340,7 +607,7 @@ class AreaOfGates(object):
         @Params: new_value  (int)   [optional] The new interval in milliseconds.
         """
         if new_value is not None:
-            self.__loop_interval = loop_interval
+            self.__loop_interval = new_value / 1000
         else:
             return self.__loop_interval
 
@@ -367,30 +634,40 @@ class AreaOfGates(object):
         self.__do_loop = True
         self.__start_ns = time_ns()
         self.__ch2_ns = time_ns()
-        self.__journal = []
+        self.__journal.clear()
+        self.__emitted = {}
+        next_tick = monotonic() + self.__loop_interval
         while self.__do_loop:
             cycle_start = time_ns()
-            new_data = []
-            while self.__flow_source.poll():
-                element = self.__flow_source.recv()
-                new_data.append(element)
-                self.__journal.append(element)
+            new_data = self.__new_data = []
+            self.__journal.evict()
+            if self.__event_driven:
+                drain_source(self.__flow_source, self.__receive,
+                             next_tick - monotonic(), self.__batch_delay)
+                now = monotonic()
+                if now >= next_tick:
+                    next_tick += self.__loop_interval
+                    if next_tick <= now:
+                        next_tick = now + self.__loop_interval
+            else:
+                drain_source(self.__flow_source, self.__receive)
             if len(new_data) > 0:
-                ch1_data, clear = self.__ch1(new_data, self.__journal)
+                ch1_data, clear = self.__ch1.eval(new_data, self.__journal)
                 if clear:
-                    del self.__journal[:]
+                    self.__journal.clear()
             else:
-                ch1_data = self.__empty_results.copy()
+                ch1_data = None
             ch2_data, clear = self.__ch2.tick(self.__start_ns, self.__ch2_ns)
             if clear:
                 self.__ch2_ns = time_ns()
-            for key, keyfunction in self.__gates.items():
-                open, data = keyfunction(ch1_data[key].open, ch2_data[key].open, ch1_data[key].data, ch2_data[key].data)
-                if open:
-                    outputarea.act(key, data)
-                    row = MGPDataRowL2(time(), ch1_data, ch2_data)
-                    self.__to_data.send(row)
-                    self.__to_ui.send(row)
-            sleep_interval = self.__loop_interval - ((time_ns() - cycle_start) / 1000000000)
-            if sleep_interval > 0:
-                sleep(sleep_interval)
+            decisions = self.evaluate(ch1_data, ch2_data)
+            if self.__incremental:
+                decisions = self.__changes(decisions)
+            self.__counters['acted'] += len(decisions)
+            for key, channel, data in decisions:
+                self.__output_area.act(key, data)
+            self.__report(decisions)
+            if not self.__event_driven:
+                sleep_interval = self.__loop_interval - ((time_ns() - cycle_start) / 1000000000)
+                if sleep_interval > 0:
+                    sleep(sleep_interval)
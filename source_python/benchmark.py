@@ -0,0 +1,374 @@
+"""
+Medical Gateway Platform - Benchmarks
+=====================================
+
+This module is part of the MGP library. It contains microbenchmarks of the
+performance critical parts of the library. Run it as a script with the name of
+the benchmark to run, or without arguments to run all of them:
+
+    python benchmark.py [codec] [gates] [stats] [storage] [transport] [wakeup]
+"""
+
+
+
+from common import ExitObject, MGPData, MGPDataRowL0, MGPLedger, MGPRowBatch
+from multiprocessing import Pipe, Process
+from pickle import dumps, loads, HIGHEST_PROTOCOL
+from sys import argv
+from time import perf_counter, sleep, time_ns
+
+
+
+def bench_codec(rows_per_message=1000, repeat=20):
+    """
+    Compares MGPCodec with pickle
+    -----------------------------
+    @Params: rows_per_message   (int)   [optional] Count of L0 rows per message.
+             repeat             (int)   [optional] Count of messages to measure.
+    """
+
+    from codec import MGPCodec
+
+    MGPLedger.reportatexit(False)
+    rows = [MGPDataRowL0(time_ns(), MGPData('paw', 20.0 + (i % 10) * 0.5, 'cmH2O'),
+                         'vent-{}'.format(i % 4), 'sample')
+            for i in range(rows_per_message)]
+    print('codec: {} L0 rows per message, {} messages'.format(rows_per_message, repeat))
+    for name, encode, decode in (('pickle one by one',
+                                  lambda: [dumps(row, HIGHEST_PROTOCOL) for row in rows],
+                                  lambda data: [loads(message) for message in data]),
+                                 ('pickle list',
+                                  lambda: dumps(rows, HIGHEST_PROTOCOL),
+                                  loads),
+                                 ('MGPCodec batch',
+                                  lambda: MGPCodec.encode(rows),
+                                  MGPCodec.decode)):
+        start = perf_counter()
+        for _ in range(repeat):
+            data = encode()
+        encoded = perf_counter() - start
+        start = perf_counter()
+        for _ in range(repeat):
+            decode(data)
+        decoded = perf_counter() - start
+        size = sum(len(message) for message in data) if isinstance(data, list) else len(data)
+        total = rows_per_message * repeat
+        print('   {:<20} {:>8} bytes  encode {:>10.0f} rows/s  decode {:>10.0f} rows/s'
+              .format(name, size, total / encoded, total / decoded))
+
+
+
+def bench_gates(gates=500, cycles=2000):
+    """
+    Measures the evaluation of all gates of AreaOfGates
+    ---------------------------------------------------
+    Every 20th gate asks for opening from channel 1, like in a cycle where a
+    few gates change.
+    @Params: gates  (int)   [optional] Count of gates.
+             cycles (int)   [optional] Count of cycles to measure.
+    """
+
+    from areaofgates import AreaOfGates
+    from outputarea import OutputArea
+
+    logics = ['P OR A (P)', 'P OR A (A)', 'P AND A (P)', 'P AND A (A)', 'P XOR A',
+              'P > A', 'P < A', 'P ONLY', 'ONLY A']
+    gatelogics = {'gate-{}'.format(i): logics[i % len(logics)] for i in range(gates)}
+    source, sink = Pipe(False)
+    area = AreaOfGates(source, OutputArea(), _Channel(), _Channel(), gatelogics)
+    data = MGPData('paw', 20.5, 'cmH2O')
+    ch1_data = {key: AreaOfGates.GateObject(i % 20 == 0, data)
+                for i, key in enumerate(gatelogics)}
+    ch2_data = {key: AreaOfGates.GateObject(False, data) for key in gatelogics}
+    print('gates: {} gates, {} cycles'.format(gates, cycles))
+    start = perf_counter()
+    for _ in range(cycles):
+        area.evaluate(ch1_data, ch2_data)
+    elapsed = perf_counter() - start
+    source.close()
+    sink.close()
+    print('   {:<20} {:>8.1f} us per cycle  {:>10.0f} gates/s'
+          .format('truth table', elapsed / cycles * 1000000, gates * cycles / elapsed))
+
+
+
+def bench_stats(samples=200000, window=1000, series=4):
+    """
+    Measures the updates of MGPWindowStats
+    --------------------------------------
+    Samples of a few series are added one by one through rows, like a
+    processor function gets them, and every series is queried after each
+    100 samples.
+    @Params: samples    (int)   [optional] Count of samples to add.
+             window     (int)   [optional] Count of samples in a window.
+             series     (int)   [optional] Count of series.
+    """
+
+    from random import Random
+    from windowstats import MGPWindowStats
+
+    MGPLedger.reportatexit(False)
+    random = Random(1)
+    batch = MGPRowBatch(0)
+    for i in range(samples):
+        batch.append(i, 'paw', random.uniform(5.0, 30.0), 'cmH2O',
+                     equipment_id='vent-{}'.format(i % series))
+    rows = list(batch)
+    stats = MGPWindowStats(max_count=window)
+    print('stats: {} samples of {} series, {} samples per window'
+          .format(samples, series, window))
+    start = perf_counter()
+    for i in range(0, samples, 100):
+        stats.update(rows[i:i + 100])
+        for key in stats.keys():
+            current = stats.series(*key)
+            summary = (current.mean(), current.std(), current.min(), current.max(),
+                       current.quantile(0.95))
+    elapsed = perf_counter() - start
+    batch.finalize(None)
+    print('   {:<20} {:>10.0f} samples/s  {:>10.0f} samples/s per series'
+          .format('MGPWindowStats', samples / elapsed, samples / elapsed / series))
+
+
+
+def bench_storage(rows=100000, cycle=1000):
+    """
+    Measures sustained L0 inserts of the storage engines
+    ----------------------------------------------------
+    L0 sample streams of a few ventilators are stored in cycles with
+    create_many(), like DataArea stores what it drained from the data pipe,
+    and the engine commits after every cycle. The SQL engine is compared with
+    inserting and committing every row by itself. Then the samples of one
+    ventilator in the time range of a cycle are queried from the middle of the
+    stream. The size of the L0 files is given per row, the DoF segments are
+    preallocated, so their size is not comparable.
+    @Params: rows   (int)   [optional] Count of L0 rows to store.
+             cycle  (int)   [optional] Count of rows per cycle.
+    """
+
+    from dataarea import DataArea
+    from os.path import getsize, join
+    from sqlite3 import connect
+    from tempfile import TemporaryDirectory
+
+    MGPLedger.reportatexit(False)
+    batch = MGPRowBatch(0)
+    for i in range(rows):
+        batch.append(time_ns(), 'paw', 20.0 + (i % 10) * 0.5, 'cmH2O',
+                     equipment_id='vent-{}'.format(i % 8), event_type='sample')
+    views = list(batch)
+    print('storage: {} L0 rows in cycles of {}'.format(rows, cycle))
+    with TemporaryDirectory() as directory:
+        connection = connect(join(directory, 'row.sqlite'), isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('''CREATE TABLE l0 (id INTEGER PRIMARY KEY, timestamp,
+                              label TEXT, value, unit TEXT, equipment_id TEXT,
+                              event_type TEXT)''')
+        connection.execute('CREATE INDEX l0_equipment_timestamp ON l0 (equipment_id, timestamp)')
+        start = perf_counter()
+        for row in views[:rows // 10]:
+            connection.execute('INSERT INTO l0 VALUES (NULL, ?, ?, ?, ?, ?, ?)',
+                               (row.gettimestamp(), row.getlabel(), row.getvalue(),
+                                row.getunit(), row.getequipment(), row.geteventtype()))
+        elapsed = perf_counter() - start
+        connection.close()
+        print('   {:<20} {:>10.0f} rows/s'.format('SQLite row by row', rows // 10 / elapsed))
+        source, sink = Pipe(False)
+        for storage, configdict, files in (('CSV', {'path': directory}, ['l0.csv', 'l0.idx']),
+                                           ('DoF', {'path': directory}, []),
+                                           ('SQL', {'database': join(directory, 'mgp.sqlite')},
+                                            ['mgp.sqlite']),
+                                           ('Chunk', {'path': join(directory, 'chunk')},
+                                            [join('chunk', 'l0.chunk')])):
+            DataArea.engine = None
+            DataArea(storage, configdict, source)
+            engine = DataArea.engine
+            start = perf_counter()
+            for i in range(0, rows, cycle):
+                engine.create_many(0, views[i:i + cycle])
+                engine.commit()
+            engine.commit(True)
+            elapsed = perf_counter() - start
+            first = views[rows // 2].gettimestamp()
+            last = views[rows // 2 + cycle - 1].gettimestamp()
+            start = perf_counter()
+            found = sum(1 for _ in DataArea.query_range(0, first, last, 'vent-0'))
+            queried = perf_counter() - start
+            engine.close()
+            size = sum(getsize(join(directory, name)) for name in files)
+            print('   {:<20} {:>10.0f} rows/s  {:>8.2f} ms per query of {} rows  {:>6} bytes per row'
+                  .format(storage + ' engine', rows / elapsed, queried * 1000, found,
+                          '{:.1f}'.format(size / rows) if files else '-'))
+        DataArea.engine = None
+        source.close()
+        sink.close()
+    batch.finalize(None)
+
+
+
+def bench_transport(round_trips=20000, stream=200000):
+    """
+    Compares SharedRingPipe with multiprocessing.Pipe
+    -------------------------------------------------
+    Two processes send a small message back and forth, the half of a round
+    trip is the latency of a hop between two areas. Then one process streams
+    messages to the other to measure the throughput. SharedRingPipe is left out
+    on machines that are not x86.
+    @Params: round_trips    (int)   [optional] Count of round trips to measure.
+             stream         (int)   [optional] Count of streamed messages.
+    """
+
+    from sharedring import SharedRingPipe
+
+    print('transport: {} round trips, {} streamed messages between two processes'
+          .format(round_trips, stream))
+    transports = [('multiprocessing.Pipe', lambda: Pipe(False))]
+    if SharedRingPipe.issupported():
+        transports.append(('SharedRingPipe', lambda: SharedRingPipe.pair(1 << 16)))
+    for name, factory in transports:
+        ping_source, ping_sink = factory()
+        pong_source, pong_sink = factory()
+        echo = Process(target=_echo, args=(ping_source, pong_sink, round_trips))
+        echo.start()
+        message = ('paw', 20.5, 'cmH2O')
+        start = perf_counter()
+        for _ in range(round_trips):
+            ping_sink.send(message)
+            pong_source.recv()
+        elapsed = perf_counter() - start
+        echo.join()
+        stream_source, stream_sink = factory()
+        producer = Process(target=_produce, args=(stream_sink, stream))
+        start = perf_counter()
+        producer.start()
+        for _ in range(stream):
+            stream_source.recv()
+        streamed = perf_counter() - start
+        producer.join()
+        for endpoint in (ping_source, ping_sink, pong_source, pong_sink, stream_source,
+                         stream_sink):
+            endpoint.close()
+        print('   {:<20} {:>8.1f} us per hop  {:>10.0f} messages/s'
+              .format(name, elapsed / round_trips / 2 * 1000000, stream / streamed))
+
+
+
+def bench_wakeup(samples=50, gap=0.013):
+    """
+    Compares the fixed-interval and the event-driven loop of ProcessArea
+    --------------------------------------------------------------------
+    Samples are sent to a ProcessArea in another process with a gap that is
+    not in step with the loop interval. The processor sends every sample back
+    at once, the time until it is back is the latency of the area.
+    @Params: samples    (int)       [optional] Count of samples to measure.
+             gap        (float)     [optional] Time in seconds between samples.
+    """
+
+    print('wakeup: {} samples through ProcessArea with 100 ms loop interval'
+          .format(samples))
+    for name, event_driven in (('fixed interval', False), ('event-driven', True)):
+        in_source, in_sink = Pipe(False)
+        out_source, out_sink = Pipe(False)
+        area = Process(target=_process_area, args=(in_source, out_sink, event_driven),
+                       daemon=True)
+        area.start()
+        latencies = []
+        for i in range(samples):
+            sleep(gap)
+            start = perf_counter()
+            in_sink.send(i)
+            out_source.recv()
+            latencies.append(perf_counter() - start)
+        area.terminate()
+        area.join()
+        for endpoint in (in_source, in_sink, out_source, out_sink):
+            endpoint.close()
+        latencies.sort()
+        print('   {:<20} median {:>8.2f} ms  max {:>8.2f} ms'
+              .format(name, latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000))
+
+
+
+class _Channel(object):
+    """
+    _Channel class
+    ==============
+    This class is a channel handler that is never called by the benchmarks.
+    """
+
+
+
+    def eval(self, new_data, journal):
+        """
+        Does nothing
+        ------------
+        """
+
+        pass
+
+
+
+    def tick(self, start_ns, last_ns):
+        """
+        Does nothing
+        ------------
+        """
+
+        pass
+
+
+
+def _echo(source, sink, count):
+    """
+    Sends back every received message
+    ---------------------------------
+    @Params: source (PipeConnection)    The pipe to receive from.
+             sink   (PipeConnection)    The pipe to send to.
+             count  (int)               Count of messages to echo.
+    """
+
+    for _ in range(count):
+        sink.send(source.recv())
+
+
+
+def _produce(sink, count):
+    """
+    Sends messages as fast as possible
+    ----------------------------------
+    @Params: sink   (PipeConnection)    The pipe to send to.
+             count  (int)               Count of messages to send.
+    """
+
+    message = ('paw', 20.5, 'cmH2O')
+    for _ in range(count):
+        sink.send(message)
+
+
+
+def _process_area(source, sink, event_driven):
+    """
+    Runs a ProcessArea that sends back the received samples
+    -------------------------------------------------------
+    @Params: source         (PipeConnection)    The pipe to receive from.
+             sink           (PipeConnection)    The pipe to send to.
+             event_driven   (bool)              The loop mode of the area.
+    """
+
+    from processarea import ProcessArea
+
+    ProcessArea(source, lambda data: ExitObject(data, None, None), 100, sink,
+                event_driven=event_driven).start()
+
+
+
+BENCHMARKS = {'codec': bench_codec, 'gates': bench_gates, 'stats': bench_stats,
+              'storage': bench_storage, 'transport': bench_transport,
+              'wakeup': bench_wakeup}
+
+
+
+if __name__ == '__main__':
+    for name in (argv[1:] if len(argv) > 1 else BENCHMARKS.keys()):
+        BENCHMARKS[name]()
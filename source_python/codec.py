@@ -0,0 +1,486 @@
+"""
+Medical Gateway Platform - Codec
+================================
+
+This module is part of the MGP library.
+"""
+
+
+
+from array import array
+from collections import deque
+from common import (ExitObject, MGPData, MGPDataRowL0, MGPDataRowL1,
+                    MGPDataRowL2, MGPDataRowL3, MGPError, MGPGateCycle,
+                    MGPRowBatch)
+from struct import Struct
+
+
+
+class MGPCodec(object):
+    """
+    MGPCodec class
+    ==============
+    This class provides a compact, versioned binary wire format for objects
+    sent between the areas. Instead of pickling full Python objects one by one,
+    many MGPData, MGPDataRowL*, MGPRowBatch, MGPGateCycle and ExitObject objects
+    are packed into one message with the help of the struct module. Strings like
+    labels, units and equipment IDs are stored only once per message in a string
+    table.
+
+    Layout of a message:
+        header          magic (4 bytes), version (uint8), reserved (uint8),
+                        count of objects (uint32), count of strings (uint32)
+        string table    length (uint32) and UTF-8 content of every string
+        objects         tagged items, see __TAG_* constants
+
+    Unfinalized MGPDataRowL0 rows with integer timestamp, float value and
+    string label, unit, equipment and event type are the most common objects on
+    the wire, so they are packed with a single fixed layout.
+
+    Batches are written as their tag and a fixed list of columns as tagged
+    items, the layout belongs to the version:
+        MGPRowBatch         level, string table, timestamp, value, label,
+                            unit, equipment, event type, L0 ID, patient ID,
+                            patient password, ID, filtered
+        MGPGateCycle        timestamp, gate, channel, data, ID, filtered
+
+    The decoder reads the message with struct.unpack_from() over a memoryview,
+    so no intermediate bytes objects are created while parsing.
+    """
+
+
+
+    VERSION = 1
+
+    __MAGIC = b'MGPW'
+
+    __TAG_NONE = 0
+    __TAG_FALSE = 1
+    __TAG_TRUE = 2
+    __TAG_INT = 3
+    __TAG_FLOAT = 4
+    __TAG_STR = 5
+    __TAG_TUPLE = 6
+    __TAG_LIST = 7
+    __TAG_ARRAY = 8
+    __TAG_DICT = 9
+    __TAG_DATA = 10
+    __TAG_ROW_L0 = 11
+    __TAG_ROW_L1 = 12
+    __TAG_ROW_L2 = 13
+    __TAG_ROW_L3 = 14
+    __TAG_EXIT = 15
+    __TAG_BATCH = 16
+    __TAG_ROW_L0_PACKED = 17
+    __TAG_GATE_CYCLE = 18
+
+    __HEADER = Struct('<4sBBII')
+    __UINT = Struct('<I')
+    __INT = Struct('<Bq')
+    __FLOAT = Struct('<Bd')
+    __STR = Struct('<BI')
+    __ARRAY = Struct('<BcI')
+    __ROW_L0_PACKED = Struct('<BqIdIII')
+
+    __INT_MIN = -(1 << 63)
+    __INT_MAX = (1 << 63) - 1
+
+    __BATCH_COLUMNS = 13
+    __GATE_CYCLE_COLUMNS = 6
+
+    __ROWS = {MGPDataRowL0: __TAG_ROW_L0, MGPDataRowL1: __TAG_ROW_L1,
+              MGPDataRowL2: __TAG_ROW_L2, MGPDataRowL3: __TAG_ROW_L3}
+    __ROW_CLASSES = {tag: cls for cls, tag in __ROWS.items()}
+
+
+
+    @classmethod
+    def decode(cls, message):
+        """
+        Decodes a message
+        -----------------
+        @Params: message    (bytes-like)    The encoded message.
+        @Return: (list)                     The decoded objects in order.
+        @Throws: MGPError                   When the message is not an MGP wire
+                                            message or its version is not
+                                            supported.
+        """
+
+        view = memoryview(message)
+        if view.nbytes < cls.__HEADER.size:
+            raise MGPError('MGPCodec.decode(): Message is too short.')
+        magic, version, _, count, string_count = cls.__HEADER.unpack_from(view, 0)
+        if magic != cls.__MAGIC:
+            raise MGPError('MGPCodec.decode(): Message is not an MGP wire message.')
+        if version != cls.VERSION:
+            raise MGPError('MGPCodec.decode(): Version {} is not supported.'
+                           .format(version))
+        offset = cls.__HEADER.size
+        strings = []
+        unpack_uint = cls.__UINT.unpack_from
+        for _ in range(string_count):
+            length, = unpack_uint(view, offset)
+            offset += 4
+            strings.append(str(view[offset:offset + length], 'utf-8'))
+            offset += length
+        result = []
+        for _ in range(count):
+            element, offset = cls.__decodeitem(view, offset, strings)
+            result.append(element)
+        return result
+
+
+
+    @classmethod
+    def __decodeitem(cls, view, offset, strings):
+        """
+        Decodes a tagged item
+        ---------------------
+        @Params: view       (memoryview)    The message.
+                 offset     (int)           The position of the item.
+                 strings    (list)          The string table of the message.
+        @Return: (tuple)                    The decoded item and the position
+                                            right after it.
+        @Throws: MGPError                   When the tag is unknown.
+        """
+
+        tag = view[offset]
+        if tag == cls.__TAG_ROW_L0_PACKED:
+            (_, timestamp, label, value, unit,
+             equipment_id, event_type) = cls.__ROW_L0_PACKED.unpack_from(view, offset)
+            row = MGPDataRowL0.__new__(MGPDataRowL0)
+            row.__setstate__((timestamp, MGPData(strings[label], value, strings[unit]),
+                              strings[equipment_id], strings[event_type], False, None))
+            return row, offset + cls.__ROW_L0_PACKED.size
+        elif tag == cls.__TAG_FLOAT:
+            return cls.__FLOAT.unpack_from(view, offset)[1], offset + 9
+        elif tag == cls.__TAG_INT:
+            return cls.__INT.unpack_from(view, offset)[1], offset + 9
+        elif tag == cls.__TAG_STR:
+            return strings[cls.__STR.unpack_from(view, offset)[1]], offset + 5
+        elif tag == cls.__TAG_NONE:
+            return None, offset + 1
+        elif tag == cls.__TAG_FALSE:
+            return False, offset + 1
+        elif tag == cls.__TAG_TRUE:
+            return True, offset + 1
+        elif tag == cls.__TAG_DATA:
+            label, offset = cls.__decodeitem(view, offset + 1, strings)
+            value, offset = cls.__decodeitem(view, offset, strings)
+            unit, offset = cls.__decodeitem(view, offset, strings)
+            return MGPData(label, value, unit), offset
+        elif tag in cls.__ROW_CLASSES:
+            state, offset = cls.__decodeitem(view, offset + 1, strings)
+            row = cls.__ROW_CLASSES[tag].__new__(cls.__ROW_CLASSES[tag])
+            row.__setstate__(state)
+            return row, offset
+        elif tag == cls.__TAG_TUPLE or tag == cls.__TAG_LIST:
+            count, = cls.__UINT.unpack_from(view, offset + 1)
+            offset += 5
+            items = []
+            for _ in range(count):
+                item, offset = cls.__decodeitem(view, offset, strings)
+                items.append(item)
+            return (tuple(items) if tag == cls.__TAG_TUPLE else items), offset
+        elif tag == cls.__TAG_ARRAY:
+            _, typecode, nbytes = cls.__ARRAY.unpack_from(view, offset)
+            offset += cls.__ARRAY.size
+            items = array(typecode.decode('ascii'))
+            items.frombytes(view[offset:offset + nbytes])
+            return items, offset + nbytes
+        elif tag == cls.__TAG_DICT:
+            count, = cls.__UINT.unpack_from(view, offset + 1)
+            offset += 5
+            items = {}
+            for _ in range(count):
+                key, offset = cls.__decodeitem(view, offset, strings)
+                items[key], offset = cls.__decodeitem(view, offset, strings)
+            return items, offset
+        elif tag == cls.__TAG_EXIT:
+            to_flow, offset = cls.__decodeitem(view, offset + 1, strings)
+            to_data, offset = cls.__decodeitem(view, offset, strings)
+            to_ui, offset = cls.__decodeitem(view, offset, strings)
+            return ExitObject(to_flow, to_data, to_ui), offset
+        elif tag == cls.__TAG_BATCH:
+            columns, offset = cls.__decodecolumns(view, offset + 1, strings,
+                                                  cls.__BATCH_COLUMNS)
+            batch = MGPRowBatch.__new__(MGPRowBatch)
+            batch.__setstate__(columns)
+            return batch, offset
+        elif tag == cls.__TAG_GATE_CYCLE:
+            columns, offset = cls.__decodecolumns(view, offset + 1, strings,
+                                                  cls.__GATE_CYCLE_COLUMNS)
+            cycle = MGPGateCycle.__new__(MGPGateCycle)
+            cycle.__setstate__(columns)
+            return cycle, offset
+        else:
+            raise MGPError('MGPCodec.decode(): Tag {} at offset {} is unknown.'
+                           .format(tag, offset))
+
+
+
+    @classmethod
+    def __decodecolumns(cls, view, offset, strings, count):
+        """
+        Decodes the columns of a batch
+        ------------------------------
+        @Params: view       (memoryview)    The message.
+                 offset     (int)           The position of the first column.
+                 strings    (list)          The string table of the message.
+                 count      (int)           The count of columns.
+        @Return: (tuple)                    The tuple of the columns and the
+                                            position right after them.
+        """
+
+        columns = []
+        for _ in range(count):
+            column, offset = cls.__decodeitem(view, offset, strings)
+            columns.append(column)
+        return tuple(columns), offset
+
+
+
+    @classmethod
+    def encode(cls, elements):
+        """
+        Encodes many objects into one message
+        -------------------------------------
+        @Params: elements   (iterable)  The objects to encode.
+        @Return: (bytes)                The encoded message.
+        @Throws: MGPError               When an object or a value cannot be
+                                        encoded.
+        """
+
+        body = bytearray()
+        strings = {}
+        count = 0
+        for element in elements:
+            cls.__encodeitem(element, body, strings)
+            count += 1
+        parts = [cls.__HEADER.pack(cls.__MAGIC, cls.VERSION, 0, count, len(strings))]
+        pack_uint = cls.__UINT.pack
+        for text in strings:
+            encoded = text.encode('utf-8')
+            parts.append(pack_uint(len(encoded)))
+            parts.append(encoded)
+        parts.append(body)
+        return b''.join(parts)
+
+
+
+    @classmethod
+    def encodeone(cls, element):
+        """
+        Encodes a single object into a message
+        --------------------------------------
+        @Params: element    (object)    The object to encode.
+        @Return: (bytes)                The encoded message.
+        """
+
+        return cls.encode((element,))
+
+
+
+    @classmethod
+    def __encodeitem(cls, item, body, strings):
+        """
+        Encodes a tagged item
+        ---------------------
+        @Params: item       (object)    The item to encode.
+                 body       (bytearray) The buffer to append to.
+                 strings    (dict)      The string table of the message.
+        @Throws: MGPError               When the item cannot be encoded.
+        """
+
+        kind = type(item)
+        if kind is float:
+            body += cls.__FLOAT.pack(cls.__TAG_FLOAT, item)
+        elif kind is str:
+            index = strings.get(item)
+            if index is None:
+                index = strings[item] = len(strings)
+            body += cls.__STR.pack(cls.__TAG_STR, index)
+        elif kind is int:
+            if not cls.__INT_MIN <= item <= cls.__INT_MAX:
+                raise MGPError('MGPCodec.encode(): Integer {} is out of 64 bits.'
+                               .format(item))
+            body += cls.__INT.pack(cls.__TAG_INT, item)
+        elif item is None:
+            body.append(cls.__TAG_NONE)
+        elif kind is bool:
+            body.append(cls.__TAG_TRUE if item else cls.__TAG_FALSE)
+        elif kind is MGPData:
+            body.append(cls.__TAG_DATA)
+            cls.__encodeitem(item.getlabel(), body, strings)
+            cls.__encodeitem(item.getvalue(), body, strings)
+            cls.__encodeitem(item.getunit(), body, strings)
+        elif kind is MGPDataRowL0:
+            state = item.__getstate__()
+            timestamp, data, equipment_id, event_type, is_filtered, row_id = state
+            label, value, unit = data.getlabel(), data.getvalue(), data.getunit()
+            if (type(timestamp) is int and type(value) is float and type(label) is str
+                    and type(unit) is str and type(equipment_id) is str
+                    and type(event_type) is str and not is_filtered and row_id is None
+                    and cls.__INT_MIN <= timestamp <= cls.__INT_MAX):
+                indices = []
+                for text in (label, unit, equipment_id, event_type):
+                    index = strings.get(text)
+                    if index is None:
+                        index = strings[text] = len(strings)
+                    indices.append(index)
+                body += cls.__ROW_L0_PACKED.pack(cls.__TAG_ROW_L0_PACKED, timestamp,
+                                                 indices[0], value, indices[1],
+                                                 indices[2], indices[3])
+            else:
+                body.append(cls.__TAG_ROW_L0)
+                cls.__encodeitem(state, body, strings)
+        elif kind in cls.__ROWS:
+            body.append(cls.__ROWS[kind])
+            cls.__encodeitem(item.__getstate__(), body, strings)
+        elif kind is tuple or kind is list:
+            body += cls.__STR.pack(cls.__TAG_TUPLE if kind is tuple else cls.__TAG_LIST,
+                                   len(item))
+            for element in item:
+                cls.__encodeitem(element, body, strings)
+        elif kind is array:
+            raw = item.tobytes()
+            body += cls.__ARRAY.pack(cls.__TAG_ARRAY, item.typecode.encode('ascii'),
+                                     len(raw))
+            body += raw
+        elif kind is dict:
+            body += cls.__STR.pack(cls.__TAG_DICT, len(item))
+            for key, value in item.items():
+                cls.__encodeitem(key, body, strings)
+                cls.__encodeitem(value, body, strings)
+        elif kind is ExitObject:
+            body.append(cls.__TAG_EXIT)
+            cls.__encodeitem(item.toflow(), body, strings)
+            cls.__encodeitem(item.todata(), body, strings)
+            cls.__encodeitem(item.toui(), body, strings)
+        elif kind is MGPRowBatch:
+            body.append(cls.__TAG_BATCH)
+            for column in item.__getstate__():
+                cls.__encodeitem(column, body, strings)
+        elif kind is MGPGateCycle:
+            body.append(cls.__TAG_GATE_CYCLE)
+            for column in item.__getstate__():
+                cls.__encodeitem(column, body, strings)
+        else:
+            raise MGPError('MGPCodec.encode(): Type "{}" is not supported.'
+                           .format(kind.__name__))
+
+
+
+class CodecPipe(object):
+    """
+    CodecPipe class
+    ===============
+    This class wraps a multiprocessing connection to send and receive objects
+    in MGPCodec format with send_bytes() and recv_bytes() instead of pickle. It
+    has the same send(), poll() and recv() surface the areas use, so it can be
+    given to any area instead of the bare connection. With sendmany() many
+    objects travel in one message, the receiving side still gets them one by
+    one from recv().
+    """
+
+
+
+    def __init__(self, connection):
+        """
+        Initializes the class
+        ---------------------
+        @Params: connection (Connection)    The connection to wrap.
+        """
+
+        self.__connection = connection
+        self.__received = deque()
+
+
+
+    def close(self):
+        """
+        Closes the wrapped connection
+        -----------------------------
+        """
+
+        self.__connection.close()
+
+
+
+    def fileno(self):
+        """
+        Gets the file descriptor of the wrapped connection
+        --------------------------------------------------
+        @Return: (int)  The file descriptor.
+        """
+
+        return self.__connection.fileno()
+
+
+
+    def poll(self, timeout=0.0):
+        """
+        Gets whether there is data to receive
+        -------------------------------------
+        @Params: timeout    (float|NoneType)    [optional] Time in seconds to
+                                                wait for data, None to wait
+                                                without limit.
+        @Return: (bool)                         True if there is data to
+                                                receive, False if not.
+        """
+
+        return len(self.__received) > 0 or self.__connection.poll(timeout)
+
+
+
+    def recv(self):
+        """
+        Receives an object
+        ------------------
+        @Return: (object)   The next object in the order of sending.
+        """
+
+        while len(self.__received) == 0:
+            self.__received.extend(MGPCodec.decode(self.__connection.recv_bytes()))
+        return self.__received.popleft()
+
+
+
+    def recvmany(self):
+        """
+        Receives every object that is available without waiting
+        -------------------------------------------------------
+        @Return: (list) The received objects in the order of sending.
+        """
+
+        while self.__connection.poll():
+            self.__received.extend(MGPCodec.decode(self.__connection.recv_bytes()))
+        result = list(self.__received)
+        self.__received.clear()
+        return result
+
+
+
+    def send(self, element):
+        """
+        Sends an object
+        ---------------
+        @Params: element    (object)    The object to send.
+        """
+
+        self.__connection.send_bytes(MGPCodec.encodeone(element))
+
+
+
+    def sendmany(self, elements):
+        """
+        Sends many objects in one message
+        ---------------------------------
+        Nothing is sent without objects, since poll() would report the empty
+        message while recv() waits for an object.
+        @Params: elements   (iterable)  The objects to send.
+        """
+
+        elements = list(elements)
+        if len(elements) > 0:
+            self.__connection.send_bytes(MGPCodec.encode(elements))
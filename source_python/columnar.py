@@ -0,0 +1,678 @@
+"""
+Medical Gateway Platform - Columnar
+===================================
+
+This module is part of the MGP library.
+"""
+
+
+
+from array import array
+from common import MGPError
+from struct import Struct, error as StructError
+
+
+
+class MGPChunk(object):
+    """
+    MGPChunk class
+    ==============
+    This class provides a compressed columnar format for chunks of Zero Level
+    records. L0 rows are mostly numeric time series with regular timestamps
+    and a few repeating labels, units and equipments, so every column of a
+    chunk is compressed in the way that fits its content:
+        timestamp       Delta-of-delta encoding of int timestamps, a regular
+                        series costs one bit per sample. Float timestamps are
+                        compressed like float values.
+        value           Gorilla-style XOR compression of float values, delta-
+                        of-delta encoding of int values, any other mix of
+                        values is dictionary encoded.
+        label, unit,    Dictionary encoding with a string table of the chunk,
+        equipment,      the indices are run-length encoded.
+        event_type
+
+    The IDs of the records of a chunk are consecutive, so only the first ID is
+    stored.
+
+    Layout of a chunk:
+        header          magic (4 bytes), version (uint8), timestamp kind
+                        (uint8), value kind (uint8), count of records
+                        (uint32), first ID (uint64)
+        bounds          the smallest and the largest timestamp (2 x int64 or
+                        2 x double)
+        string table    count (uint32), then length (uint32) and UTF-8 content
+                        of every string
+        columns         length (uint32) and content of the timestamp, value,
+                        label, unit, equipment and event type columns
+
+    Chunks are written to files as frames, the length (uint32) and the content
+    of the chunk, readfile() reads them back. Decoded columns are arrays, so
+    numpy.frombuffer() turns the timestamp and the numeric value columns into
+    NumPy arrays without copying.
+    """
+
+
+
+    VERSION = 1
+
+    __MAGIC = b'MGPC'
+
+    __TIME_INT, __TIME_FLOAT = range(2)
+    __VALUE_FLOAT, __VALUE_INT, __VALUE_OBJECT = range(3)
+    __NONE, __FALSE, __TRUE, __INTEGER, __REAL, __STRING = range(6)
+
+    __BOUNDS = [Struct('<qq'), Struct('<dd')]
+    __HEADER = Struct('<4sBBBIQ')
+    __INT = Struct('<q')
+    __LENGTH = Struct('<I')
+    __REAL_CELL = Struct('<d')
+    __INT_MIN = -(1 << 63)
+    __INT_MAX = (1 << 63) - 1
+    __STRING_COLUMNS = ['label', 'unit', 'equipment', 'event_type']
+
+
+
+    def __init__(self, first_id, timestamps, values, labels, units, equipments,
+                 event_types):
+        """
+        Initializes the class
+        ---------------------
+        @Params: first_id       (int)       The ID of the first record.
+                 timestamps     (sequence)  Int or float timestamps.
+                 values         (sequence)  None, bool, int, float or string
+                                            values. Ints must fit in 64 bits.
+                 labels         (sequence)  String or None labels.
+                 units          (sequence)  String or None units.
+                 equipments     (sequence)  String or None equipment IDs.
+                 event_types    (sequence)  String or None event types.
+        @Throws: MGPError                   When the columns are empty, differ
+                                            in length or have content the
+                                            format can't hold.
+        """
+
+        count = len(timestamps)
+        if count == 0:
+            raise MGPError('MGPChunk: A chunk must have records.')
+        if any(len(column) != count for column in (values, labels, units, equipments,
+                                                   event_types)):
+            raise MGPError('MGPChunk: Columns must have the same length.')
+        if any(timestamp.__class__ is not int for timestamp in timestamps):
+            if any(timestamp.__class__ is not int and timestamp.__class__ is not float
+                   for timestamp in timestamps):
+                raise MGPError('MGPChunk: Timestamps must be int or float.')
+            timestamps = array('d', timestamps)
+        else:
+            try:
+                timestamps = array('q', timestamps)
+            except OverflowError:
+                raise MGPError('MGPChunk: Int timestamps must fit in 64 bits.')
+        if all(value.__class__ is float for value in values):
+            values = array('d', values)
+        elif all(value.__class__ is int and self.__INT_MIN <= value <= self.__INT_MAX
+                 for value in values):
+            values = array('q', values)
+        else:
+            for value in values:
+                if not (value is None or value.__class__ in (bool, float, str) or
+                        value.__class__ is int and self.__INT_MIN <= value <= self.__INT_MAX):
+                    raise MGPError('MGPChunk: Value "{}" can\'t be stored.'.format(value))
+            values = list(values)
+        strings = []
+        for column in (labels, units, equipments, event_types):
+            if any(text is not None and text.__class__ is not str for text in column):
+                raise MGPError('MGPChunk: Labels, units, equipments and event types must be strings or None.')
+            strings.append(list(column))
+        self.__first_id = first_id
+        self.__timestamps = timestamps
+        self.__values = values
+        self.__strings = dict(zip(self.__STRING_COLUMNS, strings))
+
+
+
+    def __len__(self):
+        """
+        Gets the count of records
+        -------------------------
+        @Return: (int)  The count of records of the chunk.
+        """
+
+        return len(self.__timestamps)
+
+
+
+    @staticmethod
+    def __bits(data):
+        """
+        Gets the bits of a column as text
+        ---------------------------------
+        Bit fields are read by slicing the text and parsing the slices, which
+        is much faster in Python than shifting the bits out of bytes.
+        @Params: data   (bytes alike)   The encoded column.
+        @Return: (string)               The bits as '0' and '1' characters,
+                                        padded with 72 zero bits.
+        """
+
+        return format(int.from_bytes(data, 'big'), '0{}b'.format(len(data) * 8)) + '0' * 72
+
+
+
+    @classmethod
+    def __decodedod(cls, data, count, typecode):
+        """
+        Decodes a delta-of-delta column
+        -------------------------------
+        @Params: data       (bytes alike)   The encoded column.
+                 count      (int)           The count of values.
+                 typecode   (string)        The typecode of the result.
+        @Return: (array)                    The values.
+        """
+
+        bits = cls.__bits(data)
+        value = int(bits[:64], 2)
+        if value >> 63:
+            value -= 1 << 64
+        result = array(typecode, [value])
+        append = result.append
+        position = 64
+        delta = 0
+        for _ in range(count - 1):
+            if bits[position] == '0':
+                position += 1
+                value += delta
+                append(value)
+                continue
+            if bits[position + 1] == '0':
+                zigzag = int(bits[position + 2:position + 9], 2)
+                position += 9
+            elif bits[position + 2] == '0':
+                zigzag = int(bits[position + 3:position + 12], 2)
+                position += 12
+            elif bits[position + 3] == '0':
+                zigzag = int(bits[position + 4:position + 16], 2)
+                position += 16
+            else:
+                zigzag = int(bits[position + 4:position + 76], 2)
+                position += 76
+            delta += (zigzag >> 1) ^ -(zigzag & 1)
+            value += delta
+            append(value)
+        return result
+
+
+
+    @classmethod
+    def __decodexor(cls, data, count):
+        """
+        Decodes a XOR compressed float column
+        -------------------------------------
+        @Params: data   (bytes alike)   The encoded column.
+                 count  (int)           The count of values.
+        @Return: (array)                The values.
+        """
+
+        bits = cls.__bits(data)
+        value = int(bits[:64], 2)
+        result = array('Q', [value])
+        append = result.append
+        position = 64
+        leading = trailing = 0
+        for _ in range(count - 1):
+            if bits[position] == '1':
+                if bits[position + 1] == '1':
+                    leading = int(bits[position + 2:position + 7], 2)
+                    meaningful = int(bits[position + 7:position + 13], 2) or 64
+                    trailing = 64 - leading - meaningful
+                    position += 13
+                else:
+                    meaningful = 64 - leading - trailing
+                    position += 2
+                value ^= int(bits[position:position + meaningful], 2) << trailing
+                position += meaningful
+            else:
+                position += 1
+            append(value)
+        return array('d', result.tobytes())
+
+
+
+    @classmethod
+    def __encodedod(cls, values):
+        """
+        Encodes a delta-of-delta column
+        -------------------------------
+        The change of the difference of neighbouring values is zigzag encoded
+        and written with the shortest of the prefixes 0 (no change), 10 (7
+        bits), 110 (9 bits), 1110 (12 bits) and 1111 (72 bits).
+        @Params: values (array) The int values.
+        @Return: (bytes)        The encoded column.
+        """
+
+        previous = values[0]
+        parts = [format(previous & 0xFFFFFFFFFFFFFFFF, '064b')]
+        append = parts.append
+        delta = 0
+        for value in values[1:]:
+            change = value - previous - delta
+            delta = value - previous
+            previous = value
+            if change == 0:
+                append('0')
+                continue
+            zigzag = change << 1 if change > 0 else (-change << 1) - 1
+            if zigzag < 128:
+                append(format(0x100 | zigzag, '09b'))
+            elif zigzag < 512:
+                append(format(0xC00 | zigzag, '012b'))
+            elif zigzag < 4096:
+                append(format(0xE000 | zigzag, '016b'))
+            else:
+                append('1111' + format(zigzag, '072b'))
+        return cls.__pack(parts)
+
+
+
+    @classmethod
+    def __encodexor(cls, values):
+        """
+        Encodes a XOR compressed float column
+        -------------------------------------
+        The bits of every value are XORed with the previous one. An equal value
+        is written as 0, a change that fits the window of meaningful bits of
+        the previous change as 10 and the bits of the window, other changes as
+        11, the count of leading zeros (5 bits), the count of meaningful bits
+        (6 bits) and the meaningful bits.
+        @Params: values (array) The float values.
+        @Return: (bytes)        The encoded column.
+        """
+
+        all_bits = array('Q', values.tobytes())
+        previous = all_bits[0]
+        parts = [format(previous, '064b')]
+        append = parts.append
+        window_leading = window_trailing = 64
+        for bits in all_bits[1:]:
+            xor = bits ^ previous
+            previous = bits
+            if xor == 0:
+                append('0')
+                continue
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if leading >= window_leading and trailing >= window_trailing:
+                append('10' + format(xor >> window_trailing,
+                                     '0{}b'.format(64 - window_leading - window_trailing)))
+            else:
+                meaningful = 64 - leading - trailing
+                append(format((((3 << 5) | leading) << 6) | (meaningful & 63), '013b') +
+                       format(xor >> trailing, '0{}b'.format(meaningful)))
+                window_leading = leading
+                window_trailing = trailing
+        return cls.__pack(parts)
+
+
+
+    @staticmethod
+    def __decoderuns(data, table):
+        """
+        Decodes a run-length encoded dictionary column
+        ----------------------------------------------
+        @Params: data   (bytes alike)   The varint pairs of index and length.
+                 table  (list)          The dictionary of the column.
+        @Return: (list)                 The values of the column.
+        """
+
+        result = []
+        numbers = []
+        number = shift = 0
+        for byte in data:
+            number |= (byte & 127) << shift
+            if byte & 128:
+                shift += 7
+            else:
+                numbers.append(number)
+                number = shift = 0
+        for index in range(0, len(numbers), 2):
+            result.extend([table[numbers[index]]] * numbers[index + 1])
+        return result
+
+
+
+    @staticmethod
+    def __encoderuns(indices):
+        """
+        Encodes a run-length encoded dictionary column
+        ----------------------------------------------
+        @Params: indices    (sequence)  The dictionary indices of the column.
+        @Return: (bytearray)            The varint pairs of index and length.
+        """
+
+        result = bytearray()
+        position = 0
+        count = len(indices)
+        while position < count:
+            index = indices[position]
+            end = position + 1
+            while end < count and indices[end] == index:
+                end += 1
+            for number in (index, end - position):
+                while number > 127:
+                    result.append((number & 127) | 128)
+                    number >>= 7
+                result.append(number)
+            position = end
+        return result
+
+
+
+    def column(self, name):
+        """
+        Gets a column of the chunk
+        --------------------------
+        @Params: name   (string)    The name of the column. It can be one of
+                                    'id', 'timestamp', 'value', 'label',
+                                    'unit', 'equipment' or 'event_type'.
+        @Return: (sequence)         The content of the column. Int timestamps
+                                    and values are arrays of 'q', float ones
+                                    arrays of 'd', other columns are lists.
+        @Throws: MGPError           When the column doesn't exist.
+        """
+
+        if name == 'id':
+            return range(self.__first_id, self.__first_id + len(self.__timestamps))
+        elif name == 'timestamp':
+            return self.__timestamps
+        elif name == 'value':
+            return self.__values
+        elif name in self.__strings:
+            return self.__strings[name]
+        else:
+            raise MGPError('MGPChunk.column(): Column "{}" doesn\'t exist.'
+                           .format(name))
+
+
+
+    @classmethod
+    def frombytes(cls, data):
+        """
+        Decodes a chunk
+        ---------------
+        @Params: data   (bytes alike)   The content of the chunk.
+        @Return: (MGPChunk)             The chunk.
+        @Throws: MGPError               When data is not a chunk of a known
+                                        version or it is truncated.
+        """
+
+        data = memoryview(data)
+        first_id, count, _, _ = cls.header(data)
+        _, _, time_kind, value_kind, _, _ = cls.__HEADER.unpack_from(data)
+        position = cls.__HEADER.size + cls.__BOUNDS[time_kind].size
+        try:
+            strings, position = cls.__readtable(data, position)
+            sections = []
+            for _ in range(6):
+                length, = cls.__LENGTH.unpack_from(data, position)
+                position += cls.__LENGTH.size
+                sections.append(data[position:position + length])
+                position += length
+                if position > len(data):
+                    raise StructError('section out of data')
+            if time_kind == cls.__TIME_INT:
+                timestamps = cls.__decodedod(sections[0], count, 'q')
+            else:
+                timestamps = cls.__decodexor(sections[0], count)
+            if value_kind == cls.__VALUE_FLOAT:
+                values = cls.__decodexor(sections[1], count)
+            elif value_kind == cls.__VALUE_INT:
+                values = cls.__decodedod(sections[1], count, 'q')
+            else:
+                table, start = cls.__readvalues(sections[1], 0)
+                values = cls.__decoderuns(sections[1][start:], table)
+            columns = [cls.__decoderuns(section, strings) for section in sections[2:]]
+        except (IndexError, StructError, UnicodeDecodeError) as error:
+            raise MGPError('MGPChunk.frombytes(): Chunk is truncated or damaged ({}).'
+                           .format(error))
+        chunk = cls.__new__(cls)
+        chunk.__first_id = first_id
+        chunk.__timestamps = timestamps
+        chunk.__values = values
+        chunk.__strings = dict(zip(cls.__STRING_COLUMNS, columns))
+        return chunk
+
+
+
+    @staticmethod
+    def __pack(parts):
+        """
+        Packs bits given as text
+        ------------------------
+        @Params: parts  (list)  Bit fields as '0' and '1' characters.
+        @Return: (bytes)        The bits, the last byte is padded with zero
+                                bits.
+        """
+
+        bits = ''.join(parts)
+        bits += '0' * (-len(bits) & 7)
+        return int(bits, 2).to_bytes(len(bits) >> 3, 'big') if bits else b''
+
+
+
+    def getfirstid(self):
+        """
+        Gets the ID of the first record
+        -------------------------------
+        @Return: (int)  The ID of the first record.
+        """
+
+        return self.__first_id
+
+
+
+    def gettimerange(self):
+        """
+        Gets the smallest and the largest timestamp
+        -------------------------------------------
+        @Return: (tuple)    The first and the last timestamp in time order.
+        """
+
+        return min(self.__timestamps), max(self.__timestamps)
+
+
+
+    @classmethod
+    def header(cls, data):
+        """
+        Decodes the header of a chunk
+        -----------------------------
+        Only the header is read, so the chunks of a time range can be found
+        without decoding their columns.
+        @Params: data   (bytes alike)   The content of the chunk.
+        @Return: (tuple)                The first ID, the count of records, the
+                                        smallest and the largest timestamp.
+        @Throws: MGPError               When data is not a chunk of a known
+                                        version.
+        """
+
+        try:
+            magic, version, time_kind, value_kind, count, first_id = cls.__HEADER.unpack_from(data)
+            if magic != cls.__MAGIC or version != cls.VERSION or time_kind > 1 or value_kind > 2:
+                raise MGPError('MGPChunk.header(): Data is not a version {} chunk.'
+                               .format(cls.VERSION))
+            lowest, highest = cls.__BOUNDS[time_kind].unpack_from(data, cls.__HEADER.size)
+        except StructError:
+            raise MGPError('MGPChunk.header(): Chunk is truncated.')
+        return first_id, count, lowest, highest
+
+
+
+    @classmethod
+    def __readtable(cls, data, position):
+        """
+        Reads a string table
+        --------------------
+        @Params: data       (memoryview)    The content of the chunk.
+                 position   (int)           The position of the table.
+        @Return: (tuple)                    The strings with None at index 0
+                                            and the position after the table.
+        """
+
+        count, = cls.__LENGTH.unpack_from(data, position)
+        position += cls.__LENGTH.size
+        strings = [None]
+        for _ in range(count):
+            length, = cls.__LENGTH.unpack_from(data, position)
+            position += cls.__LENGTH.size
+            strings.append(str(data[position:position + length], 'utf-8'))
+            position += length
+        return strings, position
+
+
+
+    @classmethod
+    def __readvalues(cls, data, position):
+        """
+        Reads a value table
+        -------------------
+        @Params: data       (memoryview)    The value column.
+                 position   (int)           The position of the table.
+        @Return: (tuple)                    The values and the position after
+                                            the table.
+        """
+
+        count, = cls.__LENGTH.unpack_from(data, position)
+        position += cls.__LENGTH.size
+        values = []
+        for _ in range(count):
+            tag = data[position]
+            position += 1
+            if tag == cls.__NONE:
+                values.append(None)
+            elif tag == cls.__FALSE:
+                values.append(False)
+            elif tag == cls.__TRUE:
+                values.append(True)
+            elif tag == cls.__INTEGER:
+                values.append(cls.__INT.unpack_from(data, position)[0])
+                position += cls.__INT.size
+            elif tag == cls.__REAL:
+                values.append(cls.__REAL_CELL.unpack_from(data, position)[0])
+                position += cls.__REAL_CELL.size
+            else:
+                length, = cls.__LENGTH.unpack_from(data, position)
+                position += cls.__LENGTH.size
+                values.append(str(data[position:position + length], 'utf-8'))
+                position += length
+        return values, position
+
+
+
+    @classmethod
+    def readfile(cls, path):
+        """
+        Reads the chunks of a file
+        --------------------------
+        Reading stops at a torn frame at the end of the file.
+        @Params: path   (string)    The path of a file of chunk frames.
+        @Return: (generator)        MGPChunk chunks in the order of the file.
+        """
+
+        with open(path, 'rb') as file:
+            while True:
+                prefix = file.read(cls.__LENGTH.size)
+                if len(prefix) < cls.__LENGTH.size:
+                    return
+                length, = cls.__LENGTH.unpack(prefix)
+                data = file.read(length)
+                if len(data) < length:
+                    return
+                yield cls.frombytes(data)
+
+
+
+    def tobytes(self):
+        """
+        Encodes the chunk
+        -----------------
+        @Return: (bytes)    The content of the chunk.
+        """
+
+        timestamps = self.__timestamps
+        values = self.__values
+        strings = [None]
+        string_ids = {None: 0}
+        indices = []
+        for name in self.__STRING_COLUMNS:
+            column = []
+            for text in self.__strings[name]:
+                index = string_ids.get(text)
+                if index is None:
+                    index = string_ids[text] = len(strings)
+                    strings.append(text)
+                column.append(index)
+            indices.append(column)
+        if timestamps.typecode == 'q':
+            time_kind = self.__TIME_INT
+            time_column = self.__encodedod(timestamps)
+        else:
+            time_kind = self.__TIME_FLOAT
+            time_column = self.__encodexor(timestamps)
+        if values.__class__ is array and values.typecode == 'd':
+            value_kind = self.__VALUE_FLOAT
+            value_column = self.__encodexor(values)
+        elif values.__class__ is array:
+            value_kind = self.__VALUE_INT
+            value_column = self.__encodedod(values)
+        else:
+            value_kind = self.__VALUE_OBJECT
+            table = []
+            table_ids = {}
+            value_indices = []
+            for value in values:
+                key = (value.__class__, value)
+                index = table_ids.get(key)
+                if index is None:
+                    index = table_ids[key] = len(table)
+                    table.append(value)
+                value_indices.append(index)
+            value_column = bytearray(self.__LENGTH.pack(len(table)))
+            for value in table:
+                if value is None:
+                    value_column.append(self.__NONE)
+                elif value is False:
+                    value_column.append(self.__FALSE)
+                elif value is True:
+                    value_column.append(self.__TRUE)
+                elif value.__class__ is int:
+                    value_column.append(self.__INTEGER)
+                    value_column += self.__INT.pack(value)
+                elif value.__class__ is float:
+                    value_column.append(self.__REAL)
+                    value_column += self.__REAL_CELL.pack(value)
+                else:
+                    encoded = value.encode('utf-8')
+                    value_column.append(self.__STRING)
+                    value_column += self.__LENGTH.pack(len(encoded)) + encoded
+            value_column += self.__encoderuns(value_indices)
+        result = bytearray(self.__HEADER.pack(self.__MAGIC, self.VERSION, time_kind,
+                                              value_kind, len(timestamps), self.__first_id))
+        result += self.__BOUNDS[time_kind].pack(*self.gettimerange())
+        result += self.__LENGTH.pack(len(strings) - 1)
+        for text in strings[1:]:
+            encoded = text.encode('utf-8')
+            result += self.__LENGTH.pack(len(encoded)) + encoded
+        for section in [time_column, value_column] + [self.__encoderuns(column)
+                                                      for column in indices]:
+            result += self.__LENGTH.pack(len(section)) + section
+        return bytes(result)
+
+
+
+    def toframe(self):
+        """
+        Encodes the chunk as a frame
+        ----------------------------
+        @Return: (bytes)    The length and the content of the chunk, like
+                            readfile() reads them.
+        """
+
+        data = self.tobytes()
+        return self.__LENGTH.pack(len(data)) + data
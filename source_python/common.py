@@ -7,6 +7,15 @@ This module is part of the MGP library.
 
 
 
+from array import array
+from atexit import register
+from bisect import bisect_left
+from multiprocessing.connection import wait
+from sys import intern, stderr
+from time import monotonic, time_ns
+
+
+
 class ExitObject(object):
     """
     ExitObject class
@@ -19,6 +28,10 @@ class ExitObject(object):
 
 
 
+    __slots__ = ('__to_flow', '__to_data', '__to_ui')
+
+
+
     def __init__(self, to_flow, to_data, to_ui):
         """
         Iniializes the class
@@ -52,7 +65,7 @@ class ExitObject(object):
         @Return: (MGPDataRowL*) Data to be sent.
         """
 
-        return selft.__to_flow
+        return self.__to_flow
 
 
 
@@ -79,6 +92,10 @@ class MGPData(object):
     """
 
 
+
+    __slots__ = ('__label', '__value', '__unit')
+
+
     def __init__(self, label, value, unit):
         """
         Iniializes the class
@@ -139,12 +156,17 @@ class MGPDataRowL0(object):
     be set at the instantiation. As a data storage helper tool it can be
     finalized with getting the storage record id or it can be filtered.
 
-    This class has custom implementation of deconstruction. If tried to
-    deconstruct without finalization it throws an error.
+    Instances are counted by MGPLedger at creation and at finalization, so rows
+    that are deleted without finalization are reported by the ledger.
     """
 
 
 
+    __slots__ = ('__timestamp', '__data', '__equipment_id', '__event_type',
+                 '__is_filtered', '__id', '__handed_off')
+
+
+
     def __init__(self, timestamp, data, equipment_id, event_type):
         """
         Initializes the class
@@ -167,21 +189,46 @@ class MGPDataRowL0(object):
         else:
             raise MGPError('MGPDataRowL0: Parameter data must be instance of MGPData.')
         self.__equipment_id = equipment_id
-        self.__evemt_type = event_type
+        self.__event_type = event_type
         self.__is_filtered = False
         self.__id = None
+        self.__handed_off = False
+        MGPLedger.created[0] += 1
 
 
 
-    def __del__(self):
+    def __getstate__(self):
         """
-        Handles instance's deconstruction
-        ---------------------------------
-        @Throws MGPError    When instance is not finalized yet.
+        Gets the state of the instance for pickling
+        -------------------------------------------
+        An unfinalized row that is pickled to be sent through a pipe is handed
+        over to the receiving process, so it is counted as transferred.
+        @Return: (tuple)    The content of the row.
+        """
+
+        if not (self.__handed_off or self.__is_filtered or self.__id is not None):
+            self.__handed_off = True
+            MGPLedger.transferred[0] += 1
+        return (self.__timestamp, self.__data, self.__equipment_id,
+                self.__event_type, self.__is_filtered, self.__id)
+
+
+
+    def __setstate__(self, state):
+        """
+        Sets the state of the instance after unpickling
+        -----------------------------------------------
+        @Params: state  (tuple) The content of the row.
         """
 
-        if not (self.__is_filtered or slef.__id is not None):
-            raise MGPError('MGPDataRowL0: tried to delete a record without use.')
+        (self.__timestamp, self.__data, self.__equipment_id, self.__event_type,
+         self.__is_filtered, self.__id) = state
+        if MGPLedger.owner:
+            self.__handed_off = False
+            if not (self.__is_filtered or self.__id is not None):
+                MGPLedger.received[0] += 1
+        else:
+            self.__handed_off = True
 
 
 
@@ -195,10 +242,15 @@ class MGPDataRowL0(object):
                                         NoneType.
         """
 
+        if not (self.__handed_off or self.__is_filtered or self.__id is not None):
+            if result is not None:
+                MGPLedger.stored[0] += 1
+            else:
+                MGPLedger.filtered[0] += 1
         if result is not None:
             self.__id = result
         else:
-            slef.__is_filtered = True
+            self.__is_filtered = True
 
 
 
@@ -220,7 +272,7 @@ class MGPDataRowL0(object):
         @Return: (string)   The name of the event type stored in the row.
         """
 
-        return self.__evemt_type
+        return self.__event_type
 
 
 
@@ -247,6 +299,17 @@ class MGPDataRowL0(object):
 
 
 
+    def gettimestamp(self):
+        """
+        Gets the timestamp of the row
+        -----------------------------
+        @Return: (time alike)   The timestamp when the data was generated.
+        """
+
+        return self.__timestamp
+
+
+
     def getunit(self):
         """
         Gets the measurement unit of the stored data
@@ -290,12 +353,17 @@ class MGPDataRowL1(object):
     be set at the instantiation. As a data storage helper tool it can be
     finalized with getting the storage record id or it can be filtered.
 
-    This class has custom implementation of deconstruction. If tried to
-    deconstruct without finalization it throws an error.
+    Instances are counted by MGPLedger at creation and at finalization, so rows
+    that are deleted without finalization are reported by the ledger.
     """
 
 
 
+    __slots__ = ('__timestamp', '__data', '__l0_id', '__patient_id',
+                 '__patient_pwd', '__is_filtered', '__id', '__handed_off')
+
+
+
     def __init__(self, timestamp, data, l0_id=None, patient_id=None, patient_pwd=None):
         """
         Initializes the class
@@ -323,18 +391,43 @@ class MGPDataRowL1(object):
         self.__patient_pwd = patient_pwd
         self.__is_filtered = False
         self.__id = None
+        self.__handed_off = False
+        MGPLedger.created[1] += 1
 
 
 
-    def __del__(self):
+    def __getstate__(self):
         """
-        Handles instance's deconstruction
-        ---------------------------------
-        @Throws MGPError    When instance is not finalized yet.
+        Gets the state of the instance for pickling
+        -------------------------------------------
+        An unfinalized row that is pickled to be sent through a pipe is handed
+        over to the receiving process, so it is counted as transferred.
+        @Return: (tuple)    The content of the row.
+        """
+
+        if not (self.__handed_off or self.__is_filtered or self.__id is not None):
+            self.__handed_off = True
+            MGPLedger.transferred[1] += 1
+        return (self.__timestamp, self.__data, self.__l0_id, self.__patient_id,
+                self.__patient_pwd, self.__is_filtered, self.__id)
+
+
+
+    def __setstate__(self, state):
+        """
+        Sets the state of the instance after unpickling
+        -----------------------------------------------
+        @Params: state  (tuple) The content of the row.
         """
 
-        if not (self.__is_filtered or slef.__id is not None):
-            raise MGPError('MGPDataRowL1: tried to delete a record without use.')
+        (self.__timestamp, self.__data, self.__l0_id, self.__patient_id,
+         self.__patient_pwd, self.__is_filtered, self.__id) = state
+        if MGPLedger.owner:
+            self.__handed_off = False
+            if not (self.__is_filtered or self.__id is not None):
+                MGPLedger.received[1] += 1
+        else:
+            self.__handed_off = True
 
 
 
@@ -348,10 +441,15 @@ class MGPDataRowL1(object):
                                         NoneType.
         """
 
+        if not (self.__handed_off or self.__is_filtered or self.__id is not None):
+            if result is not None:
+                MGPLedger.stored[1] += 1
+            else:
+                MGPLedger.filtered[1] += 1
         if result is not None:
             self.__id = result
         else:
-            slef.__is_filtered = True
+            self.__is_filtered = True
 
 
 
@@ -406,6 +504,17 @@ class MGPDataRowL1(object):
 
 
 
+    def gettimestamp(self):
+        """
+        Gets the timestamp of the row
+        -----------------------------
+        @Return: (time alike)   The timestamp when the data was generated.
+        """
+
+        return self.__timestamp
+
+
+
     def getunit(self):
         """
         Gets the measurement unit of the stored data
@@ -449,12 +558,17 @@ class MGPDataRowL2(object):
     be set at the instantiation. As a data storage helper tool it can be
     finalized with getting the storage record id or it can be filtered.
 
-    This class has custom implementation of deconstruction. If tried to
-    deconstruct without finalization it throws an error.
+    Instances are counted by MGPLedger at creation and at finalization, so rows
+    that are deleted without finalization are reported by the ledger.
     """
 
 
 
+    __slots__ = ('__timestamp', '__data_ch1', '__data_ch2', '__l1_id',
+                 '__is_filtered', '__id', '__handed_off')
+
+
+
     def __init__(self, timestamp, data_ch1, data_ch2, l1_id=None):
         """
         Initializes the class
@@ -478,24 +592,49 @@ class MGPDataRowL2(object):
         else:
             raise MGPError('MGPDataRowL2: Parameter data channel #1 must be instance of MGPData or NoneType.')
         if isinstance(data_ch2, MGPData) or data_ch2 is None:
-            self.__data_ch1 = data_ch2
+            self.__data_ch2 = data_ch2
         else:
             raise MGPError('MGPDataRowL2: Parameter data channel #2 must be instance of MGPData or NoneType.')
         self.__l1_id = l1_id
         self.__is_filtered = False
         self.__id = None
+        self.__handed_off = False
+        MGPLedger.created[2] += 1
 
 
 
-    def __del__(self):
+    def __getstate__(self):
         """
-        Handles instance's deconstruction
-        ---------------------------------
-        @Throws MGPError    When instance is not finalized yet.
+        Gets the state of the instance for pickling
+        -------------------------------------------
+        An unfinalized row that is pickled to be sent through a pipe is handed
+        over to the receiving process, so it is counted as transferred.
+        @Return: (tuple)    The content of the row.
+        """
+
+        if not (self.__handed_off or self.__is_filtered or self.__id is not None):
+            self.__handed_off = True
+            MGPLedger.transferred[2] += 1
+        return (self.__timestamp, self.__data_ch1, self.__data_ch2,
+                self.__l1_id, self.__is_filtered, self.__id)
+
+
+
+    def __setstate__(self, state):
+        """
+        Sets the state of the instance after unpickling
+        -----------------------------------------------
+        @Params: state  (tuple) The content of the row.
         """
 
-        if not (self.__is_filtered or slef.__id is not None):
-            raise MGPError('MGPDataRowL0: tried to delete a record without use.')
+        (self.__timestamp, self.__data_ch1, self.__data_ch2, self.__l1_id,
+         self.__is_filtered, self.__id) = state
+        if MGPLedger.owner:
+            self.__handed_off = False
+            if not (self.__is_filtered or self.__id is not None):
+                MGPLedger.received[2] += 1
+        else:
+            self.__handed_off = True
 
 
 
@@ -509,10 +648,15 @@ class MGPDataRowL2(object):
                                         NoneType.
         """
 
+        if not (self.__handed_off or self.__is_filtered or self.__id is not None):
+            if result is not None:
+                MGPLedger.stored[2] += 1
+            else:
+                MGPLedger.filtered[2] += 1
         if result is not None:
             self.__id = result
         else:
-            slef.__is_filtered = True
+            self.__is_filtered = True
 
 
 
@@ -546,33 +690,46 @@ class MGPDataRowL2(object):
         Gets the label of the stored data
         ---------------------------------
         @Params: channel    (int)   The ID of the channel to get label from.
-        @Return: (string)           The actual label.
+        @Return: (string|NoneType)  The actual label or None if the channel
+                                    has no data.
         @Throws: MGPError           When non existing channel ID is given.
         """
 
         if channel == 1:
-            return self.__data_ch1.getlabel()
+            return self.__data_ch1.getlabel() if self.__data_ch1 is not None else None
         elif channel == 2:
-            return self.__data_ch2.getlabel()
+            return self.__data_ch2.getlabel() if self.__data_ch2 is not None else None
         else:
             raise MGPError('MGPDataRowL2.getlabel(): channel "{}" is not supported.'
                            .format(channel))
 
 
 
+    def gettimestamp(self):
+        """
+        Gets the timestamp of the row
+        -----------------------------
+        @Return: (time alike)   The timestamp when the data was generated.
+        """
+
+        return self.__timestamp
+
+
+
     def getunit(self, channel):
         """
         Gets the measurement unit of the stored data
         --------------------------------------------
         @Params: channel    (int)   The ID of the channel to get unit from.
-        @Return: (string)           The name of the measurement unit.
+        @Return: (string|NoneType)  The name of the measurement unit or None
+                                    if the channel has no data.
         @Throws: MGPError           When non existing channel ID is given.
         """
 
         if channel == 1:
-            return self.__data_ch1.getunit()
+            return self.__data_ch1.getunit() if self.__data_ch1 is not None else None
         elif channel == 2:
-            return self.__data_ch2.getunit()
+            return self.__data_ch2.getunit() if self.__data_ch2 is not None else None
         else:
             raise MGPError('MGPDataRowL2.getunit(): channel "{}" is not supported.'
                            .format(channel))
@@ -584,14 +741,16 @@ class MGPDataRowL2(object):
         Gets the value, amount of the stored data
         -----------------------------------------
         @Params: channel    (int)   The ID of the channel to get value from.
-        @Return: (string|int|float) The value of the measurement or action.
+        @Return: (string|int|float|NoneType)    The value of the measurement
+                                                or action, or None if the
+                                                channel has no data.
         @Throws: MGPError           When non existing channel ID is given.
         """
 
         if channel == 1:
-            return self.__data_ch1.getvalue()
+            return self.__data_ch1.getvalue() if self.__data_ch1 is not None else None
         elif channel == 2:
-            return self.__data_ch2.getvalue()
+            return self.__data_ch2.getvalue() if self.__data_ch2 is not None else None
         else:
             raise MGPError('MGPDataRowL2.getvalue(): channel "{}" is not supported.'
                            .format(channel))
@@ -619,12 +778,17 @@ class MGPDataRowL3(object):
     be set at the instantiation. As a data storage helper tool it can be
     finalized with getting the storage record id or it can be filtered.
 
-    This class has custom implementation of deconstruction. If tried to
-    deconstruct without finalization it throws an error.
+    Instances are counted by MGPLedger at creation and at finalization, so rows
+    that are deleted without finalization are reported by the ledger.
     """
 
 
 
+    __slots__ = ('__timestamp', '__l2_id', '__response', '__is_filtered',
+                 '__id', '__handed_off')
+
+
+
     def __init__(self, timestamp, l2_id, response):
         """
         Initializes the class
@@ -643,18 +807,43 @@ class MGPDataRowL3(object):
         self.__response = response
         self.__is_filtered = False
         self.__id = None
+        self.__handed_off = False
+        MGPLedger.created[3] += 1
 
 
 
-    def __del__(self):
+    def __getstate__(self):
         """
-        Handles instance's deconstruction
-        ---------------------------------
-        @Throws MGPError    When instance is not finalized yet.
+        Gets the state of the instance for pickling
+        -------------------------------------------
+        An unfinalized row that is pickled to be sent through a pipe is handed
+        over to the receiving process, so it is counted as transferred.
+        @Return: (tuple)    The content of the row.
         """
 
-        if not (self.__is_filtered or slef.__id is not None):
-            raise MGPError('MGPDataRowL0: tried to delete a record without use.')
+        if not (self.__handed_off or self.__is_filtered or self.__id is not None):
+            self.__handed_off = True
+            MGPLedger.transferred[3] += 1
+        return (self.__timestamp, self.__l2_id, self.__response,
+                self.__is_filtered, self.__id)
+
+
+
+    def __setstate__(self, state):
+        """
+        Sets the state of the instance after unpickling
+        -----------------------------------------------
+        @Params: state  (tuple) The content of the row.
+        """
+
+        (self.__timestamp, self.__l2_id, self.__response, self.__is_filtered,
+         self.__id) = state
+        if MGPLedger.owner:
+            self.__handed_off = False
+            if not (self.__is_filtered or self.__id is not None):
+                MGPLedger.received[3] += 1
+        else:
+            self.__handed_off = True
 
 
 
@@ -668,10 +857,15 @@ class MGPDataRowL3(object):
                                         NoneType.
         """
 
+        if not (self.__handed_off or self.__is_filtered or self.__id is not None):
+            if result is not None:
+                MGPLedger.stored[3] += 1
+            else:
+                MGPLedger.filtered[3] += 1
         if result is not None:
             self.__id = result
         else:
-            slef.__is_filtered = True
+            self.__is_filtered = True
 
 
 
@@ -709,6 +903,17 @@ class MGPDataRowL3(object):
 
 
 
+    def gettimestamp(self):
+        """
+        Gets the timestamp of the row
+        -----------------------------
+        @Return: (time alike)   The timestamp when the data was generated.
+        """
+
+        return self.__timestamp
+
+
+
     def is_filtered(self):
         """
         Gets whether the object is filtered or not
@@ -788,22 +993,1655 @@ class MGPFilter(object):
 
 
 
-class NullPipe(object):
+class MGPFinalizable(object):
     """
-    NullPipe class
-    ==============
-    This class provides endpoint-less alternative to multiprocessing.PipeConnection
-    class sending functionality. The goal of the class is to speed up the workflow
-    of the areas since no if junctions are needed to filter non-running data flows.
+    MGPFinalizable class
+    ====================
+    This class is the base of the columnar containers of many rows,
+    MGPGateCycle and MGPRowBatch. It keeps the ID and the filtered columns of
+    the rows and counts the rows in MGPLedger just like MGPDataRowL*
+    instances: a row is created when it is appended, unfinalized rows are
+    handed over to the receiving process when the container is pickled, and
+    the rows are finalized one by one or as a whole.
+
+    The subclasses add the ID and the filtered columns of a row with
+    _appendrow() and keep them in their pickled state with _handoff() and
+    _takeover().
     """
 
 
 
-    def send(self, arg):
+    def __init__(self, level):
         """
-        Does nothing
-        ------------
-        @Params: arg    (object)    Data to ignore.
+        Initializes the class
+        ---------------------
+        @Params: level  (int)   The storage level of the rows.
         """
 
-        pass
+        self.__level = level
+        self.__ids = []
+        self.__filtered = []
+        self.__handed_off = 0
+
+
+
+    def __len__(self):
+        """
+        Gets the count of rows
+        ----------------------
+        @Return: (int)  The count of rows in the container.
+        """
+
+        return len(self.__ids)
+
+
+
+    def __pending(self, start=0):
+        """
+        Gets the count of unfinalized rows
+        ----------------------------------
+        @Params: start  (int)   [optional] The position of the first row to
+                                count.
+        @Return: (int)          The count of rows that are neither stored nor
+                                filtered.
+        """
+
+        ids = self.__ids
+        filtered = self.__filtered
+        return sum(1 for i in range(start, len(ids))
+                   if ids[i] is None and not filtered[i])
+
+
+
+    def _appendrow(self):
+        """
+        Adds the ID and the filtered columns of a new row
+        -------------------------------------------------
+        The row is counted as created.
+        """
+
+        self.__ids.append(None)
+        self.__filtered.append(False)
+        MGPLedger.created[self.__level] += 1
+
+
+
+    def _handoff(self):
+        """
+        Hands over the rows for pickling
+        --------------------------------
+        Unfinalized rows of a container that is pickled to be sent through a
+        pipe are handed over to the receiving process, so they are counted as
+        transferred. Rows appended later are handed over by the next pickling.
+        @Return: (tuple)    The ID and the filtered columns.
+        """
+
+        count = len(self.__ids)
+        if self.__handed_off < count:
+            MGPLedger.transferred[self.__level] += self.__pending(self.__handed_off)
+            self.__handed_off = count
+        return self.__ids, self.__filtered
+
+
+
+    def _takeover(self, level, ids, filtered):
+        """
+        Takes over the rows after unpickling
+        ------------------------------------
+        In the process that owns the ledger the unfinalized rows are counted as
+        received.
+        @Params: level      (int)   The storage level of the rows.
+                 ids        (list)  The ID column.
+                 filtered   (list)  The filtered column.
+        """
+
+        self.__level = level
+        self.__ids = ids
+        self.__filtered = filtered
+        if MGPLedger.owner:
+            self.__handed_off = 0
+            MGPLedger.received[level] += self.__pending()
+        else:
+            self.__handed_off = len(ids)
+
+
+
+    def finalize(self, results):
+        """
+        Finalizes all rows
+        ------------------
+        @Params: results    (list|NoneType) The result of consumption of the
+                                            rows. It is a list of IDs (or None
+                                            values for filtered rows) in the
+                                            order of the rows, or None if all
+                                            rows are filtered.
+        @Throws: MGPError                   When the count of results doesn't
+                                            match the count of rows.
+        """
+
+        if results is None:
+            results = [None] * len(self.__ids)
+        elif len(results) != len(self.__ids):
+            raise MGPError('{}.finalize(): {} results given for {} rows.'
+                           .format(self.__class__.__name__, len(results), len(self.__ids)))
+        for i, result in enumerate(results):
+            self.finalizerow(i, result)
+
+
+
+    def finalizerow(self, index, result):
+        """
+        Finalizes a single row
+        ----------------------
+        @Params: index  (int)           The position of the row.
+                 result (int|NoneType)  The ID of the stored row or None if the
+                                        row is filtered.
+        """
+
+        if not (index < self.__handed_off or self.__filtered[index]
+                or self.__ids[index] is not None):
+            if result is not None:
+                MGPLedger.stored[self.__level] += 1
+            else:
+                MGPLedger.filtered[self.__level] += 1
+        if result is not None:
+            self.__ids[index] = result
+        else:
+            self.__filtered[index] = True
+
+
+
+    def getids(self):
+        """
+        Gets the IDs of the rows
+        ------------------------
+        @Return: (list) IDs of the rows or None values for rows without ID.
+        """
+
+        return self.__ids
+
+
+
+    def getlevel(self):
+        """
+        Gets the storage level of the rows
+        ----------------------------------
+        @Return: (int)  The storage level of the rows.
+        """
+
+        return self.__level
+
+
+
+    def is_filteredrow(self, index):
+        """
+        Gets whether a row is filtered or not
+        -------------------------------------
+        @Params: index  (int)   The position of the row.
+        @Return: (bool)         True if the row is filtered, False if not.
+        """
+
+        return self.__filtered[index]
+
+
+
+    def is_finalized(self):
+        """
+        Gets whether every row is finalized or not
+        ------------------------------------------
+        @Return: (bool) True if every row is stored or filtered, False if not.
+        """
+
+        return self.__pending() == 0
+
+
+
+class MGPGateCycle(MGPFinalizable):
+    """
+    MGPGateCycle class
+    ==================
+    This class holds the gate decisions of a single AreaOfGates cycle. Each
+    opened gate is a Second Level database record with the label of the gate,
+    the channel whose data went through the gate and that data. Instead of one
+    MGPDataRowL2 per opened gate, a cycle is sent to the Data Area as a single
+    message. Decisions can be reached through light-weight views that have the
+    same "getter functions" as MGPDataRowL2.
+
+    The cycle is finalized as a whole with the list of storage record ids, or
+    decision by decision through the views. Decisions are counted by MGPLedger
+    as level 2 rows.
+    """
+
+
+
+    class RowView(object):
+        """
+        MGPGateCycle.RowView class
+        ==========================
+        This class gives read access to a single decision of a cycle. Views
+        don't copy any data, they just point into the columns of the cycle.
+        """
+
+
+
+        def __init__(self, cycle, index):
+            """
+            Initializes the class
+            ---------------------
+            @Params: cycle  (MGPGateCycle)  The cycle that holds the decision.
+                     index  (int)           The position of the decision.
+            """
+
+            self.__cycle = cycle
+            self.__index = index
+
+
+
+        def __channeldata(self, channel, name):
+            """
+            Gets the data of a channel
+            --------------------------
+            @Params: channel    (int)       The ID of the channel.
+                     name       (string)    The name of the calling getter.
+            @Return: (MGPData|NoneType)     The data if the gate opened with
+                                            the channel, else None.
+            @Throws: MGPError               When non existing channel ID is
+                                            given.
+            """
+
+            if channel not in (1, 2):
+                raise MGPError('MGPGateCycle.RowView.{}(): channel "{}" is not supported.'
+                               .format(name, channel))
+            if channel == self.getchannel():
+                return self.getdata()
+            return None
+
+
+
+        def finalize(self, result):
+            """
+            Finalizes the decision
+            ----------------------
+            @Params: result (int|NoneType)  The result of consumption of the data.
+                                            If it is stored, the result is an ID.
+                                            If it is filtered, the result should
+                                            be NoneType.
+            """
+
+            self.__cycle.finalizerow(self.__index, result)
+
+
+
+        def getchannel(self):
+            """
+            Gets the channel of the decision
+            --------------------------------
+            @Return: (int)  1 if the gate opened with channel 1 data, 2 if with
+                            channel 2 data.
+            """
+
+            return self.__cycle.column('channel')[self.__index]
+
+
+
+        def getdata(self):
+            """
+            Gets the data that went through the gate
+            ----------------------------------------
+            @Return: (MGPData|NoneType) The data of the chosen channel.
+            """
+
+            return self.__cycle.column('data')[self.__index]
+
+
+
+        def getgate(self):
+            """
+            Gets the label of the gate
+            --------------------------
+            @Return: (string)   The label of the gate.
+            """
+
+            return self.__cycle.column('gate')[self.__index]
+
+
+
+        def getid(self):
+            """
+            Gets the ID of the row
+            ----------------------
+            @Return: (int|NoneType) If the ID of the row already exists, it
+                                    returns it, else it returns None.
+            """
+
+            return self.__cycle.getids()[self.__index]
+
+
+
+        def getl1id(self):
+            """
+            Gets L1 record ID
+            -----------------
+            @Return: (NoneType) Decisions of a cycle aren't inherited from an
+                                L1 row.
+            """
+
+            return None
+
+
+
+        def getlabel(self, channel):
+            """
+            Gets the label of the stored data
+            ---------------------------------
+            @Params: channel    (int)   The ID of the channel to get label from.
+            @Return: (string|NoneType)  The actual label or None if the gate
+                                        didn't open with the channel.
+            @Throws: MGPError           When non existing channel ID is given.
+            """
+
+            data = self.__channeldata(channel, 'getlabel')
+            return data.getlabel() if data is not None else None
+
+
+
+        def gettimestamp(self):
+            """
+            Gets the timestamp of the decision
+            ----------------------------------
+            @Return: (time alike)   The timestamp of the cycle.
+            """
+
+            return self.__cycle.gettimestamp()
+
+
+
+        def getunit(self, channel):
+            """
+            Gets the measurement unit of the stored data
+            --------------------------------------------
+            @Params: channel    (int)   The ID of the channel to get unit from.
+            @Return: (string|NoneType)  The name of the measurement unit or None
+                                        if the gate didn't open with the channel.
+            @Throws: MGPError           When non existing channel ID is given.
+            """
+
+            data = self.__channeldata(channel, 'getunit')
+            return data.getunit() if data is not None else None
+
+
+
+        def getvalue(self, channel):
+            """
+            Gets the value, amount of the stored data
+            -----------------------------------------
+            @Params: channel    (int)   The ID of the channel to get value from.
+            @Return: (string|int|float|NoneType)    The value of the measurement
+                                                    or action, or None if the
+                                                    gate didn't open with the
+                                                    channel.
+            @Throws: MGPError           When non existing channel ID is given.
+            """
+
+            data = self.__channeldata(channel, 'getvalue')
+            return data.getvalue() if data is not None else None
+
+
+
+        def is_filtered(self):
+            """
+            Gets whether the row is filtered or not
+            ---------------------------------------
+            @Return: (bool) True if the row is filtered, False if not.
+            """
+
+            return self.__cycle.is_filteredrow(self.__index)
+
+
+
+    def __init__(self, timestamp):
+        """
+        Initializes the class
+        ---------------------
+        @Params: timestamp  (time alike)    The timestamp of the cycle.
+        """
+
+        super().__init__(2)
+        self.__timestamp = timestamp
+        self.__gates = []
+        self.__channels = array('b')
+        self.__data = []
+
+
+
+    def __getitem__(self, index):
+        """
+        Gets a view of a decision
+        -------------------------
+        @Params: index  (int)               The position of the decision.
+        @Return: (MGPGateCycle.RowView)     The view of the decision.
+        """
+
+        if index < 0:
+            index += len(self.__gates)
+        if not 0 <= index < len(self.__gates):
+            raise IndexError('MGPGateCycle: decision index out of range.')
+        return MGPGateCycle.RowView(self, index)
+
+
+
+    def __getstate__(self):
+        """
+        Gets the state of the instance for pickling
+        -------------------------------------------
+        Unfinalized decisions of a cycle that is pickled to be sent through a
+        pipe are handed over to the receiving process, so they are counted as
+        transferred.
+        @Return: (tuple)    The timestamp and the columns of the cycle: gate,
+                            channel, data, ID and filtered.
+        """
+
+        ids, filtered = self._handoff()
+        return (self.__timestamp, self.__gates, self.__channels, self.__data, ids, filtered)
+
+
+
+    def __iter__(self):
+        """
+        Iterates over views of the decisions
+        ------------------------------------
+        @Return: (generator)    Views of the decisions in order.
+        """
+
+        for i in range(len(self.__gates)):
+            yield MGPGateCycle.RowView(self, i)
+
+
+
+    def __setstate__(self, state):
+        """
+        Sets the state of the instance after unpickling
+        -----------------------------------------------
+        @Params: state  (tuple) The content of the cycle.
+        """
+
+        (self.__timestamp, self.__gates, self.__channels, self.__data, ids,
+         filtered) = state
+        self._takeover(2, ids, filtered)
+
+
+
+    def append(self, gate, channel, data):
+        """
+        Appends a decision to the cycle
+        -------------------------------
+        @Params: gate       (string)            The label of the opened gate.
+                 channel    (int)               The channel whose data went
+                                                through the gate, 1 or 2.
+                 data       (MGPData|NoneType)  The data of the channel.
+        """
+
+        self.__gates.append(gate)
+        self.__channels.append(channel)
+        self.__data.append(data)
+        self._appendrow()
+
+
+
+    def column(self, name):
+        """
+        Gets a column of the cycle
+        --------------------------
+        @Params: name   (string)    The name of the column. It can be one of
+                                    'gate', 'channel' or 'data'.
+        @Return: (sequence)         The content of the column, not a copy.
+        @Throws: MGPError           When the column doesn't exist.
+        """
+
+        if name == 'gate':
+            return self.__gates
+        elif name == 'channel':
+            return self.__channels
+        elif name == 'data':
+            return self.__data
+        else:
+            raise MGPError('MGPGateCycle.column(): Column "{}" doesn\'t exist.'
+                           .format(name))
+
+
+
+    def gettimestamp(self):
+        """
+        Gets the timestamp of the cycle
+        -------------------------------
+        @Return: (time alike)   The timestamp of the cycle.
+        """
+
+        return self.__timestamp
+
+
+
+class MGPJournal(object):
+    """
+    MGPJournal class
+    ================
+    This class holds the elements that AreaOfGates received, together with the
+    time of receiving in nanoseconds, for the channel 1 handler. A retention
+    policy keeps the journal bounded: elements older than max_age and the
+    oldest elements beyond max_entries are evicted from the front.
+
+    Elements and timestamps are kept in two parallel lists with a moving start
+    position. Evicted elements are only cut off the lists in large chunks, so
+    both eviction and indexing cost O(1), and time ranges are found with a
+    binary search over the timestamps. Timestamps never decrease, a timestamp
+    earlier than the last one is raised to the last one.
+
+    Time ranges and slices are given as MGPJournal.View objects that don't copy
+    anything. A view is valid until the journal changes.
+    """
+
+
+
+    class View(object):
+        """
+        MGPJournal.View class
+        =====================
+        This class gives read access to a range of a journal without copying
+        the elements.
+        """
+
+
+
+        def __init__(self, elements, timestamps, start, end):
+            """
+            Initializes the class
+            ---------------------
+            @Params: elements   (list)  The elements of the journal.
+                     timestamps (list)  The timestamps of the journal.
+                     start      (int)   The position of the first element.
+                     end        (int)   The position after the last element.
+            """
+
+            self.__elements = elements
+            self.__timestamps = timestamps
+            self.__start = start
+            self.__end = end
+
+
+
+        def __getitem__(self, index):
+            """
+            Gets an element
+            ---------------
+            @Params: index  (int)   The position of the element in the view.
+            @Return: (object)       The element.
+            """
+
+            return self.__elements[self.__position(index)]
+
+
+
+        def __iter__(self):
+            """
+            Iterates over the elements
+            --------------------------
+            @Return: (generator)    Elements of the view from the oldest one.
+            """
+
+            elements = self.__elements
+            for i in range(self.__start, self.__end):
+                yield elements[i]
+
+
+
+        def __len__(self):
+            """
+            Gets the count of elements
+            --------------------------
+            @Return: (int)  The count of elements in the view.
+            """
+
+            return self.__end - self.__start
+
+
+
+        def __position(self, index):
+            """
+            Gets the position of an element in the lists of the journal
+            -----------------------------------------------------------
+            @Params: index  (int)   The position of the element in the view.
+            @Return: (int)          The position in the lists.
+            @Throws: IndexError     When index is out of range.
+            """
+
+            if index < 0:
+                index += self.__end - self.__start
+            if not 0 <= index < self.__end - self.__start:
+                raise IndexError('MGPJournal.View: index out of range.')
+            return self.__start + index
+
+
+
+        def gettimestamp(self, index):
+            """
+            Gets the time of receiving an element
+            -------------------------------------
+            @Params: index  (int)   The position of the element in the view.
+            @Return: (int)          The timestamp in nanoseconds.
+            """
+
+            return self.__timestamps[self.__position(index)]
+
+
+
+    __COMPACT_SIZE = 1024
+
+
+
+    def __init__(self, max_age=None, max_entries=None):
+        """
+        Initializes the class
+        ---------------------
+        @Params: max_age        (int|NoneType)  [optional] Time in nanoseconds
+                                                to keep elements, None to keep
+                                                them without time limit.
+                 max_entries    (int|NoneType)  [optional] Count of elements to
+                                                keep at most, None to keep any
+                                                count.
+        @Throws: MGPError                       When max_age or max_entries is
+                                                not positive.
+        """
+
+        if max_age is not None and max_age <= 0:
+            raise MGPError('MGPJournal: max_age must be positive or None but is "{}".'
+                           .format(max_age))
+        if max_entries is not None and max_entries <= 0:
+            raise MGPError('MGPJournal: max_entries must be positive or None but is "{}".'
+                           .format(max_entries))
+        self.__max_age = max_age
+        self.__max_entries = max_entries
+        self.__elements = []
+        self.__timestamps = []
+        self.__start = 0
+
+
+
+    def __getitem__(self, index):
+        """
+        Gets an element or a view of a slice
+        ------------------------------------
+        @Params: index  (int|slice)             The position of the element or
+                                                a slice without step.
+        @Return: (object|MGPJournal.View)       The element or the view.
+        @Throws: IndexError                     When index is out of range.
+                 MGPError                       When the slice has a step.
+        """
+
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise MGPError('MGPJournal: slices with step are not supported.')
+            start, end, _ = index.indices(len(self))
+            return MGPJournal.View(self.__elements, self.__timestamps,
+                                   self.__start + start, self.__start + max(start, end))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('MGPJournal: index out of range.')
+        return self.__elements[self.__start + index]
+
+
+
+    def __iter__(self):
+        """
+        Iterates over the elements
+        --------------------------
+        @Return: (generator)    Elements of the journal from the oldest one.
+        """
+
+        elements = self.__elements
+        for i in range(self.__start, len(elements)):
+            yield elements[i]
+
+
+
+    def __len__(self):
+        """
+        Gets the count of elements
+        --------------------------
+        @Return: (int)  The count of elements in the journal.
+        """
+
+        return len(self.__elements) - self.__start
+
+
+
+    def __drop(self, count):
+        """
+        Evicts elements from the front
+        ------------------------------
+        The lists are cut only when the evicted part is large and at least the
+        half of the lists, so each element is moved at most once on average.
+        @Params: count  (int)   The count of elements to evict.
+        """
+
+        self.__start += count
+        if (self.__start >= MGPJournal.__COMPACT_SIZE
+                and self.__start * 2 >= len(self.__elements)):
+            del self.__elements[:self.__start]
+            del self.__timestamps[:self.__start]
+            self.__start = 0
+
+
+
+    def append(self, element, timestamp=None):
+        """
+        Adds an element to the journal
+        ------------------------------
+        @Params: element    (object)        The element to add.
+                 timestamp  (int|NoneType)  [optional] The time of receiving in
+                                            nanoseconds, None for the current
+                                            time.
+        """
+
+        if timestamp is None:
+            timestamp = time_ns()
+        timestamps = self.__timestamps
+        if len(timestamps) > self.__start and timestamp < timestamps[-1]:
+            timestamp = timestamps[-1]
+        self.__elements.append(element)
+        timestamps.append(timestamp)
+        if self.__max_entries is not None and len(self) > self.__max_entries:
+            self.__drop(len(self) - self.__max_entries)
+
+
+
+    def between(self, start_ns=None, end_ns=None):
+        """
+        Gets the elements received in a time range
+        ------------------------------------------
+        @Params: start_ns   (int|NoneType)  [optional] The start of the range in
+                                            nanoseconds, the element received at
+                                            that time is included. None to start
+                                            with the oldest element.
+                 end_ns     (int|NoneType)  [optional] The end of the range in
+                                            nanoseconds, the element received at
+                                            that time is excluded. None to end
+                                            with the newest element.
+        @Return: (MGPJournal.View)          The view of the range.
+        """
+
+        timestamps = self.__timestamps
+        start = self.__start
+        end = len(timestamps)
+        if start_ns is not None:
+            start = bisect_left(timestamps, start_ns, start, end)
+        if end_ns is not None:
+            end = bisect_left(timestamps, end_ns, start, end)
+        return MGPJournal.View(self.__elements, timestamps, start, end)
+
+
+
+    def clear(self):
+        """
+        Evicts all elements
+        -------------------
+        """
+
+        del self.__elements[:]
+        del self.__timestamps[:]
+        self.__start = 0
+
+
+
+    def evict(self, now=None):
+        """
+        Evicts the elements older than max_age
+        --------------------------------------
+        @Params: now    (int|NoneType)  [optional] The current time in
+                                        nanoseconds, None to get it.
+        @Return: (int)                  The count of evicted elements.
+        """
+
+        if self.__max_age is None:
+            return 0
+        limit = (time_ns() if now is None else now) - self.__max_age
+        count = bisect_left(self.__timestamps, limit, self.__start) - self.__start
+        if count > 0:
+            self.__drop(count)
+        return count
+
+
+
+    def gettimestamp(self, index):
+        """
+        Gets the time of receiving an element
+        -------------------------------------
+        @Params: index  (int)   The position of the element.
+        @Return: (int)          The timestamp in nanoseconds.
+        @Throws: IndexError     When index is out of range.
+        """
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('MGPJournal: index out of range.')
+        return self.__timestamps[self.__start + index]
+
+
+
+    def last(self, milliseconds, now=None):
+        """
+        Gets the elements received in the last milliseconds
+        ----------------------------------------------------
+        @Params: milliseconds   (int|float)     The length of the time range.
+                 now            (int|NoneType)  [optional] The current time in
+                                                nanoseconds, None to get it.
+        @Return: (MGPJournal.View)              The view of the range.
+        """
+
+        if now is None:
+            now = time_ns()
+        return self.between(now - int(milliseconds * 1000000))
+
+
+
+class MGPLedger(object):
+    """
+    MGPLedger class
+    ===============
+    This class is the central finalization ledger of database records. Every
+    MGPDataRowL* instance and every row of an MGPRowBatch is counted per storage
+    level when it is created and when it is finalized as stored or filtered.
+    Rows that are pickled through a pipe before finalization are counted as
+    transferred by the sender and as received by the receiver process. The
+    difference of these counters is the count of outstanding rows, that could
+    be leaked rows at the end of the life-cycle of a process.
+
+    Only the process that owns the finalization of received rows counts them,
+    that is the process of DataArea, which sets owner to True. Other receivers,
+    like ProcessArea or the UI, pass rows on or drop them, so their received
+    rows are not counted at all and never show up as outstanding.
+
+    Counters are class level lists indexed by the storage level, so rows can
+    count themselves with a single increment. Leaks are reported on demand with
+    check() or report(), or at the shutdown of the interpreter.
+    """
+
+
+
+    LEVELS = 4
+
+    created = [0] * LEVELS
+    filtered = [0] * LEVELS
+    received = [0] * LEVELS
+    stored = [0] * LEVELS
+    transferred = [0] * LEVELS
+
+    owner = False
+
+    __report_at_exit = True
+
+
+
+    @classmethod
+    def check(cls):
+        """
+        Checks whether there are outstanding rows or not
+        ------------------------------------------------
+        @Throws: MGPError   When any level has outstanding rows.
+        """
+
+        outstanding = cls.outstanding()
+        if sum(outstanding) > 0:
+            raise MGPError('MGPLedger.check(): Rows without use per level: {}.'
+                           .format(outstanding))
+
+
+
+    @classmethod
+    def outstanding(cls, level_id=None):
+        """
+        Gets the count of outstanding rows
+        ----------------------------------
+        @Params: level_id   (int)   [optional] The identifier of the storage
+                                    level.
+        @Return: (int|list)         The count of created or received rows
+                                    that are neither finalized nor transferred
+                                    to another process on the given level, or
+                                    the list of counts of every level if no
+                                    level is given.
+        """
+
+        if level_id is None:
+            return [cls.outstanding(level) for level in range(cls.LEVELS)]
+        return (cls.created[level_id] + cls.received[level_id]
+                - cls.stored[level_id] - cls.filtered[level_id]
+                - cls.transferred[level_id])
+
+
+
+    @classmethod
+    def report(cls):
+        """
+        Gets the content of the ledger
+        ------------------------------
+        @Return: (dict) Counters of every level. Keys are the storage levels,
+                        values are dictionaries of counters.
+        """
+
+        return {level: {'created': cls.created[level],
+                        'received': cls.received[level],
+                        'stored': cls.stored[level],
+                        'filtered': cls.filtered[level],
+                        'transferred': cls.transferred[level],
+                        'outstanding': cls.outstanding(level)}
+                for level in range(cls.LEVELS)}
+
+
+
+    @classmethod
+    def reportatexit(cls, new_value=None):
+        """
+        Gets or sets whether leaks are reported at shutdown
+        ---------------------------------------------------
+        @Params: new_value  (bool)  [optional] True to report leaks at the
+                                    shutdown of the interpreter, False to stay
+                                    silent.
+        @Return: (bool)             The actual setting if no new value is given.
+        """
+
+        if new_value is not None:
+            cls.__report_at_exit = new_value
+        else:
+            return cls.__report_at_exit
+
+
+
+    @classmethod
+    def reset(cls):
+        """
+        Resets every counter of the ledger
+        ----------------------------------
+        """
+
+        for counter in (cls.created, cls.filtered, cls.received, cls.stored,
+                        cls.transferred):
+            counter[:] = [0] * cls.LEVELS
+
+
+
+    @classmethod
+    def shutdown(cls):
+        """
+        Reports outstanding rows at shutdown
+        ------------------------------------
+        This function is registered to run at the exit of the interpreter.
+        """
+
+        if cls.__report_at_exit:
+            outstanding = cls.outstanding()
+            if sum(outstanding) > 0:
+                print('MGPLedger: Rows without use per level: {}.'.format(outstanding),
+                      file=stderr)
+
+
+
+class MGPRowBatch(MGPFinalizable):
+    """
+    MGPRowBatch class
+    =================
+    This class holds many Zero Level or First Level database records in a
+    columnar way. Instead of one MGPDataRowL* object and one MGPData object per
+    sample, the batch keeps parallel arrays of timestamps, values and interned
+    label, unit and equipment identifiers, so thousands of rows can be moved
+    between areas as one object. Rows can be reached through light-weight views
+    that have the same "getter functions" as MGPDataRowL0 and MGPDataRowL1.
+
+    Integer timestamps are kept in an array of 64 bit integers and float
+    timestamps of a batch that starts with a float in an array of doubles.
+    A timestamp of another kind, like a float among integers or a datetime,
+    turns the column into a list, so no timestamp loses precision.
+
+    The batch is finalized as a whole with the list of storage record ids, or
+    row by row through the views. Rows of the batch are counted by MGPLedger
+    just like MGPDataRowL* instances.
+    """
+
+
+
+    class __Decoded(object):
+        """
+        MGPRowBatch.__Decoded class
+        ===========================
+        This class maps an interned column to its strings on access without
+        copying the column.
+        """
+
+
+
+        def __init__(self, indices, strings):
+            """
+            Initializes the class
+            ---------------------
+            @Params: indices    (array) Indices of the strings.
+                     strings    (list)  The string table.
+            """
+
+            self.__indices = indices
+            self.__strings = strings
+
+
+
+        def __getitem__(self, index):
+            """
+            Gets the string at a position
+            -----------------------------
+            @Params: index  (int)   The position in the column.
+            @Return: (string)       The string at the position.
+            """
+
+            return self.__strings[self.__indices[index]]
+
+
+
+        def __iter__(self):
+            """
+            Iterates over the strings of the column
+            ---------------------------------------
+            @Return: (generator)    Strings of the column in order.
+            """
+
+            strings = self.__strings
+            for index in self.__indices:
+                yield strings[index]
+
+
+
+        def __len__(self):
+            """
+            Gets the length of the column
+            -----------------------------
+            @Return: (int)  The count of the elements.
+            """
+
+            return len(self.__indices)
+
+
+
+    class RowView(object):
+        """
+        MGPRowBatch.RowView class
+        =========================
+        This class gives read access to a single row of a batch. Views don't
+        copy any data, they just point into the columns of the batch and index
+        them directly.
+        """
+
+
+
+        def __init__(self, batch, index, columns):
+            """
+            Initializes the class
+            ---------------------
+            @Params: batch      (MGPRowBatch)   The batch that holds the row.
+                     index      (int)           The position of the row in the
+                                                batch.
+                     columns    (tuple)         The columns of the batch:
+                                                timestamp, value, string table,
+                                                label, unit, equipment, event
+                                                type, L0 ID, patient ID and
+                                                patient password. The last
+                                                three are None at level 0.
+            """
+
+            self.__batch = batch
+            self.__index = index
+            self.__columns = columns
+
+
+
+        def finalize(self, result):
+            """
+            Finalizes the row
+            -----------------
+            @Params: result (int|NoneType)  The result of consumption of the data.
+                                            If it is stored, the result is an ID.
+                                            If it is filtered, the result should
+                                            be NoneType.
+            """
+
+            self.__batch.finalizerow(self.__index, result)
+
+
+
+        def getequipment(self):
+            """
+            Gets the equipment’s ID
+            -----------------------
+            @Return: (string|NoneType)  The ID of the equipment.
+            """
+
+            columns = self.__columns
+            return columns[2][columns[5][self.__index]]
+
+
+
+        def geteventtype(self):
+            """
+            Gets the type of the event
+            --------------------------
+            @Return: (string|NoneType)  The name of the event type.
+            """
+
+            columns = self.__columns
+            return columns[2][columns[6][self.__index]]
+
+
+
+        def getid(self):
+            """
+            Gets the ID of the row
+            ----------------------
+            @Return: (int|NoneType) If the ID of the row already exists, it
+                                    returns it, else it returns None.
+            """
+
+            return self.__batch.getids()[self.__index]
+
+
+
+        def getl0id(self):
+            """
+            Gets L0 record ID
+            -----------------
+            @Return: (int|NoneType) The ID of an L0 row from which the flow is
+                                    inherited or None.
+            """
+
+            l0_ids = self.__columns[7]
+            return l0_ids[self.__index] if l0_ids is not None else None
+
+
+
+        def getlabel(self):
+            """
+            Gets the label of the stored data
+            ---------------------------------
+            @Return: (string)   The acutal label.
+            """
+
+            columns = self.__columns
+            return columns[2][columns[3][self.__index]]
+
+
+
+        def getpatientid(self, patient_pwd=None):
+            """
+            Gets the patient’s ID
+            ---------------------
+            @Params: patient_pwd    (string)    The password the get the
+                                                patient’s ID.
+            @Return: (int|NoneType)             The ID of the patient if the
+                                                password matches, else None.
+            """
+
+            columns = self.__columns
+            if columns[8] is not None and patient_pwd == columns[9][self.__index]:
+                return columns[8][self.__index]
+            else:
+                return None
+
+
+
+        def gettimestamp(self):
+            """
+            Gets the timestamp of the row
+            -----------------------------
+            @Return: (time alike)   The timestamp when the data was generated.
+            """
+
+            return self.__columns[0][self.__index]
+
+
+
+        def getunit(self):
+            """
+            Gets the measurement unit of the stored data
+            --------------------------------------------
+            @Return: (string)   The name of the measurement unit.
+            """
+
+            columns = self.__columns
+            return columns[2][columns[4][self.__index]]
+
+
+
+        def getvalue(self):
+            """
+            Gets the value, amount of the stored data
+            -----------------------------------------
+            @Return: (string|int|float|bool)    The value of the measurement or
+                                                action.
+            """
+
+            return self.__columns[1][self.__index]
+
+
+
+        def is_filtered(self):
+            """
+            Gets whether the row is filtered or not
+            ---------------------------------------
+            @Return: (bool) True if the row is filtered, False if not.
+            """
+
+            return self.__batch.is_filteredrow(self.__index)
+
+
+
+    __LEVELS = [0, 1]
+
+
+
+    def __init__(self, level=0):
+        """
+        Initializes the class
+        ---------------------
+        @Params: level  (int)   [optional] The storage level of the rows. It
+                                must be 0 (MGPDataRowL0 alike rows) or 1
+                                (MGPDataRowL1 alike rows).
+        @Throws: MGPError       When level is not supported.
+        """
+
+        if level not in MGPRowBatch.__LEVELS:
+            raise MGPError('MGPRowBatch: level "{}" is not supported.'.format(level))
+        super().__init__(level)
+        self.__strings = [None]
+        self.__string_ids = {None: 0}
+        self.__timestamps = array('q')
+        self.__values = []
+        self.__labels = array('I')
+        self.__units = array('I')
+        self.__equipments = array('I')
+        self.__event_types = array('I')
+        self.__l0_ids = []
+        self.__patient_ids = []
+        self.__patient_pwds = []
+        self.__setcolumns()
+
+
+
+    def __getitem__(self, index):
+        """
+        Gets a view of a row
+        --------------------
+        @Params: index  (int)               The position of the row.
+        @Return: (MGPRowBatch.RowView)      The view of the row.
+        """
+
+        if index < 0:
+            index += len(self.__values)
+        if not 0 <= index < len(self.__values):
+            raise IndexError('MGPRowBatch: row index out of range.')
+        return MGPRowBatch.RowView(self, index, self.__columns)
+
+
+
+    def __getstate__(self):
+        """
+        Gets the state of the instance for pickling
+        -------------------------------------------
+        Unfinalized rows of a batch that is pickled to be sent through a pipe
+        are handed over to the receiving process, so they are counted as
+        transferred. Rows appended later are handed over by the next pickling.
+        @Return: (tuple)    The level, the string table and the columns of the
+                            batch: timestamp, value, label, unit, equipment,
+                            event type, L0 ID, patient ID, patient password,
+                            ID and filtered.
+        """
+
+        ids, filtered = self._handoff()
+        return (self.getlevel(), self.__strings, self.__timestamps, self.__values,
+                self.__labels, self.__units, self.__equipments, self.__event_types,
+                self.__l0_ids, self.__patient_ids, self.__patient_pwds, ids, filtered)
+
+
+
+    def __iter__(self):
+        """
+        Iterates over views of the rows
+        -------------------------------
+        @Return: (generator)    Views of the rows in order.
+        """
+
+        columns = self.__columns
+        for i in range(len(self.__values)):
+            yield MGPRowBatch.RowView(self, i, columns)
+
+
+
+    def __setstate__(self, state):
+        """
+        Sets the state of the instance after unpickling
+        -----------------------------------------------
+        @Params: state  (tuple) The content of the batch.
+        """
+
+        (level, self.__strings, self.__timestamps, self.__values, self.__labels,
+         self.__units, self.__equipments, self.__event_types, self.__l0_ids,
+         self.__patient_ids, self.__patient_pwds, ids, filtered) = state
+        self.__string_ids = {text: index for index, text in enumerate(self.__strings)}
+        self._takeover(level, ids, filtered)
+        self.__setcolumns()
+
+
+
+    def __intern(self, text):
+        """
+        Gets the index of a string in the string table of the batch
+        -----------------------------------------------------------
+        @Params: text   (string|NoneType)   The string to intern.
+        @Return: (int)                      The index of the string.
+        """
+
+        index = self.__string_ids.get(text)
+        if index is None:
+            index = len(self.__strings)
+            self.__strings.append(intern(text) if isinstance(text, str) else text)
+            self.__string_ids[text] = index
+        return index
+
+
+
+    def __setcolumns(self):
+        """
+        Sets the columns given to the row views
+        ---------------------------------------
+        Views created before keep the columns they got, a replaced timestamp
+        column still holds their rows.
+        """
+
+        level_1 = self.getlevel() == 1
+        self.__columns = (self.__timestamps, self.__values, self.__strings, self.__labels,
+                          self.__units, self.__equipments, self.__event_types,
+                          self.__l0_ids if level_1 else None,
+                          self.__patient_ids if level_1 else None,
+                          self.__patient_pwds if level_1 else None)
+
+
+
+    def append(self, timestamp, label, value, unit, equipment_id=None,
+               event_type=None, l0_id=None, patient_id=None, patient_pwd=None):
+        """
+        Appends a row to the batch
+        --------------------------
+        @Params: timestamp      (time alike)            The timestamp when the
+                                                        data was generated.
+                 label          (string)                The label of the data.
+                 value          (string|int|float|bool) The actual value.
+                 unit           (string)                The name of the
+                                                        measurement unit.
+                 equipment_id   (string)                [optional] The ID of the
+                                                        equipment (level 0).
+                 event_type     (string)                [optional] The type of
+                                                        the event (level 0).
+                 l0_id          (int)                   [optional] The ID of an
+                                                        L0 row (level 1).
+                 patient_id     (int)                   [optional] The ID of the
+                                                        patient (level 1).
+                 patient_pwd    (string)                [optional] The password
+                                                        to get the ID of the
+                                                        patient (level 1).
+        """
+
+        timestamps = self.__timestamps
+        if timestamps.__class__ is array:
+            kind = timestamp.__class__
+            typecode = 'q' if kind is int else 'd' if kind is float else None
+            if typecode != timestamps.typecode:
+                if typecode == 'd' and not timestamps:
+                    self.__timestamps = timestamps = array('d')
+                else:
+                    self.__timestamps = timestamps = list(timestamps)
+                self.__setcolumns()
+        timestamps.append(timestamp)
+        self.__values.append(value)
+        self.__labels.append(self.__intern(label))
+        self.__units.append(self.__intern(unit))
+        self.__equipments.append(self.__intern(equipment_id))
+        self.__event_types.append(self.__intern(event_type))
+        if self.getlevel() == 1:
+            self.__l0_ids.append(l0_id)
+            self.__patient_ids.append(patient_id)
+            self.__patient_pwds.append(patient_pwd)
+        self._appendrow()
+
+
+
+    def appendrow(self, row, patient_pwd=None):
+        """
+        Appends the content of a row object to the batch
+        ------------------------------------------------
+        @Params: row            (MGPDataRowL0|MGPDataRowL1) The row to copy into
+                                                            the batch. The row
+                                                            itself gets finalized
+                                                            as filtered, since its
+                                                            content lives on in
+                                                            the batch.
+                 patient_pwd    (string)                    [optional] The
+                                                            password to get the ID
+                                                            of the patient from an
+                                                            MGPDataRowL1 row.
+        @Throws: MGPError                           When the row doesn't fit the
+                                                    level of the batch.
+        """
+
+        level = self.getlevel()
+        if level == 0 and isinstance(row, MGPDataRowL0):
+            self.append(row.gettimestamp(), row.getlabel(), row.getvalue(),
+                        row.getunit(), equipment_id=row.getequipment(),
+                        event_type=row.geteventtype())
+        elif level == 1 and isinstance(row, MGPDataRowL1):
+            self.append(row.gettimestamp(), row.getlabel(), row.getvalue(),
+                        row.getunit(), l0_id=row.getl0id(),
+                        patient_id=row.getpatientid(patient_pwd),
+                        patient_pwd=patient_pwd)
+        else:
+            raise MGPError('MGPRowBatch.appendrow(): Row "{}" doesn\'t fit level {}.'
+                           .format(row.__class__.__name__, level))
+        row.finalize(None)
+
+
+
+    def column(self, name):
+        """
+        Gets a column of the batch
+        --------------------------
+        @Params: name   (string)    The name of the column. It can be one of
+                                    'timestamp', 'value', 'label', 'unit',
+                                    'equipment', 'event_type', 'l0_id',
+                                    'patient_id' or 'patient_pwd'.
+        @Return: (sequence)         The content of the column. Interned columns
+                                    are returned as a light-weight mapping
+                                    sequence and never as a copy.
+        @Throws: MGPError           When the column doesn't exist.
+        """
+
+        if name == 'timestamp':
+            return self.__timestamps
+        elif name == 'value':
+            return self.__values
+        elif name == 'label':
+            return MGPRowBatch.__Decoded(self.__labels, self.__strings)
+        elif name == 'unit':
+            return MGPRowBatch.__Decoded(self.__units, self.__strings)
+        elif name == 'equipment':
+            return MGPRowBatch.__Decoded(self.__equipments, self.__strings)
+        elif name == 'event_type':
+            return MGPRowBatch.__Decoded(self.__event_types, self.__strings)
+        elif name == 'l0_id':
+            return self.__l0_ids if self.getlevel() == 1 else [None] * len(self.__values)
+        elif name == 'patient_id':
+            return self.__patient_ids if self.getlevel() == 1 else [None] * len(self.__values)
+        elif name == 'patient_pwd':
+            return self.__patient_pwds if self.getlevel() == 1 else [None] * len(self.__values)
+        else:
+            raise MGPError('MGPRowBatch.column(): Column "{}" doesn\'t exist.'
+                           .format(name))
+
+
+
+    def extend(self, rows, patient_pwd=None):
+        """
+        Appends the content of many row objects to the batch
+        ----------------------------------------------------
+        @Params: rows           (iterable)  MGPDataRowL0 or MGPDataRowL1 objects.
+                 patient_pwd    (string)    [optional] The password to get the
+                                            ID of the patient from MGPDataRowL1
+                                            rows.
+        """
+
+        for row in rows:
+            self.appendrow(row, patient_pwd)
+
+
+
+class NullPipe(object):
+    """
+    NullPipe class
+    ==============
+    This class provides endpoint-less alternative to multiprocessing.PipeConnection
+    class sending functionality. The goal of the class is to speed up the workflow
+    of the areas since no if junctions are needed to filter non-running data flows.
+    """
+
+
+
+    def send(self, arg):
+        """
+        Does nothing
+        ------------
+        @Params: arg    (object)    Data to ignore.
+        """
+
+        pass
+
+
+
+def is_source(connection):
+    """
+    Checks whether an object can be used as a source pipe
+    -----------------------------------------------------
+    Areas accept multiprocessing.PipeConnection (or Connection on non-Windows
+    platforms) as source and any other object that provides the same poll() and
+    recv() surface, like CodecPipe.
+    @Params: connection (object)    The object to check.
+    @Return: (bool)                 True if the object has callable poll() and
+                                    recv() members, False if not.
+    """
+
+    return (callable(getattr(connection, 'poll', None))
+            and callable(getattr(connection, 'recv', None)))
+
+
+
+def wait_source(source, timeout):
+    """
+    Waits for data on a source
+    --------------------------
+    A source with a fileno() member is waited with
+    multiprocessing.connection.wait(), so the process sleeps in the kernel and
+    wakes up as soon as data arrives. Other sources are waited with
+    poll(timeout). Data that the source has buffered already is reported
+    without waiting.
+    @Params: source     (object)    Source with poll() and recv() members.
+             timeout    (float)     Time in seconds to wait at most.
+    @Return: (bool)                 True if there is data to receive, False if
+                                    the time is over.
+    """
+
+    if source.poll():
+        return True
+    if timeout <= 0:
+        return False
+    if callable(getattr(source, 'fileno', None)):
+        return len(wait([source], timeout)) > 0
+    return source.poll(timeout)
+
+
+
+def drain_source(source, receiver, timeout=0.0, batch_delay=0.0):
+    """
+    Receives a batch of data from a source
+    --------------------------------------
+    Every element the source has is given to receiver. With a timeout the
+    function waits for the first element. After the first element it goes on
+    receiving until batch_delay is over, so elements arriving shortly after
+    each other are handled together, but none waits more than batch_delay.
+    The end of batch_delay is checked after every element too, so a source
+    that never runs dry doesn't keep the caller, the rest is left for the next
+    call. With the defaults it only receives what is there already, like a
+    polling loop.
+    @Params: source         (object)    Source with poll() and recv() members.
+             receiver       (callable)  Function to call with each element.
+             timeout        (float)     [optional] Time in seconds to wait for
+                                        the first element.
+             batch_delay    (float)     [optional] Time in seconds to collect
+                                        elements after the first one.
+    @Return: (bool)                     True if anything was received, False if
+                                        not.
+    """
+
+    if not wait_source(source, timeout):
+        return False
+    batch_end = monotonic() + batch_delay
+    while True:
+        while source.poll():
+            receiver(source.recv())
+            if batch_delay and monotonic() >= batch_end:
+                return True
+        remaining = batch_end - monotonic()
+        if remaining <= 0 or not wait_source(source, remaining):
+            return True
+
+
+
+def row_samples(rows, patient_pwd=None):
+    """
+    Gets the numeric samples of rows
+    --------------------------------
+    A sample belongs to the series of the equipment ID and the label of its
+    row. Rows without equipment, like MGPDataRowL1 rows, belong to the series
+    of their patient ID and the label, rows without patient ID to the one of
+    None. Rows without numeric value, like actions with string or bool values,
+    NaN values and elements without getvalue() and getlabel() without
+    arguments, like MGPDataRowL2 rows, are skipped.
+    @Params: rows           (iterable)          MGPDataRowL0, MGPDataRowL1 or
+                                                their MGPRowBatch views, other
+                                                elements are skipped.
+             patient_pwd    (string|NoneType)   [optional] The password to get
+                                                the patient IDs.
+    @Return: (generator)                        Tuples of the key of the series,
+                                                the timestamp and the value of
+                                                the samples.
+    """
+
+    for row in rows:
+        try:
+            value = row.getvalue()
+            label = row.getlabel()
+        except (AttributeError, TypeError):
+            continue
+        if value.__class__ is not float and value.__class__ is not int or value != value:
+            continue
+        getequipment = getattr(row, 'getequipment', None)
+        owner = getequipment() if getequipment is not None else None
+        if owner is None:
+            getpatientid = getattr(row, 'getpatientid', None)
+            if getpatientid is not None:
+                owner = getpatientid(patient_pwd)
+        yield (owner, label), row.gettimestamp(), value
+
+
+
+register(MGPLedger.shutdown)
@@ -7,8 +7,28 @@ This module is part of the MGP library.
 
 
 
-from common import MGPError, NullPipe
+from array import array
+from atexit import register, unregister
+from bisect import bisect_left, bisect_right
+from codecs import iterdecode
+from collections import OrderedDict, deque
+from columnar import MGPChunk
+from common import (MGPData, MGPDataRowL0, MGPDataRowL1, MGPDataRowL2,
+                    MGPDataRowL3, MGPError, MGPGateCycle, MGPLedger, MGPRowBatch,
+                    NullPipe, drain_source, is_source)
+from csv import reader, writer
+from datetime import datetime
+from io import SEEK_END, StringIO
+from itertools import islice
+from mmap import ACCESS_READ, mmap
+from os import fsync, listdir, makedirs
+from os.path import getsize, join
+from pickle import HIGHEST_PROTOCOL, dumps, loads
+from sqlite3 import Error as SQLError, OperationalError, connect
+from struct import Struct, error as StructError, iter_unpack
+from threading import Condition, Lock, RLock, Thread
 from time import sleep, time_ns
+from zlib import crc32
 
 
 
@@ -24,6 +44,54 @@ class DataArea(object):
     functionality. However in Python DataArea.engine member could be called
     straight. To maintain a clean coding style it’s strongly recommended to use
     DataArea’s loop for data management.
+
+    The process of DataArea finalizes the rows it receives, so it sets
+    MGPLedger.owner to count them in the ledger.
+
+    The loop runs in one of two modes. In the fixed-interval mode the source is
+    polled once per loop_interval. In the event-driven mode the loop blocks on
+    the source and stores data as soon as it arrives.
+
+    With rollup the stored L0 and L1 rows are added to an MGPRollup, so the
+    history graphs of the UI can query buckets of time instead of every row.
+    The series of L1 rows belong to their patient ID, read with patient_pwd.
+
+    With a write-ahead log the rows of a cycle are appended to the log and
+    synced once before the engine stores them, so large groups of rows can be
+    committed by the engine without losing them at a crash. The next IDs of
+    the engine before the rows are stored are logged with them. When DataArea
+    starts, the log is replayed: rows the engine stored already are known by
+    its next IDs and skipped, so a replay can be repeated. At a checkpoint,
+    when the log reached wal_size bytes, the engine writes all pending records
+    and the log is emptied. The log is set in configdict besides the engine
+    settings:
+        wal         (string)    The path of the log file, None disables the
+                                log. Default is None.
+        wal_size    (int)       Size of the log in bytes that triggers a
+                                checkpoint. Default is 16 MiB.
+    The records written at a checkpoint are as durable as the fsync settings
+    of the engine make them.
+
+    With writers the loop only collects the rows and puts them to the bounded
+    queue of a pool of writer threads, which write, commit and checkpoint, so
+    a stalling engine doesn't hold back the loop and the areas upstream. The
+    engine is shared by the writers under the lock of DataArea, the class
+    level functions take it too. The rows are logged by the loop before they
+    are queued, so the write-ahead log covers the queue and the spill file,
+    and it is not emptied while batches are queued. The log entry of a cycle
+    is synced in the loop, so with a write-ahead log every cycle still waits
+    for one fsync of the log, only the engine writes are offloaded to the
+    writers. The pool is set in configdict:
+        writers     (int)       Count of writer threads, 0 writes in the loop.
+                                Default is 0.
+        queue_size  (int)       Count of batches, the rows of a level of a
+                                cycle, to queue at most. Default is 64.
+        overflow    (string)    The policy when the queue is full: 'block' to
+                                wait, 'spill' to pickle batches to the spill
+                                file or 'drop' to drop the lowest level first.
+                                Default is 'block'.
+        spill       (string)    The path of the spill file. Default is
+                                'mgp.spill'.
     """
 
 
@@ -33,24 +101,187 @@ class DataArea(object):
         DataArea.__DataAreaEngine class
         ===============================
         This class provides a wrapper for a DataArea.__EngineCSV,
-        DataArea.__EngineDoF or  DataArea.__EngineSQL engine, which serves the
-        actual data storage handling. The use of a wrapper has advantages in
-        simplification of type check and involves a future possibility to
-        improve the data management process workflow. The workflow itself
+        DataArea.__EngineDoF, DataArea.__EngineSQL or DataArea.__EngineChunk
+        engine, which serves the actual data storage handling. The use of a
+        wrapper has advantages in simplification of type check and involves a
+        future possibility to improve the data management process workflow. The workflow itself
         consists of basic data storage functionality based on CRUD model.
+
+        The wrapper can keep the recently created and read records in a
+        bounded LRU cache, keyed by the level and the ID of the record, so
+        repeated reads of the same records, like the ones of a dashboard, don't
+        reach the engine. Updated and deleted records are removed from the
+        cache. Updates can be held back in a write-behind buffer too, where
+        repeated updates of a record are coalesced into one write. The settings
+        are given in the configdict of the engine:
+            cache_size      (int)       Count of records to keep in the cache,
+                                        0 disables the cache. Default is 0.
+            write_behind    (int)       Longest time in milliseconds an update
+                                        may stay in the write-behind buffer,
+                                        None writes updates immediately.
+                                        Default is None.
+            lineage         (bool)      False to disable the lineage index
+                                        and its rebuild. Default is True.
+
+        Cached rows are shared between the readers, they should not be changed.
+
+        The parents of the records created, updated and deleted through the
+        wrapper are kept in a DataArea.LineageIndex, so trace_up() and
+        trace_down() walk the chain of a record with one lookup per level. The
+        index is rebuilt from the stored records of levels 1 to 3 when the
+        wrapper is created, the SQL engine reads them with one query per
+        level, the other engines read them record by record. Parents of
+        records that are not indexed are read from the records by trace_up().
         """
 
 
 
-        def __init__(self, engine):
+        __PARENT_GETTERS = [None, 'getl0id', 'getl1id', 'getl2id']
+
+
+
+        def __init__(self, engine, configdict=None):
             """
             Initializes the class
             ---------------------
-            @Params: engine (DataArea.__Engine***)  The instance of engine to
-                                                    work with.
+            @Params: engine     (DataArea.__Engine***)  The instance of engine to
+                                                        work with.
+                     configdict (dict)                  [optional] Settings of
+                                                        the cache.
+            @Throws: MGPError                           When a setting is not
+                                                        valid.
             """
 
+            configdict = configdict if configdict is not None else {}
             self.__engine = engine
+            self.__cache_size = configdict.get('cache_size', 0)
+            write_behind = configdict.get('write_behind')
+            self.__patient_pwd = configdict.get('patient_pwd')
+            if not isinstance(self.__cache_size, int) or self.__cache_size < 0:
+                raise MGPError('DataArea.__DataAreaEngine: cache_size must be a non-negative int but is "{}".'
+                               .format(self.__cache_size))
+            if write_behind is not None and write_behind < 0:
+                raise MGPError('DataArea.__DataAreaEngine: write_behind must be non-negative but is "{}".'
+                               .format(write_behind))
+            self.__write_behind = write_behind * 1000000 if write_behind is not None else None
+            self.__cache = OrderedDict()
+            self.__behind = {}
+            self.__behind_since = None
+            self.__counters = {'hits': 0, 'misses': 0, 'evictions': 0,
+                               'coalesced': 0}
+            self.__lineage = None
+            if configdict.get('lineage', True):
+                self.__lineage = DataArea.LineageIndex()
+                for level_id in range(1, 4):
+                    for record_id, parent_id in engine.parents(level_id):
+                        self.__lineage.add(level_id, record_id, parent_id)
+            if self.__write_behind is not None:
+                register(self.close)
+
+
+
+        def __cache_put(self, level_id, record_id, row):
+            """
+            Puts a row to the cache
+            -----------------------
+            The least recently used rows are evicted over the size of the cache.
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record_id  (int)           The ID of the record.
+                     row        (MGPDataRowL*)  The row of the record.
+            """
+
+            cache = self.__cache
+            cache[(level_id, record_id)] = row
+            cache.move_to_end((level_id, record_id))
+            while len(cache) > self.__cache_size:
+                cache.popitem(last=False)
+                self.__counters['evictions'] += 1
+
+
+
+        def __flush(self):
+            """
+            Writes the updates of the write-behind buffer
+            ---------------------------------------------
+            Records whose update failed are removed from the cache, since the
+            cache may hold the version of the update.
+            """
+
+            behind = self.__behind
+            self.__behind = {}
+            self.__behind_since = None
+            for (level_id, record_id), record in behind.items():
+                if not self.__engine.update(level_id, record_id, record):
+                    self.__cache.pop((level_id, record_id), None)
+
+
+
+        def __index(self, level_id, record_id, record):
+            """
+            Indexes the parent of a record
+            ------------------------------
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record_id  (int)           The ID of the record.
+                     record     (MGPDataRowL*)  The data of the record.
+            """
+
+            self.__lineage.remove(level_id, record_id)
+            getparent = getattr(record, self.__PARENT_GETTERS[level_id], None)
+            if getparent is not None:
+                self.__lineage.add(level_id, record_id, getparent())
+
+
+
+        def __parent(self, level_id, record_id):
+            """
+            Gets the parent of a record
+            ---------------------------
+            Records that are not indexed are read.
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (int|NoneType)     The ID of the parent record or None if
+                                        it is unknown.
+            """
+
+            if self.__lineage is not None:
+                parent_id = self.__lineage.parent(level_id, record_id)
+                if parent_id is not None:
+                    return parent_id
+            row = self.read(level_id, record_id)
+            if row is False:
+                return None
+            parent_id = getattr(row, self.__PARENT_GETTERS[level_id])()
+            return parent_id if parent_id.__class__ is int else None
+
+
+
+        def close(self):
+            """
+            Wraps the engine's close() function
+            -----------------------------------
+            Updates of the write-behind buffer are written before.
+            """
+
+            if self.__write_behind is not None:
+                unregister(self.close)
+            self.__flush()
+            self.__engine.close()
+
+
+
+        def commit(self, force=False):
+            """
+            Wraps the engine's commit() function
+            ------------------------------------
+            The updates of the write-behind buffer are written when the oldest
+            of them is due.
+            @Params: force  (bool)  [optional] True to write all pending records,
+                                    False to write the due ones only.
+            """
+
+            if self.__behind and (force or time_ns() - self.__behind_since >= self.__write_behind):
+                self.__flush()
+            self.__engine.commit(force)
 
 
 
@@ -64,7 +295,44 @@ class DataArea(object):
                                                 failure.
             """
 
-            return self.__engine.create(level_id, record)
+            record_id = self.__engine.create(level_id, record)
+            if self.__lineage is not None and level_id and record_id != -1:
+                self.__index(level_id, record_id, record)
+            if self.__cache_size and record_id != -1:
+                values = _record_values(level_id, record, self.__patient_pwd)
+                self.__cache_put(level_id, record_id,
+                                 _stored_row(level_id, record_id, values, self.__patient_pwd))
+            return record_id
+
+
+
+        def create_many(self, level_id, records):
+            """
+            Wraps the engine's create_many() function
+            -----------------------------------------
+            Only the last records that fit in the cache are cached.
+            @Params: level_id   (int)       The identifier of the storage level.
+                     records    (sequence)  MGPDataRowL* rows or views of the
+                                            level to store.
+            @Return: (list)                 The IDs of the records in order, -1
+                                            for the records that failed.
+            """
+
+            record_ids = self.__engine.create_many(level_id, records)
+            if self.__lineage is not None and level_id:
+                for record, record_id in zip(records, record_ids):
+                    if record_id != -1:
+                        self.__index(level_id, record_id, record)
+            if self.__cache_size:
+                first = max(len(record_ids) - self.__cache_size, 0)
+                patient_pwd = self.__patient_pwd
+                for index in range(first, len(record_ids)):
+                    record_id = record_ids[index]
+                    if record_id != -1:
+                        values = _record_values(level_id, records[index], patient_pwd)
+                        self.__cache_put(level_id, record_id,
+                                         _stored_row(level_id, record_id, values, patient_pwd))
+            return record_ids
 
 
 
@@ -77,7 +345,67 @@ class DataArea(object):
             @Return: (bool)             True if succeed, False if failed.
             """
 
-            return self.__engine.delete(level_id, record_id)
+            self.__behind.pop((level_id, record_id), None)
+            self.__cache.pop((level_id, record_id), None)
+            if not self.__engine.delete(level_id, record_id):
+                return False
+            if self.__lineage is not None and level_id in range(4):
+                self.__lineage.remove(level_id, record_id)
+            return True
+
+
+
+        def getcounters(self):
+            """
+            Gets the counters of the cache
+            ------------------------------
+            @Return: (dict)     The count of reads served by the cache (hits),
+                                of reads that reached the engine (misses), of
+                                rows evicted from the cache (evictions) and of
+                                updates coalesced in the write-behind buffer
+                                (coalesced).
+            """
+
+            return self.__counters.copy()
+
+
+
+        def getnextid(self, level_id):
+            """
+            Wraps the engine's getnextid() function
+            ---------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+            @Return: (int)              The ID the next created record of the
+                                        level gets, -1 if the level doesn't
+                                        exist.
+            """
+
+            return self.__engine.getnextid(level_id)
+
+
+
+        def query_range(self, level_id, start, end, equipment=None, label=None):
+            """
+            Wraps the engine's query_range() function
+            -----------------------------------------
+            Updates of the write-behind buffer are written before.
+            @Params: level_id   (int)               The identifier of the
+                                                    storage level.
+                     start      (time alike)        The first timestamp of the
+                                                    range.
+                     end        (time alike)        The last timestamp of the
+                                                    range.
+                     equipment  (string|NoneType)   [optional] The equipment of
+                                                    level 0 records to match.
+                     label      (string|NoneType)   [optional] The label of the
+                                                    records to match.
+            @Return: (generator)                    MGPDataRowL* rows of the
+                                                    range.
+            """
+
+            if self.__behind:
+                self.__flush()
+            return self.__engine.query_range(level_id, start, end, equipment, label)
 
 
 
@@ -85,12 +413,90 @@ class DataArea(object):
             """
             Wraps the engine's read() function
             ----------------------------------
+            Records in the write-behind buffer are read in their updated form.
             @Params: level_id   (int)   The identifier of the storage level.
                      record_id  (int)   The ID of the record.
             @Return: (MGPDataRowL*)     Data if succeed, False if failed.
             """
 
-            return self.__engine.read(level_id, record_id)
+            key = (level_id, record_id)
+            row = self.__cache.get(key)
+            if row is not None:
+                self.__cache.move_to_end(key)
+                self.__counters['hits'] += 1
+                return row
+            record = self.__behind.get(key)
+            if record is not None:
+                self.__counters['hits'] += 1
+                values = _record_values(level_id, record, self.__patient_pwd)
+                row = _stored_row(level_id, record_id, values, self.__patient_pwd)
+            else:
+                self.__counters['misses'] += 1
+                row = self.__engine.read(level_id, record_id)
+                if row is False:
+                    return row
+            if self.__cache_size:
+                self.__cache_put(level_id, record_id, row)
+            return row
+
+
+
+        def trace_down(self, level_id, record_ids):
+            """
+            Traces records to their descendants
+            -----------------------------------
+            @Params: level_id   (int)       The identifier of the storage level.
+                     record_ids (sequence)  The IDs of the records.
+            @Return: (list)                 A dictionary per record of the IDs
+                                            of the descendants by level, from
+                                            the level of the record to level 3.
+            @Throws: MGPError               When the lineage index is disabled.
+            """
+
+            if self.__lineage is None:
+                raise MGPError('DataArea.__DataAreaEngine.trace_down(): The lineage index is disabled.')
+            children = self.__lineage.children
+            result = []
+            for record_id in record_ids:
+                trace = {level_id: [record_id]}
+                for level in range(level_id, 3):
+                    trace[level + 1] = [child for parent_id in trace[level]
+                                        for child in children(level, parent_id)]
+                result.append(trace)
+            return result
+
+
+
+        def trace_up(self, level_id, record_ids):
+            """
+            Traces records to their ancestors
+            ---------------------------------
+            Parents shared by the records are looked up once.
+            @Params: level_id   (int)       The identifier of the storage level.
+                     record_ids (sequence)  The IDs of the records.
+            @Return: (list)                 A dictionary per record of the IDs
+                                            of the record and its ancestors by
+                                            level. A chain ends at the first
+                                            unknown parent.
+            """
+
+            known = [{} for _ in range(level_id + 1)]
+            result = []
+            for record_id in record_ids:
+                trace = {level_id: record_id}
+                level = level_id
+                while level > 0:
+                    parents = known[level]
+                    if record_id in parents:
+                        parent_id = parents[record_id]
+                    else:
+                        parent_id = parents[record_id] = self.__parent(level, record_id)
+                    if parent_id is None:
+                        break
+                    level -= 1
+                    record_id = trace[level] = parent_id
+                result.append(trace)
+            return result
 
 
 
@@ -98,13 +504,31 @@ class DataArea(object):
             """
             Wraps the engine's update() function
             ------------------------------------
+            With write-behind the update is only buffered, so True means that
+            the update is accepted, a failed write removes the record from the
+            cache later.
             @Params: level_id   (int)           The identifier of the storage level.
                      record_id  (int)           The ID of the record.
                      record     (MGPDataRowL*)  The data to update.
             @Return: (bool)                     True if succeed, False if failed.
             """
 
-            return self.__engine.update(level_id, record_id, record)
+            key = (level_id, record_id)
+            self.__cache.pop(key, None)
+            if self.__write_behind is None:
+                if not self.__engine.update(level_id, record_id, record):
+                    return False
+                if self.__lineage is not None and level_id in range(1, 4):
+                    self.__index(level_id, record_id, record)
+                return True
+            if self.__lineage is not None and level_id in range(1, 4):
+                self.__index(level_id, record_id, record)
+            if key in self.__behind:
+                self.__counters['coalesced'] += 1
+            elif not self.__behind:
+                self.__behind_since = time_ns()
+            self.__behind[key] = record
+            return True
 
 
 
@@ -112,91 +536,363 @@ class DataArea(object):
         """
         This class provides CSV endpoint to the data management workflow. The
         engine realizes basic data storage functionality based on CRUD model.
+
+        Every level is stored in its own append-only file, l0.csv to l3.csv in
+        the directory of the engine. Next to every data file a sidecar index,
+        l0.idx to l3.idx, holds the 8 byte offset of every record at the
+        position of its ID, so a read is a single seek in the index and a
+        single seek in the data file. Record IDs are assigned monotonically
+        from 1 per level.
+
+        Records are collected in memory and written with group commit: a level
+        is written when flush_rows records are pending or the oldest pending
+        record is older than flush_interval. DataArea calls commit() once per
+        cycle to let the time limit take effect. An update appends the new
+        version of the record and moves its index entry, a delete marks the
+        index entry only.
+
+        A DataArea.TimeIndex of every level finds the records of a time range
+        for query_range(), it is built in one pass over the data files when
+        the engine is opened.
+
+        Settings in configdict:
+            path            (string)    The directory of the files, it is
+                                        created if missing. Default is the
+                                        working directory.
+            flush_rows      (int)       Count of pending records that triggers
+                                        a write. Default is 100.
+            flush_interval  (int)       Longest time in milliseconds a record
+                                        may stay pending. Default is 1000.
+            fsync           (string)    'never' leaves the flushed data to the
+                                        operating system, 'commit' syncs every
+                                        write of a group, 'always' writes and
+                                        syncs at every call of create(),
+                                        create_many(), update() and delete().
+                                        Default is 'commit'.
+            index_stride    (int)       Count of records in a block of the time
+                                        index. Default is 256.
+            patient_pwd     (string)    The password to store the patient IDs
+                                        of L1 rows. Without it the patient IDs
+                                        are not stored.
+
+        Labels, units, equipments, event types, gates and responses are read
+        back as strings, other cells as the most specific type of int, float,
+        bool, datetime and string. Datetime timestamps are written in ISO
+        format.
         """
 
 
 
+        __COLUMNS = [['id', 'timestamp', 'label', 'value', 'unit', 'equipment_id',
+                      'event_type'],
+                     ['id', 'timestamp', 'label', 'value', 'unit', 'l0_id',
+                      'patient_id'],
+                     ['id', 'timestamp', 'l1_id', 'gate', 'ch1_label', 'ch1_value',
+                      'ch1_unit', 'ch2_label', 'ch2_value', 'ch2_unit'],
+                     ['id', 'timestamp', 'l2_id', 'response']]
+        __DELETED = 0xFFFFFFFFFFFFFFFF
+        __FSYNC_POLICIES = ['never', 'commit', 'always']
+        __OFFSET = Struct('<Q')
+        __TEXT_COLUMNS = [(2, 4, 5, 6), (2, 4), (3, 4, 6, 7, 9), (3,)]
+
+
+
         def __init__(self, configdict):
             """
             Initializes the class
             ---------------------
+            Indexed records whose data didn't reach the data file, like after a
+            crash between the two writes, are dropped from the index and a torn
+            last line of a data file is terminated.
             @Params: configdict (dict)  Settings to instantiate engine.
+            @Throws: MGPError           When a setting is not valid.
             """
 
-            pass
+            self.__path = configdict.get('path', '.')
+            stride = configdict.get('index_stride', 256)
+            self.__flush_rows = configdict.get('flush_rows', 100)
+            self.__flush_interval = configdict.get('flush_interval', 1000) * 1000000
+            self.__fsync = configdict.get('fsync', 'commit')
+            self.__patient_pwd = configdict.get('patient_pwd')
+            if self.__fsync not in self.__FSYNC_POLICIES:
+                raise MGPError('DataArea.__EngineCSV: fsync must be one of {} but is "{}".'
+                               .format(self.__FSYNC_POLICIES, self.__fsync))
+            for name, value in (('flush_rows', self.__flush_rows), ('index_stride', stride)):
+                if value < 1:
+                    raise MGPError('DataArea.__EngineCSV: {} must be positive but is "{}".'
+                                   .format(name, value))
+            makedirs(self.__path, exist_ok=True)
+            self.__buffer = StringIO()
+            self.__writer = writer(self.__buffer, lineterminator='\n')
+            self.__data_files = []
+            self.__index_files = []
+            self.__sizes = []
+            self.__counts = []
+            self.__next_ids = []
+            self.__pending_data = []
+            self.__pending_sizes = []
+            self.__pending_index = []
+            self.__pending_since = []
+            self.__indexes = []
+            for level_id, columns in enumerate(self.__COLUMNS):
+                data_file = open(join(self.__path, 'l{}.csv'.format(level_id)), 'a+b')
+                index_path = join(self.__path, 'l{}.idx'.format(level_id))
+                open(index_path, 'ab').close()
+                index_file = open(index_path, 'r+b')
+                size = data_file.seek(0, SEEK_END)
+                if size == 0:
+                    self.__writer.writerow(columns)
+                    size = data_file.write(self.__takeline())
+                    data_file.flush()
+                else:
+                    data_file.seek(size - 1)
+                    if data_file.read(1) != b'\n':
+                        size += data_file.write(b'\n')
+                        data_file.flush()
+                count = index_file.seek(0, SEEK_END) // 8
+                while count > 0:
+                    index_file.seek((count - 1) * 8)
+                    offset, = self.__OFFSET.unpack(index_file.read(8))
+                    if offset < size or offset == self.__DELETED:
+                        break
+                    count -= 1
+                index_file.truncate(count * 8)
+                self.__data_files.append(data_file)
+                self.__index_files.append(index_file)
+                self.__sizes.append(size)
+                self.__counts.append(count)
+                self.__next_ids.append(count + 1)
+                self.__pending_data.append([])
+                self.__pending_sizes.append(0)
+                self.__pending_index.append({})
+                self.__pending_since.append(None)
+                self.__indexes.append(DataArea.TimeIndex(stride))
+                self.__scanindex(level_id)
+            register(self.close)
 
 
 
-        def create(self, level_id, record):
+        def __append(self, level_id, record_id, record):
             """
-            Creates a new record in the database
-            ------------------------------------
+            Appends a record to the pending records of a level
+            --------------------------------------------------
             @Params: level_id   (int)           The identifier of the storage level.
+                     record_id  (int)           The ID of the record.
                      record     (MGPDataRowL*)  The data to store.
-            @Return: (int)                      The ID of the record or -1 in case of
-                                                failure.
             """
 
-            return -1
+            values = _record_values(level_id, record, self.__patient_pwd)
+            self.__indexes[level_id].add(record_id, values[0])
+            encode = self.__encode
+            self.__writer.writerow([record_id] + [encode(value) for value in values])
+            line = self.__takeline()
+            pending = self.__pending_data[level_id]
+            self.__pending_index[level_id][record_id] = (self.__sizes[level_id]
+                                                         + self.__pending_sizes[level_id])
+            pending.append(line)
+            self.__pending_sizes[level_id] += len(line)
+            if self.__pending_since[level_id] is None:
+                self.__pending_since[level_id] = time_ns()
 
 
 
-        def delete(self, level_id, record_id):
+        def __checklimit(self, level_id):
             """
-            Deletes a record from the database
-            ----------------------------------
+            Writes the pending records of a level that reached the row limit
+            ----------------------------------------------------------------
             @Params: level_id   (int)   The identifier of the storage level.
-                     record_id  (int)   The ID of the record.
-            @Return: (bool)             True if succeed, False if failed.
             """
 
-            return False
+            if (self.__fsync == 'always'
+                    or len(self.__pending_data[level_id]) >= self.__flush_rows):
+                self.__commit(level_id)
 
 
 
-        def read(self, level_id, record_id):
+        def __commit(self, level_id):
             """
-            Reads a record from the database
-            --------------------------------
+            Writes the pending records of a level
+            -------------------------------------
+            The data is written before the index, so an index entry never
+            points to data that is not written.
             @Params: level_id   (int)   The identifier of the storage level.
-                     record_id  (int)   The ID of the record.
-            @Return: (MGPDataRowL*)     Data if succeed, False if failed.
             """
 
-            return False
+            pending = self.__pending_data[level_id]
+            data_file = self.__data_files[level_id]
+            if pending:
+                data = b''.join(pending)
+                data_file.write(data)
+                data_file.flush()
+                if self.__fsync != 'never':
+                    fsync(data_file.fileno())
+                self.__sizes[level_id] += len(data)
+                self.__pending_sizes[level_id] = 0
+                pending.clear()
+            pending_index = self.__pending_index[level_id]
+            if pending_index:
+                index_file = self.__index_files[level_id]
+                count = self.__counts[level_id]
+                appended = []
+                for record_id in sorted(pending_index):
+                    if record_id > count:
+                        appended.append(self.__OFFSET.pack(pending_index[record_id]))
+                    else:
+                        index_file.seek((record_id - 1) * 8)
+                        index_file.write(self.__OFFSET.pack(pending_index[record_id]))
+                if appended:
+                    index_file.seek(count * 8)
+                    index_file.write(b''.join(appended))
+                index_file.flush()
+                if self.__fsync != 'never':
+                    fsync(index_file.fileno())
+                self.__counts[level_id] += len(appended)
+                pending_index.clear()
+            self.__pending_since[level_id] = None
 
 
 
-        def update(self, level_id, record_id, record):
+        @staticmethod
+        def __decode(cell):
             """
-            Updates a record in the database
-            --------------------------------
-            @Params: level_id   (int)           The identifier of the storage level.
-                     record_id  (int)           The ID of the record.
-                     record     (MGPDataRowL*)  The data to update.
-            @Return: (bool)                     True if succeed, False if failed.
+            Decodes a cell
+            --------------
+            @Params: cell   (string)                            The content of
+                                                                the cell.
+            @Return: (int|float|bool|datetime|string|NoneType)  The value.
             """
 
-            return False
+            if cell == '':
+                return None
+            if cell == 'True':
+                return True
+            if cell == 'False':
+                return False
+            try:
+                return int(cell)
+            except ValueError:
+                pass
+            try:
+                return float(cell)
+            except ValueError:
+                pass
+            try:
+                return datetime.fromisoformat(cell)
+            except ValueError:
+                return cell
 
 
 
-    class __EngineDoF(object):
-        """
-        This class provides DoF endpoint to the data management workflow. The
-        engine realizes basic data storage functionality based on CRUD model.
-        """
+        @staticmethod
+        def __encode(value):
+            """
+            Encodes a value to a cell
+            -------------------------
+            @Params: value  (any)   The value to encode.
+            @Return: (string)       The content of the cell.
+            """
 
+            if value is None:
+                return ''
+            if isinstance(value, datetime):
+                return value.isoformat()
+            if value.__class__ is float:
+                return repr(value)
+            return str(value)
 
 
-        def __init__(self, configdict):
+
+        def __offset(self, level_id, record_id):
             """
-            Initializes the class
-            ---------------------
-            @Params: configdict (dict)  Settings to instantiate engine.
+            Gets the offset of a record
+            ---------------------------
+            @Params: level_id   (int)       The identifier of the storage level.
+                     record_id  (int)       The ID of the record.
+            @Return: (int|NoneType)         The offset of the record in the
+                                            data file or None if the record
+                                            doesn't exist or is deleted.
+            """
+
+            if not 0 < record_id < self.__next_ids[level_id]:
+                return None
+            offset = self.__pending_index[level_id].get(record_id)
+            if offset is None:
+                index_file = self.__index_files[level_id]
+                index_file.seek((record_id - 1) * 8)
+                offset, = self.__OFFSET.unpack(index_file.read(8))
+            return offset if offset != self.__DELETED else None
+
+
+
+        def __scanindex(self, level_id):
+            """
+            Builds the time index of a level from the data file
+            ---------------------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+            """
+
+            data_file = self.__data_files[level_id]
+            time_index = self.__indexes[level_id]
+            count = self.__counts[level_id]
+            decode = self.__decode
+            data_file.seek(0)
+            rows = reader(iterdecode(iter(data_file.readline, b''), 'utf-8'))
+            next(rows, None)
+            for cells in rows:
+                try:
+                    record_id = int(cells[0])
+                    if record_id <= count:
+                        time_index.add(record_id, decode(cells[1]))
+                except (IndexError, TypeError, ValueError):
+                    continue
+
+
+
+        def __takeline(self):
+            """
+            Takes the line written to the buffer
+            ------------------------------------
+            @Return: (bytes)    The encoded line.
+            """
+
+            line = self.__buffer.getvalue().encode('utf-8')
+            self.__buffer.seek(0)
+            self.__buffer.truncate()
+            return line
+
+
+
+        def close(self):
+            """
+            Writes all pending records and closes the files
+            -----------------------------------------------
+            """
+
+            if self.__data_files:
+                self.commit(True)
+                for data_file in self.__data_files:
+                    data_file.close()
+                for index_file in self.__index_files:
+                    index_file.close()
+                self.__data_files = []
+                self.__index_files = []
+                unregister(self.close)
+
+
+
+        def commit(self, force=False):
+            """
+            Writes the pending records that are due
+            ---------------------------------------
+            @Params: force  (bool)  [optional] True to write all pending records,
+                                    False to write the levels only that reached
+                                    a limit.
             """
 
-            pass
+            now = time_ns()
+            for level_id, since in enumerate(self.__pending_since):
+                if since is not None and (force or now - since >= self.__flush_interval):
+                    self.__commit(level_id)
 
 
 
@@ -210,7 +906,38 @@ class DataArea(object):
                                                 failure.
             """
 
-            return -1
+            return self.create_many(level_id, [record])[0]
+
+
+
+        def create_many(self, level_id, records):
+            """
+            Creates new records in the database
+            -----------------------------------
+            @Params: level_id   (int)       The identifier of the storage level.
+                     records    (sequence)  MGPDataRowL* rows or views of the
+                                            level to store.
+            @Return: (list)                 The IDs of the records in order, -1
+                                            for the records that failed.
+            """
+
+            if level_id not in range(len(self.__next_ids)):
+                return [-1] * len(records)
+            record_ids = []
+            for record in records:
+                record_id = self.__next_ids[level_id]
+                try:
+                    self.__append(level_id, record_id, record)
+                except (AttributeError, TypeError, ValueError):
+                    record_ids.append(-1)
+                    continue
+                self.__next_ids[level_id] += 1
+                record_ids.append(record_id)
+            try:
+                self.__checklimit(level_id)
+            except OSError:
+                return [-1] * len(records)
+            return record_ids
 
 
 
@@ -223,7 +950,87 @@ class DataArea(object):
             @Return: (bool)             True if succeed, False if failed.
             """
 
-            return False
+            if level_id not in range(len(self.__next_ids)):
+                return False
+            try:
+                if self.__offset(level_id, record_id) is None:
+                    return False
+                self.__pending_index[level_id][record_id] = self.__DELETED
+                if self.__pending_since[level_id] is None:
+                    self.__pending_since[level_id] = time_ns()
+                if self.__fsync == 'always':
+                    self.__commit(level_id)
+            except OSError:
+                return False
+            return True
+
+
+
+        def getnextid(self, level_id):
+            """
+            Gets the ID of the next created record
+            --------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+            @Return: (int)              The ID the next created record of the
+                                        level gets, -1 if the level doesn't
+                                        exist.
+            """
+
+            if level_id not in range(len(self.__next_ids)):
+                return -1
+            return self.__next_ids[level_id]
+
+
+
+        def parents(self, level_id):
+            """
+            Gets the parents of the stored records
+            --------------------------------------
+            The records of the level are read one by one.
+            @Params: level_id   (int)   The identifier of the storage level, 1
+                                        to 3.
+            @Return: (generator)        Tuples of the ID of every record of the
+                                        level and the ID of its parent record.
+            """
+
+            if level_id not in range(1, len(self.__next_ids)):
+                return
+            getter = 'getl{}id'.format(level_id - 1)
+            for record_id in range(1, self.__next_ids[level_id]):
+                row = self.read(level_id, record_id)
+                if row is not False:
+                    yield record_id, getattr(row, getter)()
+
+
+
+        def query_range(self, level_id, start, end, equipment=None, label=None):
+            """
+            Queries the records of a time range
+            -----------------------------------
+            The blocks of the range are found with the time index and their
+            records are read by ID.
+            @Params: level_id   (int)               The identifier of the
+                                                    storage level.
+                     start      (time alike)        The first timestamp of the
+                                                    range.
+                     end        (time alike)        The last timestamp of the
+                                                    range.
+                     equipment  (string|NoneType)   [optional] The equipment of
+                                                    level 0 records to match.
+                     label      (string|NoneType)   [optional] The label of the
+                                                    records to match.
+            @Return: (generator)                    MGPDataRowL* rows of the
+                                                    range in ID order.
+            """
+
+            for record_id in self.__indexes[level_id].records(start, end,
+                                                              self.__next_ids[level_id] - 1):
+                row = self.read(level_id, record_id)
+                if row is not False:
+                    timestamp = row.gettimestamp()
+                    if (timestamp is not None and start <= timestamp <= end
+                            and _matches(level_id, row, equipment, label)):
+                        yield row
 
 
 
@@ -231,12 +1038,36 @@ class DataArea(object):
             """
             Reads a record from the database
             --------------------------------
+            Pending records of the level are written before the read.
             @Params: level_id   (int)   The identifier of the storage level.
                      record_id  (int)   The ID of the record.
             @Return: (MGPDataRowL*)     Data if succeed, False if failed.
             """
 
-            return False
+            if level_id not in range(len(self.__next_ids)):
+                return False
+            try:
+                offset = self.__offset(level_id, record_id)
+                if offset is None:
+                    return False
+                if self.__pending_data[level_id]:
+                    self.__commit(level_id)
+                data_file = self.__data_files[level_id]
+                data_file.seek(offset)
+                line = data_file.readline()
+                while line.count(b'"') % 2:
+                    more = data_file.readline()
+                    if not more:
+                        break
+                    line += more
+                cells = next(reader([line.decode('utf-8')]))
+            except (OSError, StopIteration, ValueError):
+                return False
+            decode = self.__decode
+            text_columns = self.__TEXT_COLUMNS[level_id]
+            values = [(cell or None) if index in text_columns else decode(cell)
+                      for index, cell in enumerate(cells)]
+            return _stored_row(level_id, record_id, values[1:], self.__patient_pwd)
 
 
 
@@ -250,139 +1081,2712 @@ class DataArea(object):
             @Return: (bool)                     True if succeed, False if failed.
             """
 
-            return False
+            if level_id not in range(len(self.__next_ids)):
+                return False
+            try:
+                if self.__offset(level_id, record_id) is None:
+                    return False
+                self.__append(level_id, record_id, record)
+                self.__checklimit(level_id)
+            except (AttributeError, OSError, TypeError, ValueError):
+                return False
+            return True
 
 
 
-    class __EngineSQL(object):
+    class __EngineDoF(object):
         """
-        This class provides SQL endpoint to the data management workflow. The
+        This class provides DoF endpoint to the data management workflow. The
         engine realizes basic data storage functionality based on CRUD model.
+
+        The engine is an append-only segmented log of fixed-size binary
+        records. Every level is stored in the directory l0 to l3 of the engine
+        in segment files of segment_size bytes. Segment n holds the records
+        from ID n * records per segment + 1, so the position of a record comes
+        from its ID without any lookup. Created records are written
+        sequentially to the end of the last segment with group commit like in
+        the CSV engine, updates overwrite the slot of the record and deletes
+        mark it. Segments are preallocated and read through read-only memory
+        maps, records are unpacked straight from the maps without copies.
+
+        Strings, like labels, units and responses, are stored once in the
+        dictionary file strings.dof and records refer to them by number, so
+        the records keep their fixed size. Timestamps and values are stored in
+        typed cells of None, int, float, bool, string or datetime.
+
+        A sparse timestamp index holds the smallest and the largest timestamp
+        of every block of index_stride records. It is written next to a
+        segment as .idx file when the segment gets full, the index of the last
+        segment is rebuilt from the records when the engine is opened.
+        query_range() finds the blocks of a time range with it.
+
+        Settings in configdict:
+            path            (string)    The directory of the files, it is
+                                        created if missing. Default is the
+                                        working directory.
+            segment_size    (int)       The size of new segment files in
+                                        bytes. Default is 64 MiB.
+            index_stride    (int)       Count of records in a block of the
+                                        timestamp index. Default is 256.
+            open_segments   (int)       Count of segments kept mapped at most
+                                        per level. Default is 16.
+            flush_rows      (int)       Count of pending records that triggers
+                                        a write. Default is 100.
+            flush_interval  (int)       Longest time in milliseconds a record
+                                        may stay pending. Default is 1000.
+            fsync           (string)    'never', 'commit' or 'always' like in
+                                        the CSV engine. Default is 'commit'.
+            patient_pwd     (string)    The password to store the patient IDs
+                                        of L1 rows. Without it the patient IDs
+                                        are not stored.
         """
 
 
 
+        __CELL = Struct('<Bq')
+        __FLOAT = Struct('<d')
+        __FSYNC_POLICIES = ['never', 'commit', 'always']
+        __INT = Struct('<q')
+        __LAYOUTS = ['cscsss', 'cscsic', 'cisscsscs', 'cis']
+        __LENGTH = Struct('<I')
+        __NONE, __INTEGER, __REAL, __FALSE, __TRUE, __STRING, __DATETIME = range(7)
+        __WRITTEN = 1
+        __DELETED = 2
+
+
+
         def __init__(self, configdict):
             """
             Initializes the class
             ---------------------
+            A torn end of the string dictionary is cut, the count of records
+            in the last segment of a level is found by the written flag at the
+            end of the records.
             @Params: configdict (dict)  Settings to instantiate engine.
+            @Throws: MGPError           When a setting is not valid.
             """
 
-            pass
+            self.__path = configdict.get('path', '.')
+            segment_size = configdict.get('segment_size', 64 << 20)
+            self.__stride = configdict.get('index_stride', 256)
+            self.__open_segments = configdict.get('open_segments', 16)
+            self.__flush_rows = configdict.get('flush_rows', 100)
+            self.__flush_interval = configdict.get('flush_interval', 1000) * 1000000
+            self.__fsync = configdict.get('fsync', 'commit')
+            self.__patient_pwd = configdict.get('patient_pwd')
+            if self.__fsync not in self.__FSYNC_POLICIES:
+                raise MGPError('DataArea.__EngineDoF: fsync must be one of {} but is "{}".'
+                               .format(self.__FSYNC_POLICIES, self.__fsync))
+            for name, value in (('flush_rows', self.__flush_rows),
+                                ('index_stride', self.__stride),
+                                ('open_segments', self.__open_segments),
+                                ('segment_size', segment_size)):
+                if value < 1:
+                    raise MGPError('DataArea.__EngineDoF: {} must be positive but is "{}".'
+                                   .format(name, value))
+            makedirs(self.__path, exist_ok=True)
+            self.__strings = [None]
+            self.__string_ids = {}
+            self.__pending_strings = bytearray()
+            self.__strings_file = open(join(self.__path, 'strings.dof'), 'a+b')
+            self.__loadstrings()
+            self.__records = [Struct('<' + ''.join({'c': 'Bq', 'i': 'Q', 's': 'I'}[kind]
+                                                   for kind in layout) + 'B')
+                              for layout in self.__LAYOUTS]
+            self.__directories = []
+            self.__per_segment = []
+            self.__counts = []
+            self.__next_ids = []
+            self.__indexes = []
+            self.__segments = []
+            self.__pending = []
+            self.__pending_since = []
+            for level_id, record in enumerate(self.__records):
+                directory = join(self.__path, 'l{}'.format(level_id))
+                makedirs(directory, exist_ok=True)
+                names = sorted(name for name in listdir(directory) if name.endswith('.seg'))
+                if names:
+                    per_segment = getsize(join(directory, names[0])) // record.size
+                    if per_segment % self.__stride:
+                        raise MGPError('DataArea.__EngineDoF: index_stride "{}" doesn\'t divide the {} records of the segments of level {}.'
+                                       .format(self.__stride, per_segment, level_id))
+                else:
+                    per_segment = max(segment_size // record.size // self.__stride, 1) * self.__stride
+                self.__directories.append(directory)
+                self.__per_segment.append(per_segment)
+                self.__indexes.append(DataArea.TimeIndex(self.__stride))
+                self.__segments.append(OrderedDict())
+                self.__pending.append(bytearray())
+                self.__pending_since.append(None)
+                count = 0
+                for index in range(len(names) - 1):
+                    self.__loadindex(level_id, index)
+                    count += per_segment
+                if names:
+                    index = len(names) - 1
+                    _, segment = self.__segment(level_id, index)
+                    lower, upper = 0, per_segment
+                    while lower < upper:
+                        middle = (lower + upper) // 2
+                        if segment[(middle + 1) * record.size - 1]:
+                            lower = middle + 1
+                        else:
+                            upper = middle
+                    count += lower
+                    if lower == per_segment:
+                        self.__loadindex(level_id, index)
+                    else:
+                        self.__scanblocks(level_id, index, lower)
+                self.__counts.append(count)
+                self.__next_ids.append(count + 1)
+            register(self.close)
 
 
 
-        def create(self, level_id, record):
+        def __cell(self, value):
             """
-            Creates a new record in the database
-            ------------------------------------
-            @Params: level_id   (int)           The identifier of the storage level.
-                     record     (MGPDataRowL*)  The data to store.
-            @Return: (int)                      The ID of the record or -1 in case of
-                                                failure.
+            Encodes a value to a cell
+            -------------------------
+            @Params: value  (any)   The value to encode.
+            @Return: (tuple)        The kind and the payload of the cell.
+            @Throws: TypeError      When the type of value can't be stored.
             """
 
-            return -1
+            if value is None:
+                return self.__NONE, 0
+            value_type = value.__class__
+            if value_type is int:
+                return self.__INTEGER, value
+            if value_type is float:
+                return self.__REAL, self.__INT.unpack(self.__FLOAT.pack(value))[0]
+            if value_type is bool:
+                return (self.__TRUE if value else self.__FALSE), 0
+            if value_type is str:
+                return self.__STRING, self.__stringid(value)
+            if isinstance(value, datetime):
+                return self.__DATETIME, self.__stringid(value.isoformat())
+            raise TypeError('DataArea.__EngineDoF: Type "{}" can\'t be stored.'
+                            .format(value_type.__name__))
 
 
 
-        def delete(self, level_id, record_id):
+        def __checklimit(self, level_id):
             """
-            Deletes a record from the database
-            ----------------------------------
+            Writes the pending records of a level that reached the row limit
+            ----------------------------------------------------------------
             @Params: level_id   (int)   The identifier of the storage level.
-                     record_id  (int)   The ID of the record.
-            @Return: (bool)             True if succeed, False if failed.
             """
 
-            return False
+            if (self.__fsync == 'always' or len(self.__pending[level_id])
+                    >= self.__flush_rows * self.__records[level_id].size):
+                self.__commit(level_id)
 
 
 
-        def read(self, level_id, record_id):
+        def __commit(self, level_id):
             """
-            Reads a record from the database
-            --------------------------------
+            Writes the pending records of a level
+            -------------------------------------
+            New strings are written before the records that refer to them. The
+            timestamp index of a segment is written when the segment gets full.
             @Params: level_id   (int)   The identifier of the storage level.
-                     record_id  (int)   The ID of the record.
-            @Return: (MGPDataRowL*)     Data if succeed, False if failed.
             """
 
-            return False
+            self.__commitstrings()
+            pending = self.__pending[level_id]
+            if pending:
+                size = self.__records[level_id].size
+                per_segment = self.__per_segment[level_id]
+                count = self.__counts[level_id]
+                data = memoryview(pending)
+                position = 0
+                while position < len(data):
+                    index, slot = divmod(count, per_segment)
+                    chunk = min(per_segment - slot, (len(data) - position) // size)
+                    segment_file, _ = self.__segment(level_id, index)
+                    segment_file.seek(slot * size)
+                    segment_file.write(data[position:position + chunk * size])
+                    segment_file.flush()
+                    if self.__fsync != 'never':
+                        fsync(segment_file.fileno())
+                    count += chunk
+                    position += chunk * size
+                    if count % per_segment == 0:
+                        self.__writeindex(level_id, index)
+                data.release()
+                self.__counts[level_id] = count
+                pending.clear()
+            self.__pending_since[level_id] = None
 
 
 
-        def update(self, level_id, record_id, record):
+        def __commitstrings(self):
             """
-            Updates a record in the database
-            --------------------------------
+            Writes the new strings to the dictionary
+            ----------------------------------------
+            """
+
+            if self.__pending_strings:
+                self.__strings_file.write(self.__pending_strings)
+                self.__strings_file.flush()
+                if self.__fsync != 'never':
+                    fsync(self.__strings_file.fileno())
+                self.__pending_strings.clear()
+
+
+
+        def __decode(self, level_id, record_id):
+            """
+            Decodes a stored record
+            -----------------------
             @Params: level_id   (int)           The identifier of the storage level.
-                     record_id  (int)           The ID of the record.
-                     record     (MGPDataRowL*)  The data to update.
-            @Return: (bool)                     True if succeed, False if failed.
+                     record_id  (int)           The ID of a committed record.
+            @Return: (list|NoneType)            The values of the columns like
+                                                _record_values() gives them or
+                                                None if the record is deleted.
             """
 
-            return False
+            record = self.__records[level_id]
+            index, slot = divmod(record_id - 1, self.__per_segment[level_id])
+            _, segment = self.__segment(level_id, index)
+            fields = record.unpack_from(segment, slot * record.size)
+            if fields[-1] != self.__WRITTEN:
+                return None
+            values = []
+            position = 0
+            strings = self.__strings
+            for kind in self.__LAYOUTS[level_id]:
+                if kind == 'c':
+                    values.append(self.__value(fields[position], fields[position + 1]))
+                    position += 2
+                elif kind == 's':
+                    values.append(strings[fields[position]])
+                    position += 1
+                else:
+                    values.append(fields[position] or None)
+                    position += 1
+            return values
 
 
 
-    __STORAGE_TYPES = ['DoF', 'CSV', 'SQL']
+        def __encode(self, level_id, record):
+            """
+            Encodes a record
+            ----------------
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record     (MGPDataRowL*)  The data to store.
+            @Return: (tuple)                    The timestamp and the bytes of the
+                                                record.
+            """
 
+            values = _record_values(level_id, record, self.__patient_pwd)
+            string_ids = self.__string_ids
+            fields = []
+            append = fields.append
+            for kind, value in zip(self.__LAYOUTS[level_id], values):
+                if kind == 's':
+                    if value is None:
+                        append(0)
+                    else:
+                        string_id = string_ids.get(value)
+                        append(string_id if string_id is not None
+                               else self.__stringid(str(value)))
+                elif kind == 'c':
+                    if value.__class__ is int:
+                        append(self.__INTEGER)
+                        append(value)
+                    else:
+                        fields.extend(self.__cell(value))
+                else:
+                    append(value or 0)
+            append(self.__WRITTEN)
+            return values[0], self.__records[level_id].pack(*fields)
 
 
-    engine = None # Class level variable for singleton instance
 
+        def __loadindex(self, level_id, index):
+            """
+            Loads the timestamp index of a full segment
+            -------------------------------------------
+            A missing or incomplete index file is rebuilt from the records.
+            @Params: level_id   (int)   The identifier of the storage level.
+                     index      (int)   The number of the segment.
+            """
 
+            block_count = self.__per_segment[level_id] // self.__stride
+            try:
+                with open(self.__indexpath(level_id, index), 'rb') as index_file:
+                    data = index_file.read()
+            except FileNotFoundError:
+                data = b''
+            if len(data) != block_count * self.__CELL.size * 2:
+                self.__scanblocks(level_id, index, self.__per_segment[level_id])
+                self.__writeindex(level_id, index)
+                return
+            time_index = self.__indexes[level_id]
+            record_id = index * self.__per_segment[level_id] + 1
+            for lower_kind, lower, upper_kind, upper in iter_unpack('<BqBq', data):
+                if lower_kind != self.__NONE:
+                    time_index.add(record_id, self.__value(lower_kind, lower))
+                    time_index.add(record_id, self.__value(upper_kind, upper))
+                record_id += self.__stride
 
-    def __init__(self, storage_type, configdict, data_source,
-                 loop_interval=5000, ui_pipe=None):
-        """
-        Intializes the class
-        --------------------
-        @Params: storage_type   (string)            Type of the selected storage
-                                                    method. Must be one of the
-                                                    implemented types.
-                 configdict     (dict)              Key value pair based settings
-                                                    according to the needs of the
-                                                    selected storing engine.
-                 data_source    (PipeConnection)    The pipe where source data
-                                                    come from.
-                 loop_interval  (int)               Time in milliseconds between
-                                                    cycles.
-                 ui_pipe        (PipeConnection)    Pipe to send data to the UI
-                                                    flow.
-        @Throws: MGPError                           When storage type is not
-                                                    implemented or doesn't exist.
-                                                    When data source is not
-                                                    instance of PipeConnection.
-        """
 
-        if not isinstance(DataArea.engine, DataArea.__DataAreaEngine):
+
+        def __loadstrings(self):
+            """
+            Loads the string dictionary
+            ---------------------------
+            """
+
+            strings_file = self.__strings_file
+            strings_file.seek(0)
+            data = strings_file.read()
+            position = 0
+            while position + self.__LENGTH.size <= len(data):
+                length, = self.__LENGTH.unpack_from(data, position)
+                end = position + self.__LENGTH.size + length
+                if end > len(data):
+                    break
+                value = data[position + self.__LENGTH.size:end].decode('utf-8')
+                self.__string_ids[value] = len(self.__strings)
+                self.__strings.append(value)
+                position = end
+            if position < len(data):
+                strings_file.truncate(position)
+
+
+
+        def __indexpath(self, level_id, index):
+            """
+            Gets the path of the index file of a segment
+            --------------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     index      (int)   The number of the segment.
+            @Return: (string)           The path of the file.
+            """
+
+            return join(self.__directories[level_id], '{:08d}.idx'.format(index))
+
+
+
+        def __scanblocks(self, level_id, index, count):
+            """
+            Builds the timestamp index of a segment from its records
+            --------------------------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     index      (int)   The number of the segment.
+                     count      (int)   Count of records in the segment.
+            """
+
+            size = self.__records[level_id].size
+            first_id = index * self.__per_segment[level_id] + 1
+            time_index = self.__indexes[level_id]
+            _, segment = self.__segment(level_id, index)
+            for slot in range(count):
+                kind, payload = self.__CELL.unpack_from(segment, slot * size)
+                time_index.add(first_id + slot, self.__value(kind, payload))
+
+
+
+        def __segment(self, level_id, index):
+            """
+            Gets a segment
+            --------------
+            Segments are created and preallocated on first use. The least
+            recently used segments are closed above open_segments.
+            @Params: level_id   (int)   The identifier of the storage level.
+                     index      (int)   The number of the segment.
+            @Return: (tuple)            The file and the read-only memory map of
+                                        the segment.
+            """
+
+            segments = self.__segments[level_id]
+            segment = segments.get(index)
+            if segment is not None:
+                segments.move_to_end(index)
+                return segment
+            path = join(self.__directories[level_id], '{:08d}.seg'.format(index))
+            open(path, 'ab').close()
+            segment_file = open(path, 'r+b')
+            size = self.__per_segment[level_id] * self.__records[level_id].size
+            if getsize(path) < size:
+                segment_file.truncate(size)
+            segment = segments[index] = (segment_file, mmap(segment_file.fileno(), size,
+                                                            access=ACCESS_READ))
+            while len(segments) > self.__open_segments:
+                _, (old_file, old_map) = segments.popitem(False)
+                old_map.close()
+                old_file.close()
+            return segment
+
+
+
+        def __slot(self, level_id, record_id):
+            """
+            Checks whether a record exists
+            ------------------------------
+            Pending records are written first.
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (int|NoneType)     The offset of the record in its segment
+                                        or None if the record doesn't exist or
+                                        is deleted.
+            """
+
+            if (level_id not in range(len(self.__next_ids))
+                    or not 0 < record_id < self.__next_ids[level_id]):
+                return None
+            if record_id > self.__counts[level_id]:
+                self.__commit(level_id)
+            size = self.__records[level_id].size
+            index, slot = divmod(record_id - 1, self.__per_segment[level_id])
+            _, segment = self.__segment(level_id, index)
+            offset = slot * size
+            return offset if segment[offset + size - 1] == self.__WRITTEN else None
+
+
+
+        def __stringid(self, value):
+            """
+            Gets the number of a string in the dictionary
+            ---------------------------------------------
+            @Params: value  (string)    The string.
+            @Return: (int)              The number of the string, new strings
+                                        are added to the dictionary.
+            """
+
+            string_id = self.__string_ids.get(value)
+            if string_id is None:
+                data = value.encode('utf-8')
+                self.__pending_strings += self.__LENGTH.pack(len(data))
+                self.__pending_strings += data
+                string_id = self.__string_ids[value] = len(self.__strings)
+                self.__strings.append(value)
+            return string_id
+
+
+
+        def __value(self, kind, payload):
+            """
+            Decodes a cell
+            --------------
+            @Params: kind       (int)                               The kind of the
+                                                                    cell.
+                     payload    (int)                               The payload of
+                                                                    the cell.
+            @Return: (int|float|bool|string|datetime|NoneType)      The value.
+            """
+
+            if kind == self.__INTEGER:
+                return payload
+            if kind == self.__REAL:
+                return self.__FLOAT.unpack(self.__INT.pack(payload))[0]
+            if kind == self.__STRING:
+                return self.__strings[payload]
+            if kind == self.__TRUE:
+                return True
+            if kind == self.__FALSE:
+                return False
+            if kind == self.__DATETIME:
+                return datetime.fromisoformat(self.__strings[payload])
+            return None
+
+
+
+        def __writeindex(self, level_id, index):
+            """
+            Writes the timestamp index of a full segment
+            --------------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     index      (int)   The number of the segment.
+            """
+
+            block_count = self.__per_segment[level_id] // self.__stride
+            first = index * block_count
+            data = bytearray()
+            for block in range(first, first + block_count):
+                bounds = self.__indexes[level_id].bounds(block)
+                if bounds is None:
+                    data += self.__CELL.pack(self.__NONE, 0) * 2
+                else:
+                    data += self.__CELL.pack(*self.__cell(bounds[0]))
+                    data += self.__CELL.pack(*self.__cell(bounds[1]))
+            self.__commitstrings()
+            with open(self.__indexpath(level_id, index), 'wb') as index_file:
+                index_file.write(data)
+                index_file.flush()
+                if self.__fsync != 'never':
+                    fsync(index_file.fileno())
+
+
+
+        def close(self):
+            """
+            Writes all pending records and closes the files
+            -----------------------------------------------
+            """
+
+            if self.__strings_file is not None:
+                self.commit(True)
+                for segments in self.__segments:
+                    for segment_file, segment in segments.values():
+                        segment.close()
+                        segment_file.close()
+                    segments.clear()
+                self.__strings_file.close()
+                self.__strings_file = None
+                unregister(self.close)
+
+
+
+        def commit(self, force=False):
+            """
+            Writes the pending records that are due
+            ---------------------------------------
+            @Params: force  (bool)  [optional] True to write all pending records,
+                                    False to write the levels only that reached
+                                    a limit.
+            """
+
+            now = time_ns()
+            for level_id, since in enumerate(self.__pending_since):
+                if since is not None and (force or now - since >= self.__flush_interval):
+                    self.__commit(level_id)
+
+
+
+        def create(self, level_id, record):
+            """
+            Creates a new record in the database
+            ------------------------------------
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record     (MGPDataRowL*)  The data to store.
+            @Return: (int)                      The ID of the record or -1 in case of
+                                                failure.
+            """
+
+            return self.create_many(level_id, [record])[0]
+
+
+
+        def create_many(self, level_id, records):
+            """
+            Creates new records in the database
+            -----------------------------------
+            @Params: level_id   (int)       The identifier of the storage level.
+                     records    (sequence)  MGPDataRowL* rows or views of the
+                                            level to store.
+            @Return: (list)                 The IDs of the records in order, -1
+                                            for the records that failed.
+            """
+
+            if level_id not in range(len(self.__next_ids)):
+                return [-1] * len(records)
+            record_ids = []
+            pending = self.__pending[level_id]
+            for record in records:
+                record_id = self.__next_ids[level_id]
+                try:
+                    timestamp, data = self.__encode(level_id, record)
+                    self.__indexes[level_id].add(record_id, timestamp)
+                except (AttributeError, StructError, TypeError, ValueError):
+                    record_ids.append(-1)
+                    continue
+                pending += data
+                self.__next_ids[level_id] += 1
+                record_ids.append(record_id)
+            if pending and self.__pending_since[level_id] is None:
+                self.__pending_since[level_id] = time_ns()
+            try:
+                self.__checklimit(level_id)
+            except OSError:
+                return [-1] * len(records)
+            return record_ids
+
+
+
+        def delete(self, level_id, record_id):
+            """
+            Deletes a record from the database
+            ----------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (bool)             True if succeed, False if failed.
+            """
+
+            try:
+                offset = self.__slot(level_id, record_id)
+                if offset is None:
+                    return False
+                size = self.__records[level_id].size
+                index = (record_id - 1) // self.__per_segment[level_id]
+                segment_file, _ = self.__segment(level_id, index)
+                segment_file.seek(offset + size - 1)
+                segment_file.write(bytes((self.__WRITTEN | self.__DELETED,)))
+                segment_file.flush()
+                if self.__fsync != 'never':
+                    fsync(segment_file.fileno())
+            except OSError:
+                return False
+            return True
+
+
+
+        def getnextid(self, level_id):
+            """
+            Gets the ID of the next created record
+            --------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+            @Return: (int)              The ID the next created record of the
+                                        level gets, -1 if the level doesn't
+                                        exist.
+            """
+
+            if level_id not in range(len(self.__next_ids)):
+                return -1
+            return self.__next_ids[level_id]
+
+
+
+        def parents(self, level_id):
+            """
+            Gets the parents of the stored records
+            --------------------------------------
+            The records of the level are read one by one.
+            @Params: level_id   (int)   The identifier of the storage level, 1
+                                        to 3.
+            @Return: (generator)        Tuples of the ID of every record of the
+                                        level and the ID of its parent record.
+            """
+
+            if level_id not in range(1, len(self.__next_ids)):
+                return
+            getter = 'getl{}id'.format(level_id - 1)
+            for record_id in range(1, self.__next_ids[level_id]):
+                row = self.read(level_id, record_id)
+                if row is not False:
+                    yield record_id, getattr(row, getter)()
+
+
+
+        def query_range(self, level_id, start, end, equipment=None, label=None):
+            """
+            Queries the records of a time range
+            -----------------------------------
+            Pending records are written first. The blocks of the range are
+            found with the time index.
+            @Params: level_id   (int)               The identifier of the
+                                                    storage level.
+                     start      (time alike)        The first timestamp of the
+                                                    range.
+                     end        (time alike)        The last timestamp of the
+                                                    range.
+                     equipment  (string|NoneType)   [optional] The equipment of
+                                                    level 0 records to match.
+                     label      (string|NoneType)   [optional] The label of the
+                                                    records to match.
+            @Return: (generator)                    MGPDataRowL* rows of the
+                                                    range in ID order.
+            """
+
+            self.__commit(level_id)
+            for record_id in self.__indexes[level_id].records(start, end, self.__counts[level_id]):
+                values = self.__decode(level_id, record_id)
+                if values is not None and values[0] is not None and start <= values[0] <= end:
+                    row = _stored_row(level_id, record_id, values, self.__patient_pwd)
+                    if _matches(level_id, row, equipment, label):
+                        yield row
+
+
+
+        def read(self, level_id, record_id):
+            """
+            Reads a record from the database
+            --------------------------------
+            Pending records of the level are written before the read.
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (MGPDataRowL*)     Data if succeed, False if failed.
+            """
+
+            try:
+                if self.__slot(level_id, record_id) is None:
+                    return False
+                values = self.__decode(level_id, record_id)
+            except OSError:
+                return False
+            return _stored_row(level_id, record_id, values, self.__patient_pwd)
+
+
+
+        def update(self, level_id, record_id, record):
+            """
+            Updates a record in the database
+            --------------------------------
+            The record is overwritten in its slot and the timestamp index of a
+            full segment is written again.
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record_id  (int)           The ID of the record.
+                     record     (MGPDataRowL*)  The data to update.
+            @Return: (bool)                     True if succeed, False if failed.
+            """
+
+            try:
+                offset = self.__slot(level_id, record_id)
+                if offset is None:
+                    return False
+                timestamp, data = self.__encode(level_id, record)
+                self.__indexes[level_id].add(record_id, timestamp)
+                self.__commitstrings()
+                index = (record_id - 1) // self.__per_segment[level_id]
+                segment_file, _ = self.__segment(level_id, index)
+                segment_file.seek(offset)
+                segment_file.write(data)
+                segment_file.flush()
+                if self.__fsync != 'never':
+                    fsync(segment_file.fileno())
+                if index < self.__counts[level_id] // self.__per_segment[level_id]:
+                    self.__writeindex(level_id, index)
+            except (AttributeError, OSError, StructError, TypeError, ValueError):
+                return False
+            return True
+
+
+
+    class __EngineSQL(object):
+        """
+        This class provides SQL endpoint to the data management workflow. The
+        engine realizes basic data storage functionality based on CRUD model.
+
+        The levels are stored in the tables l0 to l3 of an SQLite database in
+        WAL journal mode, with the columns of the CSV engine. Indexes are kept
+        on (equipment_id, timestamp) of l0, (label, timestamp) of l1, the
+        timestamp of every level and on the lineage columns l0_id, l1_id and
+        l2_id, so query_range() is a B-tree range scan. Record IDs are assigned by the engine, so created
+        records are collected in memory and inserted with executemany() in a
+        single transaction when DataArea commits the cycle. The statements are
+        constant, so SQLite keeps them prepared in the statement cache of the
+        connection. Reads, updates and deletes insert the pending records
+        first. Records with values SQLite can't bind are refused at creation,
+        records refused at the insert are left out of the transaction, so one
+        record can't block the others. The engine must be the only writer of
+        the database.
+
+        Settings in configdict:
+            database        (string)    The path of the database file. Default
+                                        is 'mgp.sqlite'.
+            synchronous     (string)    The synchronous pragma of SQLite. With
+                                        'NORMAL' the last transactions may be
+                                        lost at a power loss, 'FULL' syncs
+                                        every transaction, 'OFF' leaves the
+                                        data to the operating system. Default
+                                        is 'NORMAL'.
+            patient_pwd     (string)    The password to store the patient IDs
+                                        of L1 rows. Without it the patient IDs
+                                        are not stored.
+
+        Bool values are read back as int, datetime timestamps are stored in ISO
+        format.
+        """
+
+
+
+        __TABLES = ['''CREATE TABLE IF NOT EXISTS l0 (id INTEGER PRIMARY KEY,
+                        timestamp, label TEXT, value, unit TEXT, equipment_id TEXT,
+                        event_type TEXT)''',
+                    '''CREATE TABLE IF NOT EXISTS l1 (id INTEGER PRIMARY KEY,
+                        timestamp, label TEXT, value, unit TEXT, l0_id INTEGER,
+                        patient_id)''',
+                    '''CREATE TABLE IF NOT EXISTS l2 (id INTEGER PRIMARY KEY,
+                        timestamp, l1_id INTEGER, gate TEXT, ch1_label TEXT,
+                        ch1_value, ch1_unit TEXT, ch2_label TEXT, ch2_value,
+                        ch2_unit TEXT)''',
+                    '''CREATE TABLE IF NOT EXISTS l3 (id INTEGER PRIMARY KEY,
+                        timestamp, l2_id INTEGER, response TEXT)''']
+        __INDEXES = ['CREATE INDEX IF NOT EXISTS l0_equipment_timestamp ON l0 (equipment_id, timestamp)',
+                     'CREATE INDEX IF NOT EXISTS l1_l0_id ON l1 (l0_id)',
+                     'CREATE INDEX IF NOT EXISTS l2_l1_id ON l2 (l1_id)',
+                     'CREATE INDEX IF NOT EXISTS l3_l2_id ON l3 (l2_id)',
+                     'CREATE INDEX IF NOT EXISTS l0_timestamp ON l0 (timestamp)',
+                     'CREATE INDEX IF NOT EXISTS l1_label_timestamp ON l1 (label, timestamp)',
+                     'CREATE INDEX IF NOT EXISTS l1_timestamp ON l1 (timestamp)',
+                     'CREATE INDEX IF NOT EXISTS l2_timestamp ON l2 (timestamp)',
+                     'CREATE INDEX IF NOT EXISTS l3_timestamp ON l3 (timestamp)']
+        __COLUMNS = [['timestamp', 'label', 'value', 'unit', 'equipment_id', 'event_type'],
+                     ['timestamp', 'label', 'value', 'unit', 'l0_id', 'patient_id'],
+                     ['timestamp', 'l1_id', 'gate', 'ch1_label', 'ch1_value', 'ch1_unit',
+                      'ch2_label', 'ch2_value', 'ch2_unit'],
+                     ['timestamp', 'l2_id', 'response']]
+        __SYNCHRONOUS = ['OFF', 'NORMAL', 'FULL']
+
+
+
+        def __init__(self, configdict):
+            """
+            Initializes the class
+            ---------------------
+            @Params: configdict (dict)  Settings to instantiate engine.
+            @Throws: MGPError           When a setting is not valid or the
+                                        database can't be opened.
+            """
+
+            self.__patient_pwd = configdict.get('patient_pwd')
+            synchronous = configdict.get('synchronous', 'NORMAL')
+            if synchronous not in self.__SYNCHRONOUS:
+                raise MGPError('DataArea.__EngineSQL: synchronous must be one of {} but is "{}".'
+                               .format(self.__SYNCHRONOUS, synchronous))
+            try:
+                self.__connection = connect(configdict.get('database', 'mgp.sqlite'),
+                                            isolation_level=None, check_same_thread=False)
+                self.__connection.execute('PRAGMA journal_mode=WAL')
+                self.__connection.execute('PRAGMA synchronous={}'.format(synchronous))
+                for statement in self.__TABLES + self.__INDEXES:
+                    self.__connection.execute(statement)
+                self.__next_ids = [self.__connection.execute('SELECT MAX(id) FROM l{}'
+                                                             .format(level_id))
+                                   .fetchone()[0] or 0
+                                   for level_id in range(len(self.__TABLES))]
+            except SQLError as error:
+                raise MGPError('DataArea.__EngineSQL: Database can\'t be opened: {}'
+                               .format(error))
+            self.__next_ids = [record_id + 1 for record_id in self.__next_ids]
+            self.__inserts = ['INSERT INTO l{} (id, {}) VALUES (?, {})'
+                              .format(level_id, ', '.join(columns), ', '.join('?' * len(columns)))
+                              for level_id, columns in enumerate(self.__COLUMNS)]
+            self.__selects = ['SELECT {} FROM l{} WHERE id = ?'.format(', '.join(columns), level_id)
+                              for level_id, columns in enumerate(self.__COLUMNS)]
+            self.__updates = ['UPDATE l{} SET {} WHERE id = ?'
+                              .format(level_id, ', '.join('{} = ?'.format(column)
+                                                          for column in columns))
+                              for level_id, columns in enumerate(self.__COLUMNS)]
+            self.__deletes = ['DELETE FROM l{} WHERE id = ?'.format(level_id)
+                              for level_id in range(len(self.__TABLES))]
+            self.__pending = [[] for _ in self.__TABLES]
+            register(self.close)
+
+
+
+        def __isolate(self):
+            """
+            Inserts the pending records one by one
+            --------------------------------------
+            The records are inserted in a single transaction, the records SQLite
+            refuses are left out.
+            @Throws: sqlite3.OperationalError   When the database fails.
+            """
+
+            connection = self.__connection
+            connection.execute('BEGIN')
+            try:
+                for level_id, pending in enumerate(self.__pending):
+                    insert = self.__inserts[level_id]
+                    for parameters in pending:
+                        try:
+                            connection.execute(insert, parameters)
+                        except OperationalError:
+                            raise
+                        except SQLError:
+                            continue
+                connection.execute('COMMIT')
+            except OperationalError:
+                connection.execute('ROLLBACK')
+                raise
+
+
+
+        def __parameters(self, level_id, record):
+            """
+            Gets the SQL parameters of a record
+            -----------------------------------
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record     (MGPDataRowL*)  The data to store.
+            @Return: (list)                     The values of the columns.
+            @Throws: TypeError                  When a value can't be bound by
+                                                SQLite.
+            """
+
+            values = _record_values(level_id, record, self.__patient_pwd)
+            if isinstance(values[0], datetime):
+                values[0] = values[0].isoformat()
+            for value in values:
+                if not (value is None or isinstance(value, (float, str, bytes))
+                        or isinstance(value, int) and -(1 << 63) <= value < (1 << 63)):
+                    raise TypeError('DataArea.__EngineSQL: A value of type "{}" can\'t be stored.'
+                                    .format(type(value).__name__))
+            return values
+
+
+
+        def close(self):
+            """
+            Inserts all pending records and closes the database
+            ---------------------------------------------------
+            """
+
+            if self.__connection is not None:
+                self.commit(True)
+                self.__connection.close()
+                self.__connection = None
+                unregister(self.close)
+
+
+
+        def commit(self, force=False):
+            """
+            Inserts the pending records
+            ---------------------------
+            The records of all levels are inserted in a single transaction. If
+            SQLite refuses a record, the transaction is repeated record by
+            record and the refused records are left out, so one record can't
+            block the others. The records stay pending when the database fails.
+            @Params: force  (bool)  [optional] Ignored, all pending records are
+                                    inserted in every cycle.
+            @Throws: sqlite3.OperationalError   When the database fails.
+            """
+
+            if not any(self.__pending):
+                return
+            connection = self.__connection
+            connection.execute('BEGIN')
+            try:
+                for level_id, pending in enumerate(self.__pending):
+                    if pending:
+                        connection.executemany(self.__inserts[level_id], pending)
+                connection.execute('COMMIT')
+            except OperationalError:
+                connection.execute('ROLLBACK')
+                raise
+            except SQLError:
+                connection.execute('ROLLBACK')
+                self.__isolate()
+            for pending in self.__pending:
+                pending.clear()
+
+
+
+        def create(self, level_id, record):
+            """
+            Creates a new record in the database
+            ------------------------------------
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record     (MGPDataRowL*)  The data to store.
+            @Return: (int)                      The ID of the record or -1 in case of
+                                                failure.
+            """
+
+            return self.create_many(level_id, [record])[0]
+
+
+
+        def create_many(self, level_id, records):
+            """
+            Creates new records in the database
+            -----------------------------------
+            @Params: level_id   (int)       The identifier of the storage level.
+                     records    (sequence)  MGPDataRowL* rows or views of the
+                                            level to store.
+            @Return: (list)                 The IDs of the records in order, -1
+                                            for the records that failed.
+            """
+
+            if level_id not in range(len(self.__next_ids)):
+                return [-1] * len(records)
+            record_ids = []
+            pending = self.__pending[level_id]
+            for record in records:
+                try:
+                    parameters = self.__parameters(level_id, record)
+                except (AttributeError, TypeError):
+                    record_ids.append(-1)
+                    continue
+                record_id = self.__next_ids[level_id]
+                self.__next_ids[level_id] += 1
+                parameters.insert(0, record_id)
+                pending.append(parameters)
+                record_ids.append(record_id)
+            return record_ids
+
+
+
+        def delete(self, level_id, record_id):
+            """
+            Deletes a record from the database
+            ----------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (bool)             True if succeed, False if failed.
+            """
+
+            if level_id not in range(len(self.__next_ids)):
+                return False
+            try:
+                self.commit()
+                return self.__connection.execute(self.__deletes[level_id],
+                                                  (record_id,)).rowcount == 1
+            except SQLError:
+                return False
+
+
+
+        def getnextid(self, level_id):
+            """
+            Gets the ID of the next created record
+            --------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+            @Return: (int)              The ID the next created record of the
+                                        level gets, -1 if the level doesn't
+                                        exist.
+            """
+
+            if level_id not in range(len(self.__next_ids)):
+                return -1
+            return self.__next_ids[level_id]
+
+
+
+        def parents(self, level_id):
+            """
+            Gets the parents of the stored records
+            --------------------------------------
+            Pending records are inserted first.
+            @Params: level_id   (int)   The identifier of the storage level, 1
+                                        to 3.
+            @Return: (generator)        Tuples of the ID of every record of the
+                                        level and the ID of its parent record.
+            """
+
+            if level_id not in range(1, len(self.__next_ids)):
+                return
+            self.commit()
+            yield from self.__connection.execute('SELECT id, l{}_id FROM l{} ORDER BY id'
+                                                 .format(level_id - 1, level_id))
+
+
+
+        def query_range(self, level_id, start, end, equipment=None, label=None):
+            """
+            Queries the records of a time range
+            -----------------------------------
+            Pending records are inserted first.
+            @Params: level_id   (int)               The identifier of the
+                                                    storage level.
+                     start      (time alike)        The first timestamp of the
+                                                    range.
+                     end        (time alike)        The last timestamp of the
+                                                    range.
+                     equipment  (string|NoneType)   [optional] The equipment of
+                                                    level 0 records to match.
+                     label      (string|NoneType)   [optional] The label of the
+                                                    records to match.
+            @Return: (generator)                    MGPDataRowL* rows of the
+                                                    range in time order.
+            """
+
+            if isinstance(start, datetime):
+                start = start.isoformat()
+            if isinstance(end, datetime):
+                end = end.isoformat()
+            conditions = ['timestamp BETWEEN ? AND ?']
+            parameters = [start, end]
+            if equipment is not None:
+                conditions.append('equipment_id = ?')
+                parameters.append(equipment)
+            if label is not None:
+                if level_id == 2:
+                    conditions.append('(ch1_label = ? OR ch2_label = ?)')
+                    parameters.append(label)
+                else:
+                    conditions.append('label = ?')
+                parameters.append(label)
+            self.commit()
+            cursor = self.__connection.execute('SELECT id, {} FROM l{} WHERE {} ORDER BY timestamp'
+                                               .format(', '.join(self.__COLUMNS[level_id]),
+                                                       level_id, ' AND '.join(conditions)),
+                                               parameters)
+            for values in cursor:
+                values = list(values)
+                if isinstance(values[1], str):
+                    values[1] = datetime.fromisoformat(values[1])
+                yield _stored_row(level_id, values[0], values[1:], self.__patient_pwd)
+
+
+
+        def read(self, level_id, record_id):
+            """
+            Reads a record from the database
+            --------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (MGPDataRowL*)     Data if succeed, False if failed.
+            """
+
+            if level_id not in range(len(self.__next_ids)):
+                return False
+            try:
+                self.commit()
+                values = self.__connection.execute(self.__selects[level_id],
+                                                   (record_id,)).fetchone()
+            except SQLError:
+                return False
+            if values is None:
+                return False
+            values = list(values)
+            if isinstance(values[0], str):
+                values[0] = datetime.fromisoformat(values[0])
+            return _stored_row(level_id, record_id, values, self.__patient_pwd)
+
+
+
+        def update(self, level_id, record_id, record):
+            """
+            Updates a record in the database
+            --------------------------------
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record_id  (int)           The ID of the record.
+                     record     (MGPDataRowL*)  The data to update.
+            @Return: (bool)                     True if succeed, False if failed.
+            """
+
+            if level_id not in range(len(self.__next_ids)):
+                return False
+            try:
+                parameters = self.__parameters(level_id, record)
+                parameters.append(record_id)
+                self.commit()
+                return self.__connection.execute(self.__updates[level_id],
+                                                 parameters).rowcount == 1
+            except (AttributeError, SQLError, TypeError):
+                return False
+
+
+
+    class __EngineChunk(object):
+        """
+        This class provides Chunk endpoint to the data management workflow.
+        The engine realizes basic data storage functionality based on CRUD
+        model.
+
+        Level 0 records, the samples of the equipments, are stored in
+        compressed columnar MGPChunk chunks in the append-only file l0.chunk in
+        the directory of the engine. Created records are collected in columns
+        and a chunk is written when chunk_rows records are pending or the
+        oldest pending record is older than flush_interval, so a chunk holds
+        the records of a cycle at most at the default settings. The first ID,
+        the count and the time range of every chunk are read from the chunk
+        headers when the engine is opened, so a read decodes a single chunk
+        and query_range() decodes only the chunks of the range. Decoded chunks
+        are kept in an LRU of open_chunks chunks. Chunks are not rewritten, so
+        level 0 records can't be updated or deleted.
+
+        Levels 1 to 3 are stored by the DoF engine given to the engine, in the
+        same directory.
+
+        Settings in configdict:
+            path            (string)    The directory of the files, it is
+                                        created if missing. Default is the
+                                        working directory.
+            chunk_rows      (int)       Count of pending level 0 records that
+                                        triggers a chunk. Default is 4096.
+            flush_interval  (int)       Longest time in milliseconds a record
+                                        may stay pending. Default is 1000.
+            fsync           (string)    'never' leaves the written chunks to
+                                        the operating system, 'commit' and
+                                        'always' sync every chunk. Default is
+                                        'commit'.
+            open_chunks     (int)       Count of decoded chunks kept in memory.
+                                        Default is 16.
+
+        The other settings belong to the DoF engine of levels 1 to 3. Level 0
+        timestamps must be int or float, a chunk of int timestamps is started
+        when the kind of the timestamps changes.
+        """
+
+
+
+        __FSYNC_POLICIES = ['never', 'commit', 'always']
+        __LENGTH = Struct('<I')
+        __HEADER_SIZE = 37
+
+
+
+        def __init__(self, configdict, levels_engine):
+            """
+            Initializes the class
+            ---------------------
+            A torn chunk at the end of the file is cut.
+            @Params: configdict     (dict)                  Settings to
+                                                            instantiate engine.
+                     levels_engine  (DataArea.__EngineDoF)  The engine of
+                                                            levels 1 to 3.
+            @Throws: MGPError                               When a setting is
+                                                            not valid.
+            """
+
+            self.__path = configdict.get('path', '.')
+            self.__chunk_rows = configdict.get('chunk_rows', 4096)
+            self.__flush_interval = configdict.get('flush_interval', 1000) * 1000000
+            self.__fsync = configdict.get('fsync', 'commit')
+            self.__open_chunks = configdict.get('open_chunks', 16)
+            if self.__fsync not in self.__FSYNC_POLICIES:
+                raise MGPError('DataArea.__EngineChunk: fsync must be one of {} but is "{}".'
+                               .format(self.__FSYNC_POLICIES, self.__fsync))
+            for name, value in (('chunk_rows', self.__chunk_rows),
+                                ('open_chunks', self.__open_chunks)):
+                if value < 1:
+                    raise MGPError('DataArea.__EngineChunk: {} must be positive but is "{}".'
+                                   .format(name, value))
+            self.__levels_engine = levels_engine
+            makedirs(self.__path, exist_ok=True)
+            self.__file = open(join(self.__path, 'l0.chunk'), 'a+b')
+            self.__firsts = []
+            self.__chunks = []
+            self.__decoded = OrderedDict()
+            self.__size = 0
+            self.__next_id = 1
+            self.__loadchunks()
+            self.__pending = [[] for _ in range(6)]
+            self.__pending_since = None
+            register(self.close)
+
+
+
+        def __chunk(self, index):
+            """
+            Gets a decoded chunk
+            --------------------
+            @Params: index  (int)   The position of the chunk in the file.
+            @Return: (MGPChunk)     The chunk.
+            """
+
+            chunk = self.__decoded.get(index)
+            if chunk is None:
+                _, _, _, offset, length = self.__chunks[index]
+                self.__file.seek(offset)
+                chunk = MGPChunk.frombytes(self.__file.read(length))
+                self.__decoded[index] = chunk
+                if len(self.__decoded) > self.__open_chunks:
+                    self.__decoded.popitem(last=False)
+            else:
+                self.__decoded.move_to_end(index)
+            return chunk
+
+
+
+        def __commit(self):
+            """
+            Writes the pending level 0 records as a chunk
+            ---------------------------------------------
+            """
+
+            pending = self.__pending
+            if not pending[0]:
+                return
+            first_id = self.__next_id - len(pending[0])
+            chunk = MGPChunk(first_id, pending[0], pending[2], pending[1], pending[3],
+                             pending[4], pending[5])
+            frame = chunk.toframe()
+            self.__file.write(frame)
+            self.__file.flush()
+            if self.__fsync != 'never':
+                fsync(self.__file.fileno())
+            lowest, highest = chunk.gettimerange()
+            self.__firsts.append(first_id)
+            self.__chunks.append((len(chunk), lowest, highest,
+                                  self.__size + self.__LENGTH.size,
+                                  len(frame) - self.__LENGTH.size))
+            self.__decoded[len(self.__chunks) - 1] = chunk
+            if len(self.__decoded) > self.__open_chunks:
+                self.__decoded.popitem(last=False)
+            self.__size += len(frame)
+            self.__pending = [[] for _ in range(6)]
+            self.__pending_since = None
+
+
+
+        def __loadchunks(self):
+            """
+            Reads the headers of the chunks
+            -------------------------------
+            """
+
+            data_file = self.__file
+            end = data_file.seek(0, SEEK_END)
+            position = 0
+            while position < end:
+                data_file.seek(position)
+                prefix = data_file.read(self.__LENGTH.size)
+                if len(prefix) < self.__LENGTH.size:
+                    break
+                length, = self.__LENGTH.unpack(prefix)
+                if position + self.__LENGTH.size + length > end:
+                    break
+                try:
+                    first_id, count, lowest, highest = MGPChunk.header(
+                        data_file.read(min(length, self.__HEADER_SIZE)))
+                except MGPError:
+                    break
+                self.__firsts.append(first_id)
+                self.__chunks.append((count, lowest, highest,
+                                      position + self.__LENGTH.size, length))
+                self.__next_id = first_id + count
+                position += self.__LENGTH.size + length
+            if position < end:
+                data_file.truncate(position)
+            self.__size = position
+
+
+
+        def close(self):
+            """
+            Writes all pending records and closes the files
+            -----------------------------------------------
+            """
+
+            if self.__file is not None:
+                self.commit(True)
+                self.__file.close()
+                self.__file = None
+                self.__levels_engine.close()
+                unregister(self.close)
+
+
+
+        def commit(self, force=False):
+            """
+            Writes the pending records that are due
+            ---------------------------------------
+            @Params: force  (bool)  [optional] True to write all pending records,
+                                    False to write the levels only that reached
+                                    a limit.
+            """
+
+            since = self.__pending_since
+            if since is not None and (force or time_ns() - since >= self.__flush_interval):
+                self.__commit()
+            self.__levels_engine.commit(force)
+
+
+
+        def create(self, level_id, record):
+            """
+            Creates a new record in the database
+            ------------------------------------
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record     (MGPDataRowL*)  The data to store.
+            @Return: (int)                      The ID of the record or -1 in case of
+                                                failure.
+            """
+
+            return self.create_many(level_id, [record])[0]
+
+
+
+        def create_many(self, level_id, records):
+            """
+            Creates new records in the database
+            -----------------------------------
+            @Params: level_id   (int)       The identifier of the storage level.
+                     records    (sequence)  MGPDataRowL* rows or views of the
+                                            level to store.
+            @Return: (list)                 The IDs of the records in order, -1
+                                            for the records that failed.
+            """
+
+            if level_id != 0:
+                return self.__levels_engine.create_many(level_id, records)
+            record_ids = []
+            pending = self.__pending
+            for record in records:
+                try:
+                    values = _record_values(0, record)
+                except (AttributeError, TypeError):
+                    record_ids.append(-1)
+                    continue
+                timestamp, value = values[0], values[2]
+                if (timestamp.__class__ not in (int, float)
+                        or not -(1 << 63) <= timestamp < (1 << 63)
+                        or not (value is None or value.__class__ in (bool, float, str)
+                                or value.__class__ is int and -(1 << 63) <= value < (1 << 63))
+                        or any(text is not None and text.__class__ is not str
+                               for text in (values[1], values[3], values[4], values[5]))):
+                    record_ids.append(-1)
+                    continue
+                try:
+                    if pending[0] and pending[0][-1].__class__ is not timestamp.__class__:
+                        self.__commit()
+                        pending = self.__pending
+                    for column, cell in zip(pending, values):
+                        column.append(cell)
+                    if self.__pending_since is None:
+                        self.__pending_since = time_ns()
+                    record_ids.append(self.__next_id)
+                    self.__next_id += 1
+                    if len(pending[0]) >= self.__chunk_rows:
+                        self.__commit()
+                        pending = self.__pending
+                except OSError:
+                    return record_ids + [-1] * (len(records) - len(record_ids))
+            return record_ids
+
+
+
+        def delete(self, level_id, record_id):
+            """
+            Deletes a record from the database
+            ----------------------------------
+            Level 0 records can't be deleted.
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (bool)             True if succeed, False if failed.
+            """
+
+            if level_id == 0:
+                return False
+            return self.__levels_engine.delete(level_id, record_id)
+
+
+
+        def getnextid(self, level_id):
+            """
+            Gets the ID of the next created record
+            --------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+            @Return: (int)              The ID the next created record of the
+                                        level gets, -1 if the level doesn't
+                                        exist.
+            """
+
+            if level_id != 0:
+                return self.__levels_engine.getnextid(level_id)
+            return self.__next_id
+
+
+
+        def parents(self, level_id):
+            """
+            Gets the parents of the stored records
+            --------------------------------------
+            @Params: level_id   (int)   The identifier of the storage level, 1
+                                        to 3.
+            @Return: (generator)        Tuples of the ID of every record of the
+                                        level and the ID of its parent record.
+            """
+
+            return self.__levels_engine.parents(level_id)
+
+
+
+        def query_range(self, level_id, start, end, equipment=None, label=None):
+            """
+            Queries the records of a time range
+            -----------------------------------
+            Level 0 chunks out of the range are skipped by their time range,
+            the columns of the others are filtered before rows are made.
+            @Params: level_id   (int)               The identifier of the
+                                                    storage level.
+                     start      (time alike)        The first timestamp of the
+                                                    range.
+                     end        (time alike)        The last timestamp of the
+                                                    range.
+                     equipment  (string|NoneType)   [optional] The equipment of
+                                                    level 0 records to match.
+                     label      (string|NoneType)   [optional] The label of the
+                                                    records to match.
+            @Return: (generator)                    MGPDataRowL* rows of the
+                                                    range in ID order.
+            """
+
+            if level_id != 0:
+                yield from self.__levels_engine.query_range(level_id, start, end,
+                                                            equipment, label)
+                return
+            sources = [(self.__firsts[index], index)
+                       for index, (_, lowest, highest, _, _) in enumerate(self.__chunks)
+                       if lowest <= end and highest >= start]
+            if self.__pending[0]:
+                sources.append((self.__next_id - len(self.__pending[0]), None))
+            for first_id, index in sources:
+                if index is None:
+                    columns = list(self.__pending)
+                else:
+                    chunk = self.__chunk(index)
+                    columns = [chunk.column(name) for name in ('timestamp', 'label', 'value',
+                                                               'unit', 'equipment',
+                                                               'event_type')]
+                timestamps, labels, _, _, equipments, _ = columns
+                for position, timestamp in enumerate(timestamps):
+                    if (start <= timestamp <= end
+                            and (equipment is None or equipments[position] == equipment)
+                            and (label is None or labels[position] == label)):
+                        yield _stored_row(0, first_id + position,
+                                          [column[position] for column in columns])
+
+
+
+        def read(self, level_id, record_id):
+            """
+            Reads a record from the database
+            --------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (MGPDataRowL*)     Data if succeed, False if failed.
+            """
+
+            if level_id != 0:
+                return self.__levels_engine.read(level_id, record_id)
+            pending_first = self.__next_id - len(self.__pending[0])
+            if record_id.__class__ is not int or not 1 <= record_id < self.__next_id:
+                return False
+            if record_id >= pending_first:
+                position = record_id - pending_first
+                return _stored_row(0, record_id, [column[position] for column in self.__pending])
+            index = bisect_right(self.__firsts, record_id) - 1
+            if index < 0 or record_id - self.__firsts[index] >= self.__chunks[index][0]:
+                return False
+            position = record_id - self.__firsts[index]
+            try:
+                chunk = self.__chunk(index)
+            except (MGPError, OSError):
+                return False
+            return _stored_row(0, record_id, [chunk.column(name)[position]
+                                              for name in ('timestamp', 'label', 'value',
+                                                           'unit', 'equipment', 'event_type')])
+
+
+
+        def update(self, level_id, record_id, record):
+            """
+            Updates a record in the database
+            --------------------------------
+            Level 0 records can't be updated.
+            @Params: level_id   (int)           The identifier of the storage level.
+                     record_id  (int)           The ID of the record.
+                     record     (MGPDataRowL*)  The data to update.
+            @Return: (bool)                     True if succeed, False if failed.
+            """
+
+            if level_id == 0:
+                return False
+            return self.__levels_engine.update(level_id, record_id, record)
+
+
+
+    class __Record(object):
+        """
+        DataArea.__Record class
+        =======================
+        This class gives the stored columns of a record, like _record_values()
+        gives them, through the getter functions of the MGPDataRowL* rows, so
+        records of the write-ahead log can be stored again by any engine. It is
+        not counted by MGPLedger.
+        """
+
+
+
+        def __init__(self, level_id, values):
+            """
+            Initializes the class
+            ---------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     values     (list)  The values of the columns.
+            """
+
+            self.__level = level_id
+            self.__values = values
+
+
+
+        def getequipment(self):
+            """
+            Gets the equipment ID
+            ---------------------
+            @Return: (string)   The ID of the equipment (level 0).
+            """
+
+            return self.__values[4]
+
+
+
+        def geteventtype(self):
+            """
+            Gets the event type
+            -------------------
+            @Return: (string)   The type of the event (level 0).
+            """
+
+            return self.__values[5]
+
+
+
+        def getgate(self):
+            """
+            Gets the gate
+            -------------
+            @Return: (string)   The label of the gate (level 2).
+            """
+
+            return self.__values[2]
+
+
+
+        def getl0id(self):
+            """
+            Gets the L0 ID
+            --------------
+            @Return: (int)  The ID of the L0 record (level 1).
+            """
+
+            return self.__values[4]
+
+
+
+        def getl1id(self):
+            """
+            Gets the L1 ID
+            --------------
+            @Return: (int)  The ID of the L1 record (level 2).
+            """
+
+            return self.__values[1]
+
+
+
+        def getl2id(self):
+            """
+            Gets the L2 ID
+            --------------
+            @Return: (int)  The ID of the L2 record (level 3).
+            """
+
+            return self.__values[1]
+
+
+
+        def getlabel(self, channel=None):
+            """
+            Gets the label
+            --------------
+            @Params: channel    (int)   [optional] The channel of level 2
+                                        records, 1 or 2.
+            @Return: (object)           The label.
+            """
+
+            return self.__values[1] if self.__level < 2 else self.__values[3 * channel]
+
+
+
+        def getpatientid(self, patient_pwd=None):
+            """
+            Gets the patient ID
+            -------------------
+            The stored patient ID is given without checking the password.
+            @Params: patient_pwd    (string)    [optional] Not used.
+            @Return: (int|NoneType)             The ID of the patient (level 1).
+            """
+
+            return self.__values[5]
+
+
+
+        def getresponse(self):
+            """
+            Gets the response
+            -----------------
+            @Return: (string)   The response (level 3).
+            """
+
+            return self.__values[2]
+
+
+
+        def gettimestamp(self):
+            """
+            Gets the timestamp
+            ------------------
+            @Return: (time   alike)   The timestamp of the record.
+            """
+
+            return self.__values[0]
+
+
+
+        def getunit(self, channel=None):
+            """
+            Gets the unit
+            -------------
+            @Params: channel    (int)   [optional] The channel of level 2
+                                        records, 1 or 2.
+            @Return: (object)           The unit.
+            """
+
+            return self.__values[3] if self.__level < 2 else self.__values[3 * channel + 2]
+
+
+
+        def getvalue(self, channel=None):
+            """
+            Gets the value
+            --------------
+            @Params: channel    (int)   [optional] The channel of level 2
+                                        records, 1 or 2.
+            @Return: (object)           The value.
+            """
+
+            return self.__values[2] if self.__level < 2 else self.__values[3 * channel + 1]
+
+
+
+    class __WriteAheadLog(object):
+        """
+        DataArea.__WriteAheadLog class
+        ==============================
+        This class is the sequential write-ahead log of DataArea. Entries are
+        appended to the log file as frames of the length (uint32), the CRC32
+        (uint32) and the content of the entry, and synced with a single fsync
+        per append. A torn or damaged frame at the end of the log is cut when
+        the log is opened. It is the spill file of DataArea.__WriterPool too.
+
+        The log counts the batches that are logged but not stored yet, like
+        the ones in the queue of the writers, and it is not emptied while
+        there are any. The functions can be called from many threads.
+        """
+
+
+
+        __FRAME = Struct('<II')
+
+
+
+        def __init__(self, path):
+            """
+            Initializes the class
+            ---------------------
+            @Params: path   (string)    The path of the log file, it is created
+                                        if missing.
+            """
+
+            self.__lock = Lock()
+            self.__file = open(path, 'a+b')
+            end = self.__file.seek(0, SEEK_END)
+            position = 0
+            for data in self.entries():
+                position += self.__FRAME.size + len(data)
+            if position < end:
+                self.__file.truncate(position)
+                self.__file.flush()
+                fsync(self.__file.fileno())
+            self.__size = position
+            self.__pending = 0
+            register(self.close)
+
+
+
+        def append(self, data, sync=True, pending=0):
+            """
+            Appends an entry to the log
+            ---------------------------
+            @Params: data       (bytes)     The content of the entry.
+                     sync       (bool)      [optional] False to leave the entry
+                                            to the operating system.
+                     pending    (int)       [optional] Count of batches of the
+                                            entry that are not stored yet.
+            """
+
+            with self.__lock:
+                self.__file.write(self.__FRAME.pack(len(data), crc32(data)) + data)
+                self.__file.flush()
+                if sync:
+                    fsync(self.__file.fileno())
+                self.__size += self.__FRAME.size + len(data)
+                self.__pending += pending
+
+
+
+        def close(self):
+            """
+            Closes the log file
+            -------------------
+            """
+
+            with self.__lock:
+                if not self.__file.closed:
+                    self.__file.close()
+                    unregister(self.close)
+
+
+
+        def entries(self):
+            """
+            Reads the entries of the log
+            ----------------------------
+            Reading stops at a torn or damaged frame.
+            @Return: (list)     The contents of the entries in order.
+            """
+
+            result = []
+            with self.__lock:
+                log_file = self.__file
+                position = 0
+                while True:
+                    log_file.seek(position)
+                    header = log_file.read(self.__FRAME.size)
+                    if len(header) < self.__FRAME.size:
+                        return result
+                    length, checksum = self.__FRAME.unpack(header)
+                    data = log_file.read(length)
+                    if len(data) < length or crc32(data) != checksum:
+                        return result
+                    position += self.__FRAME.size + length
+                    result.append(data)
+
+
+
+        def getpending(self):
+            """
+            Gets the count of pending batches
+            ---------------------------------
+            @Return: (int)  The count of logged batches that are not stored yet.
+            """
+
+            return self.__pending
+
+
+
+        def getsize(self):
+            """
+            Gets the size of the log
+            ------------------------
+            @Return: (int)  The size of the entries in bytes.
+            """
+
+            return self.__size
+
+
+
+        def release(self, count=1):
+            """
+            Marks logged batches as stored
+            ------------------------------
+            @Params: count  (int)   [optional] Count of the stored batches.
+            """
+
+            with self.__lock:
+                self.__pending -= count
+
+
+
+        def truncate(self, force=True):
+            """
+            Removes all entries of the log
+            ------------------------------
+            @Params: force  (bool)  [optional] False to keep the entries while
+                                    batches are pending.
+            @Return: (bool)         True if the log is emptied, False if not.
+            """
+
+            with self.__lock:
+                if not force and self.__pending:
+                    return False
+                self.__file.truncate(0)
+                self.__file.flush()
+                fsync(self.__file.fileno())
+                self.__size = 0
+                self.__pending = 0
+                return True
+
+
+
+    class __WriterPool(object):
+        """
+        DataArea.__WriterPool class
+        ===========================
+        This class is the storage stage of DataArea. The ingest loop puts the
+        rows of a level as a batch to a bounded queue and a pool of writer
+        threads writes them, so the loop doesn't wait for the disk and the
+        areas upstream are not slowed down by the storage. The levels are
+        shared among the writers by level_id % writers, so the batches of a
+        level are written by the same writer in order. When the queue is full,
+        the overflow policy decides:
+            block   The loop waits for room in the queue.
+            spill   The batch is pickled to the spill file, like to a pipe, and
+                    written when the writers are idle. Later batches follow it
+                    to the file until it is written, so the order is kept.
+            drop    The oldest batch of the lowest level is dropped and its
+                    rows are finalized as filtered. A batch of a lower level
+                    than all queued ones is dropped itself.
+        Every batch carries the sequence of its entry in the write-ahead log,
+        if any, to the write and drop functions. The first error of a writer
+        is raised by the next put().
+        """
+
+
+
+        __OVERFLOWS = ['block', 'spill', 'drop']
+
+
+
+        def __init__(self, write, drop, writers, queue_size=64, overflow='block',
+                     spill=None, interval=5.0):
+            """
+            Initializes the class
+            ---------------------
+            @Params: write      (callable)      Function to write a list of
+                                                tuples of a level and its rows
+                                                with the sequence of the
+                                                batch, it is called with an
+                                                empty list and None when a
+                                                writer is idle.
+                     drop       (callable)      Function to call with the level
+                                                and the sequence of a dropped
+                                                batch.
+                     writers    (int)           Count of writer threads.
+                     queue_size (int)           [optional] Count of batches to
+                                                queue at most.
+                     overflow   (string)        [optional] The overflow policy.
+                     spill      (DataArea.__WriteAheadLog)
+                                                [optional] The spill file of the
+                                                spill policy. Batches spilled
+                                                before are written first.
+                     interval   (float)         [optional] Time in seconds a
+                                                writer waits before it calls
+                                                write when it is idle.
+            @Throws: MGPError                   When a setting is not valid.
+            """
+
+            if not isinstance(writers, int) or writers <= 0:
+                raise MGPError('DataArea.__WriterPool: writers must be a positive int but is "{}".'
+                               .format(writers))
+            if not isinstance(queue_size, int) or queue_size <= 0:
+                raise MGPError('DataArea.__WriterPool: queue_size must be a positive int but is "{}".'
+                               .format(queue_size))
+            if overflow not in self.__OVERFLOWS:
+                raise MGPError('DataArea.__WriterPool: overflow must be one of {} but is "{}".'
+                               .format(self.__OVERFLOWS, overflow))
+            if overflow == 'spill' and spill is None:
+                raise MGPError('DataArea.__WriterPool: The spill policy needs a spill file.')
+            self.__write = write
+            self.__dropped = drop
+            self.__queue_size = queue_size
+            self.__overflow = overflow
+            self.__spill = spill
+            self.__interval = interval
+            self.__condition = Condition()
+            self.__queues = [deque() for _ in range(4)]
+            self.__queued = 0
+            self.__busy = 0
+            self.__spilled = len(spill.entries()) if spill is not None else 0
+            self.__draining = False
+            self.__running = True
+            self.__error = None
+            self.__counters = {'queued': 0, 'spilled': 0, 'dropped': 0}
+            self.__threads = [Thread(target=self.__run, args=(index, writers), daemon=True,
+                                     name='DataArea writer {}'.format(index))
+                              for index in range(writers)]
+            for thread in self.__threads:
+                thread.start()
+            register(self.close)
+
+
+
+        def __drop(self, level_id, batch):
+            """
+            Drops a batch
+            -------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     batch      (tuple) The rows and the sequence of the batch.
+            """
+
+            rows, sequence = batch
+            for row in rows:
+                row.finalize(None)
+            self.__counters['dropped'] += len(rows)
+            self.__dropped(level_id, sequence)
+
+
+
+        def __run(self, index, writers):
+            """
+            Runs a writer
+            -------------
+            @Params: index      (int)   The index of the writer.
+                     writers    (int)   Count of writers.
+            """
+
+            levels = range(index, len(self.__queues), writers)
+            condition = self.__condition
+            while True:
+                batch = None
+                spilled = []
+                with condition:
+                    while True:
+                        level_id = next((level_id for level_id in levels
+                                         if self.__queues[level_id]), None)
+                        if level_id is not None:
+                            batch = (level_id,) + self.__queues[level_id].popleft()
+                            self.__queued -= 1
+                            condition.notify_all()
+                            break
+                        if self.__spilled and not (self.__draining or self.__queued or self.__busy):
+                            spilled = self.__spill.entries()
+                            self.__spill.truncate()
+                            self.__spilled = 0
+                            self.__draining = True
+                            break
+                        if not self.__running and not self.__spilled:
+                            return
+                        if not condition.wait(self.__interval) and index == 0:
+                            break
+                    self.__busy += 1
+                try:
+                    if spilled:
+                        for data in spilled:
+                            level_id, rows, sequence = loads(data)
+                            self.__write([(level_id, rows)], sequence)
+                    elif batch is not None:
+                        self.__write([batch[:2]], batch[2])
+                    else:
+                        self.__write([], None)
+                except Exception as error:
+                    with condition:
+                        if self.__error is None:
+                            self.__error = error
+                finally:
+                    with condition:
+                        self.__busy -= 1
+                        if spilled:
+                            self.__draining = False
+                        condition.notify_all()
+
+
+
+        def close(self):
+            """
+            Stops the writers
+            -----------------
+            The writers write the queued and spilled batches before they stop.
+            """
+
+            with self.__condition:
+                if not self.__running:
+                    return
+                self.__running = False
+                self.__condition.notify_all()
+            unregister(self.close)
+            for thread in self.__threads:
+                thread.join()
+
+
+
+        def getcounters(self):
+            """
+            Gets the counters of the queue
+            ------------------------------
+            @Return: (dict)     The count of batches in the queue now (queued),
+                                of batches put to the spill file (spilled) and
+                                of dropped rows (dropped).
+            """
+
+            with self.__condition:
+                counters = self.__counters.copy()
+                counters['queued'] = self.__queued
+            return counters
+
+
+
+        def put(self, level_id, rows, sequence=None):
+            """
+            Puts a batch to the queue
+            -------------------------
+            Spilled batches are synced to the spill file.
+            @Params: level_id   (int)           The identifier of the storage
+                                                level.
+                     rows       (list)          The rows of the level.
+                     sequence   (int|NoneType)  [optional] The sequence of the
+                                                entry of the batch in the
+                                                write-ahead log.
+            @Throws: MGPError                   When a writer failed or the
+                                                pool is closed.
+            """
+
+            with self.__condition:
+                if self.__error is not None:
+                    raise MGPError('DataArea.__WriterPool.put(): A writer failed: {}'
+                                   .format(self.__error))
+                if not self.__running:
+                    raise MGPError('DataArea.__WriterPool.put(): The writers are stopped.')
+                if self.__spilled or self.__draining or self.__queued >= self.__queue_size:
+                    if self.__overflow == 'spill':
+                        self.__spill.append(dumps((level_id, rows, sequence), HIGHEST_PROTOCOL))
+                        self.__spilled += 1
+                        self.__counters['spilled'] += 1
+                        self.__condition.notify_all()
+                        return
+                    while self.__queued >= self.__queue_size:
+                        if self.__overflow == 'block':
+                            self.__condition.wait()
+                            continue
+                        lowest = next(level for level, queue in enumerate(self.__queues) if queue)
+                        if level_id < lowest:
+                            self.__drop(level_id, (rows, sequence))
+                            return
+                        self.__drop(lowest, self.__queues[lowest].popleft())
+                        self.__queued -= 1
+                self.__queues[level_id].append((rows, sequence))
+                self.__queued += 1
+                self.__condition.notify_all()
+
+
+
+    class LineageIndex(object):
+        """
+        DataArea.LineageIndex class
+        ===========================
+        This class is the lineage index of the stored records. Records of
+        levels 1 to 3 point to their parent record on the level below by
+        l0_id, l1_id and l2_id. The index holds these pointers forward, from a
+        record to its parent, in an array per level indexed by the ID of the
+        record, and reverse, from a record to its children, in a dictionary
+        per level. So a chain of records is resolved in one lookup per level
+        in either direction.
+        """
+
+
+
+        def __init__(self):
+            """
+            Initializes the class
+            ---------------------
+            """
+
+            self.__parents = [array('q') for _ in range(4)]
+            self.__children = [{} for _ in range(3)]
+
+
+
+        def add(self, level_id, record_id, parent_id):
+            """
+            Adds the parent of a record
+            ---------------------------
+            A parent that was indexed for the record before is replaced.
+            Records of level 0 and records without an int parent ID are not
+            indexed.
+            @Params: level_id   (int)           The identifier of the storage
+                                                level.
+                     record_id  (int)           The ID of the record.
+                     parent_id  (int|NoneType)  The ID of the parent record.
+            """
+
+            if level_id == 0 or parent_id.__class__ is not int or parent_id < 1:
+                return
+            self.remove(level_id, record_id)
+            parents = self.__parents[level_id]
+            if len(parents) <= record_id:
+                parents.frombytes(bytes(8 * (record_id + 1 - len(parents))))
+            parents[record_id] = parent_id
+            children = self.__children[level_id - 1]
+            siblings = children.get(parent_id)
+            if siblings is None:
+                children[parent_id] = [record_id]
+            else:
+                siblings.append(record_id)
+
+
+
+        def children(self, level_id, record_id):
+            """
+            Gets the children of a record
+            -----------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (list)             The IDs of the records of the level
+                                        above that point to the record.
+            """
+
+            if level_id >= 3:
+                return []
+            return list(self.__children[level_id].get(record_id, ()))
+
+
+
+        def parent(self, level_id, record_id):
+            """
+            Gets the parent of a record
+            ---------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            @Return: (int|NoneType)     The ID of the parent record or None if
+                                        the record is not indexed.
+            """
+
+            parents = self.__parents[level_id]
+            if 0 < record_id < len(parents) and parents[record_id]:
+                return parents[record_id]
+            return None
+
+
+
+        def remove(self, level_id, record_id):
+            """
+            Removes the parent of a record
+            ------------------------------
+            @Params: level_id   (int)   The identifier of the storage level.
+                     record_id  (int)   The ID of the record.
+            """
+
+            parent_id = self.parent(level_id, record_id)
+            if parent_id is None:
+                return
+            self.__parents[level_id][record_id] = 0
+            children = self.__children[level_id - 1]
+            siblings = children[parent_id]
+            siblings.remove(record_id)
+            if not siblings:
+                del children[parent_id]
+
+
+
+    class TimeIndex(object):
+        """
+        DataArea.TimeIndex class
+        ========================
+        This class is the time index of the CSV and DoF engines. Records are
+        grouped in blocks of consecutive IDs and the index holds the smallest
+        and the largest timestamp of every block. Two more bounds make the
+        blocks of a time range searchable with bisect even if timestamps come
+        out of order: the largest timestamp up to a block and the smallest
+        timestamp from a block on, neither decreases from block to block.
+        Adding timestamps in time order updates the bounds in O(1), a
+        timestamp out of order updates the bounds of the blocks it overtakes.
+        """
+
+
+
+        def __init__(self, stride):
+            """
+            Initializes the class
+            ---------------------
+            @Params: stride (int)   Count of records in a block.
+            """
+
+            self.__stride = stride
+            self.__lows = []
+            self.__highs = []
+            self.__floors = []
+            self.__ceilings = []
+            self.__first = None
+            self.__last = -1
+
+
+
+        def add(self, record_id, timestamp):
+            """
+            Adds the timestamp of a record
+            ------------------------------
+            Records without timestamp are not indexed.
+            @Params: record_id  (int)           The ID of the record.
+                     timestamp  (time alike)    The timestamp of the record.
+            @Throws: TypeError                  When the timestamp can't be
+                                                compared with the others.
+            """
+
+            if timestamp is None:
+                return
+            block = (record_id - 1) // self.__stride
+            lows, highs = self.__lows, self.__highs
+            floors, ceilings = self.__floors, self.__ceilings
+            while len(lows) <= block:
+                lows.append(None)
+                highs.append(None)
+                floors.append(None)
+                ceilings.append(ceilings[-1] if ceilings else None)
+            index = block
+            while index < len(ceilings) and (ceilings[index] is None
+                                             or ceilings[index] < timestamp):
+                ceilings[index] = timestamp
+                index += 1
+            index = block
+            while index >= 0 and (floors[index] is None or floors[index] > timestamp):
+                floors[index] = timestamp
+                index -= 1
+            if lows[block] is None:
+                lows[block] = highs[block] = timestamp
+            elif timestamp < lows[block]:
+                lows[block] = timestamp
+            elif timestamp > highs[block]:
+                highs[block] = timestamp
+            if self.__first is None or block < self.__first:
+                self.__first = block
+            if block > self.__last:
+                self.__last = block
+
+
+
+        def blocks(self, start, end):
+            """
+            Finds the blocks of a time range
+            --------------------------------
+            @Params: start  (time alike)    The first timestamp of the range.
+                     end    (time alike)    The last timestamp of the range.
+            @Return: (generator)            The numbers of the blocks that have
+                                            timestamps of the range.
+            """
+
+            if self.__first is None:
+                return
+            lows, highs = self.__lows, self.__highs
+            for block in range(bisect_left(self.__ceilings, start, self.__first),
+                               bisect_right(self.__floors, end, 0, self.__last + 1)):
+                if lows[block] is not None and lows[block] <= end and highs[block] >= start:
+                    yield block
+
+
+
+        def bounds(self, block):
+            """
+            Gets the bounds of a block
+            --------------------------
+            @Params: block  (int)       The number of the block.
+            @Return: (tuple|NoneType)   The smallest and the largest timestamp of
+                                        the block or None if it has no indexed
+                                        record.
+            """
+
+            if block >= len(self.__lows) or self.__lows[block] is None:
+                return None
+            return self.__lows[block], self.__highs[block]
+
+
+
+        def records(self, start, end, count):
+            """
+            Finds the records of a time range
+            ---------------------------------
+            @Params: start  (time alike)    The first timestamp of the range.
+                     end    (time alike)    The last timestamp of the range.
+                     count  (int)           Count of records of the level.
+            @Return: (generator)            The IDs of the records in the blocks
+                                            of the range in ID order, their
+                                            timestamps have to be checked.
+            """
+
+            stride = self.__stride
+            for block in self.blocks(start, end):
+                yield from range(block * stride + 1, min((block + 1) * stride, count) + 1)
+
+
+
+    __LEVELS = {MGPDataRowL0: 0, MGPDataRowL1: 1, MGPDataRowL2: 2, MGPDataRowL3: 3}
+    __QUERY_ROWS = 1024
+    __STORAGE_TYPES = ['DoF', 'CSV', 'SQL', 'Chunk']
+
+
+
+    engine = None # Class level variable for singleton instance
+    __lock = RLock()
+
+
+
+    def __init__(self, storage_type, configdict, data_source,
+                 loop_interval=5000, ui_pipe=None, event_driven=False,
+                 rollup=None):
+        """
+        Intializes the class
+        --------------------
+        @Params: storage_type   (string)            Type of the selected storage
+                                                    method. Must be one of the
+                                                    implemented types.
+                 configdict     (dict)              Key value pair based settings
+                                                    according to the needs of the
+                                                    selected storing engine.
+                 data_source    (PipeConnection)    The pipe where source data
+                                                    come from.
+                 loop_interval  (int)               Time in milliseconds between
+                                                    cycles. In event-driven mode
+                                                    the longest wait for data.
+                 ui_pipe        (PipeConnection)    Pipe to send data to the UI
+                                                    flow.
+                 event_driven   (bool)              [optional] True to wake up
+                                                    on incoming data, False to
+                                                    poll in fixed intervals.
+                 rollup         (MGPRollup)         [optional] Multi-resolution
+                                                    rollups to update with the
+                                                    stored L0 and L1 rows.
+        @Throws: MGPError                           When storage type is not
+                                                    implemented or doesn't exist.
+                                                    When data source is not
+                                                    PipeConnection alike.
+        """
+
+        MGPLedger.owner = True
+        if not isinstance(DataArea.engine, DataArea.__DataAreaEngine):
             if storage_type in DataArea.__STORAGE_TYPES:
                 if storage_type == 'DoF':
-                    DataArea.engine = DataArea.__DataAreaEngine(DataArea.__EngineDof(configdict))
+                    DataArea.engine = DataArea.__DataAreaEngine(DataArea.__EngineDoF(configdict),
+                                                                configdict)
                 elif storage_type == 'CSV':
-                    DataArea.engine = DataArea.__DataAreaEngine(DataArea.__EngineCSV(configdict))
+                    DataArea.engine = DataArea.__DataAreaEngine(DataArea.__EngineCSV(configdict),
+                                                                configdict)
                 elif storage_type == 'SQL':
-                    DataArea.engine = DataArea.__DataAreaEngine(DataArea.__EngineSQL(configdict))
+                    DataArea.engine = DataArea.__DataAreaEngine(DataArea.__EngineSQL(configdict),
+                                                                configdict)
+                elif storage_type == 'Chunk':
+                    engine = DataArea.__EngineChunk(configdict, DataArea.__EngineDoF(configdict))
+                    DataArea.engine = DataArea.__DataAreaEngine(engine, configdict)
             else:
                 self.showimplemented()
                 raise MGPError('DataArea: Storage "{}" is not valid or not implemented.'
                                .format(storage_type))
-            if data_source.__class__.__name__ == 'PipeConnection':
+            if is_source(data_source):
                 self.__data_source = data_source
             else:
-                raise MGPError('DataArea: Pipe for data source must be instance of PipeConnection but is "{}".'
+                raise MGPError('DataArea: Pipe for data source must be a PipeConnection alike object with poll() and recv() but is "{}".'
                                .format(data_source.__class__.__name__))
             self.__loop_interval = loop_interval / 1000
             if ui_pipe is not None:
                 self.__to_ui = ui_pipe
             else:
                 self.__to_ui = NullPipe()
+            self.__event_driven = event_driven
+            self.__rollup = rollup
+            wal_path = configdict.get('wal')
+            self.__wal = DataArea.__WriteAheadLog(wal_path) if wal_path is not None else None
+            self.__wal_size = configdict.get('wal_size', 16 << 20)
+            self.__patient_pwd = configdict.get('patient_pwd')
+            self.__sequence = 0
+            self.__writers = None
+            if configdict.get('writers', 0):
+                overflow = configdict.get('overflow', 'block')
+                spill = None
+                if overflow == 'spill':
+                    spill = DataArea.__WriteAheadLog(configdict.get('spill', 'mgp.spill'))
+                    if self.__wal is not None and self.__wal.entries():
+                        spill.truncate()
+                self.__writers = DataArea.__WriterPool(self.__write, self.__dropped,
+                                                       configdict['writers'],
+                                                       configdict.get('queue_size', 64),
+                                                       overflow, spill, self.__loop_interval)
+            self.__new_data = [[] for _ in DataArea.__LEVELS]
             self.__do_loop = False
 
 
+
+    def __checkpoint(self):
+        """
+        Empties the write-ahead log when it is full
+        -------------------------------------------
+        The engine writes all pending records before. While batches are in the
+        queue of the writers the log is kept, it is emptied by the first
+        checkpoint without them.
+        """
+
+        if (self.__wal is not None and self.__wal.getsize() >= self.__wal_size
+                and not self.__wal.getpending()):
+            DataArea.engine.commit(True)
+            self.__wal.truncate(False)
+
+
+
+    def __dropped(self, level_id, sequence):
+        """
+        Logs a dropped batch
+        --------------------
+        @Params: level_id   (int)           The identifier of the storage level.
+                 sequence   (int|NoneType)  The sequence of the entry of the
+                                            batch in the write-ahead log.
+        """
+
+        if sequence is not None:
+            self.__wal.append(dumps(('dropped', sequence, level_id), HIGHEST_PROTOCOL))
+            self.__wal.release()
+
+
+
+    def __receive(self, element):
+        """
+        Collects an element of the source
+        ---------------------------------
+        Rows are grouped by their storage level, batches and gate cycles get
+        unpacked into the group of their level.
+        @Params: element    (MGPDataRowL*|MGPRowBatch|MGPGateCycle) The data to
+                                                                    store.
+        """
+
+        level_id = DataArea.__LEVELS.get(element.__class__)
+        if level_id is not None:
+            self.__new_data[level_id].append(element)
+        elif isinstance(element, (MGPRowBatch, MGPGateCycle)):
+            self.__new_data[element.getlevel()].extend(element)
+
+
+
+    def __recover(self):
+        """
+        Replays the write-ahead log
+        ---------------------------
+        The rows of a level of an entry got the IDs from the next ID of the
+        engine at the time they were stored in order, except the ones the
+        engine refused. So the rows up to the next ID of the engine now are
+        stored already and skipped, the rest is stored again. Without writers
+        the next IDs are in the entry, with writers a writer logs them before
+        it stores the batch, batches without them were still in the queue and
+        are stored completely. Dropped batches are skipped. The log is emptied
+        when all rows are written.
+        """
+
+        if self.__wal is None:
+            return
+        engine = DataArea.engine
+        with DataArea.__lock:
+            entries = [loads(data) for data in self.__wal.entries()]
+            first_ids = {}
+            failed = {}
+            dropped = set()
+            for entry in entries:
+                if entry[0] == 'ids':
+                    first_ids[entry[1], entry[2]] = entry[3]
+                elif entry[0] == 'failed':
+                    for level_id, positions in entry[2]:
+                        failed[entry[1], level_id] = set(positions)
+                elif entry[0] == 'dropped':
+                    dropped.add((entry[1], entry[2]))
+            for entry in entries:
+                if entry[0] != 'rows':
+                    continue
+                for level_id, first_id, values in entry[2]:
+                    key = (entry[1], level_id)
+                    if key in dropped:
+                        continue
+                    if first_id is None:
+                        first_id = first_ids.get(key)
+                    refused = failed.get(key, ())
+                    records = [record for position, record in enumerate(values)
+                               if position not in refused]
+                    done = 0
+                    if first_id is not None:
+                        done = min(max(engine.getnextid(level_id) - first_id, 0), len(records))
+                    if done < len(records):
+                        engine.create_many(level_id, [DataArea.__Record(level_id, record)
+                                                      for record in records[done:]])
+            engine.commit(True)
+            self.__wal.truncate()
+
+
+
+    def __store(self):
+        """
+        Stores the collected rows
+        -------------------------
+        The rows are logged to the write-ahead log first, the entry is synced
+        in the loop with writers too. With writers the rows of every level are
+        put to their queue, else they are written in the loop.
+        """
+
+        levels = [(level_id, rows) for level_id, rows in enumerate(self.__new_data) if rows]
+        if levels:
+            self.__new_data = [[] for _ in DataArea.__LEVELS]
+        if self.__writers is None:
+            self.__write(levels, self.__log(levels))
+        else:
+            sequence = self.__log(levels)
+            for level_id, rows in levels:
+                self.__writers.put(level_id, rows, sequence)
+
+
+
+    def __log(self, levels):
+        """
+        Logs rows to the write-ahead log
+        --------------------------------
+        The rows of all levels are logged as one synced entry, rows whose
+        columns can't be read are removed, so they are not stored. Without
+        writers the entry has the next ID of the engine for every level, since
+        the rows get their IDs from it in order. With writers the next IDs are
+        logged by the writers and the batches are pending in the log until
+        they are stored or dropped, so the log covers the queue and the spill
+        file.
+        @Params: levels (list)      Tuples of the identifier of a storage level
+                                    and the rows of the level, the rows that
+                                    are not logged are removed.
+        @Return: (int|NoneType)     The sequence of the entry or None if there
+                                    is no write-ahead log or no rows.
+        """
+
+        if self.__wal is None or not levels:
+            return None
+        entry = []
+        for index, (level_id, rows) in enumerate(levels):
+            logged = []
+            values = []
+            for row in rows:
+                try:
+                    values.append(_record_values(level_id, row, self.__patient_pwd))
+                except (AttributeError, TypeError):
+                    continue
+                logged.append(row)
+            levels[index] = (level_id, logged)
+            entry.append((level_id, None, values))
+        pending = len(levels)
+        if self.__writers is None:
+            with DataArea.__lock:
+                entry = [(level_id, DataArea.engine.getnextid(level_id), values)
+                         for level_id, _, values in entry]
+            pending = 0
+        self.__sequence += 1
+        self.__wal.append(dumps(('rows', self.__sequence, entry), HIGHEST_PROTOCOL), True, pending)
+        return self.__sequence
+
+
+
+    def __write(self, levels, sequence=None):
+        """
+        Writes rows to the engine
+        -------------------------
+        Every level is stored with a single create_many() call. Stored rows are
+        finalized with their IDs, rows that failed are left unfinalized, so
+        MGPLedger reports them. Stored L0 and L1 rows are added to the rollup.
+        The engine is committed and the write-ahead log checkpointed after
+        them, also when there are no rows.
+
+        The rows are logged by __log() before. With writers the next ID of the
+        engine is logged before a level is stored. The positions of the rows
+        the engine refused are logged after them, since they didn't get IDs.
+        @Params: levels     (list)          Tuples of the identifier of a
+                                            storage level and the rows of the
+                                            level.
+                 sequence   (int|NoneType)  [optional] The sequence of the
+                                            entry of the rows in the
+                                            write-ahead log.
+        """
+
+        engine = DataArea.engine
+        logged = self.__wal is not None and sequence is not None
+        with DataArea.__lock:
+            failed = []
+            for level_id, rows in levels:
+                if logged and self.__writers is not None:
+                    self.__wal.append(dumps(('ids', sequence, level_id, engine.getnextid(level_id)),
+                                            HIGHEST_PROTOCOL))
+                stored = []
+                record_ids = engine.create_many(level_id, rows)
+                for row, record_id in zip(rows, record_ids):
+                    if record_id != -1:
+                        row.finalize(record_id)
+                        stored.append(row)
+                if len(stored) < len(rows):
+                    failed.append((level_id, [position for position, record_id
+                                              in enumerate(record_ids) if record_id == -1]))
+                if self.__rollup is not None and level_id < 2:
+                    self.__rollup.update(stored, self.__patient_pwd)
+            if failed and logged:
+                self.__wal.append(dumps(('failed', sequence, failed), HIGHEST_PROTOCOL))
+            engine.commit()
+            if logged and self.__writers is not None:
+                self.__wal.release(len(levels))
+            self.__checkpoint()
+
+
+
     @classmethod
     def hasengine(cls):
         """
@@ -395,6 +3799,109 @@ class DataArea(object):
 
 
 
+    @classmethod
+    def getcounters(cls):
+        """
+        Gets the counters of the record cache
+        -------------------------------------
+        The cache is set by cache_size and write_behind in the configdict.
+        @Return: (dict)     The count of cache hits (hits), misses (misses),
+                            evictions (evictions) and coalesced updates
+                            (coalesced).
+        @Throws: MGPError   When there is no engine.
+        """
+
+        if not cls.hasengine():
+            raise MGPError('DataArea.getcounters(): There is no storage engine.')
+        with cls.__lock:
+            return cls.engine.getcounters()
+
+
+
+    def getqueuecounters(self):
+        """
+        Gets the counters of the writer queue
+        -------------------------------------
+        The queue is set by writers, queue_size and overflow in the configdict.
+        @Return: (dict)     The count of batches in the queue now (queued), of
+                            batches put to the spill file (spilled) and of
+                            dropped rows (dropped).
+        @Throws: MGPError   When there are no writers.
+        """
+
+        if self.__writers is None:
+            raise MGPError('DataArea.getqueuecounters(): There are no writers.')
+        return self.__writers.getcounters()
+
+
+
+    @classmethod
+    def __pages(cls, rows, page):
+        """
+        Reads the rows of a query in pages
+        ----------------------------------
+        The engine is only run under the lock of DataArea, so the pages don't
+        race with the writers.
+        @Params: rows   (generator)     The rows of the engine's query_range().
+                 page   (list)          The first page of rows.
+        @Return: (generator)            MGPDataRowL* rows of the query.
+        """
+
+        while page:
+            yield from page
+            if len(page) < cls.__QUERY_ROWS:
+                return
+            with cls.__lock:
+                page = list(islice(rows, cls.__QUERY_ROWS))
+
+
+
+    @classmethod
+    def query_range(cls, level_id, start, end, equipment=None, label=None):
+        """
+        Queries the records of a time range
+        -----------------------------------
+        Rows are read lazily in pages while the iterator is consumed, like the
+        samples of a label of an equipment for a graph. The timestamps of the
+        range must be comparable with the stored ones. SQL storage gives the
+        rows in time order, CSV, DoF and Chunk storages in the order of their
+        IDs. The pending records of the engine are written and the first page
+        is read when the query is called, every page is read under the lock of
+        DataArea. With writers, rows written between two pages may be in the
+        result or not.
+        @Params: level_id   (int)               The identifier of the storage
+                                                level.
+                 start      (time alike)        The first timestamp of the
+                                                range.
+                 end        (time alike)        The last timestamp of the
+                                                range, it is included.
+                 equipment  (string|NoneType)   [optional] The equipment to
+                                                match, level 0 only.
+                 label      (string|NoneType)   [optional] The label to match,
+                                                either channel of level 2
+                                                rows. Not for level 3.
+        @Return: (iterator)                     MGPDataRowL* rows of the range.
+        @Throws: MGPError                       When there is no engine, the
+                                                level doesn't exist or a filter
+                                                is not supported by the level.
+        """
+
+        if not cls.hasengine():
+            raise MGPError('DataArea.query_range(): There is no storage engine.')
+        if level_id not in range(len(cls.__LEVELS)):
+            raise MGPError('DataArea.query_range(): Level "{}" doesn\'t exist.'
+                           .format(level_id))
+        if equipment is not None and level_id != 0:
+            raise MGPError('DataArea.query_range(): Equipment filter is for level 0 only.')
+        if label is not None and level_id == 3:
+            raise MGPError('DataArea.query_range(): Level 3 has no label to filter.')
+        with cls.__lock:
+            rows = cls.engine.query_range(level_id, start, end, equipment, label)
+            page = list(islice(rows, cls.__QUERY_ROWS))
+        return cls.__pages(rows, page)
+
+
+
     def showimplemented(self):
         """
         Prints implemented storage identifiers
@@ -413,21 +3920,219 @@ class DataArea(object):
         -----------------
         """
 
+        self.__recover()
         self.__do_loop = True
         while self.__do_loop:
             cycle_start = time_ns()
-            while self.__data_source.poll():
-                element = self.__data_source.recv()
-                if element.__class__.__name__ == 'MGPDataRowL0':
-                    DataArea.engine.create(0, element)
-                elif element.__class__.__name__ == 'MGPDataRowL1':
-                    DataArea.engine.create(1, element)
-                elif element.__class__.__name__ == 'MGPDataRowL2':
-                    DataArea.engine.create(2, element)
-                elif element.__class__.__name__ == 'MGPDataRowL3':
-                    DataArea.engine.create(3, element)
-            if len(new_data) > 0:
-                pass
-            sleep_interval = self.__loop_interval - ((time_ns() - cycle_start) / 1000000000)
-            if sleep_interval > 0:
-                sleep(sleep_interval)
+            if self.__event_driven:
+                drain_source(self.__data_source, self.__receive, self.__loop_interval)
+                self.__store()
+            else:
+                drain_source(self.__data_source, self.__receive)
+                self.__store()
+                sleep_interval = self.__loop_interval - ((time_ns() - cycle_start) / 1000000000)
+                if sleep_interval > 0:
+                    sleep(sleep_interval)
+
+
+
+    @classmethod
+    def __checktrace(cls, function, level_id):
+        """
+        Checks the arguments of a trace
+        -------------------------------
+        @Params: function   (string)    The name of the function for the error
+                                        message.
+                 level_id   (int)       The identifier of the storage level.
+        @Throws: MGPError               When there is no engine or the level
+                                        doesn't exist.
+        """
+
+        if not cls.hasengine():
+            raise MGPError('DataArea.{}(): There is no storage engine.'.format(function))
+        if level_id not in range(len(cls.__LEVELS)):
+            raise MGPError('DataArea.{}(): Level "{}" doesn\'t exist.'
+                           .format(function, level_id))
+
+
+
+    @classmethod
+    def trace_down(cls, level_id, record_id):
+        """
+        Traces a record to its descendants
+        ----------------------------------
+        Like the L1 rows of an L0 sample, the gate decisions of them and the
+        responses to the decisions. Descendants are found by the lineage index,
+        so records stored before the engine was opened are not found.
+        @Params: level_id   (int)   The identifier of the storage level.
+                 record_id  (int)   The ID of the record.
+        @Return: (dict)             The IDs of the record and its descendants
+                                    in lists by level, from the level of the
+                                    record to level 3.
+        @Throws: MGPError           When there is no engine, the level doesn't
+                                    exist or the lineage index is disabled.
+        """
+
+        cls.__checktrace('trace_down', level_id)
+        with cls.__lock:
+            return cls.engine.trace_down(level_id, [record_id])[0]
+
+
+
+    @classmethod
+    def trace_down_many(cls, level_id, record_ids):
+        """
+        Traces many records to their descendants
+        ----------------------------------------
+        @Params: level_id   (int)       The identifier of the storage level.
+                 record_ids (iterable)  The IDs of the records.
+        @Return: (list)                 A dictionary per record like
+                                        trace_down() gives it.
+        @Throws: MGPError               When there is no engine, the level
+                                        doesn't exist or the lineage index is
+                                        disabled.
+        """
+
+        cls.__checktrace('trace_down_many', level_id)
+        with cls.__lock:
+            return cls.engine.trace_down(level_id, record_ids)
+
+
+
+    @classmethod
+    def trace_up(cls, level_id, record_id):
+        """
+        Traces a record to its ancestors
+        --------------------------------
+        Like an L3 response back to the gate decision, the L1 row and the raw
+        L0 sample it was made of.
+        @Params: level_id   (int)   The identifier of the storage level.
+                 record_id  (int)   The ID of the record.
+        @Return: (dict)             The IDs of the record and its ancestors by
+                                    level. The chain ends at the first unknown
+                                    parent.
+        @Throws: MGPError           When there is no engine or the level doesn't
+                                    exist.
+        """
+
+        cls.__checktrace('trace_up', level_id)
+        with cls.__lock:
+            return cls.engine.trace_up(level_id, [record_id])[0]
+
+
+
+    @classmethod
+    def trace_up_many(cls, level_id, record_ids):
+        """
+        Traces many records to their ancestors
+        --------------------------------------
+        Parents shared by the records are looked up once, like the gate
+        decision of the responses of an incident.
+        @Params: level_id   (int)       The identifier of the storage level.
+                 record_ids (iterable)  The IDs of the records.
+        @Return: (list)                 A dictionary per record like trace_up()
+                                        gives it.
+        @Throws: MGPError               When there is no engine or the level
+                                        doesn't exist.
+        """
+
+        cls.__checktrace('trace_up_many', level_id)
+        with cls.__lock:
+            return cls.engine.trace_up(level_id, record_ids)
+
+
+
+def _matches(level_id, row, equipment=None, label=None):
+    """
+    Checks whether a row matches the filters of a query
+    ---------------------------------------------------
+    @Params: level_id   (int)               The identifier of the storage level.
+             row        (MGPDataRowL*)      The row to check.
+             equipment  (string|NoneType)   [optional] The equipment of level 0
+                                            rows to match.
+             label      (string|NoneType)   [optional] The label to match, any
+                                            channel of level 2 rows.
+    @Return: (bool)                         True if the row matches, False if
+                                            not.
+    """
+
+    if equipment is not None and row.getequipment() != equipment:
+        return False
+    if label is not None:
+        if level_id == 2:
+            return label in (row.getlabel(1), row.getlabel(2))
+        return row.getlabel() == label
+    return True
+
+
+
+def _record_values(level_id, record, patient_pwd=None):
+    """
+    Gets the stored columns of a record
+    -----------------------------------
+    The columns follow the ID column of the level:
+        0   timestamp, label, value, unit, equipment_id, event_type
+        1   timestamp, label, value, unit, l0_id, patient_id
+        2   timestamp, l1_id, gate, ch1_label, ch1_value, ch1_unit, ch2_label,
+            ch2_value, ch2_unit
+        3   timestamp, l2_id, response
+    @Params: level_id       (int)           The identifier of the storage level.
+             record         (MGPDataRowL*)  The data to store, views of
+                                            MGPRowBatch and MGPGateCycle work
+                                            too.
+             patient_pwd    (string)        [optional] The password to get the
+                                            patient ID of L1 records, rows
+                                            without password need None.
+    @Return: (list)                         The values of the columns.
+    """
+
+    timestamp = record.gettimestamp()
+    if level_id == 0:
+        return [timestamp, record.getlabel(), record.getvalue(), record.getunit(),
+                record.getequipment(), record.geteventtype()]
+    elif level_id == 1:
+        return [timestamp, record.getlabel(), record.getvalue(), record.getunit(),
+                record.getl0id(), record.getpatientid(patient_pwd)]
+    elif level_id == 2:
+        getgate = getattr(record, 'getgate', None)
+        return [timestamp, record.getl1id(), getgate() if getgate is not None else None,
+                record.getlabel(1), record.getvalue(1), record.getunit(1),
+                record.getlabel(2), record.getvalue(2), record.getunit(2)]
+    return [timestamp, record.getl2id(), record.getresponse()]
+
+
+
+def _stored_row(level_id, record_id, values, patient_pwd=None):
+    """
+    Creates a row of stored columns
+    -------------------------------
+    The row is created as a finalized one, so it is not counted by MGPLedger.
+    @Params: level_id       (int)           The identifier of the storage level.
+             record_id      (int)           The ID of the record.
+             values         (sequence)      The values of the columns like
+                                            _record_values() gives them.
+             patient_pwd    (string)        [optional] The password of the
+                                            patient ID of L1 records.
+    @Return: (MGPDataRowL*)                 The row.
+    """
+
+    if level_id == 0:
+        row = MGPDataRowL0.__new__(MGPDataRowL0)
+        row.__setstate__((values[0], MGPData(values[1], values[2], values[3]),
+                          values[4], values[5], False, record_id))
+    elif level_id == 1:
+        row = MGPDataRowL1.__new__(MGPDataRowL1)
+        row.__setstate__((values[0], MGPData(values[1], values[2], values[3]),
+                          values[4], values[5],
+                          patient_pwd if values[5] is not None else None,
+                          False, record_id))
+    elif level_id == 2:
+        channels = [MGPData(*values[index:index + 3]) if values[index] is not None else None
+                    for index in (3, 6)]
+        row = MGPDataRowL2.__new__(MGPDataRowL2)
+        row.__setstate__((values[0], channels[0], channels[1], values[1], False,
+                          record_id))
+    else:
+        row = MGPDataRowL3.__new__(MGPDataRowL3)
+        row.__setstate__((values[0], values[1], values[2], False, record_id))
+    return row
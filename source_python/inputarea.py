@@ -7,7 +7,13 @@ This module is part of the MGP library.
 
 
 
-from common import MGPError, NullPipe
+from asyncio import (DatagramProtocol, IncompleteReadError, Queue, create_task, gather,
+                     get_running_loop, open_connection, run as asyncio_run)
+from binascii import crc_hqx
+from common import ExitObject, MGPData, MGPDataRowL0, MGPError, MGPRowBatch, NullPipe
+from struct import Struct, error as StructError
+from time import time_ns
+from zlib import crc32
 
 
 
@@ -18,10 +24,400 @@ class InputArea(object):
     This class provides the functionality of the Input Area. The task of the
     class is to translate information received from sensors and state variables
     to data for the Processing Area.
+
+    Sensor drivers that deliver buffers of many samples can give them to
+    read_many(), which sends the MGPDataRowL0 rows of every flow as an
+    MGPRowBatch, so a buffer costs one send per flow instead of one per
+    sample. A handler can return a batch ExitObject too, whose members are
+    MGPRowBatch instances, then read() sends the buffer translated at once.
     """
 
 
 
+    class __Collector(object):
+        """
+        InputArea.__Collector class
+        ===========================
+        This class collects the data of a flow for read_many(). Consecutive
+        MGPDataRowL0 rows are copied into an MGPRowBatch, any other data is sent
+        as it is after the rows collected before, so the order is kept.
+        """
+
+
+
+        def __init__(self, pipe):
+            """
+            Intializes the class
+            --------------------
+            @Params: pipe   (PipeConnection)    Pipe to send the data to.
+            """
+
+            self.__pipe = pipe
+            self.__batch = None
+
+
+
+        def add(self, data):
+            """
+            Adds data of the flow
+            ---------------------
+            @Params: data   (object|NoneType)   The data or None if there is
+                                                nothing to send.
+            """
+
+            if data is None:
+                return
+            if data.__class__ is MGPDataRowL0:
+                if self.__batch is None:
+                    self.__batch = MGPRowBatch(0)
+                self.__batch.appendrow(data)
+            else:
+                self.flush()
+                self.__pipe.send(data)
+
+
+
+        def flush(self):
+            """
+            Sends the collected rows
+            ------------------------
+            """
+
+            if self.__batch is not None:
+                self.__pipe.send(self.__batch)
+                self.__batch = None
+
+
+
+    class FrameParser(object):
+        """
+        InputArea.FrameParser class
+        ===========================
+        This class is an incremental parser of binary frames of a raw sensor
+        stream. A frame is declared, not coded:
+            sync        The sync word the frame starts with, it is searched
+                        to find the next frame after garbage or a bad frame.
+            length      The struct format of the length field after the sync
+                        word, that gives the count of payload bytes. Without
+                        length the payload is records records long.
+            layout      The struct format of a record of the payload, the
+                        payload is a sequence of records.
+            checksum    The checksum after the payload, over the length field
+                        and the payload: 'sum8', 'xor8', 'crc16' (CCITT) or
+                        'crc32'.
+        The fields of a record are mapped by fields to 'timestamp', to a label
+        and unit pair of a value or to None to skip it, every value gives an
+        MGPDataRowL0 row.
+
+        The parser has a fixed receive buffer. Sources can read into it with
+        getbuffer() and fill(), like with recv_into() of a socket, or give
+        their bytes to feed(). Frames are decoded with struct from views of the
+        buffer without copying them, a partial frame at the end of the buffer
+        waits for the rest.
+        """
+
+
+
+        __CHECKSUMS = {'sum8': 'B', 'xor8': 'B', 'crc16': 'H', 'crc32': 'I'}
+
+
+
+        def __init__(self, layout, fields, sync=b'', length=None, records=1,
+                     checksum=None, equipment_id=None, event_type=None,
+                     batch=True, buffer_size=65536):
+            """
+            Intializes the class
+            --------------------
+            @Params: layout         (string)    The struct format of a record,
+                                                its byte order is the byte order
+                                                of the frame.
+                     fields         (sequence)  Per field of a record
+                                                'timestamp', a label and unit
+                                                tuple or None. Records without
+                                                timestamp get the time_ns() of
+                                                their parsing.
+                     sync           (bytes)     [optional] The sync word.
+                     length         (string)    [optional] The struct format of
+                                                the length field, like 'H'.
+                     records        (int)       [optional] Count of records of
+                                                a frame without length field.
+                     checksum       (string)    [optional] The type of the
+                                                checksum.
+                     equipment_id   (string)    [optional] The ID of the
+                                                equipment of the rows.
+                     event_type     (string)    [optional] The type of the
+                                                event of the rows.
+                     batch          (bool)      [optional] True to give the rows
+                                                as an MGPRowBatch, False as a
+                                                list of MGPDataRowL0 rows.
+                     buffer_size    (int)       [optional] The size of the
+                                                receive buffer, it limits the
+                                                size of a frame.
+            @Throws: MGPError                   When a format or the fields
+                                                don't fit the frame or the
+                                                buffer.
+            """
+
+            order = layout[0] if layout[:1] in ('<', '>', '!', '=', '@') else '<'
+            try:
+                self.__record = Struct(layout if layout[:1] == order else order + layout)
+                self.__length = Struct(order + length) if length is not None else None
+            except StructError as error:
+                raise MGPError('InputArea.FrameParser: Format is not valid ({}).'
+                               .format(error))
+            if self.__length is not None and len(self.__length.unpack(bytes(self.__length.size))) != 1:
+                raise MGPError('InputArea.FrameParser: length must be a single field but is "{}".'
+                               .format(length))
+            count = len(self.__record.unpack(bytes(self.__record.size)))
+            if len(fields) != count:
+                raise MGPError('InputArea.FrameParser: {} fields are given for {} fields of the layout.'
+                               .format(len(fields), count))
+            if checksum is not None and checksum not in self.__CHECKSUMS:
+                raise MGPError('InputArea.FrameParser: checksum must be one of {} but is "{}".'
+                               .format(list(self.__CHECKSUMS), checksum))
+            self.__timestamp = fields.index('timestamp') if 'timestamp' in fields else None
+            self.__values = [(index, field[0], field[1]) for index, field in enumerate(fields)
+                             if field is not None and field != 'timestamp']
+            self.__sync = bytes(sync)
+            self.__records = records
+            self.__checksum = checksum
+            self.__check = Struct(order + self.__CHECKSUMS[checksum]) if checksum is not None else None
+            self.__equipment_id = equipment_id
+            self.__event_type = event_type
+            self.__batch = batch
+            header = len(self.__sync) + (self.__length.size if self.__length is not None else 0)
+            tail = self.__check.size if self.__check is not None else 0
+            if self.__length is None:
+                self.__max_payload = self.__record.size * records
+            else:
+                self.__max_payload = min((1 << (8 * self.__length.size)) - 1,
+                                         buffer_size - header - tail)
+            if header + max(self.__max_payload, self.__record.size) + tail > buffer_size:
+                raise MGPError('InputArea.FrameParser: buffer_size {} is too small for the frame.'
+                               .format(buffer_size))
+            self.__buffer = bytearray(buffer_size)
+            self.__view = memoryview(self.__buffer)
+            self.__end = 0
+            self.__counters = {'frames': 0, 'bad': 0, 'skipped': 0}
+
+
+
+        def __checksum_of(self, data):
+            """
+            Computes the checksum of data
+            -----------------------------
+            @Params: data   (memoryview)    The covered bytes of a frame.
+            @Return: (int)                  The checksum.
+            """
+
+            if self.__checksum == 'crc32':
+                return crc32(data)
+            if self.__checksum == 'crc16':
+                return crc_hqx(data, 0xFFFF)
+            if self.__checksum == 'sum8':
+                return sum(data) & 0xFF
+            result = 0
+            for byte in data:
+                result ^= byte
+            return result
+
+
+
+        def __drop(self):
+            """
+            Drops the content of a full buffer
+            ----------------------------------
+            A full buffer without a complete frame holds no frame that fits it.
+            """
+
+            self.__counters['skipped'] += self.__end
+            self.__end = 0
+
+
+
+        def __emit(self, output, records):
+            """
+            Appends the samples of records to the output
+            --------------------------------------------
+            @Params: output     (MGPRowBatch|list)  The rows to extend.
+                     records    (iterator)          Tuples of the fields of the
+                                                    records.
+            """
+
+            timestamp_index = self.__timestamp
+            equipment_id = self.__equipment_id
+            event_type = self.__event_type
+            values = self.__values
+            append = output.append
+            for fields in records:
+                timestamp = fields[timestamp_index] if timestamp_index is not None else time_ns()
+                if self.__batch:
+                    for index, label, unit in values:
+                        append(timestamp, label, fields[index], unit,
+                               equipment_id=equipment_id, event_type=event_type)
+                else:
+                    for index, label, unit in values:
+                        append(MGPDataRowL0(timestamp, MGPData(label, fields[index], unit),
+                                            equipment_id, event_type))
+
+
+
+        def __parse(self, output):
+            """
+            Parses the complete frames of the buffer
+            ----------------------------------------
+            The bytes of a partial frame are moved to the start of the buffer.
+            @Params: output (MGPRowBatch|list)  The rows to extend.
+            """
+
+            buffer = self.__buffer
+            view = self.__view
+            end = self.__end
+            sync = self.__sync
+            length = self.__length
+            record = self.__record
+            check = self.__check
+            counters = self.__counters
+            step = len(sync) or 1
+            position = 0
+            while True:
+                if sync:
+                    found = buffer.find(sync, position, end)
+                    if found < 0:
+                        keep = max(end - len(sync) + 1, position)
+                        counters['skipped'] += keep - position
+                        position = keep
+                        break
+                    counters['skipped'] += found - position
+                    position = found
+                head = position + len(sync)
+                if length is not None:
+                    if head + length.size > end:
+                        break
+                    size = length.unpack_from(buffer, head)[0]
+                    body = head + length.size
+                    if size % record.size or size > self.__max_payload:
+                        counters['bad'] += 1
+                        position += step
+                        continue
+                else:
+                    size = record.size * self.__records
+                    body = head
+                stop = body + size
+                if stop + (check.size if check is not None else 0) > end:
+                    break
+                if check is not None:
+                    if self.__checksum_of(view[head:stop]) != check.unpack_from(buffer, stop)[0]:
+                        counters['bad'] += 1
+                        position += step
+                        continue
+                    stop += check.size
+                self.__emit(output, record.iter_unpack(view[body:body + size]))
+                counters['frames'] += 1
+                position = stop
+            if position:
+                rest = end - position
+                buffer[:rest] = buffer[position:end]
+                self.__end = rest
+
+
+
+        def feed(self, data):
+            """
+            Parses bytes of the stream
+            --------------------------
+            The bytes are copied into the receive buffer piece by piece, so data
+            may be longer than the buffer.
+            @Params: data   (bytes-like)        The received bytes.
+            @Return: (MGPRowBatch|list)         The rows of the complete frames.
+            """
+
+            output = MGPRowBatch(0) if self.__batch else []
+            data = memoryview(data).cast('B')
+            while data:
+                free = len(self.__buffer) - self.__end
+                if not free:
+                    self.__drop()
+                    continue
+                piece = min(free, len(data))
+                self.__buffer[self.__end:self.__end + piece] = data[:piece]
+                self.__end += piece
+                data = data[piece:]
+                self.__parse(output)
+            return output
+
+
+
+        def fill(self, count):
+            """
+            Parses bytes written to the buffer
+            ----------------------------------
+            @Params: count  (int)               Count of bytes written to the
+                                                view of getbuffer().
+            @Return: (MGPRowBatch|list)         The rows of the complete frames.
+            """
+
+            output = MGPRowBatch(0) if self.__batch else []
+            self.__end += count
+            self.__parse(output)
+            if self.__end == len(self.__buffer):
+                self.__drop()
+            return output
+
+
+
+        def getbuffer(self):
+            """
+            Gets the free space of the receive buffer
+            -----------------------------------------
+            @Return: (memoryview)   The writable view of the free space, like
+                                    for recv_into() or readinto(). Call fill()
+                                    with the count of written bytes.
+            """
+
+            return self.__view[self.__end:]
+
+
+
+        def getcounters(self):
+            """
+            Gets the counters of the parser
+            -------------------------------
+            @Return: (dict)     The count of decoded frames (frames), of frames
+                                with a bad length or checksum (bad) and of
+                                bytes skipped to find a sync word (skipped).
+            """
+
+            return self.__counters.copy()
+
+
+
+        def handler(self, to_flow=True, to_data=False, to_ui=False):
+            """
+            Gets a handler function of the parser
+            -------------------------------------
+            The handler gives the rows of the received bytes as a batch
+            ExitObject, or an empty ExitObject without complete frames.
+            @Params: to_flow    (bool)  [optional] True to send the rows to the
+                                        main flow.
+                     to_data    (bool)  [optional] True to send the rows to the
+                                        data flow.
+                     to_ui      (bool)  [optional] True to send the rows to the
+                                        UI flow.
+            @Return: (callable)         The handler function for register().
+            """
+
+            def handle(rawdata):
+                rows = self.feed(rawdata)
+                if not len(rows):
+                    return ExitObject(None, None, None)
+                return ExitObject(rows if to_flow else None, rows if to_data else None,
+                                  rows if to_ui else None)
+
+            return handle
+
+
+
     class InputHandler(object):
         """
         InputHandler.InputArea class
@@ -161,6 +557,42 @@ class InputArea(object):
 
 
 
+    def read_many(self, handler_name, rawdatas):
+        """
+        Translates many raw data to processable data
+        --------------------------------------------
+        The handler and the filter are called for every raw datum like by
+        read(), but the MGPDataRowL0 rows of a flow are copied into an
+        MGPRowBatch and sent at once. Other data is sent as it is, in order
+        with the rows. Flows without pipe collect nothing.
+        @Params: handler_name   (string)    The identifier of the handler.
+                 rawdatas       (iterable)  The data to be sent to the handler
+                                            one by one.
+        @Throws: MGPError                   When non-existing handler is called.
+        """
+
+        handler = self.__events.get(handler_name)
+        if handler is None:
+            raise MGPError('InputArea.read_many(): Tried to read for non-existing name "{}".'
+                           .format(handler_name))
+        collectors = [InputArea.__Collector(pipe) if not isinstance(pipe, NullPipe) else None
+                      for pipe in (self.__to_flow, self.__to_data, self.__to_ui)]
+        to_flow, to_data, to_ui = collectors
+        handle = handler.handle
+        for rawdata in rawdatas:
+            data = handle(rawdata)
+            if to_flow is not None:
+                to_flow.add(data.toflow())
+            if to_data is not None:
+                to_data.add(data.todata())
+            if to_ui is not None:
+                to_ui.add(data.toui())
+        for collector in collectors:
+            if collector is not None:
+                collector.flush()
+
+
+
     def register(self, handler_name, handler_type, handler_function, filter_function=None):
         """
         Registers a handler to an identifier
@@ -196,3 +628,409 @@ class InputArea(object):
         else:
             raise MGPError('InputArea.unregister(): Tried to unregister non-existing name "{}".'
                            .format(handler_name))
+
+
+
+class AsyncInputArea(InputArea):
+    """
+    AsyncInputArea class
+    ====================
+    This class provides the Input Area for many concurrent sources on a single
+    asyncio event loop, like the devices of a ward. A source is an async
+    iterable of raw data, like the lines of a serial port or of a TCP stream
+    or the datagrams of a UDP socket, and it is added for a registered handler
+    with addsource().
+
+    Every source has a reader task, that puts the raw data to a bounded queue,
+    and a sender task, that takes what the queue holds, up to batch_size, and
+    gives it to read_many(), so a batch costs one send per flow. When the
+    queue is full, the reader waits and the source is not read further, so the
+    buffer of its transport fills and slows the device down, like a TCP
+    stream or a serial port with flow control. Datagrams can't wait, so
+    UDPSource drops them over its own limit.
+
+    Serial ports can be read with streamsource() from the StreamReader of
+    serial_asyncio.open_serial_connection() of the pyserial-asyncio package.
+    """
+
+
+
+    class UDPSource(object):
+        """
+        AsyncInputArea.UDPSource class
+        ==============================
+        This class is a source of the datagrams of a UDP socket. The socket is
+        bound when the source is opened, at latest by its first read.
+        """
+
+
+
+        class __Protocol(DatagramProtocol):
+            """
+            AsyncInputArea.UDPSource.__Protocol class
+            =========================================
+            This class passes the received datagrams to the source.
+            """
+
+
+
+            def __init__(self, receive):
+                """
+                Intializes the class
+                --------------------
+                @Params: receive    (callable)  Function to call with each
+                                                datagram.
+                """
+
+                self.__receive = receive
+
+
+
+            def datagram_received(self, data, address):
+                """
+                Receives a datagram
+                -------------------
+                @Params: data       (bytes)     The content of the datagram.
+                         address    (tuple)     The address of the sender.
+                """
+
+                self.__receive(data)
+
+
+
+        def __init__(self, host, port, limit=1024):
+            """
+            Intializes the class
+            --------------------
+            @Params: host   (string)    The address to bind to.
+                     port   (int)       The port to bind to, 0 for any free
+                                        port.
+                     limit  (int)       [optional] Count of datagrams to hold
+                                        at most, the ones over it are dropped.
+            @Throws: MGPError           When limit is not positive.
+            """
+
+            if limit <= 0:
+                raise MGPError('AsyncInputArea.UDPSource: limit must be positive but is "{}".'
+                               .format(limit))
+            self.__address = (host, port)
+            self.__limit = limit
+            self.__queue = None
+            self.__transport = None
+            self.__dropped = 0
+
+
+
+        def __aiter__(self):
+            """
+            Gets the iterator of the source
+            -------------------------------
+            @Return: (AsyncInputArea.UDPSource) The source itself.
+            """
+
+            return self
+
+
+
+        async def __anext__(self):
+            """
+            Reads the next datagram
+            -----------------------
+            @Return: (bytes)    The content of the datagram.
+            """
+
+            if self.__transport is None:
+                await self.open()
+            return await self.__queue.get()
+
+
+
+        def __receive(self, data):
+            """
+            Queues a datagram
+            -----------------
+            @Params: data   (bytes) The content of the datagram.
+            """
+
+            if self.__queue.qsize() >= self.__limit:
+                self.__dropped += 1
+            else:
+                self.__queue.put_nowait(data)
+
+
+
+        async def aclose(self):
+            """
+            Closes the socket
+            -----------------
+            """
+
+            if self.__transport is not None:
+                self.__transport.close()
+                self.__transport = None
+
+
+
+        def getaddress(self):
+            """
+            Gets the bound address
+            ----------------------
+            @Return: (tuple|NoneType)   The host and the port or None if the
+                                        source is not open.
+            """
+
+            if self.__transport is None:
+                return None
+            return self.__transport.get_extra_info('sockname')[:2]
+
+
+
+        def getdropped(self):
+            """
+            Gets the count of dropped datagrams
+            -----------------------------------
+            @Return: (int)  The count of datagrams dropped over the limit.
+            """
+
+            return self.__dropped
+
+
+
+        async def open(self):
+            """
+            Binds the socket
+            ----------------
+            """
+
+            if self.__transport is None:
+                self.__queue = Queue()
+                protocol = AsyncInputArea.UDPSource.__Protocol(self.__receive)
+                self.__transport, _ = await get_running_loop().create_datagram_endpoint(
+                    lambda: protocol, local_addr=self.__address)
+
+
+
+    __END = object()
+
+
+
+    def __init__(self, flow_pipe=None, data_pipe=None, ui_pipe=None):
+        """
+        Intializes the class
+        --------------------
+        @Params: flow_pipe  (PipeConnection)    [optional] Pipe to send data to
+                                                the main flow.
+                 data_pipe  (PipeConnection)    [optional] Pipe to send data to
+                                                the data flow.
+                 ui_pipe    (PipeConnection)    [optional] Pipe to send data to
+                                                the UI flow.
+        """
+
+        super().__init__(flow_pipe, data_pipe, ui_pipe)
+        self.__sources = {}
+        self.__readers = []
+
+
+
+    async def __read(self, source, queue):
+        """
+        Reads a source to its queue
+        ---------------------------
+        The end of the source is put to the queue too, also when the reader is
+        cancelled. Sources with aclose() are closed.
+        @Params: source (async iterable)    The source of raw data.
+                 queue  (asyncio.Queue)     The queue of the source.
+        """
+
+        try:
+            async for rawdata in source:
+                await queue.put(rawdata)
+        finally:
+            aclose = getattr(source, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+            await queue.put(self.__END)
+
+
+
+    async def __send(self, handler_name, queue, batch_size, counters, reader):
+        """
+        Sends the raw data of a queue in batches
+        ----------------------------------------
+        When sending fails, the reader is cancelled and the queue is emptied
+        until its end, so the reader doesn't wait for room forever.
+        @Params: handler_name   (string)        The identifier of the handler.
+                 queue          (asyncio.Queue) The queue of the source.
+                 batch_size     (int)           Count of raw data to send at
+                                                once at most.
+                 counters       (dict)          The counters of the source.
+                 reader         (asyncio.Task)  The reader of the source.
+        """
+
+        end = False
+        try:
+            while not end:
+                rawdatas = [await queue.get()]
+                while len(rawdatas) < batch_size and not queue.empty():
+                    rawdatas.append(queue.get_nowait())
+                if rawdatas[-1] is self.__END:
+                    rawdatas.pop()
+                    end = True
+                if rawdatas:
+                    self.read_many(handler_name, rawdatas)
+                    counters['received'] += len(rawdatas)
+                    counters['batches'] += 1
+        except Exception:
+            reader.cancel()
+            while not end:
+                end = await queue.get() is self.__END
+            raise
+
+
+
+    def addsource(self, source_name, handler_name, source, batch_size=256, queue_size=1024):
+        """
+        Adds a source for a handler
+        ---------------------------
+        Sources added while run() runs are read from the next run on.
+        @Params: source_name    (string)            Identifier of the source.
+                 handler_name   (string)            The identifier of the
+                                                    handler of the raw data.
+                 source         (async iterable)    The source of raw data.
+                 batch_size     (int)               [optional] Count of raw data
+                                                    to send at once at most.
+                 queue_size     (int)               [optional] Count of raw data
+                                                    to hold at most before the
+                                                    source is not read further.
+        @Throws: MGPError                           When the source exists, the
+                                                    handler doesn't exist or a
+                                                    size is not positive.
+        """
+
+        if source_name in self.__sources:
+            raise MGPError('AsyncInputArea.addsource(): Tried to add existing source "{}".'
+                           .format(source_name))
+        if not self.is_registered(handler_name):
+            raise MGPError('AsyncInputArea.addsource(): Tried to add source for non-existing name "{}".'
+                           .format(handler_name))
+        if batch_size <= 0 or queue_size <= 0:
+            raise MGPError('AsyncInputArea.addsource(): batch_size and queue_size must be positive but are "{}" and "{}".'
+                           .format(batch_size, queue_size))
+        self.__sources[source_name] = (handler_name, source, batch_size, queue_size,
+                                       {'received': 0, 'batches': 0})
+
+
+
+    def getcounters(self, source_name):
+        """
+        Gets the counters of a source
+        -----------------------------
+        @Params: source_name    (string)    Identifier of the source.
+        @Return: (dict)                     The count of raw data sent
+                                            (received) and of batches
+                                            (batches).
+        @Throws: MGPError                   When the source doesn't exist.
+        """
+
+        if source_name not in self.__sources:
+            raise MGPError('AsyncInputArea.getcounters(): Source "{}" doesn\'t exist.'
+                           .format(source_name))
+        return self.__sources[source_name][4].copy()
+
+
+
+    async def run(self):
+        """
+        Reads the sources
+        -----------------
+        The coroutine ends when every source ended or stop() was called, and
+        the raw data read until then is sent.
+        @Throws: Exception  The first error of a source or a handler.
+        """
+
+        readers = []
+        senders = []
+        for handler_name, source, batch_size, queue_size, counters in self.__sources.values():
+            queue = Queue(queue_size)
+            reader = create_task(self.__read(source, queue))
+            readers.append(reader)
+            senders.append(create_task(self.__send(handler_name, queue, batch_size, counters,
+                                                   reader)))
+        self.__readers = readers
+        try:
+            results = await gather(*readers, *senders, return_exceptions=True)
+        finally:
+            self.__readers = []
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+
+
+    @staticmethod
+    async def streamsource(reader, separator=b'\n'):
+        """
+        Reads the records of a stream
+        -----------------------------
+        @Params: reader     (asyncio.StreamReader)  The stream, like the one of
+                                                    a TCP connection or a serial
+                                                    port.
+                 separator  (bytes)                 [optional] The end of a
+                                                    record.
+        @Return: (async generator)                  The records with their
+                                                    separator. The last record
+                                                    may be without.
+        """
+
+        while True:
+            try:
+                yield await reader.readuntil(separator)
+            except IncompleteReadError as error:
+                if error.partial:
+                    yield error.partial
+                return
+
+
+
+    def start(self):
+        """
+        Handles main loop
+        -----------------
+        Runs run() on a new event loop.
+        """
+
+        asyncio_run(self.run())
+
+
+
+    def stop(self):
+        """
+        Stops reading the sources
+        -------------------------
+        It must be called on the event loop of run(), from other threads with
+        its call_soon_threadsafe().
+        """
+
+        for reader in self.__readers:
+            reader.cancel()
+
+
+
+    @staticmethod
+    async def tcpsource(host, port, separator=b'\n'):
+        """
+        Reads the records of a TCP stream
+        ---------------------------------
+        @Params: host       (string)    The address to connect to.
+                 port       (int)       The port to connect to.
+                 separator  (bytes)     [optional] The end of a record.
+        @Return: (async generator)      The records like streamsource() gives
+                                        them.
+        """
+
+        reader, writer = await open_connection(host, port)
+        try:
+            async for record in AsyncInputArea.streamsource(reader, separator):
+                yield record
+        finally:
+            writer.close()
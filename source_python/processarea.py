@@ -7,7 +7,7 @@ This module is part of the MGP library.
 
 
 
-from common import MGPError, NullPipe
+from common import MGPError, MGPRowBatch, NullPipe, drain_source, is_source
 from time import sleep, time_ns
 
 
@@ -19,12 +19,27 @@ class ProcessArea(object):
     This class provides the functionality of the Processing Area. The task of
     the class is to maintain a loop where input data gets processed and sent to
     Area of Gates and other to other flows as well.
+
+    The loop runs in one of two modes. In the fixed-interval mode the source is
+    polled once per loop_interval, which gives a deterministic timing. In the
+    event-driven mode the loop blocks on the source and processes data as soon
+    as it arrives, after collecting further data for at most batch_delay.
+
+    With window_stats the data of every cycle is added to an MGPWindowStats
+    before processor_function is called, so processor functions can query
+    rolling statistics of the series without keeping their own history.
+
+    With reorder the data of every cycle is put through an MGPReorder first,
+    so processor_function and window_stats get the rows in time order across
+    the equipments. The reorder buffer is called in cycles without data too,
+    so the rows of idle streams are released.
     """
 
 
 
     def __init__(self, flow_source, processor_function, loop_interval=100,
-                 flow_pipe=None, data_pipe=None, ui_pipe=None):
+                 flow_pipe=None, data_pipe=None, ui_pipe=None,
+                 event_driven=False, batch_delay=0, window_stats=None, reorder=None):
         """
         Intializes the class
         --------------------
@@ -37,23 +52,42 @@ class ProcessArea(object):
                                                     data gating.
                  loop_interval      (int)               [optional] Time in
                                                         milliseconds between
-                                                        cycles.
+                                                        cycles. In event-driven
+                                                        mode the longest wait
+                                                        for data.
                  flow_pipe          (PipeConnection)    [optional] Pipe to send
                                                         data to the main flow.
                  data_pipe          (PipeConnection)    [optional] Pipe to send
                                                         data to the data flow.
                  ui_pipe            (PipeConnection)    [optional] Pipe to send
                                                         data to the UI flow.
+                 event_driven       (bool)              [optional] True to wake
+                                                        up on incoming data,
+                                                        False to poll in fixed
+                                                        intervals.
+                 batch_delay        (int)               [optional] Time in
+                                                        milliseconds to collect
+                                                        data after the first
+                                                        element in event-driven
+                                                        mode.
+                 window_stats       (MGPWindowStats)    [optional] Rolling
+                                                        statistics to update
+                                                        with the data of each
+                                                        cycle.
+                 reorder            (MGPReorder)        [optional] Reorder
+                                                        buffer to put the data
+                                                        of each cycle through.
         @Throws: MGPError                               When flow_source is not
-                                                        instance of PipeConnection.
+                                                        PipeConnection alike.
                                                         When processor_function
                                                         is not callable.
         """
 
-        if flow_source.__class__.__name__ == 'PipeConnection':
+        if is_source(flow_source):
             self.__flow_source = flow_source
         else:
-            raise MGPError('ProcessArea: Pipe for main workflow must be instance of PipeConnection but is "{}".'.format(flow_source.__class__.__name__))
+            raise MGPError('ProcessArea: Pipe for main workflow must be a PipeConnection alike object with poll() and recv() but is "{}".'
+                           .format(flow_source.__class__.__name__))
         if callable(processor_function):
             self.__processor_function = processor_function
         else:
@@ -71,10 +105,29 @@ class ProcessArea(object):
             self.__to_ui = ui_pipe
         else:
             self.__to_ui = NullPipe()
+        self.__event_driven = event_driven
+        self.__batch_delay = max(batch_delay, 0) / 1000
+        self.__window_stats = window_stats
+        self.__reorder = reorder
+        self.__new_data = []
         self.__do_loop = False
 
 
 
+    def __receive(self, element):
+        """
+        Collects an element of the source
+        ---------------------------------
+        @Params: element    (object)    The received data, batches get unpacked.
+        """
+
+        if isinstance(element, MGPRowBatch):
+            self.__new_data.extend(element)
+        else:
+            self.__new_data.append(element)
+
+
+
     def loopinterval(self, new_value=None):
         """
         Gets or sets the value of loop interval
@@ -83,7 +136,7 @@ class ProcessArea(object):
         """
 
         if new_value is not None:
-            self.__loop_interval = loop_interval
+            self.__loop_interval = new_value / 1000
         else:
             return self.__loop_interval
 
@@ -98,11 +151,17 @@ class ProcessArea(object):
         self.__do_loop = True
         while self.__do_loop:
             cycle_start = time_ns()
-            new_data = []
-            while self.__flow_source.poll():
-                element = self.__flow_source.recv()
-                new_data.append(element)
+            new_data = self.__new_data = []
+            if self.__event_driven:
+                drain_source(self.__flow_source, self.__receive, self.__loop_interval,
+                             self.__batch_delay)
+            else:
+                drain_source(self.__flow_source, self.__receive)
+            if self.__reorder is not None:
+                new_data = self.__reorder.add(new_data)
             if len(new_data) > 0:
+                if self.__window_stats is not None:
+                    self.__window_stats.update(new_data)
                 data = self.__processor_function(new_data)
                 if data.toflow() is not None:
                     self.__to_flow.send(data.toflow())
@@ -110,6 +169,7 @@ class ProcessArea(object):
                     self.__to_data.send(data.todata())
                 if data.toui() is not None:
                     self.__to_ui.send(data.toui())
-            sleep_interval = self.__loop_interval - ((time_ns() - cycle_start) / 1000000000)
-            if sleep_interval > 0:
-                sleep(sleep_interval)
+            if not self.__event_driven:
+                sleep_interval = self.__loop_interval - ((time_ns() - cycle_start) / 1000000000)
+                if sleep_interval > 0:
+                    sleep(sleep_interval)
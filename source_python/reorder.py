@@ -0,0 +1,271 @@
+"""
+Medical Gateway Platform - Reorder
+==================================
+
+This module is part of the MGP library.
+"""
+
+
+
+from common import MGPError
+from heapq import heappop, heappush
+from time import time_ns
+
+
+
+class MGPReorder(object):
+    """
+    MGPReorder class
+    ================
+    This class is a streaming reorder buffer for the rows that reach
+    ProcessArea in pipe order, while the samples of different devices and
+    threads were taken in another order. Rows are held in a heap by their
+    timestamps and released in time order, so processors that assume time
+    order, like derivatives, get it.
+
+    Every equipment is a stream with a bounded lateness: its rows may arrive
+    up to max_lateness later than its newest row. The watermark of a stream is
+    its newest timestamp minus its lateness, the watermark of the buffer is
+    the smallest watermark of the streams, no row older than it is expected
+    anymore. Rows up to the watermark are released. The watermarks of the
+    streams are kept in a heap too, so a sample costs O(log n) for any count
+    of streams.
+
+    A row older than the released ones is late. Late rows are counted and
+    dropped, or passed on out of order with late='emit'. A stream that sends
+    nothing for idle_timeout nanoseconds no longer holds the watermark back,
+    until it sends again.
+
+    Give an instance to ProcessArea as reorder to put the data of every cycle
+    through it before processor_function is called. Elements without
+    timestamp are passed on at once.
+    """
+
+
+
+    __LATE_POLICIES = ['drop', 'emit']
+
+
+
+    def __init__(self, max_lateness, lateness=None, late='drop', idle_timeout=None,
+                 max_pending=None):
+        """
+        Initializes the class
+        ---------------------
+        @Params: max_lateness   (number)            The lateness of the streams
+                                                    in the unit of the
+                                                    timestamps, like
+                                                    nanoseconds for time_ns()
+                                                    timestamps.
+                 lateness       (dict)              [optional] The lateness of
+                                                    some streams by the ID of
+                                                    their equipment.
+                 late           (string)            [optional] 'drop' to drop
+                                                    late rows, 'emit' to pass
+                                                    them on.
+                 idle_timeout   (int|NoneType)      [optional] Time in
+                                                    nanoseconds after that a
+                                                    silent stream doesn't hold
+                                                    the watermark back, None to
+                                                    wait for every stream.
+                 max_pending    (int|NoneType)      [optional] Count of rows to
+                                                    hold at most, the oldest
+                                                    ones are released over it.
+        @Throws: MGPError                           When a lateness is negative,
+                                                    late is not a policy or a
+                                                    limit is not positive.
+        """
+
+        lateness = dict(lateness) if lateness is not None else {}
+        if any(value < 0 for value in [max_lateness] + list(lateness.values())):
+            raise MGPError('MGPReorder: Lateness must not be negative.')
+        if late not in self.__LATE_POLICIES:
+            raise MGPError('MGPReorder: late must be one of {} but is "{}".'
+                           .format(self.__LATE_POLICIES, late))
+        if idle_timeout is not None and idle_timeout <= 0:
+            raise MGPError('MGPReorder: idle_timeout must be positive but is "{}".'
+                           .format(idle_timeout))
+        if max_pending is not None and max_pending <= 0:
+            raise MGPError('MGPReorder: max_pending must be positive but is "{}".'
+                           .format(max_pending))
+        self.__max_lateness = max_lateness
+        self.__lateness = lateness
+        self.__late = late
+        self.__idle_timeout = idle_timeout
+        self.__max_pending = max_pending
+        self.__rows = []
+        self.__marks = []
+        self.__streams = {}
+        self.__sequence = 0
+        self.__released_to = None
+        self.__counters = {'received': 0, 'released': 0, 'late': 0}
+
+
+
+    def __len__(self):
+        """
+        Gets the count of held rows
+        ---------------------------
+        @Return: (int)  The count of rows waiting for the watermark.
+        """
+
+        return len(self.__rows)
+
+
+
+    def __release(self, released, watermark=None, count=None):
+        """
+        Releases the oldest rows
+        ------------------------
+        @Params: released   (list)                  The list to extend.
+                 watermark  (time alike|NoneType)   [optional] The newest
+                                                    timestamp to release, None
+                                                    for any.
+                 count      (int|NoneType)          [optional] Count of rows
+                                                    to release at most, None
+                                                    for any.
+        """
+
+        rows = self.__rows
+        released_to = self.__released_to
+        first = len(released)
+        while rows and (watermark is None or rows[0][0] <= watermark):
+            if count is not None and len(released) - first >= count:
+                break
+            timestamp, _, element = heappop(rows)
+            released.append(element)
+            if released_to is None or timestamp > released_to:
+                released_to = timestamp
+        self.__released_to = released_to
+        self.__counters['released'] += len(released) - first
+
+
+
+    def __watermark(self, now):
+        """
+        Gets the watermark of the streams
+        ---------------------------------
+        Outdated entries of the heap of the watermarks are removed, just like
+        the entries of idle streams.
+        @Params: now    (int)           The time_ns() of the cycle.
+        @Return: (time alike|NoneType)  The smallest watermark of the active
+                                        streams or None if there is none.
+        """
+
+        marks = self.__marks
+        streams = self.__streams
+        while marks:
+            mark, _, equipment_id = marks[0]
+            stream = streams.get(equipment_id)
+            if stream is None or stream[0] != mark:
+                heappop(marks)
+            elif self.__idle_timeout is not None and now - stream[1] >= self.__idle_timeout:
+                heappop(marks)
+                del streams[equipment_id]
+            else:
+                return mark
+        return None
+
+
+
+    def add(self, elements):
+        """
+        Adds the elements of a cycle
+        ----------------------------
+        @Params: elements   (iterable)  Rows or their MGPRowBatch views, other
+                                        elements and rows with None timestamp
+                                        are passed on.
+        @Return: (list)                 The released elements in time order,
+                                        the elements without timestamp and the
+                                        emitted late rows first.
+        """
+
+        released = []
+        rows = self.__rows
+        marks = self.__marks
+        streams = self.__streams
+        counters = self.__counters
+        changed = set()
+        now = time_ns()
+        for element in elements:
+            gettimestamp = getattr(element, 'gettimestamp', None)
+            timestamp = gettimestamp() if gettimestamp is not None else None
+            if timestamp is None:
+                released.append(element)
+                continue
+            counters['received'] += 1
+            if self.__released_to is not None and timestamp < self.__released_to:
+                counters['late'] += 1
+                if self.__late == 'emit':
+                    released.append(element)
+                    counters['released'] += 1
+                continue
+            getequipment = getattr(element, 'getequipment', None)
+            equipment_id = getequipment() if getequipment is not None else None
+            self.__sequence += 1
+            heappush(rows, (timestamp, self.__sequence, element))
+            mark = timestamp - self.__lateness.get(equipment_id, self.__max_lateness)
+            stream = streams.get(equipment_id)
+            if stream is None:
+                streams[equipment_id] = [mark, now]
+                changed.add(equipment_id)
+            else:
+                if mark > stream[0]:
+                    stream[0] = mark
+                    changed.add(equipment_id)
+                stream[1] = now
+        for equipment_id in changed:
+            self.__sequence += 1
+            heappush(marks, (streams[equipment_id][0], self.__sequence, equipment_id))
+        watermark = self.__watermark(now)
+        if watermark is not None:
+            self.__release(released, watermark)
+            if self.__released_to is None or watermark > self.__released_to:
+                self.__released_to = watermark
+        elif rows and not streams:
+            self.__release(released)
+        if self.__max_pending is not None:
+            self.__release(released, count=len(rows) - self.__max_pending)
+        return released
+
+
+
+    def flush(self):
+        """
+        Releases every held row
+        -----------------------
+        @Return: (list) The held rows in time order.
+        """
+
+        released = []
+        self.__release(released)
+        return released
+
+
+
+    def getcounters(self):
+        """
+        Gets the counters of the buffer
+        -------------------------------
+        @Return: (dict)     The count of received rows (received), of released
+                            rows (released), of late rows (late), of held rows
+                            (pending) and of active streams (streams).
+        """
+
+        counters = self.__counters.copy()
+        counters['pending'] = len(self.__rows)
+        counters['streams'] = len(self.__streams)
+        return counters
+
+
+
+    def getwatermark(self):
+        """
+        Gets the watermark
+        ------------------
+        Rows up to the watermark are released, rows older than it are late.
+        @Return: (time alike|NoneType)  The watermark or None before the first
+                                        one.
+        """
+
+        return self.__released_to
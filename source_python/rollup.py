@@ -0,0 +1,282 @@
+"""
+Medical Gateway Platform - Rollup
+=================================
+
+This module is part of the MGP library.
+"""
+
+
+
+from collections import deque
+from common import MGPError, row_samples
+
+
+
+class MGPRollup(object):
+    """
+    MGPRollup class
+    ===============
+    This class provides multi-resolution rollups of many series for the history
+    graphs of the UI. A series is identified by the pair of the equipment ID
+    and the label of the data, like ('vent-1', 'paw'), or of the patient ID and
+    the label for L1 rows, like (42, 'spo2'), and holds the count, the
+    sum, the minimum and the maximum of its samples in buckets of time at every
+    resolution, by default 1 second, 10 seconds, 1 minute and 10 minutes of
+    time_ns() timestamps.
+
+    The buckets are updated sample by sample, so a graph of hours of history
+    reads a few hundred buckets instead of every stored sample. query() picks
+    the coarsest resolution whose buckets are not wider than a pixel of the
+    graph. Every resolution keeps the count of buckets given by retention per
+    series, the oldest buckets are dropped over it.
+
+    Give an instance to DataArea as rollup to feed it with the L0 and L1 rows
+    it stores, and keep a reference to it to query the series.
+    """
+
+
+
+    class Series(object):
+        """
+        MGPRollup.Series class
+        ======================
+        This class holds the buckets of one series at every resolution.
+        """
+
+
+
+        def __init__(self, resolutions, retention):
+            """
+            Initializes the class
+            ---------------------
+            @Params: resolutions    (tuple)     Widths of the buckets in the unit
+                                                of the timestamps, from the
+                                                finest to the coarsest.
+                     retention      (int)       Count of buckets to keep at
+                                                most per resolution.
+            """
+
+            self.__retention = retention
+            self.__levels = [(resolution, {}, deque()) for resolution in resolutions]
+
+
+
+        def add(self, timestamp, value):
+            """
+            Adds a sample to the buckets
+            ----------------------------
+            @Params: timestamp  (int)           The timestamp of the sample.
+                     value      (int|float)     The value of the sample.
+            """
+
+            for resolution, buckets, order in self.__levels:
+                index = timestamp // resolution
+                bucket = buckets.get(index)
+                if bucket is None:
+                    buckets[index] = [1, value, value, value]
+                    order.append(index)
+                    if len(order) > self.__retention:
+                        del buckets[order.popleft()]
+                else:
+                    bucket[0] += 1
+                    bucket[1] += value
+                    if value < bucket[2]:
+                        bucket[2] = value
+                    elif value > bucket[3]:
+                        bucket[3] = value
+
+
+
+        def buckets(self, level, start, end):
+            """
+            Gets the buckets of a time range
+            --------------------------------
+            @Params: level  (int)   The index of the resolution.
+                     start  (int)   The first timestamp of the range.
+                     end    (int)   The last timestamp of the range.
+            @Return: (list)         Tuples of the start timestamp, the count, the
+                                    minimum, the maximum and the mean of the
+                                    buckets with samples in time order.
+            """
+
+            resolution, buckets, _ = self.__levels[level]
+            first = start // resolution
+            last = end // resolution
+            if last - first + 1 > len(buckets):
+                indexes = sorted(index for index in buckets if first <= index <= last)
+            else:
+                indexes = [index for index in range(first, last + 1) if index in buckets]
+            result = []
+            for index in indexes:
+                count, total, minimum, maximum = buckets[index]
+                result.append((index * resolution, count, minimum, maximum, total / count))
+            return result
+
+
+
+    def __init__(self, resolutions=(1000000000, 10000000000, 60000000000,
+                                    600000000000), retention=3600):
+        """
+        Initializes the class
+        ---------------------
+        @Params: resolutions    (tuple)     [optional] Widths of the buckets in
+                                            the unit of the timestamps, like
+                                            nanoseconds for time_ns()
+                                            timestamps, from the finest to the
+                                            coarsest.
+                 retention      (int)       [optional] Count of buckets to keep
+                                            at most per resolution and series.
+        @Throws: MGPError                   When resolutions are not positive
+                                            ints in growing order or retention
+                                            is not positive.
+        """
+
+        resolutions = tuple(resolutions)
+        if not resolutions or any(not isinstance(resolution, int) or resolution <= 0
+                                  for resolution in resolutions):
+            raise MGPError('MGPRollup: resolutions must be positive ints but are "{}".'
+                           .format(resolutions))
+        if any(finer >= coarser for finer, coarser in zip(resolutions, resolutions[1:])):
+            raise MGPError('MGPRollup: resolutions must grow from the finest to the coarsest but are "{}".'
+                           .format(resolutions))
+        if retention <= 0:
+            raise MGPError('MGPRollup: retention must be positive but is "{}".'
+                           .format(retention))
+        self.__resolutions = resolutions
+        self.__retention = retention
+        self.__series = {}
+
+
+
+    def add(self, equipment_id, label, timestamp, value):
+        """
+        Adds a sample to a series
+        -------------------------
+        @Params: equipment_id   (string|int|NoneType)
+                                                    The ID of the equipment or
+                                                    of the patient.
+                 label          (string)            The label of the data.
+                 timestamp      (int)               The timestamp of the sample.
+                 value          (int|float)         The value of the sample.
+        """
+
+        key = (equipment_id, label)
+        series = self.__series.get(key)
+        if series is None:
+            series = self.__series[key] = MGPRollup.Series(self.__resolutions,
+                                                           self.__retention)
+        series.add(timestamp, value)
+
+
+
+    def keys(self):
+        """
+        Gets the keys of the series
+        ---------------------------
+        @Return: (list)     Tuples of the equipment or patient ID and the label.
+        """
+
+        return list(self.__series.keys())
+
+
+
+    def query(self, equipment_id, label, start, end, width):
+        """
+        Queries the buckets of a time range for a graph
+        -----------------------------------------------
+        @Params: equipment_id   (string|int|NoneType)
+                                                    The ID of the equipment or
+                                                    of the patient.
+                 label          (string)            The label of the data.
+                 start          (int)               The first timestamp of the
+                                                    range.
+                 end            (int)               The last timestamp of the
+                                                    range, it is included.
+                 width          (int)               The width of the graph in
+                                                    pixels.
+        @Return: (tuple)                            The resolution of the
+                                                    buckets and the list of the
+                                                    buckets like
+                                                    MGPRollup.Series.buckets()
+                                                    gives them.
+        @Throws: MGPError                           When width is not positive.
+        """
+
+        resolution = self.resolution(start, end, width)
+        series = self.__series.get((equipment_id, label))
+        if series is None or end < start:
+            return resolution, []
+        return resolution, series.buckets(self.__resolutions.index(resolution), start, end)
+
+
+
+    def resolution(self, start, end, width):
+        """
+        Gets the resolution for a graph
+        -------------------------------
+        The resolution is the coarsest one whose buckets are not wider than a
+        pixel. Ranges shorter than the width in finest buckets get the finest
+        resolution, their raw rows may be worth to query instead.
+        @Params: start  (int)   The first timestamp of the range.
+                 end    (int)   The last timestamp of the range.
+                 width  (int)   The width of the graph in pixels.
+        @Return: (int)          The width of the buckets.
+        @Throws: MGPError       When width is not positive.
+        """
+
+        if width <= 0:
+            raise MGPError('MGPRollup.resolution(): width must be positive but is "{}".'
+                           .format(width))
+        pixel = (end - start) / width
+        selected = self.__resolutions[0]
+        for resolution in self.__resolutions:
+            if resolution <= pixel:
+                selected = resolution
+        return selected
+
+
+
+    def series(self, equipment_id, label):
+        """
+        Gets a series
+        -------------
+        @Params: equipment_id   (string|int|NoneType)
+                                                    The ID of the equipment or
+                                                    of the patient.
+                 label          (string)            The label of the data.
+        @Return: (MGPRollup.Series|NoneType)        The series or None if it has
+                                                    no samples yet.
+        """
+
+        return self.__series.get((equipment_id, label))
+
+
+
+    def update(self, rows, patient_pwd=None):
+        """
+        Adds the samples of many rows
+        -----------------------------
+        The rows are read by row_samples(), which gives the series of the rows
+        and skips the ones without numeric value. Rows whose timestamp is not
+        an int or a float, like a datetime, are skipped too, since they have no
+        bucket.
+        @Params: rows           (iterable)          MGPDataRowL0, MGPDataRowL1
+                                                    or their MGPRowBatch views.
+                 patient_pwd    (string|NoneType)   [optional] The password to
+                                                    get the patient IDs, like
+                                                    the one of DataArea.
+        @Return: (int)                              The count of added samples.
+        """
+
+        added = 0
+        all_series = self.__series
+        for key, timestamp, value in row_samples(rows, patient_pwd):
+            if not isinstance(timestamp, (int, float)):
+                continue
+            series = all_series.get(key)
+            if series is None:
+                series = all_series[key] = MGPRollup.Series(self.__resolutions,
+                                                            self.__retention)
+            series.add(timestamp, value)
+            added += 1
+        return added
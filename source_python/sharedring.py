@@ -0,0 +1,514 @@
+"""
+Medical Gateway Platform - SharedRing
+=====================================
+
+This module is part of the MGP library.
+"""
+
+
+
+from common import MGPError
+from multiprocessing import Pipe, cpu_count
+from multiprocessing.shared_memory import SharedMemory
+from os import read, write
+from pickle import dumps, loads, HIGHEST_PROTOCOL
+from platform import machine
+from struct import Struct
+from threading import Lock
+from time import monotonic, sleep
+
+
+
+class SharedRingPipe(object):
+    """
+    SharedRingPipe class
+    ====================
+    This class provides a single-producer/single-consumer ring buffer on
+    multiprocessing.shared_memory. It has the same send(), poll() and recv()
+    surface as multiprocessing.PipeConnection, so the areas can use it instead
+    of a pipe. A message costs two memory copies and no system call while the
+    receiver has data to read, which makes the hop between two areas take
+    microseconds.
+
+    One endpoint must only send and the other must only receive. Endpoints can
+    be given to a child process as arguments, they attach to the same shared
+    memory block there. Use SharedRingPipe.pair() to create the two endpoints.
+
+    A receiver that finds the ring empty doesn't spin or sleep in steps, it
+    sets the waiting flag and blocks on a wakeup pipe. The sender writes a
+    single byte into the wakeup pipe when it publishes a message and finds the
+    flag set and clears it, so only the transition of an empty ring to a
+    non-empty one costs a system call and there is at most one byte in the
+    wakeup pipe. fileno() is the wakeup pipe of the receiver, so it
+    can be waited with multiprocessing.connection.wait() or select() after
+    poll() returned False. On machines with more CPUs the receiver spins
+    shortly before blocking, so a peer that answers at once is caught without
+    a system call.
+
+    Layout of the shared memory block:
+        head    (uint64)    Position of the producer, written by the sender.
+        tail    (uint64)    Position of the consumer, written by the receiver.
+        waiting (uint64)    1 if the receiver is about to block on the wakeup
+                            pipe, set by the receiver and cleared by the sender.
+        ring    (bytes)     Messages, each one is a length (uint32) followed by
+                            the payload. A length of 0xFFFFFFFF marks the end
+                            of the ring, the next message starts at the
+                            beginning of the ring.
+
+    Positions are ever growing counters, their value modulo the capacity is the
+    index in the ring. Head, tail and the waiting flag are in separate cache
+    lines to avoid false sharing between the producer and the consumer. They
+    are packed in native format, so they are read and written with a single
+    aligned access and the peer never sees a half written position.
+
+    Memory ordering: head, tail and the waiting flag are plain stores without
+    atomic instructions. The ring relies on the store ordering of x86 (TSO):
+    the payload is written before the head that publishes it and the receiver
+    reads the payload after it has read the head, so the peer never sees a
+    position before the data it covers. The only reordering TSO allows, a
+    load that passes an earlier store, would lose a wakeup between the
+    waiting flag and the head, so both endpoints put a fence (an uncontended
+    lock, that is a locked instruction) between that store and load. A
+    receiver still checks the ring every __WAKEUP_CHECK seconds while it
+    blocks. On weakly ordered CPUs, like ARM, the ring is not safe, so the
+    endpoints can't be created there, use multiprocessing.Pipe instead.
+    """
+
+
+
+    __MACHINES = ['x86', 'x86_64', 'amd64', 'i386', 'i686']
+    __COUNTER = Struct('Q')
+    __LENGTH = Struct('<I')
+    __HEAD = 0
+    __TAIL = 64
+    __WAITING = 128
+    __RING = 192
+    __WRAP = 0xFFFFFFFF
+    __SPIN_TIME = 0.00005 if cpu_count() > 1 else 0.0
+    __MAX_SLEEP = 0.001
+    __WAKEUP_CHECK = 0.1
+
+
+
+    def __init__(self, name, capacity, is_sender, wakeup, serializer=None, create=False):
+        """
+        Initializes the class
+        ---------------------
+        @Params: name       (string|NoneType)   The name of the shared memory
+                                                block, None to get a new name
+                                                when creating.
+                 capacity   (int)               The size of the ring in bytes.
+                 is_sender  (bool)              True for the sending endpoint,
+                                                False for the receiving one.
+                 wakeup     (PipeConnection)    The end of the wakeup pipe, the
+                                                sending end for the sender and
+                                                the receiving end for the
+                                                receiver.
+                 serializer (object|NoneType)   [optional] Object with encodeone()
+                                                and decode() members like
+                                                MGPCodec, or None to use pickle.
+                 create     (bool)              [optional] True to create the
+                                                shared memory block, False to
+                                                attach to an existing one.
+        @Throws: MGPError                       When capacity is too small or
+                                                the CPU is not an x86 one.
+        """
+
+        if not SharedRingPipe.issupported():
+            raise MGPError('SharedRingPipe: The ring needs the store ordering of x86 but the machine is "{}".'
+                           .format(machine()))
+        if capacity < 64:
+            raise MGPError('SharedRingPipe: Capacity must be at least 64 bytes but is {}.'
+                           .format(capacity))
+        self.__capacity = capacity
+        self.__is_sender = is_sender
+        self.__wakeup = wakeup
+        self.__serializer = serializer
+        self.__is_owner = create
+        self.__fence_lock = Lock()
+        self.__armed = False
+        if create:
+            self.__memory = SharedMemory(name=name, create=True,
+                                         size=SharedRingPipe.__RING + capacity)
+            self.__memory.buf[:SharedRingPipe.__RING] = bytes(SharedRingPipe.__RING)
+        else:
+            self.__memory = SharedMemory(name=name)
+        self.__buffer = self.__memory.buf
+        self.__head = SharedRingPipe.__COUNTER.unpack_from(self.__buffer, SharedRingPipe.__HEAD)[0]
+        self.__tail = SharedRingPipe.__COUNTER.unpack_from(self.__buffer, SharedRingPipe.__TAIL)[0]
+
+
+
+    def __getstate__(self):
+        """
+        Gets the state of the instance for pickling
+        -------------------------------------------
+        @Return: (tuple)    Everything needed to attach to the shared memory.
+        """
+
+        return (self.__memory.name, self.__capacity, self.__is_sender,
+                self.__wakeup, self.__serializer)
+
+
+
+    def __setstate__(self, state):
+        """
+        Sets the state of the instance after unpickling
+        -----------------------------------------------
+        @Params: state  (tuple) Everything needed to attach to the shared memory.
+        """
+
+        name, capacity, is_sender, wakeup, serializer = state
+        self.__init__(name, capacity, is_sender, wakeup, serializer)
+
+
+
+    @classmethod
+    def pair(cls, capacity=1 << 20, serializer=None, name=None):
+        """
+        Creates the two endpoints of a ring
+        -----------------------------------
+        @Params: capacity   (int)               [optional] The size of the ring
+                                                in bytes.
+                 serializer (object|NoneType)   [optional] Object with encodeone()
+                                                and decode() members like
+                                                MGPCodec, or None to use pickle.
+                 name       (string|NoneType)   [optional] The name of the
+                                                shared memory block.
+        @Return: (tuple)                        The receiving and the sending
+                                                endpoint, in the same order as
+                                                multiprocessing.Pipe(False)
+                                                returns them.
+        """
+
+        wakeup_source, wakeup_sink = Pipe(False)
+        sender = SharedRingPipe(name, capacity, True, wakeup_sink, serializer, create=True)
+        receiver = SharedRingPipe(sender.getname(), capacity, False, wakeup_source,
+                                  serializer)
+        return receiver, sender
+
+
+
+    def __arm(self):
+        """
+        Sets the waiting flag before blocking
+        -------------------------------------
+        If the sender cleared the flag of an earlier arming, its wakeup byte is
+        read first, so the wakeup pipe becomes readable only by a message that
+        comes after this arming.
+        @Return: (bool)     True if the ring is still empty, False if a message
+                            arrived meanwhile.
+        """
+
+        buffer = self.__buffer
+        if self.__armed and not SharedRingPipe.__COUNTER.unpack_from(buffer,
+                                                                     SharedRingPipe.__WAITING)[0]:
+            self.__consume(SharedRingPipe.__WAKEUP_CHECK)
+        SharedRingPipe.__COUNTER.pack_into(buffer, SharedRingPipe.__WAITING, 1)
+        self.__armed = True
+        self.__fence()
+        self.__head = self.__loadhead()
+        return self.__head == self.__tail
+
+
+
+    def __consume(self, timeout):
+        """
+        Waits for the wakeup byte and reads it
+        --------------------------------------
+        @Params: timeout    (float)     Time in seconds to wait for the byte.
+        """
+
+        if self.__wakeup.poll(timeout):
+            read(self.__wakeup.fileno(), 64)
+            self.__armed = False
+
+
+
+    def __fence(self):
+        """
+        Orders the stores before it and the loads after it
+        --------------------------------------------------
+        An uncontended lock is taken and given back, that is a locked
+        instruction, a full memory barrier on x86.
+        """
+
+        with self.__fence_lock:
+            pass
+
+
+
+    def __loadhead(self):
+        """
+        Reads the position of the producer
+        ----------------------------------
+        @Return: (int)  The position of the producer.
+        """
+
+        return SharedRingPipe.__COUNTER.unpack_from(self.__buffer, SharedRingPipe.__HEAD)[0]
+
+
+
+    def __loadtail(self):
+        """
+        Reads the position of the consumer
+        ----------------------------------
+        @Return: (int)  The position of the consumer.
+        """
+
+        return SharedRingPipe.__COUNTER.unpack_from(self.__buffer, SharedRingPipe.__TAIL)[0]
+
+
+
+    def __wait(self, condition, timeout):
+        """
+        Waits for a condition
+        ---------------------
+        The sender waits for free space with a short busy spinning that only
+        yields the CPU, then with increasing sleeps to save CPU time when the
+        receiver is stalled. A full ring is back-pressure, not the usual path.
+        @Params: condition  (callable)          Function that returns True when
+                                                the wait is over.
+                 timeout    (float|NoneType)    Time in seconds to wait, None to
+                                                wait without limit.
+        @Return: (bool)                         True if the condition is met,
+                                                False if the time is over.
+        """
+
+        start = monotonic()
+        deadline = None if timeout is None else start + timeout
+        delay = 0.00001
+        while not condition():
+            now = monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+            if now - start < SharedRingPipe.__SPIN_TIME:
+                sleep(0)
+            else:
+                sleep(delay)
+                delay = min(delay * 2, SharedRingPipe.__MAX_SLEEP)
+        return True
+
+
+
+    def close(self):
+        """
+        Closes the endpoint
+        -------------------
+        The endpoint that created the shared memory block also destroys it.
+        """
+
+        self.__buffer = None
+        self.__memory.close()
+        self.__wakeup.close()
+        if self.__is_owner:
+            self.__memory.unlink()
+
+
+
+    def fileno(self):
+        """
+        Gets the file descriptor to wait for data
+        -----------------------------------------
+        The descriptor becomes readable when a message arrives after poll()
+        returned False.
+        @Return: (int)      The file descriptor of the wakeup pipe.
+        @Throws: MGPError   When the endpoint is a sending one.
+        """
+
+        if self.__is_sender:
+            raise MGPError('SharedRingPipe.fileno(): Sending endpoint cannot wait for data.')
+        return self.__wakeup.fileno()
+
+
+
+    def getname(self):
+        """
+        Gets the name of the shared memory block
+        ----------------------------------------
+        @Return: (string)   The name of the shared memory block.
+        """
+
+        return self.__memory.name
+
+
+
+    @classmethod
+    def issupported(cls):
+        """
+        Gets whether the ring is safe on this machine
+        ---------------------------------------------
+        @Return: (bool)     True on x86 CPUs, False on others.
+        """
+
+        return machine().lower() in cls.__MACHINES
+
+
+
+    def poll(self, timeout=0.0):
+        """
+        Gets whether there is data to receive
+        -------------------------------------
+        When the ring is empty, the waiting flag is set, so the sender wakes up
+        the receiver through the wakeup pipe with the next message.
+        @Params: timeout    (float|NoneType)    [optional] Time in seconds to
+                                                wait for data, None to wait
+                                                without limit.
+        @Return: (bool)                         True if there is data to
+                                                receive, False if not.
+        """
+
+        if self.__head != self.__tail:
+            return True
+        self.__head = self.__loadhead()
+        if self.__head != self.__tail:
+            return True
+        start = monotonic()
+        if timeout != 0.0 and SharedRingPipe.__SPIN_TIME > 0:
+            spin = min(SharedRingPipe.__SPIN_TIME, timeout) if timeout is not None \
+                else SharedRingPipe.__SPIN_TIME
+            while monotonic() - start < spin:
+                self.__head = self.__loadhead()
+                if self.__head != self.__tail:
+                    return True
+        if not self.__arm():
+            return True
+        while True:
+            if timeout is None:
+                remaining = SharedRingPipe.__WAKEUP_CHECK
+            else:
+                remaining = timeout - (monotonic() - start)
+                if remaining <= 0:
+                    return False
+            self.__consume(min(remaining, SharedRingPipe.__WAKEUP_CHECK))
+            self.__head = self.__loadhead()
+            if self.__head != self.__tail or not self.__arm():
+                return True
+
+
+
+    def recv(self):
+        """
+        Receives an object
+        ------------------
+        @Return: (object)   The next object in the order of sending.
+        """
+
+        payload = self.recv_bytes()
+        if self.__serializer is None:
+            return loads(payload)
+        else:
+            return self.__serializer.decode(payload)[0]
+
+
+
+    def recv_bytes(self):
+        """
+        Receives a message
+        ------------------
+        It waits until a message is available.
+        @Return: (bytes)    The next message in the order of sending.
+        @Throws: MGPError   When the endpoint is a sending one.
+        """
+
+        if self.__is_sender:
+            raise MGPError('SharedRingPipe.recv(): Sending endpoint cannot receive.')
+        self.poll(None)
+        capacity = self.__capacity
+        index = self.__tail % capacity
+        if capacity - index < 4:
+            self.__tail += capacity - index
+            index = 0
+        else:
+            length, = SharedRingPipe.__LENGTH.unpack_from(self.__buffer,
+                                                          SharedRingPipe.__RING + index)
+            if length == SharedRingPipe.__WRAP:
+                self.__tail += capacity - index
+                index = 0
+        start = SharedRingPipe.__RING + index
+        length, = SharedRingPipe.__LENGTH.unpack_from(self.__buffer, start)
+        payload = bytes(self.__buffer[start + 4:start + 4 + length])
+        self.__tail += 4 + length
+        SharedRingPipe.__COUNTER.pack_into(self.__buffer, SharedRingPipe.__TAIL, self.__tail)
+        return payload
+
+
+
+    def recvmany(self, max_count=None):
+        """
+        Receives every object that is available without waiting
+        -------------------------------------------------------
+        @Params: max_count  (int|NoneType)  [optional] The maximum count of
+                                            objects to receive.
+        @Return: (list)                     The received objects in the order
+                                            of sending.
+        """
+
+        result = []
+        while (max_count is None or len(result) < max_count) and self.poll():
+            result.append(self.recv())
+        return result
+
+
+
+    def send(self, element):
+        """
+        Sends an object
+        ---------------
+        @Params: element    (object)    The object to send.
+        """
+
+        if self.__serializer is None:
+            self.send_bytes(dumps(element, HIGHEST_PROTOCOL))
+        else:
+            self.send_bytes(self.__serializer.encodeone(element))
+
+
+
+    def send_bytes(self, payload, timeout=None):
+        """
+        Sends a message
+        ---------------
+        It waits while the ring is too full to take the message.
+        @Params: payload    (bytes-like)        The message to send.
+                 timeout    (float|NoneType)    [optional] Time in seconds to
+                                                wait for free space, None to
+                                                wait without limit.
+        @Throws: MGPError                       When the endpoint is a receiving
+                                                one. When the message can never
+                                                fit into the ring. When the time
+                                                is over.
+        """
+
+        if not self.__is_sender:
+            raise MGPError('SharedRingPipe.send(): Receiving endpoint cannot send.')
+        length = len(payload)
+        capacity = self.__capacity
+        if 4 + length > capacity // 2:
+            raise MGPError('SharedRingPipe.send(): Message of {} bytes is too long for a ring of {} bytes.'
+                           .format(length, capacity))
+        self.__head = self.__loadhead()
+        index = self.__head % capacity
+        skip = capacity - index if capacity - index < 4 + length else 0
+        needed = skip + 4 + length
+        if capacity - (self.__head - self.__tail) < needed:
+            self.__tail = self.__loadtail()
+            if capacity - (self.__head - self.__tail) < needed:
+                if not self.__wait(lambda: capacity - (self.__head - self.__loadtail()) >= needed,
+                                   timeout):
+                    raise MGPError('SharedRingPipe.send(): Ring is full.')
+                self.__tail = self.__loadtail()
+        if skip > 0:
+            if skip >= 4:
+                SharedRingPipe.__LENGTH.pack_into(self.__buffer, SharedRingPipe.__RING + index,
+                                                  SharedRingPipe.__WRAP)
+            index = 0
+        start = SharedRingPipe.__RING + index
+        SharedRingPipe.__LENGTH.pack_into(self.__buffer, start, length)
+        self.__buffer[start + 4:start + 4 + length] = payload
+        self.__head += needed
+        SharedRingPipe.__COUNTER.pack_into(self.__buffer, SharedRingPipe.__HEAD, self.__head)
+        self.__fence()
+        if SharedRingPipe.__COUNTER.unpack_from(self.__buffer, SharedRingPipe.__WAITING)[0]:
+            SharedRingPipe.__COUNTER.pack_into(self.__buffer, SharedRingPipe.__WAITING, 0)
+            write(self.__wakeup.fileno(), b'\x01')
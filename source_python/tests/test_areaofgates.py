@@ -0,0 +1,259 @@
+"""
+Medical Gateway Platform - AreaOfGates tests
+============================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os.path import abspath, dirname
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from areaofgates import AreaOfGates
+from common import MGPData, MGPError
+from multiprocessing import Pipe
+from outputarea import OutputArea
+from time import sleep
+from unittest import TestCase, main
+
+
+
+class Channel(object):
+    """
+    Channel class
+    =============
+    This class is a minimal channel 1 and channel 2 handler.
+    """
+
+
+
+    def eval(self, new_data, journal):
+        """
+        Closes every gate
+        -----------------
+        """
+
+        return ({gate: AreaOfGates.GateObject(False, None) for gate in self.gates}, False)
+
+
+
+    def tick(self, start_ns, last_ns):
+        """
+        Closes every gate
+        -----------------
+        """
+
+        return ({gate: AreaOfGates.GateObject(False, None) for gate in self.gates}, False)
+
+
+
+class TestGateEvaluation(TestCase):
+    """
+    TestGateEvaluation class
+    ========================
+    This class tests the truth table evaluation of the gates.
+    """
+
+
+
+    LOGICS = ['P OR A (P)', 'P OR A (A)', 'P AND A (P)', 'P AND A (A)',
+              'P XOR A', 'P > A', 'P < A', 'P ONLY', 'ONLY A']
+
+
+
+    def setUp(self):
+        """
+        Creates an AreaOfGates with a gate for each logic
+        -------------------------------------------------
+        """
+
+        self.__source, self.__sink = Pipe(False)
+        self.__area = AreaOfGates(self.__source, OutputArea(), Channel(), Channel(),
+                                  {logic: logic for logic in TestGateEvaluation.LOGICS})
+        self.__ch1 = MGPData('paw', 1.0, 'cmH2O')
+        self.__ch2 = MGPData('paw', 2.0, 'cmH2O')
+
+
+
+    def tearDown(self):
+        """
+        Closes the pipe
+        ---------------
+        """
+
+        self.__source.close()
+        self.__sink.close()
+
+
+
+    def evaluate(self, ch1, ch2):
+        """
+        Evaluates all gates with the same channel states
+        ------------------------------------------------
+        @Params: ch1    (bool|NoneType)     State of channel 1.
+                 ch2    (bool|NoneType)     State of channel 2.
+        @Return: (dict)                     Channel of the open gates by logic.
+        """
+
+        ch1_data = {logic: AreaOfGates.GateObject(ch1, self.__ch1)
+                    for logic in TestGateEvaluation.LOGICS}
+        ch2_data = {logic: AreaOfGates.GateObject(ch2, self.__ch2)
+                    for logic in TestGateEvaluation.LOGICS}
+        result = {}
+        for logic, channel, data in self.__area.evaluate(ch1_data, ch2_data):
+            self.assertIs(data, self.__ch1 if channel == 1 else self.__ch2)
+            result[logic] = channel
+        return result
+
+
+
+    def test_both_open(self):
+        """
+        Both channels ask for opening
+        -----------------------------
+        """
+
+        self.assertEqual(self.evaluate(True, True),
+                         {'P OR A (P)': 1, 'P OR A (A)': 2, 'P AND A (P)': 1,
+                          'P AND A (A)': 2, 'P > A': 1, 'P < A': 2, 'P ONLY': 1,
+                          'ONLY A': 2})
+
+
+
+    def test_one_open(self):
+        """
+        Only one channel asks for opening
+        ---------------------------------
+        """
+
+        self.assertEqual(self.evaluate(True, False),
+                         {'P OR A (P)': 1, 'P OR A (A)': 1, 'P XOR A': 1,
+                          'P > A': 1, 'P ONLY': 1})
+        self.assertEqual(self.evaluate(False, True),
+                         {'P OR A (P)': 2, 'P OR A (A)': 2, 'P XOR A': 2,
+                          'P < A': 2, 'ONLY A': 2})
+
+
+
+    def test_tri_state(self):
+        """
+        None lets the other channel decide at priority logics
+        -----------------------------------------------------
+        """
+
+        self.assertEqual(self.evaluate(None, True),
+                         {'P OR A (P)': 2, 'P OR A (A)': 2, 'P XOR A': 2,
+                          'P > A': 2, 'P < A': 2, 'ONLY A': 2})
+        self.assertEqual(self.evaluate(True, None),
+                         {'P OR A (P)': 1, 'P OR A (A)': 1, 'P XOR A': 1,
+                          'P > A': 1, 'P < A': 1, 'P ONLY': 1})
+        self.assertEqual(self.evaluate(None, None), {})
+        self.assertEqual(self.evaluate('open', None), self.evaluate(True, None))
+        self.assertEqual(self.evaluate(0, 2), self.evaluate(False, True))
+
+
+
+    def test_without_channel_1(self):
+        """
+        Missing channel 1 data counts as closed
+        ---------------------------------------
+        """
+
+        ch2_data = {logic: AreaOfGates.GateObject(True, self.__ch2)
+                    for logic in TestGateEvaluation.LOGICS}
+        result = {logic: channel for logic, channel, _ in self.__area.evaluate(None, ch2_data)}
+        self.assertEqual(result, {'P OR A (P)': 2, 'P OR A (A)': 2, 'P XOR A': 2,
+                                  'P < A': 2, 'ONLY A': 2})
+
+
+
+    def test_unknown_logic(self):
+        """
+        Unknown logics raise MGPError
+        -----------------------------
+        """
+
+        with self.assertRaises(MGPError):
+            AreaOfGates(self.__source, OutputArea(), Channel(), Channel(),
+                        {'valve': 'P NAND A'})
+
+
+
+class TestIncrementalGating(TestCase):
+    """
+    TestIncrementalGating class
+    ===========================
+    This class tests the change tracking of open gates.
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates an AreaOfGates with incremental gating
+        ----------------------------------------------
+        """
+
+        self.__source, self.__sink = Pipe(False)
+        self.__area = AreaOfGates(self.__source, OutputArea(), Channel(), Channel(),
+                                  {'valve': 'P OR A (P)', 'alarm': 'P ONLY'},
+                                  incremental=True, heartbeat={'alarm': 50})
+        self.__changes = getattr(self.__area, '_AreaOfGates__changes')
+
+
+
+    def tearDown(self):
+        """
+        Closes the pipe
+        ---------------
+        """
+
+        self.__source.close()
+        self.__sink.close()
+
+
+
+    def test_changes(self):
+        """
+        Unchanged open gates are skipped until their heartbeat
+        ------------------------------------------------------
+        """
+
+        low = MGPData('peep', 5, 'cmH2O')
+        decisions = [('valve', 1, low), ('alarm', 1, None)]
+        self.assertEqual(self.__changes(decisions), decisions)
+        self.assertEqual(self.__changes([('valve', 1, MGPData('peep', 5, 'cmH2O')),
+                                         ('alarm', 1, None)]), [])
+        high = ('valve', 1, MGPData('peep', 8, 'cmH2O'))
+        self.assertEqual(self.__changes([high, ('alarm', 1, None)]), [high])
+        self.assertEqual(self.__changes([]), [])
+        self.assertEqual(self.__changes([high]), [high])
+        self.assertEqual(self.__changes([high, ('alarm', 1, None)]), [('alarm', 1, None)])
+        sleep(0.06)
+        self.assertEqual(self.__changes([high, ('alarm', 1, None)]), [('alarm', 1, None)])
+        counters = self.__area.getcounters()
+        self.assertEqual((counters['skipped'], counters['heartbeats']), (5, 1))
+        wave = ('valve', 1, MGPData('wave', [1, 2], 'cmH2O'))
+        self.assertEqual(self.__changes([wave]), [wave])
+        self.assertEqual(self.__changes([('valve', 1, MGPData('wave', [1, 2], 'cmH2O'))]), [])
+
+
+
+    def test_heartbeat_label(self):
+        """
+        Heartbeat of an unknown gate raises MGPError
+        --------------------------------------------
+        """
+
+        with self.assertRaises(MGPError):
+            AreaOfGates(self.__source, OutputArea(), Channel(), Channel(),
+                        {'valve': 'P OR A (P)'}, incremental=True, heartbeat={'pump': 100})
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Medical Gateway Platform - Codec tests
+======================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os.path import abspath, dirname
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from codec import CodecPipe, MGPCodec
+from common import MGPData, MGPGateCycle, MGPLedger, MGPRowBatch
+from multiprocessing import Pipe
+from unittest import TestCase, main
+
+
+
+class TestMGPCodec(TestCase):
+    """
+    TestMGPCodec class
+    ==================
+    This class tests the wire format of batches.
+    """
+
+
+
+    def setUp(self):
+        """
+        Resets the ledger
+        -----------------
+        """
+
+        MGPLedger.reportatexit(False)
+        MGPLedger.reset()
+
+
+
+    def test_batch(self):
+        """
+        Batches travel as columns
+        -------------------------
+        """
+
+        batch = MGPRowBatch(1)
+        for i in range(3):
+            batch.append(i, 'paw', float(i), 'cmH2O', l0_id=i + 1, patient_id=7,
+                         patient_pwd='secret')
+        batch.finalizerow(0, 11)
+        message = MGPCodec.encodeone(batch)
+        self.assertNotIn(b'_MGPRowBatch__', message)
+        decoded, = MGPCodec.decode(message)
+        self.assertEqual([(row.gettimestamp(), row.getlabel(), row.getvalue(), row.getunit(),
+                           row.getl0id(), row.getpatientid('secret'), row.getid())
+                          for row in decoded],
+                         [(0, 'paw', 0.0, 'cmH2O', 1, 7, 11), (1, 'paw', 1.0, 'cmH2O', 2, 7, None),
+                          (2, 'paw', 2.0, 'cmH2O', 3, 7, None)])
+        decoded.append(3, 'flow', 1.5, 'l/min')
+        self.assertEqual(decoded[3].getlabel(), 'flow')
+        self.assertEqual(MGPLedger.outstanding(1), 1)
+        decoded.finalizerow(3, None)
+        self.assertEqual(MGPLedger.outstanding(1), 0)
+
+
+
+    def test_gate_cycle(self):
+        """
+        Gate cycles travel as columns
+        -----------------------------
+        """
+
+        cycle = MGPGateCycle(12.5)
+        cycle.append('valve', 1, MGPData('peep', 5, 'cmH2O'))
+        cycle.append('alarm', 2, None)
+        decoded, = MGPCodec.decode(MGPCodec.encodeone(cycle))
+        self.assertEqual([(row.gettimestamp(), row.getgate(), row.getchannel(),
+                           row.getlabel(row.getchannel()), row.getvalue(row.getchannel()),
+                           row.getunit(row.getchannel())) for row in decoded],
+                         [(12.5, 'valve', 1, 'peep', 5, 'cmH2O'),
+                          (12.5, 'alarm', 2, None, None, None)])
+
+
+
+    def test_sendmany_empty(self):
+        """
+        Nothing is sent without objects
+        -------------------------------
+        """
+
+        first, second = Pipe()
+        sender, receiver = CodecPipe(first), CodecPipe(second)
+        sender.sendmany([])
+        self.assertFalse(receiver.poll(0.05))
+        sender.sendmany(iter([1, 'two']))
+        self.assertTrue(receiver.poll(0.05))
+        self.assertEqual((receiver.recv(), receiver.recv()), (1, 'two'))
+        self.assertFalse(receiver.poll())
+        sender.close()
+        receiver.close()
+
+
+
+if __name__ == '__main__':
+    main()
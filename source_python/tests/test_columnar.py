@@ -0,0 +1,147 @@
+"""
+Medical Gateway Platform - Columnar tests
+=========================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os.path import abspath, dirname, join
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from columnar import MGPChunk
+from common import MGPError
+from random import Random
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+
+
+class TestChunk(TestCase):
+    """
+    TestChunk class
+    ===============
+    This class tests the round trip and the size of chunks.
+    """
+
+
+
+    def roundtrip(self, chunk):
+        """
+        Encodes and decodes a chunk
+        ---------------------------
+        @Params: chunk  (MGPChunk)  The chunk to encode.
+        @Return: (MGPChunk)         The decoded chunk.
+        """
+
+        decoded = MGPChunk.frombytes(chunk.tobytes())
+        self.assertEqual(len(decoded), len(chunk))
+        self.assertEqual(decoded.getfirstid(), chunk.getfirstid())
+        for name in ('id', 'timestamp', 'value', 'label', 'unit', 'equipment', 'event_type'):
+            self.assertEqual(list(decoded.column(name)), list(chunk.column(name)))
+        return decoded
+
+
+
+    def test_series(self):
+        """
+        A regular series is much smaller than its CSV rows
+        --------------------------------------------------
+        """
+
+        random = Random(3)
+        count = 4096
+        timestamps = [1587904215000000000 + i * 20000000 + (random.randint(-9, 9) if i % 100 == 0 else 0)
+                      for i in range(count)]
+        values = [round(random.gauss(20.0, 0.5), 1) for _ in range(count)]
+        labels = ['paw' if i % 2 else 'flow' for i in range(count)]
+        units = ['cmH2O' if i % 2 else 'l/min' for i in range(count)]
+        chunk = MGPChunk(11, timestamps, values, labels, units, ['vent-1'] * count,
+                         ['measurement'] * count)
+        decoded = self.roundtrip(chunk)
+        self.assertEqual(decoded.column('timestamp').typecode, 'q')
+        self.assertEqual(decoded.column('value').typecode, 'd')
+        self.assertEqual(decoded.gettimerange(), (min(timestamps), max(timestamps)))
+        self.assertEqual(MGPChunk.header(chunk.tobytes()),
+                         (11, count, min(timestamps), max(timestamps)))
+        csv_size = sum(len('{},{},{},{},{},vent-1,measurement\r\n'
+                           .format(11 + i, timestamps[i], labels[i], values[i], units[i]))
+                       for i in range(count))
+        self.assertLess(len(chunk.tobytes()) * 5, csv_size)
+
+
+
+    def test_kinds(self):
+        """
+        Int, float and mixed columns keep their types
+        ---------------------------------------------
+        """
+
+        random = Random(5)
+        extremes = [-(1 << 63), (1 << 63) - 1, 0]
+        count = len(extremes) + 100
+        integers = extremes + [random.randint(-10 ** 18, 10 ** 18) for _ in range(100)]
+        self.roundtrip(MGPChunk(1, integers, list(reversed(integers)), [None] * count,
+                                [None] * count, [None] * count, [None] * count))
+        mixed = [None, True, False, 3, 'PCV', 2.5, -7, 1.0, 'résumé'] * 9
+        decoded = self.roundtrip(MGPChunk(1, [i / 3 for i in range(81)], mixed, ['a'] * 81,
+                                          [None] * 81, ['é'] * 81, [None] * 81))
+        self.assertEqual([value.__class__ for value in decoded.column('value')],
+                         [value.__class__ for value in mixed])
+        self.assertEqual(decoded.column('timestamp').typecode, 'd')
+        self.roundtrip(MGPChunk(1, [5], [float('inf')], ['a'], ['b'], ['c'], ['d']))
+
+
+
+    def test_readfile(self):
+        """
+        Frames are read back until a torn end
+        -------------------------------------
+        """
+
+        with TemporaryDirectory() as directory:
+            file_path = join(directory, 'l0.chunk')
+            with open(file_path, 'wb') as data_file:
+                for first in (1, 4):
+                    data_file.write(MGPChunk(first, [first, first + 1, first + 2], [1.0] * 3,
+                                             ['a'] * 3, ['b'] * 3, ['c'] * 3, ['d'] * 3).toframe())
+                data_file.write(MGPChunk(7, [1], [1], ['a'], ['b'], ['c'], ['d']).toframe()[:-2])
+            self.assertEqual([chunk.getfirstid() for chunk in MGPChunk.readfile(file_path)], [1, 4])
+
+
+
+    def test_errors(self):
+        """
+        Content the format can't hold raises MGPError
+        ---------------------------------------------
+        """
+
+        with self.assertRaises(MGPError):
+            MGPChunk(1, [], [], [], [], [], [])
+        with self.assertRaises(MGPError):
+            MGPChunk(1, [1, 2], [1.0], [None], [None], [None], [None])
+        with self.assertRaises(MGPError):
+            MGPChunk(1, ['now'], [1.0], [None], [None], [None], [None])
+        with self.assertRaises(MGPError):
+            MGPChunk(1, [1, 2], [1, 1 << 64], [None] * 2, [None] * 2, [None] * 2, [None] * 2)
+        with self.assertRaises(MGPError):
+            MGPChunk(1, [1], [1.0], [3], [None], [None], [None])
+        data = MGPChunk(1, [1, 2], [1.0, 2.0], ['a'] * 2, [None] * 2, [None] * 2,
+                        [None] * 2).tobytes()
+        with self.assertRaises(MGPError):
+            MGPChunk.frombytes(data[:20])
+        with self.assertRaises(MGPError):
+            MGPChunk.frombytes(data[:-3])
+        with self.assertRaises(MGPError):
+            MGPChunk.header(b'MGPW' + data[4:])
+        with self.assertRaises(MGPError):
+            MGPChunk(1, [1], [1.0], ['a'], [None], [None], [None]).column('patient_id')
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,580 @@
+"""
+Medical Gateway Platform - Common tests
+=======================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os.path import abspath, dirname
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from array import array
+from common import (MGPData, MGPDataRowL0, MGPDataRowL1, MGPError, MGPGateCycle,
+                    MGPJournal, MGPLedger, MGPRowBatch, drain_source, row_samples)
+from datetime import datetime
+from multiprocessing import Pipe
+from threading import Thread
+from time import monotonic, sleep
+from unittest import TestCase, main
+
+
+
+class TestGateCycle(TestCase):
+    """
+    TestGateCycle class
+    ===================
+    This class tests the views and the finalization of MGPGateCycle.
+    """
+
+
+
+    def setUp(self):
+        """
+        Resets the ledger
+        -----------------
+        """
+
+        MGPLedger.reportatexit(False)
+        MGPLedger.reset()
+
+
+
+    def tearDown(self):
+        """
+        Gives back the ownership
+        ------------------------
+        """
+
+        MGPLedger.owner = False
+        MGPLedger.reset()
+
+
+
+    def test_views(self):
+        """
+        Views give the decisions like MGPDataRowL2 rows
+        -----------------------------------------------
+        """
+
+        cycle = MGPGateCycle(3)
+        cycle.append('valve', 2, MGPData('peep', 5, 'cmH2O'))
+        view = cycle[0]
+        self.assertEqual((view.gettimestamp(), view.getgate(), view.getchannel()),
+                         (3, 'valve', 2))
+        self.assertEqual((view.getvalue(2), view.getunit(2), view.getlabel(2)),
+                         (5, 'cmH2O', 'peep'))
+        self.assertIsNone(view.getvalue(1))
+        self.assertIsNone(view.getl1id())
+        with self.assertRaises(MGPError):
+            view.getvalue(3)
+        with self.assertRaises(IndexError):
+            cycle[1]
+        view.finalize(4)
+        self.assertEqual(view.getid(), 4)
+        self.assertTrue(cycle.is_finalized())
+
+
+
+    def test_ledger(self):
+        """
+        Decisions are counted as level 2 rows through a pipe
+        ----------------------------------------------------
+        """
+
+        source, sink = Pipe(False)
+        cycle = MGPGateCycle(1)
+        for gate in ('valve', 'alarm', 'pump'):
+            cycle.append(gate, 1, None)
+        self.assertEqual(MGPLedger.outstanding(2), 3)
+        sink.send(cycle)
+        MGPLedger.owner = True
+        received = source.recv()
+        self.assertEqual(received.getlevel(), 2)
+        received.finalize([7, None, 8])
+        self.assertEqual(MGPLedger.outstanding(2), 0)
+        self.assertEqual(MGPLedger.stored[2], 2)
+        with self.assertRaises(MGPError):
+            received.finalize([1])
+        source.close()
+        sink.close()
+
+
+
+class TestJournal(TestCase):
+    """
+    TestJournal class
+    =================
+    This class tests the retention policy and the views of MGPJournal.
+    """
+
+
+
+    def test_max_entries(self):
+        """
+        The oldest elements beyond max_entries are evicted
+        --------------------------------------------------
+        """
+
+        journal = MGPJournal(max_entries=3)
+        for i in range(5000):
+            journal.append(i, i)
+        self.assertEqual(len(journal), 3)
+        self.assertEqual(list(journal), [4997, 4998, 4999])
+        self.assertEqual((journal[0], journal[-1]), (4997, 4999))
+        self.assertEqual(journal.gettimestamp(0), 4997)
+        with self.assertRaises(IndexError):
+            journal[3]
+
+
+
+    def test_max_age(self):
+        """
+        Elements older than max_age are evicted
+        ---------------------------------------
+        """
+
+        journal = MGPJournal(max_age=100)
+        for i in range(10):
+            journal.append(i, i * 50)
+        self.assertEqual(journal.evict(450), 7)
+        self.assertEqual(list(journal), [7, 8, 9])
+        self.assertEqual(journal.evict(450), 0)
+        journal.append('late', 10)
+        self.assertEqual(journal.gettimestamp(-1), 450)
+        journal.clear()
+        self.assertEqual(len(journal), 0)
+
+
+
+    def test_views(self):
+        """
+        Time ranges and slices are views of the journal
+        -----------------------------------------------
+        """
+
+        journal = MGPJournal()
+        for i in range(10):
+            journal.append('e{}'.format(i), i * 1000000)
+        view = journal.between(2000000, 5000000)
+        self.assertEqual(list(view), ['e2', 'e3', 'e4'])
+        self.assertEqual((len(view), view[-1], view.gettimestamp(0)), (3, 'e4', 2000000))
+        self.assertEqual(list(journal.last(3, 9000000)), ['e6', 'e7', 'e8', 'e9'])
+        self.assertEqual(list(journal[7:]), ['e7', 'e8', 'e9'])
+        self.assertEqual(len(journal[5:2]), 0)
+        with self.assertRaises(IndexError):
+            view[3]
+        with self.assertRaises(MGPError):
+            journal[::2]
+        with self.assertRaises(MGPError):
+            MGPJournal(max_age=0)
+
+
+
+class TestLedger(TestCase):
+    """
+    TestLedger class
+    ================
+    This class tests the counters of MGPLedger over the life-cycle of rows
+    that are sent through a pipe.
+    """
+
+
+
+    def setUp(self):
+        """
+        Resets the ledger
+        -----------------
+        """
+
+        MGPLedger.reportatexit(False)
+        MGPLedger.reset()
+        self.__source, self.__sink = Pipe(False)
+
+
+
+    def tearDown(self):
+        """
+        Closes the pipe and gives back the ownership
+        --------------------------------------------
+        """
+
+        MGPLedger.owner = False
+        MGPLedger.reset()
+        self.__source.close()
+        self.__sink.close()
+
+
+
+    def transfer(self, element):
+        """
+        Sends an element through the pipe
+        ---------------------------------
+        @Params: element    (object)    The element to send.
+        @Return: (object)               The received copy of the element.
+        """
+
+        self.__sink.send(element)
+        return self.__source.recv()
+
+
+
+    def test_stored(self):
+        """
+        Rows sent, received and stored leave nothing outstanding
+        --------------------------------------------------------
+        """
+
+        MGPLedger.owner = True
+        rows = [MGPDataRowL0(i, MGPData('paw', float(i), 'cmH2O'), 'vent-1', 'sample')
+                for i in range(3)]
+        received = [self.transfer(row) for row in rows]
+        for i, row in enumerate(received):
+            row.finalize(i + 1)
+        batch = MGPRowBatch(1)
+        batch.append(5, 'hr', 60, 'bpm')
+        batch.append(6, 'hr', 61, 'bpm')
+        self.transfer(batch).finalize([4, None])
+        report = MGPLedger.report()
+        self.assertEqual((report[0]['created'], report[0]['transferred'],
+                          report[0]['received'], report[0]['stored']), (3, 3, 3, 3))
+        self.assertEqual((report[1]['received'], report[1]['stored'],
+                          report[1]['filtered']), (2, 1, 1))
+        self.assertEqual(MGPLedger.outstanding(), [0, 0, 0, 0])
+        MGPLedger.check()
+
+
+
+    def test_dropped(self):
+        """
+        Rows dropped by a receiver that doesn't own them are no leaks
+        -------------------------------------------------------------
+        """
+
+        row = MGPDataRowL0(1, MGPData('paw', 1.0, 'cmH2O'), 'vent-1', 'sample')
+        batch = MGPRowBatch(0)
+        batch.append(2, 'paw', 2.0, 'cmH2O')
+        self.transfer(row)
+        received = self.transfer(batch)
+        received.finalizerow(0, None)
+        self.assertEqual(MGPLedger.report()[0]['received'], 0)
+        self.assertEqual(MGPLedger.report()[0]['filtered'], 0)
+        self.assertEqual(MGPLedger.outstanding(), [0, 0, 0, 0])
+
+
+
+    def test_appended(self):
+        """
+        Rows appended to a sent batch are handed over by the next send
+        --------------------------------------------------------------
+        """
+
+        batch = MGPRowBatch(0)
+        batch.append(1, 'paw', 1.0, 'cmH2O')
+        self.transfer(batch)
+        batch.append(2, 'paw', 2.0, 'cmH2O')
+        self.assertEqual(MGPLedger.outstanding(0), 1)
+        self.transfer(batch)
+        self.assertEqual(MGPLedger.report()[0]['transferred'], 2)
+        self.assertEqual(MGPLedger.outstanding(), [0, 0, 0, 0])
+
+
+
+    def test_outstanding(self):
+        """
+        Rows without finalization are reported
+        --------------------------------------
+        """
+
+        row = MGPDataRowL0(1, MGPData('paw', 1.0, 'cmH2O'), 'vent-1', 'sample')
+        self.assertEqual(MGPLedger.outstanding(), [1, 0, 0, 0])
+        with self.assertRaises(MGPError):
+            MGPLedger.check()
+        row.finalize(None)
+        self.assertEqual(MGPLedger.outstanding(0), 0)
+
+
+
+class TestRowBatch(TestCase):
+    """
+    TestRowBatch class
+    ==================
+    This class tests the columns and the row views of MGPRowBatch.
+    """
+
+
+
+    def test_timestamps(self):
+        """
+        Integer, float and datetime timestamps are kept
+        -----------------------------------------------
+        """
+
+        batch = MGPRowBatch(0)
+        batch.append(1700000000123456789, 'paw', 20.0, 'cmH2O')
+        self.assertEqual(batch.column('timestamp').typecode, 'q')
+        first = batch[0]
+        batch.append(2.5, 'paw', 21.0, 'cmH2O')
+        self.assertNotIsInstance(batch.column('timestamp'), array)
+        self.assertEqual(first.gettimestamp(), 1700000000123456789)
+        moment = datetime(2026, 1, 2, 3, 4, 5)
+        batch.append(moment, 'paw', 22.0, 'cmH2O')
+        self.assertEqual(list(batch.column('timestamp')), [1700000000123456789, 2.5, moment])
+        self.assertEqual([row.gettimestamp() for row in batch],
+                         [1700000000123456789, 2.5, moment])
+        floats = MGPRowBatch(0)
+        floats.append(1.5, 'paw', 20.0, 'cmH2O')
+        self.assertEqual(floats.column('timestamp').typecode, 'd')
+        floats.append(1700000000123456789, 'paw', 21.0, 'cmH2O')
+        self.assertEqual(floats[1].gettimestamp(), 1700000000123456789)
+        batch.finalize(None)
+        floats.finalize(None)
+
+
+
+    def test_datetime_first(self):
+        """
+        A datetime timestamp of the first row makes a list column
+        ---------------------------------------------------------
+        """
+
+        moment = datetime(2026, 1, 2, 3, 4, 5)
+        row = MGPDataRowL0(moment, MGPData('paw', 20.0, 'cmH2O'), 'vent-1', 'sample')
+        batch = MGPRowBatch(0)
+        batch.appendrow(row)
+        batch.append(7, 'paw', 21.0, 'cmH2O')
+        self.assertNotIsInstance(batch.column('timestamp'), array)
+        self.assertEqual(batch[0].gettimestamp(), moment)
+        self.assertEqual(batch[-1].gettimestamp(), 7)
+        batch.finalize(None)
+
+
+
+    def test_row_views(self):
+        """
+        Row views give back the content of the rows
+        -------------------------------------------
+        """
+
+        rows = [MGPDataRowL0(i, MGPData('paw', float(i), 'cmH2O'), 'vent-1', 'sample')
+                for i in range(3)]
+        batch = MGPRowBatch(0)
+        batch.extend(rows)
+        self.assertTrue(all(row.is_filtered() for row in rows))
+        self.assertEqual(len(batch), 3)
+        view = batch[1]
+        self.assertEqual((view.gettimestamp(), view.getlabel(), view.getvalue(),
+                          view.getunit(), view.getequipment(), view.geteventtype()),
+                         (1, 'paw', 1.0, 'cmH2O', 'vent-1', 'sample'))
+        self.assertIsNone(view.getl0id())
+        self.assertIsNone(view.getpatientid())
+        with self.assertRaises(IndexError):
+            batch[3]
+        view.finalize(12)
+        batch[0].finalize(None)
+        self.assertEqual(view.getid(), 12)
+        self.assertTrue(batch[0].is_filtered())
+        self.assertFalse(batch.is_finalized())
+        batch.finalizerow(2, 13)
+        self.assertTrue(batch.is_finalized())
+        self.assertEqual(batch.getids(), [None, 12, 13])
+
+
+
+    def test_level_1(self):
+        """
+        Patient IDs of level 1 rows need the password
+        ---------------------------------------------
+        """
+
+        row = MGPDataRowL1(5, MGPData('hr', 60, 'bpm'), l0_id=3, patient_id=42,
+                           patient_pwd='secret')
+        batch = MGPRowBatch(1)
+        batch.appendrow(row, 'secret')
+        view = batch[0]
+        self.assertEqual(view.getl0id(), 3)
+        self.assertEqual(view.getpatientid('secret'), 42)
+        self.assertIsNone(view.getpatientid('wrong'))
+        other = MGPDataRowL0(6, MGPData('hr', 61, 'bpm'), 'mon-1', 'sample')
+        with self.assertRaises(MGPError):
+            batch.appendrow(other)
+        other.finalize(None)
+        batch.finalize([1])
+
+
+
+    def test_errors(self):
+        """
+        Wrong levels, columns and results raise MGPError
+        ------------------------------------------------
+        """
+
+        with self.assertRaises(MGPError):
+            MGPRowBatch(2)
+        batch = MGPRowBatch(0)
+        batch.append(1, 'paw', 20.0, 'cmH2O')
+        with self.assertRaises(MGPError):
+            batch.column('missing')
+        with self.assertRaises(MGPError):
+            batch.finalize([1, 2])
+        batch.finalize([1])
+
+
+
+class TestDrainSource(TestCase):
+    """
+    TestDrainSource class
+    =====================
+    This class tests the waiting and the batching of drain_source().
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates the pipe
+        ----------------
+        """
+
+        self.__source, self.__sink = Pipe(False)
+
+
+
+    def tearDown(self):
+        """
+        Closes the pipe
+        ---------------
+        """
+
+        self.__source.close()
+        self.__sink.close()
+
+
+
+    def sendlater(self, elements, delay):
+        """
+        Sends elements from a thread after a delay
+        ------------------------------------------
+        @Params: elements   (list)      The elements to send.
+                 delay      (float)     The delay in seconds before each one.
+        @Return: (Thread)               The started thread.
+        """
+
+        def send():
+            for element in elements:
+                sleep(delay)
+                self.__sink.send(element)
+
+        thread = Thread(target=send)
+        thread.start()
+        return thread
+
+
+
+    def test_polling(self):
+        """
+        Without timeout only the data that is there already is received
+        ---------------------------------------------------------------
+        """
+
+        received = []
+        self.assertFalse(drain_source(self.__source, received.append))
+        for i in range(3):
+            self.__sink.send(i)
+        self.assertTrue(drain_source(self.__source, received.append))
+        self.assertEqual(received, [0, 1, 2])
+
+
+
+    def test_wakeup(self):
+        """
+        Waiting returns when data arrives, not at the timeout
+        -----------------------------------------------------
+        """
+
+        received = []
+        thread = self.sendlater(['paw'], 0.05)
+        start = monotonic()
+        self.assertTrue(drain_source(self.__source, received.append, 5.0))
+        thread.join()
+        self.assertLess(monotonic() - start, 1.0)
+        self.assertEqual(received, ['paw'])
+        start = monotonic()
+        self.assertFalse(drain_source(self.__source, received.append, 0.05))
+        self.assertGreaterEqual(monotonic() - start, 0.05)
+
+
+
+    def test_batch_delay(self):
+        """
+        Data arriving within the batch delay is received together
+        ---------------------------------------------------------
+        """
+
+        received = []
+        thread = self.sendlater([1, 2, 3], 0.02)
+        self.assertTrue(drain_source(self.__source, received.append, 5.0, 0.3))
+        thread.join()
+        self.assertEqual(received, [1, 2, 3])
+
+
+
+    def test_deadline(self):
+        """
+        A source that doesn't run dry doesn't hold the batch over its delay
+        -------------------------------------------------------------------
+        """
+
+        def receive(element):
+            received.append(element)
+            sleep(0.02)
+
+        received = []
+        for i in range(20):
+            self.__sink.send(i)
+        start = monotonic()
+        self.assertTrue(drain_source(self.__source, receive, 5.0, 0.05))
+        self.assertLess(monotonic() - start, 0.2)
+        self.assertLess(len(received), 20)
+        self.assertTrue(self.__source.poll())
+
+
+
+class TestRowSamples(TestCase):
+    """
+    TestRowSamples class
+    ====================
+    This class tests the series keys and the skipped rows of row_samples().
+    """
+
+
+
+    def test_samples(self):
+        """
+        Rows give samples of their equipment or patient, others are skipped
+        -------------------------------------------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        batch = MGPRowBatch(1)
+        batch.append(1, 'spo2', 97, '%', patient_id='A', patient_pwd='secret')
+        rows = [MGPDataRowL0(0, MGPData('paw', 1.5, 'cmH2O'), 'vent-1', 'sample'),
+                MGPDataRowL0(2, MGPData('paw', float('nan'), 'cmH2O'), 'vent-1', 'sample'),
+                MGPDataRowL0(3, MGPData('alarm', True, None), 'vent-1', 'action'),
+                MGPDataRowL1(4, MGPData('spo2', 95, '%'), 1, 'B', 'secret'),
+                MGPDataRowL1(5, MGPData('spo2', 93, '%'), 1)]
+        self.assertEqual(list(row_samples(rows[:1] + list(batch) + rows[1:] + [None], 'secret')),
+                         [(('vent-1', 'paw'), 0, 1.5), (('A', 'spo2'), 1, 97),
+                          (('B', 'spo2'), 4, 95), ((None, 'spo2'), 5, 93)])
+        batch.finalize(None)
+        for row in rows:
+            row.finalize(None)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1176 @@
+"""
+Medical Gateway Platform - DataArea tests
+=========================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os import listdir
+from os.path import abspath, dirname, getsize, join
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from columnar import MGPChunk
+from common import (MGPData, MGPDataRowL0, MGPDataRowL1, MGPDataRowL2, MGPDataRowL3,
+                    MGPError, MGPGateCycle, MGPLedger, MGPRowBatch)
+from dataarea import DataArea
+from datetime import datetime
+from multiprocessing import Pipe
+from random import Random
+from rollup import MGPRollup
+from sqlite3 import connect
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep
+from unittest import TestCase, main
+
+
+
+class TestTimeIndex(TestCase):
+    """
+    TestTimeIndex class
+    ===================
+    This class tests the block search of the time index.
+    """
+
+
+
+    def test_out_of_order(self):
+        """
+        Blocks of a range match a scan of the bounds with late timestamps
+        -----------------------------------------------------------------
+        """
+
+        random = Random(3)
+        timestamps = [i * 10 + random.randint(-40, 40) for i in range(1000)]
+        timestamps[700] = 5
+        index = DataArea.TimeIndex(16)
+        for record_id, timestamp in enumerate(timestamps, 1):
+            index.add(record_id, timestamp)
+        index.add(1001, None)
+        for start, end in ((0, 100), (4000, 4100), (9950, 20000), (5, 5), (-9, -1)):
+            expected = [block for block in range(63)
+                        if min(timestamps[block * 16:block * 16 + 16]) <= end
+                        and max(timestamps[block * 16:block * 16 + 16]) >= start]
+            self.assertEqual(list(index.blocks(start, end)), expected)
+        self.assertEqual(index.bounds(43), (5, max(timestamps[688:704])))
+        self.assertIsNone(index.bounds(63))
+
+
+
+class TestDataAreaEngine(TestCase):
+    """
+    TestDataAreaEngine class
+    ========================
+    This class tests the record cache of the engine wrapper.
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates a temporary directory for the files
+        -------------------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        self.__directory = TemporaryDirectory()
+        self.__wrappers = []
+
+
+
+    def tearDown(self):
+        """
+        Closes the wrappers and removes the files
+        -----------------------------------------
+        """
+
+        for wrapper in self.__wrappers:
+            wrapper.close()
+        self.__directory.cleanup()
+
+
+
+    def wrapper(self, **settings):
+        """
+        Wraps a CSV engine in the temporary directory
+        ---------------------------------------------
+        @Params: settings   (dict)              Settings besides the path.
+        @Return: (DataArea.__DataAreaEngine)    The wrapper and the engine.
+        """
+
+        settings['path'] = self.__directory.name
+        engine = DataArea._DataArea__EngineCSV(settings)
+        wrapper = DataArea._DataArea__DataAreaEngine(engine, settings)
+        self.__wrappers.append(wrapper)
+        return wrapper, engine
+
+
+
+    def test_lru(self):
+        """
+        Created and read records are cached up to the size of the cache
+        ---------------------------------------------------------------
+        """
+
+        wrapper, _ = self.wrapper(cache_size=2)
+        rows = [MGPDataRowL3(1000 + i, i, 'response {}'.format(i)) for i in range(3)]
+        self.assertEqual(wrapper.create_many(3, rows), [1, 2, 3])
+        self.assertEqual(wrapper.getcounters()['evictions'], 0)
+        self.assertEqual(wrapper.read(3, 3).getresponse(), 'response 2')
+        self.assertEqual(wrapper.read(3, 1).getresponse(), 'response 0')
+        self.assertIs(wrapper.read(3, 1), wrapper.read(3, 1))
+        self.assertEqual(wrapper.getcounters(),
+                         {'hits': 3, 'misses': 1, 'evictions': 1, 'coalesced': 0})
+        wrapper.read(3, 2)
+        self.assertEqual(wrapper.getcounters()['evictions'], 2)
+        self.assertIs(wrapper.read(3, 9), False)
+        self.assertEqual(wrapper.getcounters()['misses'], 3)
+
+
+
+    def test_invalidation(self):
+        """
+        Updated and deleted records are read from the engine again
+        ----------------------------------------------------------
+        """
+
+        wrapper, _ = self.wrapper(cache_size=8)
+        for i in range(2):
+            wrapper.create(3, MGPDataRowL3(1000 + i, i, 'response {}'.format(i)))
+        self.assertTrue(wrapper.update(3, 1, MGPDataRowL3(2000, 9, 'updated')))
+        self.assertTrue(wrapper.delete(3, 2))
+        self.assertEqual(wrapper.read(3, 1).getresponse(), 'updated')
+        self.assertIs(wrapper.read(3, 2), False)
+        self.assertEqual(wrapper.getcounters()['misses'], 2)
+
+
+
+    def test_write_behind(self):
+        """
+        Repeated updates are coalesced until they are due
+        -------------------------------------------------
+        """
+
+        wrapper, engine = self.wrapper(cache_size=8, write_behind=60000)
+        wrapper.create(3, MGPDataRowL3(1000, 0, 'response'))
+        for i in range(3):
+            self.assertTrue(wrapper.update(3, 1, MGPDataRowL3(2000 + i, 0, 'update {}'.format(i))))
+        self.assertTrue(wrapper.update(3, 5, MGPDataRowL3(3000, 0, 'missing')))
+        self.assertEqual(wrapper.getcounters()['coalesced'], 2)
+        self.assertEqual(wrapper.read(3, 1).getresponse(), 'update 2')
+        self.assertEqual(wrapper.read(3, 5).getresponse(), 'missing')
+        wrapper.commit()
+        self.assertEqual(engine.read(3, 1).getresponse(), 'response')
+        wrapper.commit(True)
+        self.assertEqual(engine.read(3, 1).getresponse(), 'update 2')
+        self.assertEqual(wrapper.read(3, 1).gettimestamp(), 2002)
+        self.assertIs(wrapper.read(3, 5), False)
+        with self.assertRaises(MGPError):
+            DataArea._DataArea__DataAreaEngine(engine, {'write_behind': -1})
+
+
+
+    def test_lineage(self):
+        """
+        Records are traced up and down the levels
+        -----------------------------------------
+        """
+
+        wrapper, engine = self.wrapper(cache_size=4)
+        rows0 = [MGPDataRowL0(i, MGPData('paw', i, 'cmH2O'), 'vent-1', 'sample') for i in range(3)]
+        rows1 = [MGPDataRowL1(10 + i, MGPData('paw', i, 'cmH2O'), l0_id) for i, l0_id in
+                 enumerate((1, 1, 3))]
+        rows2 = [MGPDataRowL2(20 + i, MGPData('paw', i, 'cmH2O'), None, l1_id) for i, l1_id in
+                 enumerate((1, 2, 2))]
+        rows3 = [MGPDataRowL3(30 + i, l2_id, 'ok') for i, l2_id in enumerate((2, 3, 3, 1))]
+        for level_id, rows in enumerate((rows0, rows1, rows2, rows3)):
+            for row, record_id in zip(rows, wrapper.create_many(level_id, rows)):
+                row.finalize(record_id)
+        self.assertEqual(wrapper.trace_up(3, [2, 3, 4]),
+                         [{3: 2, 2: 3, 1: 2, 0: 1}, {3: 3, 2: 3, 1: 2, 0: 1},
+                          {3: 4, 2: 1, 1: 1, 0: 1}])
+        self.assertEqual(wrapper.trace_down(0, [1, 2]),
+                         [{0: [1], 1: [1, 2], 2: [1, 2, 3], 3: [4, 1, 2, 3]},
+                          {0: [2], 1: [], 2: [], 3: []}])
+        self.assertTrue(wrapper.update(2, 3, MGPDataRowL2(22, None, None, 3)))
+        self.assertTrue(wrapper.delete(3, 4))
+        self.assertEqual(wrapper.trace_down(0, [3]), [{0: [3], 1: [3], 2: [3], 3: [2, 3]}])
+        self.assertEqual(wrapper.trace_down(1, [1]), [{1: [1], 2: [1], 3: []}])
+        self.assertFalse(wrapper.delete(3, 4))
+        unindexed = DataArea._DataArea__DataAreaEngine(engine, {'lineage': False})
+        self.assertEqual(unindexed.trace_up(3, [2]), [{3: 2, 2: 3, 1: 3, 0: 3}])
+        self.assertEqual(unindexed.trace_up(2, [9]), [{2: 9}])
+        with self.assertRaises(MGPError):
+            unindexed.trace_down(0, [1])
+
+
+
+    def test_lineage_reopen(self):
+        """
+        The lineage index is rebuilt from the stored records when reopened
+        ------------------------------------------------------------------
+        """
+
+        path = self.__directory.name
+        engines = (lambda: DataArea._DataArea__EngineCSV({'path': join(path, 'csv')}),
+                   lambda: DataArea._DataArea__EngineDoF({'path': join(path, 'dof')}),
+                   lambda: DataArea._DataArea__EngineSQL({'database': join(path, 'mgp.sqlite')}))
+        for open_engine in engines:
+            wrapper = DataArea._DataArea__DataAreaEngine(open_engine())
+            self.__wrappers.append(wrapper)
+            rows0 = [MGPDataRowL0(i, MGPData('paw', i, 'cmH2O'), 'vent-1', 'sample')
+                     for i in range(3)]
+            rows1 = [MGPDataRowL1(10 + i, MGPData('paw', i, 'cmH2O'), l0_id) for i, l0_id in
+                     enumerate((1, 1, 3))]
+            rows2 = [MGPDataRowL2(20 + i, MGPData('paw', i, 'cmH2O'), None, l1_id)
+                     for i, l1_id in enumerate((1, 2, 2))]
+            rows3 = [MGPDataRowL3(30 + i, l2_id, 'ok') for i, l2_id in enumerate((2, 3, 3, 1))]
+            for level_id, rows in enumerate((rows0, rows1, rows2, rows3)):
+                for row, record_id in zip(rows, wrapper.create_many(level_id, rows)):
+                    row.finalize(record_id)
+            self.assertTrue(wrapper.update(2, 3, MGPDataRowL2(22, None, None, 3)))
+            self.assertTrue(wrapper.delete(3, 4))
+            traces = wrapper.trace_down(0, [1, 2, 3])
+            wrapper.close()
+            reopened = DataArea._DataArea__DataAreaEngine(open_engine())
+            self.__wrappers.append(reopened)
+            self.assertEqual(reopened.trace_down(0, [1, 2, 3]), traces)
+            self.assertEqual(traces[0], {0: [1], 1: [1, 2], 2: [1, 2], 3: [1]})
+            self.assertEqual(reopened.trace_up(3, [3]), [{3: 3, 2: 3, 1: 3, 0: 3}])
+
+
+
+class TestEngineCSV(TestCase):
+    """
+    TestEngineCSV class
+    ===================
+    This class tests the CSV storage engine.
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates a temporary directory for the files
+        -------------------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        self.__directory = TemporaryDirectory()
+        self.__engines = []
+
+
+
+    def tearDown(self):
+        """
+        Closes the engines and removes the files
+        ----------------------------------------
+        """
+
+        for engine in self.__engines:
+            engine.close()
+        self.__directory.cleanup()
+
+
+
+    def engine(self, **settings):
+        """
+        Opens an engine in the temporary directory
+        ------------------------------------------
+        @Params: settings   (dict)          Settings besides the path.
+        @Return: (DataArea.__EngineCSV)     The engine.
+        """
+
+        settings['path'] = self.__directory.name
+        engine = DataArea._DataArea__EngineCSV(settings)
+        self.__engines.append(engine)
+        return engine
+
+
+
+    def test_group_commit(self):
+        """
+        Records are written in groups of flush_rows
+        -------------------------------------------
+        """
+
+        engine = self.engine(flush_rows=3, flush_interval=60000, fsync='never')
+        data_path = join(self.__directory.name, 'l0.csv')
+        header_size = getsize(data_path)
+        batch = MGPRowBatch(0)
+        for i in range(5):
+            batch.append(1000 + i, 'paw', 10.5 + i, 'cmH2O', equipment_id='vent-1',
+                         event_type='measurement')
+        ids = [engine.create(0, row) for row in batch]
+        batch.finalize(ids)
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+        self.assertEqual(batch.getids(), ids)
+        written = getsize(data_path)
+        self.assertGreater(written, header_size)
+        engine.commit()
+        self.assertEqual(getsize(data_path), written)
+        engine.commit(True)
+        self.assertGreater(getsize(data_path), written)
+
+
+
+    def test_read_levels(self):
+        """
+        Records of all levels are read back by ID
+        -----------------------------------------
+        """
+
+        engine = self.engine(patient_pwd='secret')
+        row0 = MGPDataRowL0(1000, MGPData('alarm', True, None), 'vent-1', 'action')
+        row1 = MGPDataRowL1(1001, MGPData('paw', 12, 'cmH2O'), 1, 42, 'secret')
+        cycle = MGPGateCycle(1002)
+        cycle.append('gate, "A"', 2, MGPData('flow', -0.25, 'l/min'))
+        row3 = MGPDataRowL3(1003, 1, '12')
+        self.assertEqual(engine.create(0, row0), 1)
+        self.assertEqual(engine.create(1, row1), 1)
+        self.assertEqual(engine.create(2, list(cycle)[0]), 1)
+        self.assertEqual(engine.create(3, row3), 1)
+        for row in (row0, row1, row3):
+            row.finalize(1)
+        cycle.finalize([1])
+        stored = MGPLedger.stored[:]
+        read0 = engine.read(0, 1)
+        self.assertEqual((read0.gettimestamp(), read0.getlabel(), read0.getvalue(),
+                          read0.getunit(), read0.getequipment(), read0.geteventtype(),
+                          read0.getid()),
+                         (1000, 'alarm', True, None, 'vent-1', 'action', 1))
+        read1 = engine.read(1, 1)
+        self.assertEqual((read1.getvalue(), read1.getl0id(), read1.getpatientid('secret')),
+                         (12, 1, 42))
+        read2 = engine.read(2, 1)
+        self.assertIsNone(read2.getlabel(1))
+        self.assertEqual((read2.gettimestamp(), read2.getlabel(2), read2.getvalue(2)),
+                         (1002, 'flow', -0.25))
+        read3 = engine.read(3, 1)
+        self.assertEqual((read3.gettimestamp(), read3.getl2id(), read3.getresponse()),
+                         (1003, 1, '12'))
+        self.assertEqual(MGPLedger.stored, stored)
+        self.assertIs(engine.read(0, 2), False)
+        self.assertEqual(engine.create(4, row0), -1)
+        self.assertEqual(engine.create_many(3, [row3, object(), row3]), [2, -1, 3])
+        self.assertEqual(engine.read(3, 3).getresponse(), '12')
+
+
+
+    def test_patient_without_password(self):
+        """
+        The patient ID of a row without password is stored without password
+        --------------------------------------------------------------------
+        """
+
+        engine = self.engine()
+        row1 = MGPDataRowL1(1001, MGPData('paw', 12, 'cmH2O'), 1, 42)
+        self.assertEqual(engine.create(1, row1), 1)
+        row1.finalize(1)
+        self.assertEqual(engine.read(1, 1).getpatientid(), 42)
+
+
+
+    def test_update_delete(self):
+        """
+        Updates are read back and deleted records are not
+        -------------------------------------------------
+        """
+
+        engine = self.engine()
+        rows = [MGPDataRowL3(1000 + i, i, 'response {}'.format(i)) for i in range(3)]
+        for row in rows:
+            row.finalize(engine.create(3, row))
+        update = MGPDataRowL3(2000, 9, 'updated')
+        self.assertTrue(engine.update(3, 2, update))
+        self.assertTrue(engine.delete(3, 3))
+        self.assertFalse(engine.delete(3, 3))
+        self.assertFalse(engine.update(3, 4, update))
+        self.assertEqual(engine.read(3, 2).getresponse(), 'updated')
+        self.assertIs(engine.read(3, 3), False)
+        self.assertEqual(engine.read(3, 1).getresponse(), 'response 0')
+        update.finalize(2)
+
+
+
+    def test_reopen(self):
+        """
+        IDs continue after reopening and unwritten index entries are dropped
+        --------------------------------------------------------------------
+        """
+
+        engine = self.engine()
+        for i in range(3):
+            row = MGPDataRowL3(i, i, 'r')
+            row.finalize(engine.create(3, row))
+        engine.close()
+        index_path = join(self.__directory.name, 'l3.idx')
+        with open(index_path, 'ab') as index_file:
+            index_file.write((1 << 40).to_bytes(8, 'little'))
+        with open(join(self.__directory.name, 'l3.csv'), 'ab') as data_file:
+            data_file.write(b'4,3,3,tor')
+        engine = self.engine()
+        self.assertEqual(getsize(index_path), 24)
+        row = MGPDataRowL3(9, 9, 'after')
+        row.finalize(engine.create(3, row))
+        self.assertEqual(row.getid(), 4)
+        self.assertEqual(engine.read(3, 4).getresponse(), 'after')
+        self.assertEqual(engine.read(3, 3).gettimestamp(), 2)
+
+
+
+    def test_query_range(self):
+        """
+        Records of a time range are found after reopening
+        -------------------------------------------------
+        """
+
+        engine = self.engine(index_stride=8)
+        batch = MGPRowBatch(1)
+        for i in range(60):
+            batch.append(i * 10, 'paw' if i % 2 else 'flow', i, 'cmH2O', l0_id=i + 1)
+        batch.finalize(engine.create_many(1, list(batch)))
+        late = MGPDataRowL1(15, MGPData('paw', -1, 'cmH2O'), 61)
+        late.finalize(engine.create(1, late))
+        self.assertTrue(engine.delete(1, 3))
+        engine.close()
+        engine = self.engine(index_stride=8)
+        self.assertEqual([row.getid() for row in engine.query_range(1, 15, 50)],
+                         [4, 5, 6, 61])
+        self.assertEqual([row.getvalue() for row in engine.query_range(1, 15, 50, label='paw')],
+                         [3, 5, -1])
+
+
+
+    def test_data_area(self):
+        """
+        DataArea stores received rows by level through the CSV engine
+        -------------------------------------------------------------
+        """
+
+        source, sink = Pipe(False)
+        owner = MGPLedger.owner
+        DataArea.engine = None
+        try:
+            rollup = MGPRollup()
+            settings = {'path': self.__directory.name, 'patient_pwd': 'secret'}
+            area = DataArea('CSV', settings, source, rollup=rollup)
+            batch = MGPRowBatch(1)
+            for i in range(3):
+                batch.append(i, 'paw', i, 'cmH2O', l0_id=i + 1)
+            row0 = MGPDataRowL0(5, MGPData('paw', 5, 'cmH2O'), 'vent-1', 'sample')
+            row1 = MGPDataRowL1(6, MGPData('paw', 6, 'cmH2O'), 1, 42, 'secret')
+            for element in (batch, row0, row1, 'unknown'):
+                area._DataArea__receive(element)
+            area._DataArea__store()
+            self.assertEqual(batch.getids(), [1, 2, 3])
+            self.assertEqual((row0.getid(), row1.getid()), (1, 4))
+            self.assertEqual(rollup.keys(), [('vent-1', 'paw'), (None, 'paw'), (42, 'paw')])
+            self.assertEqual(rollup.query(None, 'paw', 0, 10, 1)[1], [(0, 3, 0, 2, 1.0)])
+            self.assertEqual(rollup.query(42, 'paw', 0, 10, 1)[1], [(0, 1, 6, 6, 6.0)])
+            DataArea.engine.commit(True)
+            self.assertEqual(DataArea.engine.read(1, 3).getl0id(), 3)
+            self.assertEqual(DataArea.engine.read(1, 4).gettimestamp(), 6)
+            self.assertEqual([row.getid() for row in DataArea.query_range(1, 1, 6)], [2, 3, 4])
+            with self.assertRaises(MGPError):
+                DataArea.query_range(1, 0, 10, equipment='vent-1')
+            with self.assertRaises(MGPError):
+                DataArea.query_range(3, 0, 10, label='paw')
+            with self.assertRaises(MGPError):
+                DataArea.query_range(4, 0, 10)
+            self.assertEqual(DataArea.trace_up(1, 4), {1: 4, 0: 1})
+            self.assertEqual(DataArea.trace_down_many(0, [1, 2]),
+                             [{0: [1], 1: [1, 4], 2: [], 3: []}, {0: [2], 1: [2], 2: [], 3: []}])
+            with self.assertRaises(MGPError):
+                DataArea.trace_down(5, 1)
+        finally:
+            DataArea.engine = None
+            MGPLedger.owner = owner
+            source.close()
+            sink.close()
+
+
+
+    def test_write_ahead_log(self):
+        """
+        DataArea replays the write-ahead log after a crash only once
+        ------------------------------------------------------------
+        """
+
+        def crash(level_id, rows):
+            raise RuntimeError('crash')
+
+        source, sink = Pipe(False)
+        owner = MGPLedger.owner
+        wal = join(self.__directory.name, 'data.wal')
+        settings = {'path': self.__directory.name, 'wal': wal}
+        DataArea.engine = None
+        try:
+            area = DataArea('CSV', settings, source)
+            for i in range(3):
+                area._DataArea__receive(MGPDataRowL0(i, MGPData('paw', i, 'cmH2O'), 'vent-1', 'sample'))
+            area._DataArea__store()
+            DataArea.engine.commit(True)
+            area._DataArea__receive(MGPDataRowL0(3, MGPData('paw', 3, 'cmH2O'), 'vent-1', 'sample'))
+            area._DataArea__receive(MGPDataRowL1(4, MGPData('paw', 4, 'cmH2O'), 1))
+            DataArea.engine.create_many = crash
+            with self.assertRaises(RuntimeError):
+                area._DataArea__store()
+            del DataArea.engine.create_many
+            DataArea.engine.close()
+            area._DataArea__wal.close()
+            with open(wal, 'ab') as log_file:
+                log_file.write(b'\x10\x00\x00\x00torn')
+            DataArea.engine = None
+            area = DataArea('CSV', settings, source)
+            area._DataArea__recover()
+            self.assertEqual(getsize(wal), 0)
+            self.assertEqual(DataArea.engine.getnextid(0), 5)
+            self.assertEqual(DataArea.engine.getnextid(1), 2)
+            self.assertEqual(DataArea.engine.read(0, 4).gettimestamp(), 3)
+            self.assertEqual(DataArea.engine.read(0, 4).getequipment(), 'vent-1')
+            self.assertEqual(DataArea.engine.read(1, 1).getl0id(), 1)
+            area._DataArea__recover()
+            self.assertEqual(DataArea.engine.getnextid(0), 5)
+            area._DataArea__wal.close()
+        finally:
+            if DataArea.engine is not None:
+                DataArea.engine.close()
+            DataArea.engine = None
+            MGPLedger.owner = owner
+            source.close()
+            sink.close()
+
+
+
+    def test_write_ahead_log_writers(self):
+        """
+        DataArea replays the batches in the queue of the writers after a crash
+        ----------------------------------------------------------------------
+        """
+
+        def row(timestamp):
+            return MGPDataRowL0(timestamp, MGPData('paw', timestamp, 'cmH2O'), 'vent-1', 'sample')
+
+        def put(area, element):
+            area._DataArea__receive(element)
+            area._DataArea__store()
+
+        source, sink = Pipe(False)
+        owner = MGPLedger.owner
+        lock = DataArea._DataArea__lock
+        wal = join(self.__directory.name, 'data.wal')
+        settings = {'path': self.__directory.name, 'wal': wal, 'writers': 1, 'queue_size': 1,
+                    'overflow': 'drop'}
+        DataArea.engine = None
+        try:
+            area = DataArea('CSV', settings, source)
+            put(area, row(0))
+            while True:
+                with lock:
+                    if DataArea.engine.getnextid(0) == 2:
+                        DataArea.engine.commit(True)
+                        break
+                sleep(0.001)
+            with lock:
+                put(area, row(1))
+                while area.getqueuecounters()['queued']:
+                    sleep(0.001)
+                put(area, row(2))
+                put(area, row(3))
+                self.assertEqual(area.getqueuecounters()['dropped'], 1)
+                self.assertEqual(area._DataArea__wal.getpending(), 2)
+                area._DataArea__wal.close()
+                DataArea.engine.close()
+                DataArea.engine = None
+            area._DataArea__writers.close()
+            del settings['writers']
+            area = DataArea('CSV', settings, source)
+            area._DataArea__recover()
+            self.assertEqual(getsize(wal), 0)
+            self.assertEqual([stored.gettimestamp() for stored in DataArea.query_range(0, 0, 10)],
+                             [0, 1, 3])
+            area._DataArea__wal.close()
+        finally:
+            if DataArea.engine is not None:
+                DataArea.engine.close()
+            DataArea.engine = None
+            MGPLedger.owner = owner
+            source.close()
+            sink.close()
+
+
+
+    def test_writers(self):
+        """
+        DataArea writers keep the order and handle a full queue by the policies
+        -----------------------------------------------------------------------
+        """
+
+        def row(timestamp):
+            return MGPDataRowL0(timestamp, MGPData('paw', timestamp, 'cmH2O'), 'vent-1', 'sample')
+
+        def put(area, *rows):
+            for element in rows:
+                area._DataArea__receive(element)
+            area._DataArea__store()
+
+        def stall(area, element):
+            put(area, element)
+            while area.getqueuecounters()['queued']:
+                sleep(0.001)
+
+        source, sink = Pipe(False)
+        owner = MGPLedger.owner
+        lock = DataArea._DataArea__lock
+        spill = join(self.__directory.name, 'data.spill')
+        try:
+            for overflow in ('block', 'drop', 'spill'):
+                DataArea.engine = None
+                directory = join(self.__directory.name, overflow)
+                settings = {'path': directory, 'writers': 2, 'queue_size': 1,
+                            'overflow': overflow, 'spill': spill}
+                area = DataArea('CSV', settings, source)
+                with lock:
+                    stall(area, row(0))
+                    stall(area, MGPDataRowL1(1, MGPData('paw', 1, 'cmH2O'), 1))
+                    put(area, row(2))
+                    if overflow == 'block':
+                        thread = Thread(target=put, args=(area, row(3)))
+                        thread.start()
+                        thread.join(0.05)
+                        self.assertTrue(thread.is_alive())
+                    else:
+                        put(area, row(3))
+                        put(area, row(4))
+                if overflow == 'block':
+                    thread.join()
+                area._DataArea__writers.close()
+                with self.assertRaises(MGPError):
+                    put(area, row(5))
+                counters = area.getqueuecounters()
+                timestamps = [stored.gettimestamp() for stored in DataArea.query_range(0, 0, 10)]
+                self.assertEqual(DataArea.engine.getnextid(1), 2)
+                if overflow == 'block':
+                    self.assertEqual(timestamps, [0, 2, 3])
+                elif overflow == 'drop':
+                    self.assertEqual(timestamps, [0, 4])
+                    self.assertEqual(counters['dropped'], 2)
+                else:
+                    self.assertEqual(timestamps, [0, 2, 3, 4])
+                    self.assertEqual(counters['spilled'], 2)
+                    self.assertEqual(getsize(spill), 0)
+                DataArea.engine.close()
+        finally:
+            DataArea.engine = None
+            MGPLedger.owner = owner
+            source.close()
+            sink.close()
+
+
+
+    def test_query_pages(self):
+        """
+        DataArea queries run the engine under the lock page by page
+        -----------------------------------------------------------
+        """
+
+        source, sink = Pipe(False)
+        owner = MGPLedger.owner
+        lock = DataArea._DataArea__lock
+        locked = []
+        try:
+            DataArea.engine = None
+            area = DataArea('CSV', {'path': self.__directory.name, 'writers': 2}, source)
+            for timestamp in range(1500):
+                area._DataArea__receive(MGPDataRowL0(timestamp, MGPData('paw', timestamp, 'cmH2O'),
+                                                     'vent-1', 'sample'))
+            area._DataArea__store()
+            while area.getqueuecounters()['queued']:
+                sleep(0.001)
+            engine = DataArea.engine
+            query = engine.query_range
+
+            def watched(*args):
+                for stored in query(*args):
+                    locked.append(lock._is_owned())
+                    yield stored
+
+            engine.query_range = watched
+            rows = DataArea.query_range(0, 0, 2000)
+            self.assertEqual(len(locked), 1024)
+            self.assertEqual(next(rows).gettimestamp(), 0)
+            self.assertFalse(lock._is_owned())
+            self.assertEqual([stored.gettimestamp() for stored in rows], list(range(1, 1500)))
+            self.assertEqual(locked, [True] * 1500)
+            area._DataArea__writers.close()
+            engine.close()
+        finally:
+            DataArea.engine = None
+            MGPLedger.owner = owner
+            source.close()
+            sink.close()
+
+
+class TestEngineDoF(TestCase):
+    """
+    TestEngineDoF class
+    ===================
+    This class tests the segmented log engine.
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates a temporary directory for the files
+        -------------------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        self.__directory = TemporaryDirectory()
+        self.__engines = []
+
+
+
+    def tearDown(self):
+        """
+        Closes the engines and removes the files
+        ----------------------------------------
+        """
+
+        for engine in self.__engines:
+            engine.close()
+        self.__directory.cleanup()
+
+
+
+    def engine(self, **settings):
+        """
+        Opens an engine with small segments in the temporary directory
+        ---------------------------------------------------------------
+        @Params: settings   (dict)          Settings besides the path and the
+                                            sizes.
+        @Return: (DataArea.__EngineDoF)     The engine.
+        """
+
+        settings.update(path=self.__directory.name, segment_size=1000, index_stride=4)
+        engine = DataArea._DataArea__EngineDoF(settings)
+        self.__engines.append(engine)
+        return engine
+
+
+
+    def store(self, engine, count, first=0):
+        """
+        Stores L0 samples
+        -----------------
+        @Params: engine (DataArea.__EngineDoF)  The engine.
+                 count  (int)                   Count of samples.
+                 first  (int)                   [optional] The first timestamp.
+        @Return: (list)                         The IDs of the records.
+        """
+
+        batch = MGPRowBatch(0)
+        for i in range(first, first + count):
+            batch.append(i * 10, 'paw', 10.5 + i, 'cmH2O',
+                         equipment_id='vent-{}'.format(i % 3), event_type='measurement')
+        ids = engine.create_many(0, list(batch))
+        batch.finalize(ids)
+        return ids
+
+
+
+    def test_segments(self):
+        """
+        Records roll over segments and are read back after reopening
+        -------------------------------------------------------------
+        """
+
+        engine = self.engine(flush_rows=7)
+        self.assertEqual(self.store(engine, 100), list(range(1, 101)))
+        engine.commit(True)
+        directory = join(self.__directory.name, 'l0')
+        self.assertEqual(len([name for name in listdir(directory) if name.endswith('.seg')]), 4)
+        self.assertEqual(len([name for name in listdir(directory) if name.endswith('.idx')]), 3)
+        engine.close()
+        engine = self.engine()
+        read = engine.read(0, 57)
+        self.assertEqual((read.gettimestamp(), read.getlabel(), read.getvalue(), read.getunit(),
+                          read.getequipment(), read.geteventtype(), read.getid()),
+                         (560, 'paw', 66.5, 'cmH2O', 'vent-2', 'measurement', 57))
+        self.assertEqual(self.store(engine, 1, 100), [101])
+        self.assertEqual(engine.read(0, 101).getvalue(), 110.5)
+        self.assertIs(engine.read(0, 102), False)
+
+
+
+    def test_query_range(self):
+        """
+        Records of a time range are found with the timestamp index
+        ----------------------------------------------------------
+        """
+
+        engine = self.engine()
+        self.store(engine, 100)
+        self.assertEqual([row.getid() for row in engine.query_range(0, 195, 250)],
+                         [21, 22, 23, 24, 25, 26])
+        self.assertTrue(engine.update(0, 22, MGPDataRowL0(5000, MGPData('paw', 1, 'cmH2O'),
+                                                          'vent-1', 'measurement')))
+        self.assertTrue(engine.delete(0, 23))
+        self.assertEqual([row.getid() for row in engine.query_range(0, 195, 250)], [21, 24, 25, 26])
+        engine.close()
+        engine = self.engine()
+        self.assertEqual([row.getid() for row in engine.query_range(0, 4000, 6000)], [22])
+        self.assertEqual(list(engine.query_range(0, 2000, 3000)), [])
+        self.assertEqual([row.getid() for row in engine.query_range(0, 0, 990, 'vent-1')],
+                         [record_id for record_id in range(2, 101, 3) if record_id != 23])
+
+
+
+    def test_levels(self):
+        """
+        Records of all levels keep their types
+        --------------------------------------
+        """
+
+        engine = self.engine(patient_pwd='secret')
+        now = datetime(2020, 4, 26, 12, 30, 15, 250000)
+        row1 = MGPDataRowL1(now, MGPData('alarm', True, None), 7, 42, 'secret')
+        cycle = MGPGateCycle(1002)
+        cycle.append('gate A', 2, MGPData('mode', 'PCV', None))
+        row3 = MGPDataRowL3(1003, 1, 'résumé')
+        self.assertEqual(engine.create(1, row1), 1)
+        self.assertEqual(engine.create(2, list(cycle)[0]), 1)
+        self.assertEqual(engine.create(3, row3), 1)
+        self.assertEqual(engine.create_many(3, [row3, object()]), [2, -1])
+        row1.finalize(1)
+        cycle.finalize([1])
+        row3.finalize(1)
+        engine.close()
+        engine = self.engine(patient_pwd='secret')
+        read1 = engine.read(1, 1)
+        self.assertEqual((read1.gettimestamp(), read1.getvalue(), read1.getunit(),
+                          read1.getl0id(), read1.getpatientid('secret')),
+                         (now, True, None, 7, 42))
+        read2 = engine.read(2, 1)
+        self.assertEqual((read2.getlabel(1), read2.getvalue(2)), (None, 'PCV'))
+        self.assertEqual(engine.read(3, 2).getresponse(), 'résumé')
+        self.assertEqual(engine.create(4, row3), -1)
+
+
+
+class TestEngineChunk(TestCase):
+    """
+    TestEngineChunk class
+    =====================
+    This class tests the Chunk storage engine.
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates a temporary directory for the files
+        -------------------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        self.__directory = TemporaryDirectory()
+        self.__engines = []
+
+
+
+    def tearDown(self):
+        """
+        Closes the engines and removes the files
+        ----------------------------------------
+        """
+
+        for engine in self.__engines:
+            engine.close()
+        self.__directory.cleanup()
+
+
+
+    def engine(self, **settings):
+        """
+        Opens an engine in the temporary directory
+        ------------------------------------------
+        @Params: settings   (dict)          Settings besides the path.
+        @Return: (DataArea.__EngineChunk)   The engine.
+        """
+
+        settings.update(path=self.__directory.name, segment_size=1000, index_stride=4)
+        engine = DataArea._DataArea__EngineChunk(settings,
+                                                 DataArea._DataArea__EngineDoF(settings))
+        self.__engines.append(engine)
+        return engine
+
+
+
+    def store(self, engine, count, first=0):
+        """
+        Stores L0 samples
+        -----------------
+        @Params: engine (DataArea.__EngineChunk)    The engine.
+                 count  (int)                       Count of samples.
+                 first  (int)                       [optional] The first
+                                                    timestamp.
+        @Return: (list)                             The IDs of the records.
+        """
+
+        batch = MGPRowBatch(0)
+        for i in range(first, first + count):
+            batch.append(i * 10, 'paw', 10.5 + i, 'cmH2O',
+                         equipment_id='vent-{}'.format(i % 3), event_type='measurement')
+        ids = engine.create_many(0, list(batch))
+        batch.finalize(ids)
+        return ids
+
+
+
+    def test_chunks(self):
+        """
+        Records are written in chunks and read back after reopening
+        -----------------------------------------------------------
+        """
+
+        engine = self.engine(chunk_rows=30, flush_interval=60000, fsync='never')
+        self.assertEqual(self.store(engine, 100), list(range(1, 101)))
+        self.assertEqual(len(list(MGPChunk.readfile(join(self.__directory.name, 'l0.chunk')))), 3)
+        self.assertEqual(engine.read(0, 95).getvalue(), 104.5)
+        engine.commit()
+        self.assertEqual(len(list(MGPChunk.readfile(join(self.__directory.name, 'l0.chunk')))), 3)
+        engine.close()
+        with open(join(self.__directory.name, 'l0.chunk'), 'ab') as data_file:
+            data_file.write(b'\x40\x00\x00\x00MGPC')
+        engine = self.engine()
+        read = engine.read(0, 57)
+        self.assertEqual((read.gettimestamp(), read.getlabel(), read.getvalue(), read.getunit(),
+                          read.getequipment(), read.geteventtype(), read.getid()),
+                         (560, 'paw', 66.5, 'cmH2O', 'vent-2', 'measurement', 57))
+        self.assertEqual(self.store(engine, 1, 100), [101])
+        self.assertEqual(engine.read(0, 101).getvalue(), 110.5)
+        self.assertIs(engine.read(0, 102), False)
+        self.assertIs(engine.read(0, 0), False)
+        self.assertFalse(engine.update(0, 5, read))
+        self.assertFalse(engine.delete(0, 5))
+
+
+
+    def test_query_range(self):
+        """
+        Records of a time range are found by the time ranges of the chunks
+        ------------------------------------------------------------------
+        """
+
+        engine = self.engine(chunk_rows=16)
+        self.store(engine, 100)
+        self.assertEqual([row.getid() for row in engine.query_range(0, 195, 250)],
+                         [21, 22, 23, 24, 25, 26])
+        self.assertEqual([row.getid() for row in engine.query_range(0, 0, 990, 'vent-1')],
+                         list(range(2, 101, 3)))
+        self.assertEqual([row.getid() for row in engine.query_range(0, 950, 2000, label='paw')],
+                         [96, 97, 98, 99, 100])
+        self.assertEqual(list(engine.query_range(0, 0, 990, label='flow')), [])
+        self.assertEqual(list(engine.query_range(0, 2000, 3000)), [])
+
+
+
+    def test_levels(self):
+        """
+        Mixed values are kept and upper levels are stored by the DoF engine
+        -------------------------------------------------------------------
+        """
+
+        engine = self.engine()
+        rows = [MGPDataRowL0(1, MGPData('alarm', True, None), 'vent-1', 'action'),
+                MGPDataRowL0(2, MGPData('mode', 'PCV', None), 'vent-1', 'setting'),
+                MGPDataRowL0(3.5, MGPData('paw', 7, 'cmH2O'), 'vent-1', 'measurement'),
+                MGPDataRowL0(4, MGPData('paw', 1 << 70, 'cmH2O'), 'vent-1', 'measurement'),
+                MGPDataRowL0(datetime(2020, 4, 26), MGPData('paw', 1, 'cmH2O'), None, None)]
+        self.assertEqual(engine.create_many(0, rows), [1, 2, 3, -1, -1])
+        row3 = MGPDataRowL3(1003, 1, 'response')
+        self.assertEqual(engine.create(3, row3), 1)
+        engine.close()
+        engine = self.engine()
+        self.assertEqual([engine.read(0, record_id).getvalue() for record_id in (1, 2, 3)],
+                         [True, 'PCV', 7])
+        self.assertEqual(engine.read(0, 3).gettimestamp(), 3.5)
+        self.assertEqual(engine.read(3, 1).getresponse(), 'response')
+        self.assertEqual(len(list(MGPChunk.readfile(join(self.__directory.name, 'l0.chunk')))), 2)
+        for row in rows[:3]:
+            row.finalize(None)
+        rows[3].finalize(None)
+        rows[4].finalize(None)
+        row3.finalize(1)
+
+
+
+class TestEngineSQL(TestCase):
+    """
+    TestEngineSQL class
+    ===================
+    This class tests the SQLite storage engine.
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates a temporary directory for the database
+        ----------------------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        self.__directory = TemporaryDirectory()
+        self.__database = join(self.__directory.name, 'mgp.sqlite')
+        self.__engines = []
+
+
+
+    def tearDown(self):
+        """
+        Closes the engines and removes the database
+        -------------------------------------------
+        """
+
+        for engine in self.__engines:
+            engine.close()
+        self.__directory.cleanup()
+
+
+
+    def engine(self, **settings):
+        """
+        Opens an engine on the temporary database
+        -----------------------------------------
+        @Params: settings   (dict)          Settings besides the database.
+        @Return: (DataArea.__EngineSQL)     The engine.
+        """
+
+        settings['database'] = self.__database
+        engine = DataArea._DataArea__EngineSQL(settings)
+        self.__engines.append(engine)
+        return engine
+
+
+
+    def test_batched_inserts(self):
+        """
+        Created records are inserted at commit in WAL mode
+        --------------------------------------------------
+        """
+
+        engine = self.engine()
+        batch = MGPRowBatch(0)
+        for i in range(5):
+            batch.append(1000 + i, 'paw', 10.5 + i, 'cmH2O', equipment_id='vent-1',
+                         event_type='measurement')
+        batch.finalize([engine.create(0, row) for row in batch])
+        self.assertEqual(batch.getids(), [1, 2, 3, 4, 5])
+        connection = connect(self.__database)
+        self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(connection.execute('SELECT COUNT(*) FROM l0').fetchone()[0], 0)
+        engine.commit()
+        self.assertEqual(connection.execute('SELECT COUNT(*) FROM l0').fetchone()[0], 5)
+        indexes = {row[0] for row in connection.execute('SELECT name FROM sqlite_master '
+                                                        "WHERE type = 'index'")}
+        self.assertEqual(indexes, {'l0_equipment_timestamp', 'l0_timestamp', 'l1_l0_id',
+                                   'l1_label_timestamp', 'l1_timestamp', 'l2_l1_id',
+                                   'l2_timestamp', 'l3_l2_id', 'l3_timestamp'})
+        connection.close()
+        read = engine.read(0, 4)
+        self.assertEqual((read.gettimestamp(), read.getvalue(), read.getequipment()),
+                         (1003, 13.5, 'vent-1'))
+
+
+
+    def test_crud(self):
+        """
+        Records of all levels are read, updated and deleted by ID
+        ---------------------------------------------------------
+        """
+
+        engine = self.engine(patient_pwd='secret')
+        row1 = MGPDataRowL1(1001, MGPData('paw', 12, 'cmH2O'), 1, 42, 'secret')
+        cycle = MGPGateCycle(1002)
+        cycle.append('gate A', 1, MGPData('paw', 12, 'cmH2O'))
+        row3 = MGPDataRowL3(1003, 1, 'ok')
+        self.assertEqual(engine.create(1, row1), 1)
+        self.assertEqual(engine.create(2, list(cycle)[0]), 1)
+        self.assertEqual(engine.create(3, row3), 1)
+        row1.finalize(1)
+        cycle.finalize([1])
+        row3.finalize(1)
+        read1 = engine.read(1, 1)
+        self.assertEqual((read1.getl0id(), read1.getpatientid('secret')), (1, 42))
+        read2 = engine.read(2, 1)
+        self.assertEqual((read2.getvalue(1), read2.getvalue(2)), (12, None))
+        self.assertTrue(engine.update(3, 1, MGPDataRowL3(2000, 1, 'updated')))
+        self.assertEqual(engine.read(3, 1).getresponse(), 'updated')
+        self.assertTrue(engine.delete(3, 1))
+        self.assertFalse(engine.delete(3, 1))
+        self.assertIs(engine.read(3, 1), False)
+        self.assertEqual(engine.create(4, row3), -1)
+        self.assertEqual(engine.create_many(3, [row3, object(), row3]), [2, -1, 3])
+        self.assertEqual(engine.read(3, 3).getresponse(), 'ok')
+        engine.close()
+        self.assertEqual(self.engine().create(1, read1), 2)
+
+
+
+    def test_refused_records(self):
+        """
+        Records SQLite refuses don't block the others
+        ---------------------------------------------
+        """
+
+        engine = self.engine()
+        rows = [MGPDataRowL0(i, MGPData('paw', float(i), 'cmH2O'), 'vent-1', 'sample')
+                for i in range(3)]
+        listed = MGPDataRowL0(9, MGPData('paw', [1, 2], 'cmH2O'), 'vent-1', 'sample')
+        huge = MGPDataRowL0(9, MGPData('paw', 1 << 64, 'cmH2O'), 'vent-1', 'sample')
+        self.assertEqual(engine.create_many(0, [rows[0], listed, huge]), [1, -1, -1])
+        self.assertFalse(engine.update(0, 1, listed))
+        connection = connect(self.__database)
+        connection.execute('INSERT INTO l0 (id, timestamp) VALUES (2, 0)')
+        connection.commit()
+        connection.close()
+        self.assertEqual(engine.create_many(0, rows[1:]), [2, 3])
+        engine.commit()
+        self.assertEqual(engine.read(0, 1).gettimestamp(), 0)
+        self.assertIsNone(engine.read(0, 2).getvalue())
+        self.assertEqual(engine.read(0, 3).getvalue(), 2.0)
+        self.assertEqual(engine.create(0, rows[0]), 4)
+        engine.commit()
+        self.assertEqual(engine.read(0, 4).getvalue(), 0.0)
+
+
+
+    def test_query_range(self):
+        """
+        Records of a time range come in time order
+        ------------------------------------------
+        """
+
+        engine = self.engine()
+        batch = MGPRowBatch(0)
+        for i in (5, 1, 4, 2, 3):
+            batch.append(i, 'paw', i, 'cmH2O', equipment_id='vent-{}'.format(i % 2))
+        batch.finalize(engine.create_many(0, list(batch)))
+        self.assertEqual([row.gettimestamp() for row in engine.query_range(0, 2, 4)], [2, 3, 4])
+        self.assertEqual([row.getid() for row in engine.query_range(0, 0, 9, 'vent-1')],
+                         [2, 5, 1])
+        self.assertEqual(list(engine.query_range(0, 0, 9, label='flow')), [])
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+"""
+Medical Gateway Platform - InputArea tests
+==========================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os.path import abspath, dirname
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from asyncio import (DatagramProtocol, create_task, get_running_loop, run, sleep,
+                     start_server, wait_for)
+from common import ExitObject, MGPData, MGPDataRowL0, MGPError, MGPLedger, MGPRowBatch
+from inputarea import AsyncInputArea, InputArea
+from multiprocessing import Pipe
+from struct import pack
+from zlib import crc32
+from unittest import TestCase, main
+
+
+
+def sample(rawdata):
+    """
+    Translates a timestamp and value pair to an L0 row
+    --------------------------------------------------
+    Raw data None gives a status text instead of a row.
+    """
+
+    if rawdata is None:
+        return ExitObject('status', None, 'status')
+    row = MGPDataRowL0(rawdata[0], MGPData('paw', rawdata[1], 'cmH2O'), 'vent-1', 'sample')
+    return ExitObject(row, row, None)
+
+
+
+def line(rawdata):
+    """
+    Translates a timestamp and value line to an L0 row
+    --------------------------------------------------
+    """
+
+    timestamp, value = rawdata.decode().split(',')
+    return sample((int(timestamp), float(value)))
+
+
+
+def frame(samples, checksum=True):
+    """
+    Packs samples to a frame with a sync word, a length and a CRC32
+    ---------------------------------------------------------------
+    """
+
+    payload = b''.join(pack('<Ihh', timestamp, paw, flow) for timestamp, paw, flow in samples)
+    covered = pack('<H', len(payload)) + payload
+    return b'\xaa\x55' + covered + pack('<I', crc32(covered) if checksum else 0)
+
+
+
+class TestFrameParser(TestCase):
+    """
+    TestFrameParser class
+    =====================
+    This class tests the incremental binary frame parser.
+    """
+
+
+
+    def setUp(self):
+        """
+        Resets the ledger
+        -----------------
+        """
+
+        MGPLedger.reportatexit(False)
+        MGPLedger.reset()
+
+
+
+    def tearDown(self):
+        """
+        Resets the ledger
+        -----------------
+        """
+
+        MGPLedger.reset()
+
+
+
+    def parser(self, **settings):
+        """
+        Creates a parser of frames like frame() packs
+        ---------------------------------------------
+        """
+
+        return InputArea.FrameParser('<Ihh', ('timestamp', ('paw', 'cmH2O'), ('flow', 'l/min')),
+                                     sync=b'\xaa\x55', length='H', checksum='crc32',
+                                     equipment_id='vent-1', **settings)
+
+
+
+    def test_partial_frames(self):
+        """
+        Frames split at any byte are decoded once they are complete
+        -----------------------------------------------------------
+        """
+
+        stream = (b'\x00\xaa' + frame([(1, 10, -1), (2, 20, -2)]) + frame([(3, 30, -3)], False)
+                  + frame([(4, 40, -4)]))
+        parser = self.parser()
+        timestamps = []
+        values = []
+        for position in range(0, len(stream), 3):
+            batch = parser.feed(stream[position:position + 3])
+            timestamps.extend(batch.column('timestamp'))
+            values.extend(batch.column('value'))
+        self.assertEqual(timestamps, [1, 1, 2, 2, 4, 4])
+        self.assertEqual(values, [10, -1, 20, -2, 40, -4])
+        self.assertEqual(parser.getcounters(), {'frames': 2, 'bad': 1, 'skipped': 2 + 14})
+
+
+
+    def test_buffer(self):
+        """
+        Bytes written to the buffer are parsed to rows
+        ----------------------------------------------
+        """
+
+        parser = self.parser(batch=False, buffer_size=64)
+        data = frame([(5, 50, 5)]) * 3
+        rows = []
+        while data:
+            view = parser.getbuffer()
+            count = min(len(view), len(data))
+            view[:count] = data[:count]
+            data = data[count:]
+            rows.extend(parser.fill(count))
+        self.assertEqual([(row.gettimestamp(), row.getlabel(), row.getvalue(), row.getequipment())
+                          for row in rows[:2]], [(5, 'paw', 50, 'vent-1'), (5, 'flow', 5, 'vent-1')])
+        self.assertEqual(len(rows), 6)
+        with self.assertRaises(MGPError):
+            InputArea.FrameParser('<Ih', ('timestamp',))
+        with self.assertRaises(MGPError):
+            InputArea.FrameParser('<Ih', ('timestamp', None), checksum='md5')
+        with self.assertRaises(MGPError):
+            InputArea.FrameParser('<Ih', ('timestamp', None), records=100, buffer_size=64)
+
+
+
+    def test_handler(self):
+        """
+        The handler of a parser sends a batch per complete read
+        -------------------------------------------------------
+        """
+
+        source, sink = Pipe(False)
+        area = InputArea(data_pipe=sink)
+        area.register('vent', 'serial', self.parser().handler(to_flow=False, to_data=True))
+        data = frame([(6, 60, 6)])
+        area.read('vent', data[:5])
+        area.read('vent', data[5:])
+        self.assertEqual(source.recv().column('timestamp').tolist(), [6, 6])
+        self.assertFalse(source.poll())
+        source.close()
+        sink.close()
+
+
+
+class TestReadMany(TestCase):
+    """
+    TestReadMany class
+    ==================
+    This class tests the batch reading of InputArea.
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates the pipes of the flows
+        ------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        MGPLedger.reset()
+        self.__flow_source, self.__flow_sink = Pipe(False)
+        self.__ui_source, self.__ui_sink = Pipe(False)
+        self.__area = InputArea(flow_pipe=self.__flow_sink, ui_pipe=self.__ui_sink)
+        self.__area.register('vent', 'serial', sample)
+
+
+
+    def tearDown(self):
+        """
+        Closes the pipes of the flows
+        -----------------------------
+        """
+
+        for connection in (self.__flow_source, self.__flow_sink, self.__ui_source,
+                           self.__ui_sink):
+            connection.close()
+        MGPLedger.reset()
+
+
+
+    def test_batches(self):
+        """
+        Rows of a flow are sent as batches in order with other data
+        -----------------------------------------------------------
+        """
+
+        self.__area.read_many('vent', [(1, 1.0), (2, 2.0), None, (3, 3.0)])
+        first = self.__flow_source.recv()
+        self.assertIsInstance(first, MGPRowBatch)
+        self.assertEqual([row.gettimestamp() for row in first], [1, 2])
+        self.assertEqual(first.column('equipment')[0], 'vent-1')
+        self.assertEqual(self.__flow_source.recv(), 'status')
+        self.assertEqual([row.getvalue() for row in self.__flow_source.recv()], [3.0])
+        self.assertFalse(self.__flow_source.poll())
+        self.assertEqual(self.__ui_source.recv(), 'status')
+        self.assertFalse(self.__ui_source.poll())
+        with self.assertRaises(MGPError):
+            self.__area.read_many('pump', [(1, 1.0)])
+
+
+
+    def test_batch_exitobject(self):
+        """
+        A batch ExitObject of a handler is sent as it is
+        ------------------------------------------------
+        """
+
+        def buffer(rawdata):
+            batch = MGPRowBatch(0)
+            for timestamp, value in rawdata:
+                batch.append(timestamp, 'paw', value, 'cmH2O', equipment_id='vent-1')
+            return ExitObject(batch, None, None)
+
+        self.__area.register('buffer', 'dma', buffer)
+        self.__area.read('buffer', [(1, 1.0), (2, 2.0)])
+        self.__area.read_many('buffer', [[(3, 3.0)], [(4, 4.0)]])
+        self.assertEqual(len(self.__flow_source.recv()), 2)
+        self.assertEqual(self.__flow_source.recv().column('timestamp').tolist(), [3])
+        self.assertEqual(self.__flow_source.recv().column('timestamp').tolist(), [4])
+        self.assertFalse(self.__ui_source.poll())
+
+
+
+class TestAsyncInputArea(TestCase):
+    """
+    TestAsyncInputArea class
+    ========================
+    This class tests the sources of AsyncInputArea on a loopback interface.
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates the pipe of the main flow
+        ---------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        MGPLedger.reset()
+        self.__source, self.__sink = Pipe(False)
+        self.__area = AsyncInputArea(flow_pipe=self.__sink)
+        self.__area.register('line', 'stream', line)
+
+
+
+    def tearDown(self):
+        """
+        Closes the pipe of the main flow
+        --------------------------------
+        """
+
+        self.__source.close()
+        self.__sink.close()
+        MGPLedger.reset()
+
+
+
+    def timestamps(self):
+        """
+        Gets the timestamps of the sent rows
+        ------------------------------------
+        @Return: (list) The timestamps in the order of the batches.
+        """
+
+        timestamps = []
+        while self.__source.poll():
+            timestamps.extend(row.gettimestamp() for row in self.__source.recv())
+        return timestamps
+
+
+
+    def test_tcp(self):
+        """
+        A TCP stream is read in batches through a small queue
+        ------------------------------------------------------
+        """
+
+        async def serve(reader, writer):
+            writer.write(b''.join(b'%d,%d\n' % (i, i) for i in range(10)))
+            await writer.drain()
+            writer.close()
+
+        async def scenario():
+            server = await start_server(serve, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            self.__area.addsource('vent-1', 'line', AsyncInputArea.tcpsource('127.0.0.1', port),
+                                  batch_size=4, queue_size=2)
+            await wait_for(self.__area.run(), 5)
+            server.close()
+            await server.wait_closed()
+
+        run(scenario())
+        self.assertEqual(self.timestamps(), list(range(10)))
+        counters = self.__area.getcounters('vent-1')
+        self.assertEqual(counters['received'], 10)
+        self.assertGreaterEqual(counters['batches'], 3)
+        with self.assertRaises(MGPError):
+            self.__area.addsource('vent-1', 'line', AsyncInputArea.tcpsource('127.0.0.1', 1))
+        with self.assertRaises(MGPError):
+            self.__area.addsource('vent-2', 'pump', AsyncInputArea.tcpsource('127.0.0.1', 1))
+
+
+
+    def test_udp(self):
+        """
+        Datagrams are read until stop() is called
+        -----------------------------------------
+        """
+
+        source = AsyncInputArea.UDPSource('127.0.0.1', 0)
+
+        async def scenario():
+            await source.open()
+            self.__area.addsource('monitor-1', 'line', source)
+            task = create_task(self.__area.run())
+            transport, _ = await get_running_loop().create_datagram_endpoint(
+                DatagramProtocol, remote_addr=source.getaddress())
+            for i in range(3):
+                transport.sendto(b'%d,%d' % (i, i))
+            while self.__area.getcounters('monitor-1')['received'] < 3:
+                await sleep(0.001)
+            self.__area.stop()
+            await wait_for(task, 5)
+            transport.close()
+
+        run(scenario())
+        self.assertEqual(self.timestamps(), [0, 1, 2])
+        self.assertEqual(source.getdropped(), 0)
+        self.assertIsNone(source.getaddress())
+
+
+
+    def test_handler_error(self):
+        """
+        An error of a handler stops its source and is raised
+        ----------------------------------------------------
+        """
+
+        async def records():
+            for i in range(100):
+                yield b'%d,%d' % (i, i) if i != 5 else b'broken'
+
+        self.__area.addsource('vent-1', 'line', records(), batch_size=1, queue_size=1)
+        with self.assertRaises(ValueError):
+            run(wait_for(self.__area.run(), 5))
+        self.assertEqual(self.timestamps(), [0, 1, 2, 3, 4])
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Medical Gateway Platform - Reorder tests
+========================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os.path import abspath, dirname
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from common import MGPData, MGPDataRowL0, MGPError, MGPLedger, MGPRowBatch
+from random import Random
+from reorder import MGPReorder
+from time import sleep
+from unittest import TestCase, main
+
+
+
+def row(equipment_id, timestamp):
+    """
+    Creates an L0 row of an equipment
+    ---------------------------------
+    """
+
+    return MGPDataRowL0(timestamp, MGPData('paw', timestamp, 'cmH2O'), equipment_id, 'sample')
+
+
+
+class TestReorder(TestCase):
+    """
+    TestReorder class
+    =================
+    This class tests the reorder buffer against sorted streams.
+    """
+
+
+
+    def setUp(self):
+        """
+        Resets the ledger
+        -----------------
+        """
+
+        MGPLedger.reportatexit(False)
+        MGPLedger.reset()
+
+
+
+    def tearDown(self):
+        """
+        Resets the ledger
+        -----------------
+        """
+
+        MGPLedger.reset()
+
+
+
+    def test_time_order(self):
+        """
+        Shuffled rows of many streams are released in time order
+        --------------------------------------------------------
+        """
+
+        random = Random(3)
+        reorder = MGPReorder(10)
+        rows = []
+        for i in range(400):
+            rows.append(row('vent-{}'.format(i % 4), i + random.randint(-10, 0)))
+        released = []
+        for start in range(0, len(rows), 7):
+            cycle = rows[start:start + 7]
+            random.shuffle(cycle)
+            released.extend(reorder.add(cycle))
+        timestamps = [element.gettimestamp() for element in released]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertLessEqual(reorder.getwatermark(), timestamps[-1])
+        released.extend(reorder.flush())
+        self.assertEqual(len(released), len(rows))
+        counters = reorder.getcounters()
+        self.assertEqual((counters['received'], counters['released'], counters['late']),
+                         (400, 400, 0))
+        self.assertEqual((counters['pending'], counters['streams']), (0, 4))
+
+
+
+    def test_watermark(self):
+        """
+        The slowest stream and its lateness hold the watermark back
+        -----------------------------------------------------------
+        """
+
+        reorder = MGPReorder(5, lateness={'pump-1': 20})
+        self.assertEqual(reorder.getwatermark(), None)
+        untimed = row('vent-1', None)
+        self.assertEqual(reorder.add([row('vent-1', 10), 'status', untimed]), ['status', untimed])
+        self.assertEqual(reorder.getwatermark(), 5)
+        self.assertEqual(reorder.add([row('vent-1', 30), row('pump-1', 25)]), [])
+        self.assertEqual(reorder.getwatermark(), 5)
+        batch = MGPRowBatch(0)
+        batch.append(40, 'paw', 1.0, 'cmH2O', equipment_id='pump-1')
+        released = reorder.add(batch)
+        self.assertEqual([element.gettimestamp() for element in released], [10])
+        self.assertEqual(reorder.getwatermark(), 20)
+        self.assertEqual(len(reorder), 3)
+
+
+
+    def test_late_rows(self):
+        """
+        Rows older than the watermark are counted and dropped or emitted
+        ----------------------------------------------------------------
+        """
+
+        for late in ('drop', 'emit'):
+            reorder = MGPReorder(0, late=late)
+            reorder.add([row('vent-1', 10)])
+            released = reorder.add([row('vent-1', 5), row('vent-1', 12)])
+            self.assertEqual([element.gettimestamp() for element in released],
+                             [5, 12] if late == 'emit' else [12])
+            self.assertEqual(reorder.getcounters()['late'], 1)
+        with self.assertRaises(MGPError):
+            MGPReorder(0, late='keep')
+        with self.assertRaises(MGPError):
+            MGPReorder(-1)
+
+
+
+    def test_limits(self):
+        """
+        Idle streams and max_pending don't hold rows back forever
+        ---------------------------------------------------------
+        """
+
+        reorder = MGPReorder(100, idle_timeout=1000000)
+        reorder.add([row('vent-1', 10), row('vent-1', 20)])
+        self.assertEqual(len(reorder), 2)
+        sleep(0.002)
+        self.assertEqual([element.gettimestamp() for element in reorder.add([])], [10, 20])
+        self.assertEqual(reorder.getcounters()['streams'], 0)
+        reorder = MGPReorder(100, max_pending=2)
+        released = reorder.add([row('vent-1', timestamp) for timestamp in (3, 1, 2, 4)])
+        self.assertEqual([element.gettimestamp() for element in released], [1, 2])
+        self.assertEqual(reorder.getwatermark(), 2)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Medical Gateway Platform - Rollup tests
+=======================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os.path import abspath, dirname
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from common import MGPData, MGPDataRowL0, MGPDataRowL1, MGPError, MGPLedger, MGPRowBatch
+from datetime import datetime
+from random import Random
+from rollup import MGPRollup
+from unittest import TestCase, main
+
+
+
+class TestRollup(TestCase):
+    """
+    TestRollup class
+    ================
+    This class tests the buckets against a full recomputation.
+    """
+
+
+
+    def test_buckets(self):
+        """
+        Buckets hold the statistics of their samples at every resolution
+        -----------------------------------------------------------------
+        """
+
+        random = Random(11)
+        rollup = MGPRollup(resolutions=(10, 100, 1000))
+        samples = [(i * 3, random.uniform(5.0, 30.0)) for i in range(1000)]
+        for timestamp, value in samples:
+            rollup.add('vent-1', 'paw', timestamp, value)
+        series = rollup.series('vent-1', 'paw')
+        for level, resolution in enumerate((10, 100, 1000)):
+            buckets = series.buckets(level, 0, 2999)
+            self.assertEqual(len(buckets), 3000 // resolution)
+            for start, count, minimum, maximum, mean in buckets:
+                values = [value for timestamp, value in samples
+                          if start <= timestamp < start + resolution]
+                self.assertEqual(count, len(values))
+                self.assertEqual((minimum, maximum), (min(values), max(values)))
+                self.assertAlmostEqual(mean, sum(values) / len(values))
+        self.assertEqual([bucket[0] for bucket in series.buckets(1, 250, 420)],
+                         [200, 300, 400])
+
+
+
+    def test_query(self):
+        """
+        Queries get the coarsest resolution not wider than a pixel
+        ----------------------------------------------------------
+        """
+
+        rollup = MGPRollup(resolutions=(10, 100, 1000), retention=50)
+        for i in range(10000):
+            rollup.add(None, 'flow', i, float(i % 13))
+        self.assertEqual(rollup.resolution(0, 100000, 100), 1000)
+        self.assertEqual(rollup.resolution(0, 9999, 100), 10)
+        self.assertEqual(rollup.resolution(0, 50, 100), 10)
+        resolution, buckets = rollup.query(None, 'flow', 0, 10000, 10)
+        self.assertEqual(resolution, 1000)
+        self.assertEqual(len(buckets), 10)
+        self.assertEqual(sum(bucket[1] for bucket in buckets), 10000)
+        resolution, buckets = rollup.query(None, 'flow', 0, 9999, 20)
+        self.assertEqual(resolution, 100)
+        self.assertEqual(buckets[0][0], 5000)
+        self.assertEqual(len(buckets), 50)
+        self.assertEqual(rollup.query('vent-1', 'flow', 0, 9999, 20), (100, []))
+
+
+
+    def test_rows(self):
+        """
+        Rows are added by equipment and label, non-numeric ones are skipped
+        -------------------------------------------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        batch = MGPRowBatch(0)
+        for i in range(4):
+            batch.append(i, 'paw', float(i), 'cmH2O', equipment_id='vent-{}'.format(i % 2))
+        alarm = MGPDataRowL0(5, MGPData('alarm', True, None), 'vent-1', 'action')
+        row1 = MGPDataRowL1(6, MGPData('paw', 7.5, 'cmH2O'), 1)
+        patients = [MGPDataRowL1(7 + i, MGPData('spo2', 60 + 20 * i, '%'), 1, 'AB'[i], 'secret')
+                    for i in range(2)]
+        dated = MGPDataRowL0(datetime(2026, 1, 1), MGPData('paw', 1.0, 'cmH2O'), 'vent-1', 'sample')
+        rollup = MGPRollup()
+        self.assertEqual(rollup.update(list(batch) + [alarm, row1, dated] + patients, 'secret'), 7)
+        self.assertEqual(rollup.keys(), [('vent-0', 'paw'), ('vent-1', 'paw'), (None, 'paw'),
+                                         ('A', 'spo2'), ('B', 'spo2')])
+        self.assertEqual(rollup.query('vent-1', 'paw', 0, 10, 1)[1], [(0, 2, 1.0, 3.0, 2.0)])
+        self.assertEqual(rollup.query('B', 'spo2', 0, 10, 1)[1], [(0, 1, 80, 80, 80.0)])
+        batch.finalize(None)
+        for row in [alarm, row1, dated] + patients:
+            row.finalize(None)
+
+
+
+    def test_errors(self):
+        """
+        Wrong settings and widths raise MGPError
+        ----------------------------------------
+        """
+
+        with self.assertRaises(MGPError):
+            MGPRollup(resolutions=())
+        with self.assertRaises(MGPError):
+            MGPRollup(resolutions=(100, 10))
+        with self.assertRaises(MGPError):
+            MGPRollup(retention=0)
+        with self.assertRaises(MGPError):
+            MGPRollup().query(None, 'paw', 0, 10, 0)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Medical Gateway Platform - SharedRing tests
+===========================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os.path import abspath, dirname
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from common import MGPError
+from multiprocessing.connection import wait
+from sharedring import SharedRingPipe
+from threading import Thread
+from time import monotonic, sleep
+from unittest import TestCase, main, skipUnless
+from unittest.mock import patch
+
+
+
+@skipUnless(SharedRingPipe.issupported(), 'The ring needs an x86 CPU.')
+class TestSharedRingPipe(TestCase):
+    """
+    TestSharedRingPipe class
+    ========================
+    This class tests the messages, the wakeup and the errors of SharedRingPipe.
+    """
+
+
+
+    def setUp(self):
+        """
+        Creates the endpoints
+        ---------------------
+        """
+
+        self.__source, self.__sink = SharedRingPipe.pair(256)
+
+
+
+    def tearDown(self):
+        """
+        Closes the endpoints
+        --------------------
+        """
+
+        self.__source.close()
+        self.__sink.close()
+
+
+
+    def sendlater(self, element, delay):
+        """
+        Sends an element from a thread after a delay
+        --------------------------------------------
+        @Params: element    (object)    The element to send.
+                 delay      (float)     The delay in seconds.
+        @Return: (Thread)               The started thread.
+        """
+
+        def send():
+            sleep(delay)
+            self.__sink.send(element)
+
+        thread = Thread(target=send)
+        thread.start()
+        return thread
+
+
+
+    def test_roundtrip(self):
+        """
+        Messages arrive in order, also across the end of the ring
+        ---------------------------------------------------------
+        """
+
+        self.assertFalse(self.__source.poll())
+        for i in range(50):
+            self.__sink.send(('paw', i, 'x' * (i % 7)))
+            self.__sink.send_bytes(b'%d' % i)
+            self.assertTrue(self.__source.poll())
+            self.assertEqual(self.__source.recv(), ('paw', i, 'x' * (i % 7)))
+            self.assertEqual(self.__source.recv_bytes(), b'%d' % i)
+        self.assertFalse(self.__source.poll())
+        for i in range(4):
+            self.__sink.send(i)
+        self.assertEqual(self.__source.recvmany(), [0, 1, 2, 3])
+
+
+
+    def test_poll_wakeup(self):
+        """
+        A waiting poll returns when the message arrives, not at the timeout
+        -------------------------------------------------------------------
+        """
+
+        thread = self.sendlater('hr', 0.05)
+        start = monotonic()
+        self.assertTrue(self.__source.poll(5.0))
+        elapsed = monotonic() - start
+        thread.join()
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(self.__source.recv(), 'hr')
+        start = monotonic()
+        self.assertFalse(self.__source.poll(0.05))
+        self.assertGreaterEqual(monotonic() - start, 0.05)
+
+
+
+    def test_fileno(self):
+        """
+        The file descriptor becomes readable with a message
+        ---------------------------------------------------
+        """
+
+        self.assertFalse(self.__source.poll())
+        self.assertEqual(wait([self.__source], 0.01), [])
+        thread = self.sendlater('spo2', 0.02)
+        self.assertEqual(wait([self.__source], 5.0), [self.__source])
+        thread.join()
+        self.assertEqual(self.__source.recv(), 'spo2')
+        self.assertFalse(self.__source.poll())
+        self.assertEqual(wait([self.__source], 0.01), [])
+
+
+
+    def test_errors(self):
+        """
+        Misused endpoints raise MGPError
+        --------------------------------
+        """
+
+        with self.assertRaises(MGPError):
+            self.__sink.recv()
+        with self.assertRaises(MGPError):
+            self.__sink.fileno()
+        with self.assertRaises(MGPError):
+            self.__source.send('paw')
+        with self.assertRaises(MGPError):
+            self.__sink.send_bytes(b'x' * 300)
+        with patch('sharedring.machine', return_value='aarch64'):
+            with self.assertRaises(MGPError):
+                SharedRingPipe.pair(256)
+
+
+
+if __name__ == '__main__':
+    main()
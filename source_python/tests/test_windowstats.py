@@ -0,0 +1,191 @@
+"""
+Medical Gateway Platform - WindowStats tests
+============================================
+
+This module is part of the MGP library. Run it from the source_python
+directory with 'python -m unittest discover tests'.
+"""
+
+
+
+from os.path import abspath, dirname
+from sys import path
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from common import MGPData, MGPDataRowL0, MGPDataRowL2, MGPError, MGPLedger, MGPRowBatch
+from datetime import datetime
+from random import Random
+from statistics import mean, pstdev, pvariance
+from unittest import TestCase, main
+from windowstats import MGPWindowStats
+
+
+
+class TestWindowStats(TestCase):
+    """
+    TestWindowStats class
+    =====================
+    This class tests the rolling statistics against a full recomputation.
+    """
+
+
+
+    def check(self, series, window):
+        """
+        Compares a series with the statistics of its window
+        ---------------------------------------------------
+        @Params: series (MGPWindowStats.Series) The series to check.
+                 window (list)                  The values of the window.
+        """
+
+        ordered = sorted(window)
+        self.assertEqual(len(series), len(window))
+        self.assertAlmostEqual(series.mean(), mean(window))
+        self.assertAlmostEqual(series.variance(), pvariance(window))
+        self.assertAlmostEqual(series.std(), pstdev(window))
+        self.assertEqual((series.min(), series.max()), (ordered[0], ordered[-1]))
+        self.assertEqual(series.quantile(0.0), ordered[0])
+        self.assertEqual(series.quantile(1.0), ordered[-1])
+        if len(ordered) % 2 == 1:
+            self.assertEqual(series.quantile(0.5), ordered[len(ordered) // 2])
+
+
+
+    def test_count_window(self):
+        """
+        The window keeps the last max_count samples
+        -------------------------------------------
+        """
+
+        random = Random(7)
+        stats = MGPWindowStats(max_count=51)
+        values = []
+        for i in range(500):
+            values.append(random.uniform(5.0, 30.0))
+            series = stats.add('vent-1', 'paw', i, values[-1])
+            if i % 25 == 0:
+                self.check(series, values[-51:])
+        self.assertEqual(stats.keys(), [('vent-1', 'paw')])
+
+
+
+    def test_large_window(self):
+        """
+        Quantiles stay exact while the sorted blocks split and merge
+        ------------------------------------------------------------
+        """
+
+        random = Random(11)
+        stats = MGPWindowStats(max_count=2501)
+        values = []
+        for i in range(12000):
+            values.append(random.randint(0, 60) if i < 8000 else random.uniform(0.0, 1.0))
+            series = stats.add('vent-1', 'paw', i, values[-1])
+            if i % 1000 == 0 and i >= 2500:
+                window = values[-2501:]
+                self.check(series, window)
+                ordered = sorted(window)
+                self.assertEqual(series.quantile(0.25), ordered[625])
+                self.assertEqual(series.quantile(0.9), ordered[2250])
+
+
+
+    def test_time_window(self):
+        """
+        The window keeps the samples younger than max_age
+        -------------------------------------------------
+        """
+
+        stats = MGPWindowStats(max_age=10)
+        for i in range(30):
+            stats.add('vent-1', 'flow', i * 3, float(i % 7))
+        series = stats.series('vent-1', 'flow')
+        self.assertEqual(series.timestamps(), (78, 87))
+        self.check(series, [float(i % 7) for i in range(26, 30)])
+        self.assertIsNone(stats.series('vent-2', 'flow'))
+
+
+
+    def test_rows(self):
+        """
+        Rows are added by equipment and label, non-numeric ones are skipped
+        -------------------------------------------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        batch = MGPRowBatch(0)
+        for i in range(4):
+            batch.append(i, 'paw', float(i), 'cmH2O', equipment_id='vent-{}'.format(i % 2))
+        alarm = MGPDataRowL0(5, MGPData('alarm', True, None), 'vent-1', 'action')
+        row2 = MGPDataRowL2(6, MGPData('paw', 1.0, 'cmH2O'), None)
+        stats = MGPWindowStats(max_count=10)
+        self.assertEqual(stats.update(list(batch) + [alarm, row2, 'text', None]), 4)
+        self.assertEqual(stats.series('vent-1', 'paw').mean(), 2.0)
+        batch.finalize(None)
+        alarm.finalize(None)
+        row2.finalize(None)
+
+
+
+    def test_nan(self):
+        """
+        NaN samples are skipped and don't break the window
+        --------------------------------------------------
+        """
+
+        series = MGPWindowStats.Series(max_count=3)
+        for timestamp, value in enumerate([5.0, float('nan'), 1.0, 3.0, 2.0]):
+            series.add(timestamp, value)
+        self.check(series, [1.0, 3.0, 2.0])
+        MGPLedger.reportatexit(False)
+        batch = MGPRowBatch(0)
+        batch.append(0, 'paw', float('nan'), 'cmH2O')
+        batch.append(1, 'paw', 4.0, 'cmH2O')
+        self.assertEqual(MGPWindowStats(max_count=3).update(batch), 1)
+        batch.finalize(None)
+
+
+
+    def test_timestamps(self):
+        """
+        Rows without numeric timestamp are skipped, refused samples change nothing
+        --------------------------------------------------------------------------
+        """
+
+        MGPLedger.reportatexit(False)
+        rows = [MGPDataRowL0(timestamp, MGPData('paw', 1.0, 'cmH2O'), 'vent-1', 'sample')
+                for timestamp in (None, datetime(2024, 1, 1), 2)]
+        stats = MGPWindowStats(max_age=10)
+        self.assertEqual(stats.update(rows), 1)
+        self.assertEqual(stats.series('vent-1', 'paw').timestamps(), (2, 2))
+        series = MGPWindowStats.Series(max_age=10)
+        series.add(1, 4.0)
+        for timestamp in (None, datetime(2024, 1, 1)):
+            with self.assertRaises(TypeError):
+                series.add(timestamp, 8.0)
+        self.check(series, [4.0])
+        self.assertEqual(series.timestamps(), (1, 1))
+        for row in rows:
+            row.finalize(None)
+
+
+
+    def test_errors(self):
+        """
+        Missing or wrong limits raise MGPError
+        --------------------------------------
+        """
+
+        with self.assertRaises(MGPError):
+            MGPWindowStats()
+        with self.assertRaises(MGPError):
+            MGPWindowStats(max_count=0)
+        series = MGPWindowStats(max_count=3).add(None, 'paw', 1, 2.0)
+        with self.assertRaises(MGPError):
+            series.quantile(1.5)
+
+
+
+if __name__ == '__main__':
+    main()
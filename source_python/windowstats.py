@@ -0,0 +1,458 @@
+"""
+Medical Gateway Platform - WindowStats
+======================================
+
+This module is part of the MGP library.
+"""
+
+
+
+from bisect import bisect_left, insort
+from collections import deque
+from common import MGPError, row_samples
+from math import sqrt
+
+
+
+class MGPWindowStats(object):
+    """
+    MGPWindowStats class
+    ====================
+    This class provides rolling-window statistics of many series for the
+    processor functions of ProcessArea. A series is identified by the pair of
+    the equipment ID and the label of the data, like ('vent-1', 'paw'), or of
+    the patient ID and the label for L1 rows, like (42, 'spo2'), and
+    holds the samples of a sliding window that is limited by the age of the
+    samples, by their count or by both.
+
+    Every series keeps its statistics up to date sample by sample, so no
+    processor has to keep and rescan its own history:
+        mean, variance  Running mean and sum of squared deviations (Welford),
+                        updated in O(1) when a sample enters or leaves.
+        min, max        Monotonic deques, amortized O(1) per sample.
+        quantiles       A sorted copy of the window values, kept in sorted
+                        blocks of up to 2b values, b = 512, with the largest
+                        value of every block. Blocks are split over 2b and
+                        merged under b / 2 values. A sample is placed and
+                        removed in O(log n + b) for n samples of a window, as
+                        the block is found with binary search and only the
+                        values of the block are moved, a quantile is found in
+                        O(n / b). The quantiles are exact.
+
+    Give an instance to ProcessArea as window_stats to feed it with the data of
+    every cycle before processor_function is called, and keep a reference to
+    it in the processor function to query the series.
+    """
+
+
+
+    class Series(object):
+        """
+        MGPWindowStats.Series class
+        ===========================
+        This class holds the sliding window and the statistics of one series.
+        """
+
+
+
+        __BLOCK = 512
+
+
+
+        def __init__(self, max_age=None, max_count=None):
+            """
+            Initializes the class
+            ---------------------
+            @Params: max_age    (number|NoneType)   [optional] The width of the
+                                                    window in the unit of the
+                                                    timestamps, None for no
+                                                    time limit.
+                     max_count  (int|NoneType)      [optional] Count of samples
+                                                    to keep at most, None for
+                                                    any count.
+            """
+
+            self.__max_age = max_age
+            self.__max_count = max_count
+            self.__samples = deque()
+            self.__blocks = []
+            self.__tops = []
+            self.__minimums = deque()
+            self.__maximums = deque()
+            self.__added = 0
+            self.__mean = 0.0
+            self.__m2 = 0.0
+
+
+
+        def __len__(self):
+            """
+            Gets the count of samples
+            -------------------------
+            @Return: (int)  The count of samples in the window.
+            """
+
+            return len(self.__samples)
+
+
+
+        def __evict(self):
+            """
+            Removes the oldest sample
+            -------------------------
+            """
+
+            _, value = self.__samples.popleft()
+            sequence = self.__added - len(self.__samples) - 1
+            count = len(self.__samples)
+            if count == 0:
+                self.__mean = 0.0
+                self.__m2 = 0.0
+            else:
+                delta = value - self.__mean
+                self.__mean -= delta / count
+                self.__m2 = max(self.__m2 - delta * (value - self.__mean), 0.0)
+            self.__remove(value)
+            if self.__minimums[0][0] == sequence:
+                self.__minimums.popleft()
+            if self.__maximums[0][0] == sequence:
+                self.__maximums.popleft()
+
+
+
+        def __insert(self, value):
+            """
+            Places a value in the sorted blocks
+            -----------------------------------
+            @Params: value  (int|float)     The value to place.
+            """
+
+            blocks, tops = self.__blocks, self.__tops
+            if not blocks:
+                blocks.append([value])
+                tops.append(value)
+                return
+            index = bisect_left(tops, value)
+            if index == len(tops):
+                index -= 1
+                blocks[index].append(value)
+                tops[index] = value
+            else:
+                insort(blocks[index], value)
+            if len(blocks[index]) > 2 * self.__BLOCK:
+                self.__split(index)
+
+
+
+        def __remove(self, value):
+            """
+            Removes a value from the sorted blocks
+            --------------------------------------
+            Blocks under half of the block size are merged with a neighbour.
+            @Params: value  (int|float)     The value to remove, it must be in
+                                            the window.
+            """
+
+            blocks, tops = self.__blocks, self.__tops
+            index = bisect_left(tops, value)
+            block = blocks[index]
+            del block[bisect_left(block, value)]
+            if block:
+                tops[index] = block[-1]
+            else:
+                del blocks[index]
+                del tops[index]
+                return
+            if len(block) < self.__BLOCK // 2 and len(blocks) > 1:
+                if index == len(blocks) - 1:
+                    index -= 1
+                blocks[index] += blocks[index + 1]
+                tops[index] = tops[index + 1]
+                del blocks[index + 1]
+                del tops[index + 1]
+                if len(blocks[index]) > 2 * self.__BLOCK:
+                    self.__split(index)
+
+
+
+        def __split(self, index):
+            """
+            Splits a block in two
+            ---------------------
+            @Params: index  (int)   The index of the block.
+            """
+
+            block = self.__blocks[index]
+            self.__blocks.insert(index + 1, block[self.__BLOCK:])
+            del block[self.__BLOCK:]
+            self.__tops.insert(index, block[-1])
+
+
+
+        def __value(self, position):
+            """
+            Gets a value of the window by its sorted position
+            -------------------------------------------------
+            @Params: position   (int)   The position of the value, 0 is the
+                                        smallest.
+            @Return: (int|float)        The value.
+            """
+
+            for block in self.__blocks:
+                if position < len(block):
+                    return block[position]
+                position -= len(block)
+
+
+
+        def add(self, timestamp, value):
+            """
+            Adds a sample to the window
+            ---------------------------
+            Samples that fall out of the window are removed, the timestamps of
+            a series are expected to grow. NaN samples are skipped, since they
+            can't be ordered. The timestamp is checked against the window
+            before the sample is added, so a refused sample doesn't change it.
+            @Params: timestamp  (time alike)    The timestamp of the sample.
+                     value      (int|float)     The value of the sample.
+            @Throws: TypeError                  When the age of the timestamp
+                                                can't be computed with max_age.
+            """
+
+            if value != value:
+                return
+            limit = timestamp - self.__max_age if self.__max_age is not None else None
+            samples = self.__samples
+            samples.append((timestamp, value))
+            sequence = self.__added
+            self.__added += 1
+            delta = value - self.__mean
+            self.__mean += delta / len(samples)
+            self.__m2 += delta * (value - self.__mean)
+            self.__insert(value)
+            minimums = self.__minimums
+            while minimums and minimums[-1][1] >= value:
+                minimums.pop()
+            minimums.append((sequence, value))
+            maximums = self.__maximums
+            while maximums and maximums[-1][1] <= value:
+                maximums.pop()
+            maximums.append((sequence, value))
+            if self.__max_count is not None:
+                while len(samples) > self.__max_count:
+                    self.__evict()
+            if limit is not None:
+                while samples[0][0] < limit:
+                    self.__evict()
+
+
+
+        def max(self):
+            """
+            Gets the largest value of the window
+            ------------------------------------
+            @Return: (int|float|NoneType)   The maximum or None if the window
+                                            is empty.
+            """
+
+            return self.__maximums[0][1] if self.__maximums else None
+
+
+
+        def mean(self):
+            """
+            Gets the mean of the window
+            ---------------------------
+            @Return: (float|NoneType)   The mean or None if the window is empty.
+            """
+
+            return self.__mean if self.__samples else None
+
+
+
+        def min(self):
+            """
+            Gets the smallest value of the window
+            -------------------------------------
+            @Return: (int|float|NoneType)   The minimum or None if the window
+                                            is empty.
+            """
+
+            return self.__minimums[0][1] if self.__minimums else None
+
+
+
+        def quantile(self, q):
+            """
+            Gets a quantile of the window
+            -----------------------------
+            The quantile is interpolated linearly between the two closest
+            values, like the default method of numpy.quantile().
+            @Params: q  (float)         The quantile between 0.0 and 1.0, 0.5 is
+                                        the median.
+            @Return: (float|NoneType)   The quantile or None if the window is
+                                        empty.
+            @Throws: MGPError           When q is out of range.
+            """
+
+            if not 0.0 <= q <= 1.0:
+                raise MGPError('MGPWindowStats.Series.quantile(): q must be between 0 and 1 but is "{}".'
+                               .format(q))
+            count = len(self.__samples)
+            if not count:
+                return None
+            position = q * (count - 1)
+            lower = int(position)
+            value = self.__value(lower)
+            if lower + 1 >= count:
+                return value
+            return value + (self.__value(lower + 1) - value) * (position - lower)
+
+
+
+        def std(self):
+            """
+            Gets the standard deviation of the window
+            -----------------------------------------
+            @Return: (float|NoneType)   The population standard deviation or
+                                        None if the window is empty.
+            """
+
+            variance = self.variance()
+            return sqrt(variance) if variance is not None else None
+
+
+
+        def timestamps(self):
+            """
+            Gets the timestamps of the oldest and the newest sample
+            -------------------------------------------------------
+            @Return: (tuple|NoneType)   The first and the last timestamp or None
+                                        if the window is empty.
+            """
+
+            if not self.__samples:
+                return None
+            return self.__samples[0][0], self.__samples[-1][0]
+
+
+
+        def variance(self):
+            """
+            Gets the variance of the window
+            -------------------------------
+            @Return: (float|NoneType)   The population variance or None if the
+                                        window is empty.
+            """
+
+            if not self.__samples:
+                return None
+            return self.__m2 / len(self.__samples)
+
+
+
+    def __init__(self, max_age=None, max_count=None):
+        """
+        Initializes the class
+        ---------------------
+        @Params: max_age    (number|NoneType)   [optional] The width of the
+                                                windows in the unit of the
+                                                timestamps, like nanoseconds
+                                                for time_ns() timestamps.
+                 max_count  (int|NoneType)      [optional] Count of samples to
+                                                keep at most per series.
+        @Throws: MGPError                       When none of the limits is
+                                                given or a limit is not
+                                                positive.
+        """
+
+        if max_age is None and max_count is None:
+            raise MGPError('MGPWindowStats: At least one of max_age and max_count must be given.')
+        if max_age is not None and max_age <= 0:
+            raise MGPError('MGPWindowStats: max_age must be positive but is "{}".'
+                           .format(max_age))
+        if max_count is not None and max_count <= 0:
+            raise MGPError('MGPWindowStats: max_count must be positive but is "{}".'
+                           .format(max_count))
+        self.__max_age = max_age
+        self.__max_count = max_count
+        self.__series = {}
+
+
+
+    def add(self, equipment_id, label, timestamp, value):
+        """
+        Adds a sample to a series
+        -------------------------
+        @Params: equipment_id   (string|int|NoneType)
+                                                    The ID of the equipment or
+                                                    of the patient.
+                 label          (string)            The label of the data.
+                 timestamp      (time alike)        The timestamp of the sample.
+                 value          (int|float)         The value of the sample.
+        @Return: (MGPWindowStats.Series)            The series of the sample.
+        """
+
+        key = (equipment_id, label)
+        series = self.__series.get(key)
+        if series is None:
+            series = self.__series[key] = MGPWindowStats.Series(self.__max_age,
+                                                                self.__max_count)
+        series.add(timestamp, value)
+        return series
+
+
+
+    def keys(self):
+        """
+        Gets the keys of the series
+        ---------------------------
+        @Return: (list)     Tuples of the equipment or patient ID and the label.
+        """
+
+        return list(self.__series.keys())
+
+
+
+    def series(self, equipment_id, label):
+        """
+        Gets a series
+        -------------
+        @Params: equipment_id   (string|int|NoneType)
+                                                    The ID of the equipment or
+                                                    of the patient.
+                 label          (string)            The label of the data.
+        @Return: (MGPWindowStats.Series|NoneType)   The series or None if it has
+                                                    no samples yet.
+        """
+
+        return self.__series.get((equipment_id, label))
+
+
+
+    def update(self, rows, patient_pwd=None):
+        """
+        Adds the samples of many rows
+        -----------------------------
+        The rows are read by row_samples(), so elements of the flow that are
+        not rows with numeric value are skipped, like the rows whose timestamp
+        is not an int or a float.
+        @Params: rows           (iterable)          MGPDataRowL0, MGPDataRowL1
+                                                    or their MGPRowBatch views.
+                 patient_pwd    (string|NoneType)   [optional] The password to
+                                                    get the patient IDs.
+        @Return: (int)                              The count of added samples.
+        """
+
+        added = 0
+        all_series = self.__series
+        for key, timestamp, value in row_samples(rows, patient_pwd):
+            if not isinstance(timestamp, (int, float)):
+                continue
+            series = all_series.get(key)
+            if series is None:
+                series = all_series[key] = MGPWindowStats.Series(self.__max_age,
+                                                                 self.__max_count)
+            series.add(timestamp, value)
+            added += 1
+        return added